@@ -36,6 +36,28 @@ class FinancialInsightResponse(BaseModel):
 # --- Global MCP Session ---
 GLOBAL_MCP_SESSION_ID = None
 
+# --- Shared MCP HTTP Client ---
+# One pooled, keep-alive client for every MCP call. Created on startup, closed on shutdown.
+MCP_HTTP2 = os.getenv("MCP_HTTP2", "false").lower() in ("1", "true", "yes")
+MCP_CLIENT_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("MCP_MAX_CONNECTIONS", "50")),
+    max_keepalive_connections=int(os.getenv("MCP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    keepalive_expiry=30.0,
+)
+mcp_http_client: httpx.AsyncClient | None = None
+
+def get_mcp_http_client() -> httpx.AsyncClient:
+    """Returns the shared MCP client, creating it if startup has not run yet."""
+    global mcp_http_client
+    if mcp_http_client is None or mcp_http_client.is_closed:
+        try:
+            mcp_http_client = httpx.AsyncClient(limits=MCP_CLIENT_LIMITS, http2=MCP_HTTP2)
+        except ImportError:
+            # http2=True needs the optional 'h2' package
+            print("WARNING: MCP_HTTP2 requested but 'h2' is not installed, using HTTP/1.1.")
+            mcp_http_client = httpx.AsyncClient(limits=MCP_CLIENT_LIMITS)
+    return mcp_http_client
+
 # --- MCP Tool and Gemini Helper Functions ---
 
 async def call_mcp_tool(tool_name: str) -> dict:
@@ -48,12 +70,11 @@ async def call_mcp_tool(tool_name: str) -> dict:
     
     print(f"Calling MCP Tool: '{tool_name}'")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{FI_MCP_SERVER_URL}/mcp/stream", json=payload, headers=headers, timeout=30.0
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await get_mcp_http_client().post(
+            f"{FI_MCP_SERVER_URL}/mcp/stream", json=payload, headers=headers, timeout=30.0
+        )
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPStatusError as e:
         detail = f"MCP Server returned an error: {e.response.status_code}. Body: {e.response.text}"
         print(f"ERROR: {detail}")
@@ -144,12 +165,12 @@ async def startup_event():
     print("Attempting to get MCP session for common use...")
     global GLOBAL_MCP_SESSION_ID
     try:
-        async with httpx.AsyncClient() as client:
-            await client.get(f"{FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
-            await client.post(
-                f"{FI_MCP_SERVER_URL}/login",
-                data={"sessionId": BACKEND_MCP_SESSION_ID, "phoneNumber": MCP_AUTH_PHONE_NUMBER}
-            )
+        client = get_mcp_http_client()
+        await client.get(f"{FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
+        await client.post(
+            f"{FI_MCP_SERVER_URL}/login",
+            data={"sessionId": BACKEND_MCP_SESSION_ID, "phoneNumber": MCP_AUTH_PHONE_NUMBER}
+        )
         GLOBAL_MCP_SESSION_ID = BACKEND_MCP_SESSION_ID
         print(f"Successfully obtained global MCP session: {GLOBAL_MCP_SESSION_ID}")
     except Exception as e:
@@ -157,6 +178,14 @@ async def startup_event():
         # In a real app, you might want the application to exit if this fails.
         # For this project, we'll allow it to start but tool calls will fail.
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Closes the shared MCP client and its pooled connections."""
+    global mcp_http_client
+    if mcp_http_client is not None and not mcp_http_client.is_closed:
+        await mcp_http_client.aclose()
+    mcp_http_client = None
+
 @app.post("/process_agent_request", response_model=FinancialInsightResponse)
 async def process_agent_request(request: AgentBuilderRequest):
     """
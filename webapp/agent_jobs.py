@@ -0,0 +1,334 @@
+# Async job mode for the agent endpoints
+#
+# An agent call is an MCP fetch plus a Gemini call with a 45s budget. Holding
+# the HTTP request open for all of that ties up server workers and runs into
+# mobile client timeouts. In job mode the POST returns a job id at once, a
+# small pool of worker tasks runs the analysis, and the client polls
+# GET /jobs/{id} or follows GET /jobs/{id}/events (SSE) for the result.
+#
+# Job state lives in a backend with a small Redis-style command set
+# (get / set with nx+ex / delete). The default is in memory; setting
+# JOB_REDIS_URL plugs in a Redis (or compatible) server so job state survives
+# a restart and can be read from any instance. Identical jobs (same user,
+# agent and payload) that are still queued or running share one job.
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from llm_stream import sse_event
+from deadlines import request_deadline
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "120"))
+# Finished jobs can be fetched for this long
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_REDIS_URL = os.getenv("JOB_REDIS_URL")
+# SSE keep-alive for clients behind proxies that drop idle connections
+JOB_HEARTBEAT_SECONDS = 15
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# --- Backends ---
+class MemoryJobBackend:
+    """In-process stand-in for the few Redis commands the job store uses"""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at or None)
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key):
+        return self._live(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and self._live(key) is not None:
+            return None
+        self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    async def delete(self, key):
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    def __len__(self):
+        return len([key for key in list(self._data) if self._live(key) is not None])
+
+def create_job_backend():
+    """Redis when JOB_REDIS_URL is set and redis is installed, otherwise in memory"""
+    if JOB_REDIS_URL:
+        try:
+            import redis.asyncio as redis
+            print(f"✅ Agent jobs stored in Redis at {JOB_REDIS_URL}")
+            return redis.from_url(JOB_REDIS_URL, decode_responses=True)
+        except ImportError as e:
+            print(f"Warning: JOB_REDIS_URL set but redis is not installed ({e}); keeping jobs in memory")
+    return MemoryJobBackend()
+
+# --- Jobs ---
+class AgentJobManager:
+    """Submits agent jobs, runs them on a worker pool and reports their state"""
+
+    def __init__(self, backend=None, workers: int = JOB_WORKERS, timeout: float = JOB_TIMEOUT_SECONDS,
+                 ttl: int = JOB_TTL_SECONDS):
+        self.backend = backend if backend is not None else create_job_backend()
+        self.workers = workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self._runners = {}   # agent -> async fn(uid, payload) returning the agent's response
+        self._changed = {}   # job_id -> asyncio.Event set on every state change
+        self._followers = {}  # job_id -> number of wait()/events() calls following it
+        self._queue = None
+        self._tasks = []
+        self._stats = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "timed_out": 0}
+        self._durations_ms = []
+
+    def register(self, agent: str, runner):
+        """runner(uid, payload) -> result"""
+        self._runners[agent] = runner
+
+    @property
+    def agents(self):
+        return list(self._runners)
+
+    # --- Store ---
+    def _job_key(self, job_id):
+        return f"agent_job:{job_id}"
+
+    def _dedupe_key(self, uid, agent, payload):
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"agent_job_active:{uid}:{agent}:{digest}"
+
+    async def _load(self, job_id):
+        raw = await self.backend.get(self._job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    async def _save(self, job):
+        await self.backend.set(self._job_key(job["job_id"]), json.dumps(job, default=str), ex=self.ttl)
+        # Wake anyone following this job
+        event = self._changed.pop(job["job_id"], None)
+        if event is not None:
+            event.set()
+
+    # --- Submitting ---
+    async def submit(self, uid: str, agent: str, payload: dict = None) -> dict:
+        """Queue a job (or join the identical one already queued/running). Returns the job plus "deduplicated"."""
+        if agent not in self._runners:
+            raise ValueError(f"Unknown agent: {agent}")
+        payload = payload or {}
+        self._ensure_workers()
+
+        job_id = uuid.uuid4().hex
+        dedupe_key = self._dedupe_key(uid, agent, payload)
+        # The claim expires on its own in case a worker dies mid-job
+        claimed = await self.backend.set(dedupe_key, job_id, ex=int(self.timeout) + 60, nx=True)
+        if not claimed:
+            existing_id = await self.backend.get(dedupe_key)
+            existing = await self._load(existing_id) if existing_id else None
+            if existing is not None and existing["status"] not in FINISHED:
+                self._stats["deduplicated"] += 1
+                print(f"🔁 {agent} job for {uid} joined running job {existing_id}")
+                return {**existing, "deduplicated": True}
+            await self.backend.set(dedupe_key, job_id, ex=int(self.timeout) + 60)
+
+        job = {
+            "job_id": job_id,
+            "uid": uid,
+            "agent": agent,
+            "payload": payload,
+            "status": QUEUED,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        await self._save(job)
+        self._queue.put_nowait((job_id, dedupe_key))
+        self._stats["submitted"] += 1
+        return {**job, "deduplicated": False}
+
+    async def get(self, job_id: str, uid: str = None):
+        """The job, or None if it is unknown, expired or belongs to someone else"""
+        job = await self._load(job_id)
+        if job is None or (uid is not None and job["uid"] != uid):
+            return None
+        return job
+
+    # --- Running ---
+    async def _release(self, job_id, dedupe_key):
+        """Drop the dedupe claim if it is still this job's"""
+        if await self.backend.get(dedupe_key) == job_id:
+            await self.backend.delete(dedupe_key)
+
+    async def _run_job(self, job_id, dedupe_key):
+        job = await self._load(job_id)
+        if job is None:
+            # Expired while queued: free the claim so the request can run again
+            await self._release(job_id, dedupe_key)
+            return
+        job.update(status=RUNNING, started_at=time.time())
+        await self._save(job)
+        try:
+            runner = self._runners[job["agent"]]
+            # The job's timeout is its deadline: fetches and the LLM call share it
+            with request_deadline(self.timeout, name=f"{job['agent']} job"):
+                job["result"] = await asyncio.wait_for(runner(job["uid"], job["payload"]), timeout=self.timeout)
+            job["status"] = SUCCEEDED
+            self._stats["succeeded"] += 1
+        except asyncio.TimeoutError:
+            job.update(status=FAILED, error=f"Timed out after {self.timeout:.0f}s")
+            self._stats["failed"] += 1
+            self._stats["timed_out"] += 1
+        except asyncio.CancelledError:
+            job.update(status=FAILED, error="Cancelled (server shutting down)")
+            raise
+        except Exception as e:
+            print(f"❌ {job['agent']} job {job_id} failed: {e}")
+            job.update(status=FAILED, error=str(e))
+            self._stats["failed"] += 1
+        finally:
+            job["finished_at"] = time.time()
+            duration_ms = (job["finished_at"] - job["started_at"]) * 1000
+            self._durations_ms = (self._durations_ms + [duration_ms])[-200:]
+            await self._save(job)
+            await self._release(job_id, dedupe_key)
+
+    async def _run_worker(self):
+        while True:
+            job_id, dedupe_key = await self._queue.get()
+            try:
+                await self._run_job(job_id, dedupe_key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Agent job worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.ensure_future(self._run_worker()))
+
+    def start(self):
+        """Start the worker pool (call from the app's startup hook)"""
+        self._ensure_workers()
+
+    async def drain(self):
+        """Wait until every queued job has finished"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks, self._queue = [], None
+
+    # --- Following ---
+    @contextlib.contextmanager
+    def _following(self, job_id):
+        """Count a follower; the job's change event is dropped once the last one leaves"""
+        self._followers[job_id] = self._followers.get(job_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._followers[job_id] -= 1
+            if not self._followers[job_id]:
+                del self._followers[job_id]
+                self._changed.pop(job_id, None)
+
+    async def _changed_or_timeout(self, event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait(self, job_id: str, timeout: float = None):
+        """Block until the job has finished (or timeout); returns the job as it is then"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._following(job_id):
+            while True:
+                # Take the event before reading, so a change in between is not missed
+                event = self._changed.setdefault(job_id, asyncio.Event())
+                job = await self._load(job_id)
+                if job is None or job["status"] in FINISHED:
+                    return job
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return job
+                await self._changed_or_timeout(event, remaining)
+
+    async def events(self, job_id: str, uid: str = None):
+        """SSE stream: a "status" event per state change, ending with "done" (result or error)"""
+        last_status = None
+        # The finally also runs when the client disconnects and the stream is closed
+        with self._following(job_id):
+            while True:
+                event = self._changed.setdefault(job_id, asyncio.Event())
+                job = await self.get(job_id, uid)
+                if job is None:
+                    message = "Job not found" if last_status is None else "Job expired"
+                    yield sse_event({"job_id": job_id, "error": message}, event="error")
+                    return
+                if job["status"] in FINISHED:
+                    yield sse_event(job, event="done")
+                    return
+                if job["status"] != last_status:
+                    last_status = job["status"]
+                    yield sse_event({"job_id": job_id, "status": last_status}, event="status")
+                else:
+                    yield ": keep-alive\n\n"
+                # Changes made by another instance (Redis) show up on the next heartbeat
+                await self._changed_or_timeout(event, JOB_HEARTBEAT_SECONDS)
+
+    def stats(self) -> dict:
+        durations = sorted(self._durations_ms)
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "workers": len([task for task in self._tasks if not task.done()]),
+            "backend": type(self.backend).__name__,
+            "followed": len(self._followers),
+            "p50_ms": round(durations[len(durations) // 2], 2) if durations else None,
+            "p95_ms": round(durations[int(len(durations) * 0.95)], 2) if durations else None,
+        }
+
+def job_links(job: dict, prefix: str = "") -> dict:
+    """The 202 body for a submitted job"""
+    return {
+        "job_id": job["job_id"],
+        "agent": job["agent"],
+        "status": job["status"],
+        "deduplicated": job.get("deduplicated", False),
+        "poll_url": f"{prefix}/jobs/{job['job_id']}",
+        "events_url": f"{prefix}/jobs/{job['job_id']}/events",
+    }
+
+# Process-wide job manager
+agent_jobs = AgentJobManager()
+
+async def stop_agent_jobs():
+    await agent_jobs.stop()
+
+def get_job_metrics() -> dict:
+    return agent_jobs.stats()
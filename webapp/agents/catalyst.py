@@ -1,19 +1,27 @@
 # Catalyst Agent - AI financial growth agent
 
-import asyncio
 import json
-from firebase_admin import firestore
 from datetime import datetime
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from firestore_db import get_db
+from result_cache import data_fingerprint, get_cached_result, store_result, get_last_result
+from context_builder import build_context, report_prompt_tokens
+
+# Bump whenever the prompt below changes so cached results are not reused
+PROMPT_VERSION = "catalyst-v2"
+
+CATALYST_DATASETS = ("net_worth", "epf_details", "mf_transactions")
+
 try:
     from shared_utils import (
         get_user_financial_data,
         get_cached_mcp_data,
-        call_gemini_text,
+        load_user_datasets,
+        call_gemini,
         force_json_safe
     )
 except ImportError as e:
@@ -25,16 +33,22 @@ except ImportError as e:
     async def get_cached_mcp_data(uid: str):
         return {"error": "No cache available"}
     
-    def call_gemini_text(prompt: str, model_name="gemini-2.5-flash", tools=None, timeout=45):
+    async def load_user_datasets(uid: str, datasets):
+        return {name: {"error": f"Mock data for {name}"} for name in datasets}
+    
+    async def call_gemini(prompt: str, uid: str = None, priority: str = "background", model_name="gemini-2.5-flash", tools=None, timeout=45):
         return f"Mock response to: {prompt[:100]}..."
     
     def force_json_safe(data):
         return {"mock_data": True, "timestamp": "2024-01-01T00:00:00"}
 
-async def run_catalyst_analysis(uid: str):
-    """Run Catalyst analysis for financial growth opportunities"""
+async def run_catalyst_analysis(uid: str, datasets: dict = None):
+    """Run Catalyst analysis for financial growth opportunities.
+
+    datasets: already-loaded datasets to use instead of loading them (see insights.py)
+    """
     try:
-        db = firestore.client()
+        db = get_db()
     except Exception as e:
         print(f"Warning: Could not initialize Firestore: {e}")
         # Return a mock response if Firebase is not available
@@ -49,49 +63,13 @@ async def run_catalyst_analysis(uid: str):
     # Initialize variables
     net_worth = epf = mf_tx = None
     
-    # Try cache first
+    # Cached datasets first (L1, then the full-fidelity Firestore cache); only misses hit MCP
     try:
-        mcp_cache = await get_cached_mcp_data(uid)
-        if mcp_cache and isinstance(mcp_cache, dict):
-            net_worth = mcp_cache.get("net_worth")
-            epf = mcp_cache.get("epf_details")
-            mf_tx = mcp_cache.get("mf_transactions")
-        else:
-            try:
-                net_worth, epf, mf_tx = await asyncio.gather(
-                    get_user_financial_data(uid, tool_name="fetch_net_worth"),
-                    get_user_financial_data(uid, tool_name="fetch_epf_details"),
-                    get_user_financial_data(uid, tool_name="fetch_mf_transactions")
-                )
-                # Ensure all results are dictionaries
-                if net_worth is None:
-                    net_worth = {"error": "Net worth fetch failed"}
-                if epf is None:
-                    epf = {"error": "EPF details fetch failed"}
-                if mf_tx is None:
-                    mf_tx = {"error": "Mutual fund transactions fetch failed"}
-            except Exception as e:
-                print(f"❌ Error in asyncio.gather: {e}")
-                net_worth = {"error": "Net worth fetch failed"}
-                epf = {"error": "EPF details fetch failed"}
-                mf_tx = {"error": "Mutual fund transactions fetch failed"}
-            # Update cache
-            try:
-                mcp_data = mcp_cache if isinstance(mcp_cache, dict) else {}
-                mcp_data.update({
-                    "net_worth": net_worth,
-                    "epf_details": epf,
-                    "mf_transactions": mf_tx,
-                    "mcp_cache_timestamp": datetime.utcnow().isoformat()
-                })
-                safe_mcp_data = force_json_safe(mcp_data)
-                
-                # Try to save to Firestore with error handling
-                await asyncio.to_thread(db.collection("users").document(uid).set, {"mcp_data_cache": safe_mcp_data}, merge=True)
-                print("✅ SUCCESS: Catalyst MCP data cached in Firestore")
-            except Exception as e:
-                print(f"❌ WARNING: Failed to cache Catalyst MCP data in Firestore: {e}")
-                # Continue without caching - the app will still work
+        if datasets is None:
+            datasets = await load_user_datasets(uid, list(CATALYST_DATASETS))
+        net_worth = datasets.get("net_worth")
+        epf = datasets.get("epf_details")
+        mf_tx = datasets.get("mf_transactions")
     except Exception as e:
         print(f"❌ Error fetching data: {e}")
         net_worth = epf = mf_tx = {"error": "Data fetch failed"}
@@ -143,19 +121,28 @@ async def run_catalyst_analysis(uid: str):
     mf_data = mf_tx if mf_tx and not mf_tx.get('error') else "unavailable"
     data = {"net_worth_summary": nw_data, "epf_details": epf_data, "mf_transactions": mf_data}
     
+    # Same inputs as a previous run -> same answer; skip Gemini entirely
+    fingerprint = data_fingerprint("catalyst", PROMPT_VERSION, None, data)
+    cached = await get_cached_result(uid, "catalyst", fingerprint)
+    if cached is not None:
+        print(f"⚡ Catalyst result cache hit for {uid}")
+        return {"opportunities": json.dumps(cached)}
+    
+    context = build_context(data, agent="catalyst")
     prompt = (
         "You are Catalyst, an AI financial growth agent. "
-        "You receive the user's net worth summary, EPF details, and mutual fund transactions as JSON. "
+        "You receive precomputed JSON summaries of the user's net worth (assets and liabilities by type), EPF balances, and mutual fund holdings. "
         "Analyze the data and provide specific investment opportunities with ROI comparisons. "
         "If any data is 'unavailable', still provide at least two actionable, proactive opportunities for the user. "
         "If the user's finances are perfect, still suggest at least two ways to improve growth, diversification, or protection. "
         "Respond ONLY in a valid JSON object: "
         '{"opportunities": [{"title":"...", "description":"...", "category":"...", "roi_comparison":{"current":12.5, "suggested":18.2}, "action_items":["...", "..."]}]}'"\n"
-        f"Data:\n{json.dumps(data)}"
+        f"Data:\n{context.text}"
     )
+    report_prompt_tokens("catalyst", prompt, context)
     
     try:
-        answer = await asyncio.to_thread(call_gemini_text, prompt)
+        answer = await call_gemini(prompt, uid=uid, priority="background")
     except Exception as e:
         print(f"❌ Error calling Gemini: {e}")
         # Return fallback opportunities if Gemini fails
@@ -176,19 +163,17 @@ async def run_catalyst_analysis(uid: str):
                 {"title": "Increase Emergency Fund", "description": "Boost your emergency fund to cover at least 6 months of expenses.", "category": "Protection"}
             ]
         parsed['opportunities'] = opportunities
-        # Cache opportunities in Firestore
+        # Cache the result under its data fingerprint (write-behind, off the request path)
         try:
-            await asyncio.to_thread(db.collection("users").document(uid).set, {"catalyst_opportunities_cache": opportunities}, merge=True)
+            store_result(uid, "catalyst", fingerprint, parsed, PROMPT_VERSION)
         except Exception as e:
             print(f"❌ WARNING: Failed to cache Catalyst opportunities in Firestore: {e}")
         return {"opportunities": json.dumps(parsed)}
     except Exception:
         try:
-            user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
-            cache = user_doc.to_dict().get("catalyst_opportunities_cache") if user_doc.exists else None
+            cache = await get_last_result(uid, "catalyst")
             if cache:
-                fallback = {"opportunities": cache}
-                return {"opportunities": json.dumps(fallback)}
+                return {"opportunities": json.dumps(cache)}
         except Exception as e:
             print(f"❌ WARNING: Failed to read Catalyst opportunities cache: {e}")
         fallback = {
@@ -1,19 +1,29 @@
 # Guardian Agent - AI financial safety agent
 
-import asyncio
 import json
-from firebase_admin import firestore
+import time
 from datetime import datetime
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from firestore_db import get_db
+from result_cache import data_fingerprint, get_cached_result, store_result, get_last_result
+from context_builder import build_context, report_prompt_tokens
+from dataset_planner import plan_for_area, record_plan, GUARDIAN_DATASETS
+from guardian_rules import merge_enrichment
+from guardian_state import run_incremental_rules
+
+# Bump whenever the prompt below changes so cached results are not reused
+PROMPT_VERSION = "guardian-v5"
+
 try:
     from shared_utils import (
         get_user_financial_data,
         get_cached_mcp_data,
-        call_gemini_text,
+        load_user_datasets,
+        call_gemini,
         force_json_safe
     )
 except ImportError as e:
@@ -25,7 +35,10 @@ except ImportError as e:
     async def get_cached_mcp_data(uid: str):
         return {"error": "No cache available"}
     
-    def call_gemini_text(prompt: str, model_name="gemini-2.5-flash", tools=None, timeout=45):
+    async def load_user_datasets(uid: str, datasets):
+        return {name: {"error": f"Mock data for {name}"} for name in datasets}
+    
+    async def call_gemini(prompt: str, uid: str = None, priority: str = "background", model_name="gemini-2.5-flash", tools=None, timeout=45):
         return f"Mock response to: {prompt[:100]}..."
     
     def force_json_safe(data):
@@ -38,177 +51,177 @@ except ImportError as e:
             print(f"❌ Error in force_json_safe: {e}")
             return {"mock_data": True, "timestamp": "2024-01-01T00:00:00"}
 
-async def run_guardian_analysis(uid: str, area: str = None):
-    """Run Guardian analysis for financial safety alerts"""
-    try:
-        db = firestore.client()
-    except Exception as e:
-        print(f"Warning: Could not initialize Firestore: {e}")
-        # Return a mock response if Firebase is not available
-        fallback = {
-            "alerts": [
-                {"type": "System Alert", "description": "Financial data access is temporarily unavailable.", "severity": "info"},
-                {"type": "Security Reminder", "description": "Please ensure your account security settings are up to date.", "severity": "info"}
-            ]
-        }
-        return {"alerts": json.dumps(fallback)}
-    
-    # Initialize variables
-    bank_tx = credit = mf_tx = None
-    
-    # Try cache first
+GENERIC_ALERTS = [
+    {"type": "Security Reminder", "description": "Review your account security settings regularly.", "severity": "info"},
+    {"type": "Growth Tip", "description": "Consider setting up a recurring investment to maximize compounding.", "severity": "info"}
+]
+
+async def _load_guardian_datasets(uid: str, plan, datasets: dict = None) -> dict:
+    """The plan's datasets (cached first, then MCP), with mock data standing in for failed fetches"""
+    # Cached datasets first (L1, then the full-fidelity Firestore cache); only misses hit MCP
     try:
-        mcp_cache = await get_cached_mcp_data(uid)
-        if mcp_cache and isinstance(mcp_cache, dict):
-            bank_tx = mcp_cache.get("bank_transactions")
-            credit = mcp_cache.get("credit_report")
-            mf_tx = mcp_cache.get("mf_transactions")
-        else:
-            try:
-                bank_tx, credit, mf_tx = await asyncio.gather(
-                    get_user_financial_data(uid, tool_name="fetch_bank_transactions"),
-                    get_user_financial_data(uid, tool_name="fetch_credit_report"),
-                    get_user_financial_data(uid, tool_name="fetch_mf_transactions")
-                )
-                # Ensure all results are dictionaries
-                if bank_tx is None:
-                    bank_tx = {"error": "Bank transactions fetch failed"}
-                if credit is None:
-                    credit = {"error": "Credit report fetch failed"}
-                if mf_tx is None:
-                    mf_tx = {"error": "Mutual fund transactions fetch failed"}
-            except Exception as e:
-                print(f"❌ Error in asyncio.gather: {e}")
-                bank_tx = {"error": "Bank transactions fetch failed"}
-                credit = {"error": "Credit report fetch failed"}
-                mf_tx = {"error": "Mutual fund transactions fetch failed"}
-            # Update cache
-            try:
-                mcp_data = mcp_cache if isinstance(mcp_cache, dict) else {}
-                mcp_data.update({
-                    "bank_transactions": bank_tx,
-                    "credit_report": credit,
-                    "mf_transactions": mf_tx,
-                    "mcp_cache_timestamp": datetime.utcnow().isoformat()
-                })
-                safe_mcp_data = force_json_safe(mcp_data)
-                
-                # Try to save to Firestore with error handling
-                await asyncio.to_thread(db.collection("users").document(uid).set, {"mcp_data_cache": safe_mcp_data}, merge=True)
-                print("✅ SUCCESS: Guardian MCP data cached in Firestore")
-            except Exception as e:
-                print(f"❌ WARNING: Failed to cache Guardian MCP data in Firestore: {e}")
-                # Continue without caching - the app will still work
+        if datasets is None:
+            datasets = await load_user_datasets(uid, list(plan.datasets))
+        datasets = {name: datasets.get(name) for name in plan.datasets}
     except Exception as e:
         print(f"❌ Error fetching data: {e}")
-        bank_tx = credit = mf_tx = {"error": "Data fetch failed"}
+        datasets = {}
     
-    # Ensure variables are not None
-    if bank_tx is None:
-        bank_tx = {"error": "Data fetch failed"}
-    if credit is None:
-        credit = {"error": "Data fetch failed"}
-    if mf_tx is None:
-        mf_tx = {"error": "Data fetch failed"}
+    # Missing datasets count as failed fetches
+    for name in plan.datasets:
+        if datasets.get(name) is None:
+            datasets[name] = {"error": "Data fetch failed"}
     
     # If data fetch failed, use mock data for testing
-    if (bank_tx and bank_tx.get('error')) or (credit and credit.get('error')) or (mf_tx and mf_tx.get('error')):
+    if any(datasets[name].get('error') for name in plan.datasets):
         print("🔄 Using mock data for Guardian analysis")
         # Load mock data for user 2222222222
         import os
         mock_data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fi-mcp-dev', 'test_data_dir', uid)
         
         try:
-            # Load bank transactions
-            bank_file = os.path.join(mock_data_path, 'fetch_bank_transactions.json')
-            if os.path.exists(bank_file):
-                with open(bank_file, 'r') as f:
-                    bank_tx = json.load(f)
-                print("✅ Loaded mock bank transactions")
-            
-            # Load credit report
-            credit_file = os.path.join(mock_data_path, 'fetch_credit_report.json')
-            if os.path.exists(credit_file):
-                with open(credit_file, 'r') as f:
-                    credit = json.load(f)
-                print("✅ Loaded mock credit report")
-            
-            # Load mutual fund transactions
-            mf_file = os.path.join(mock_data_path, 'fetch_mf_transactions.json')
-            if os.path.exists(mf_file):
-                with open(mf_file, 'r') as f:
-                    mf_tx = json.load(f)
-                print("✅ Loaded mock mutual fund transactions")
+            for name in plan.datasets:
+                mock_file = os.path.join(mock_data_path, f'fetch_{name}.json')
+                if os.path.exists(mock_file):
+                    with open(mock_file, 'r') as f:
+                        datasets[name] = json.load(f)
+                    print(f"✅ Loaded mock {name.replace('_', ' ')}")
                 
         except Exception as e:
             print(f"❌ Error loading mock data: {e}")
             # Fallback to error state
-            bank_tx = credit = mf_tx = {"error": "Mock data load failed"}
+            datasets = {name: {"error": "Mock data load failed"} for name in plan.datasets}
+    
+    record_plan("guardian", plan, GUARDIAN_DATASETS, datasets)
+    return datasets
+
+def _with_rules(alerts: list, rules: dict) -> dict:
+    return {"alerts": alerts, "rules": {
+        "count": len(rules["alerts"]), "elapsed_ms": rules["elapsed_ms"], "as_of": rules["as_of"],
+        "new_transactions": rules["new_transactions"],
+    }}
+
+async def _fallback_alerts(uid: str, area: str, rules: dict) -> dict:
+    """No usable Gemini answer: the rule alerts if there are any, else the last stored result, else generic tips"""
+    if rules["alerts"]:
+        return _with_rules(rules["alerts"], rules)
+    try:
+        cache = await get_last_result(uid, "guardian", area)
+        if cache:
+            return cache
+    except Exception as e:
+        print(f"❌ WARNING: Failed to read Guardian alerts cache: {e}")
+    return {"alerts": GENERIC_ALERTS}
+
+async def _enrich_alerts(uid: str, area: str, plan, datasets: dict, rules: dict) -> dict:
+    """Gemini explains the rule alerts and adds its own; returns the merged alert document"""
+    data = {
+        name: datasets[name] if datasets[name] and not datasets[name].get('error') else "unavailable"
+        for name in plan.datasets
+    }
+    # Bank history is replaced by what is new since the last run plus a baseline of running statistics
+    if rules.get("bank_activity") is not None:
+        del data["bank_transactions"]
+        data["bank_activity"] = rules["bank_activity"]
     
-    tx_data = bank_tx if bank_tx and not bank_tx.get('error') else "unavailable"
-    cr_data = credit if credit and not credit.get('error') else "unavailable"
-    mf_data = mf_tx if mf_tx and not mf_tx.get('error') else "unavailable"
-    data = {"bank_transactions": tx_data, "credit_report": cr_data, "mf_transactions": mf_data}
+    # Same inputs as a previous run -> same answer; skip Gemini entirely
+    fingerprint = data_fingerprint("guardian", PROMPT_VERSION, area, data)
+    cached = await get_cached_result(uid, "guardian", fingerprint, area)
+    if cached is not None:
+        print(f"⚡ Guardian result cache hit for {uid}")
+        return cached
     
     # Customize prompt based on selected area
     area_focus = ""
     if area:
         area_focus = f"Focus specifically on {area.replace('_', ' ')} analysis. "
     
+    rule_alerts = [{"id": alert["id"], "type": alert["type"], "description": alert["description"], "severity": alert["severity"]}
+                   for alert in rules["alerts"]]
+    context = build_context(data, agent="guardian", fields=plan.fields)
     prompt = (
         f"You are Guardian, an AI financial safety agent. "
         f"{area_focus}"
-        "You receive the user's bank transactions, credit report, and mutual fund transactions as JSON. "
-        "If any data is 'unavailable', still provide at least two actionable, proactive alerts for the user. "
+        "You receive precomputed JSON summaries of the user's data relevant to this focus: bank activity (the transactions since your last review, plus a baseline of the user's usual merchants, category spend, typical debit and balances), credit report, and mutual fund holdings. "
+        "Deterministic checks have already raised the alerts listed under 'Rule alerts'. For each one, write a short plain-language explanation with a concrete next step, keyed by its id. "
+        "Only add alerts of your own for risks the rule alerts do not already cover. "
+        "If there are no rule alerts and any data is 'unavailable', still provide at least two actionable, proactive alerts for the user. "
         "If the user's finances are perfect, still suggest at least two ways to improve security, growth, or protection. "
         "Respond ONLY in a valid JSON object: "
-        '{"alerts": [{"type":"...", "description":"...", "severity":"..."}]}'"\n"
-        f"Data:\n{json.dumps(data)}"
+        '{"explanations": {"<rule alert id>": "..."}, "alerts": [{"type":"...", "description":"...", "severity":"..."}]}'"\n"
+        f"Rule alerts:\n{json.dumps(rule_alerts, separators=(',', ':'))}\n"
+        f"Data:\n{context.text}"
     )
+    report_prompt_tokens("guardian", prompt, context)
     
     try:
-        answer = await asyncio.to_thread(call_gemini_text, prompt)
+        answer = await call_gemini(prompt, uid=uid, priority="background")
     except Exception as e:
         print(f"❌ Error calling Gemini: {e}")
-        # Return fallback alerts if Gemini fails
-        fallback = {
-            "alerts": [
-                {"type": "Security Reminder", "description": "Review your account security settings regularly.", "severity": "info"},
-                {"type": "Growth Tip", "description": "Consider setting up a recurring investment to maximize compounding.", "severity": "info"}
-            ]
-        }
-        return {"alerts": json.dumps(fallback)}
+        return await _fallback_alerts(uid, area, rules)
     
-    # Try to parse and inject fallback alerts if empty
+    # Merge the explanations into the rule alerts; generic tips only if nothing at all was raised
     try:
-        parsed = json.loads(answer.replace("```json", '').replace("```", ''))
-        alerts = parsed.get('alerts', [])
-        if not alerts:
-            alerts = [
-                {"type": "Security Reminder", "description": "Review your account security settings regularly.", "severity": "info"},
-                {"type": "Growth Tip", "description": "Consider setting up a recurring investment to maximize compounding.", "severity": "info"}
-            ]
-        parsed['alerts'] = alerts
-        # Cache alerts in Firestore
-        try:
-            await asyncio.to_thread(db.collection("users").document(uid).set, {"guardian_alerts_cache": alerts}, merge=True)
-        except Exception as e:
-            print(f"❌ WARNING: Failed to cache Guardian alerts in Firestore: {e}")
-        return {"alerts": json.dumps(parsed)}
+        enrichment = json.loads(answer.replace("```json", '').replace("```", ''))
+        if not isinstance(enrichment, dict):
+            raise ValueError("Guardian answer is not a JSON object")
     except Exception:
-        # Fallback if parsing fails, try cache
-        try:
-            user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
-            cache = user_doc.to_dict().get("guardian_alerts_cache") if user_doc.exists else None
-            if cache:
-                fallback = {"alerts": cache}
-                return {"alerts": json.dumps(fallback)}
-        except Exception as e:
-            print(f"❌ WARNING: Failed to read Guardian alerts cache: {e}")
-        fallback = {
-            "alerts": [
-                {"type": "Security Reminder", "description": "Review your account security settings regularly.", "severity": "info"},
-                {"type": "Growth Tip", "description": "Consider setting up a recurring investment to maximize compounding.", "severity": "info"}
-            ]
-        }
-        return {"alerts": json.dumps(fallback)} 
\ No newline at end of file
+        # Fallback if parsing fails: rule alerts, then cache
+        return await _fallback_alerts(uid, area, rules)
+    alerts = merge_enrichment(rules["alerts"], enrichment) or GENERIC_ALERTS
+    parsed = _with_rules(alerts, rules)
+    # Cache the result under its data fingerprint (write-behind, off the request path)
+    try:
+        store_result(uid, "guardian", fingerprint, parsed, PROMPT_VERSION, area)
+    except Exception as e:
+        print(f"❌ WARNING: Failed to cache Guardian alerts in Firestore: {e}")
+    return parsed
+
+def _firestore_unavailable(e: Exception) -> dict:
+    print(f"Warning: Could not initialize Firestore: {e}")
+    # Return a mock response if Firebase is not available
+    return {
+        "alerts": [
+            {"type": "System Alert", "description": "Financial data access is temporarily unavailable.", "severity": "info"},
+            {"type": "Security Reminder", "description": "Please ensure your account security settings are up to date.", "severity": "info"}
+        ]
+    }
+
+async def run_guardian_analysis(uid: str, area: str = None, datasets: dict = None):
+    """Run Guardian analysis for financial safety alerts.
+
+    datasets: already-loaded datasets to use instead of loading them (see insights.py)
+    """
+    try:
+        get_db()
+    except Exception as e:
+        return {"alerts": json.dumps(_firestore_unavailable(e))}
+    
+    # Only the datasets this focus area needs are loaded and serialized
+    plan = plan_for_area(area)
+    datasets = await _load_guardian_datasets(uid, plan, datasets)
+    rules = await run_incremental_rules(uid, datasets, area)
+    parsed = await _enrich_alerts(uid, area, plan, datasets, rules)
+    return {"alerts": json.dumps(parsed)}
+
+async def stream_guardian_analysis(uid: str, area: str = None, datasets: dict = None):
+    """Progressive Guardian: yields {"event": "alerts"} with the rule alerts as soon as the data is loaded,
+    then {"event": "enriched"} with Gemini's explanations merged in"""
+    started_at = time.perf_counter()
+    try:
+        get_db()
+    except Exception as e:
+        yield {"event": "enriched", **_firestore_unavailable(e)}
+        return
+    
+    plan = plan_for_area(area)
+    datasets = await _load_guardian_datasets(uid, plan, datasets)
+    rules = await run_incremental_rules(uid, datasets, area)
+    yield {
+        "event": "alerts",
+        "source": "rules",
+        **_with_rules(rules["alerts"], rules),
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 2),
+    }
+    parsed = await _enrich_alerts(uid, area, plan, datasets, rules)
+    yield {"event": "enriched", **parsed, "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 2)}
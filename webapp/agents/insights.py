@@ -0,0 +1,113 @@
+# Insights - every dashboard agent from one request
+#
+# The dashboards used to call Guardian, Catalyst and Strategist separately, so
+# each call resolved the session and loaded overlapping datasets (MF
+# transactions feed all three) on its own. Here the union of their datasets is
+# loaded once, the agents run concurrently on that shared copy, and each
+# result is streamed (SSE or NDJSON) as soon as that agent finishes.
+
+import asyncio
+import json
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset_planner import plan_for_area
+from llm_stream import sse_event
+
+from guardian import run_guardian_analysis
+from catalyst import run_catalyst_analysis, CATALYST_DATASETS
+from strategist import run_strategist_analysis, STRATEGIST_DATASETS
+
+try:
+    from shared_utils import load_user_datasets
+except ImportError as e:
+    print(f"Warning: Could not import shared_utils: {e}")
+
+    async def load_user_datasets(uid: str, datasets):
+        return {name: {"error": f"Mock data for {name}"} for name in datasets}
+
+INSIGHT_AGENTS = ("guardian", "catalyst", "strategist")
+INSIGHT_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+def insight_datasets(agents, area: str = None) -> dict:
+    """Datasets each requested agent reads"""
+    needs = {
+        "guardian": plan_for_area(area).datasets,
+        "catalyst": CATALYST_DATASETS,
+        "strategist": STRATEGIST_DATASETS,
+    }
+    return {agent: needs[agent] for agent in agents}
+
+def _run_agent(agent: str, uid: str, area: str, datasets: dict):
+    if agent == "guardian":
+        return run_guardian_analysis(uid, area, datasets=datasets)
+    if agent == "catalyst":
+        return run_catalyst_analysis(uid, datasets=datasets)
+    return run_strategist_analysis(uid, datasets=datasets)
+
+def parse_agents(value) -> list:
+    """"guardian,strategist" (or a list) -> known agent names in a stable order; empty means all"""
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(",")]
+    requested = {name.lower() for name in value or () if name}
+    unknown = requested - set(INSIGHT_AGENTS)
+    if unknown:
+        raise ValueError(f"Unknown agents: {sorted(unknown)}")
+    return [agent for agent in INSIGHT_AGENTS if agent in requested] or list(INSIGHT_AGENTS)
+
+def _format(record: dict, event: str, fmt: str) -> str:
+    if fmt == "ndjson":
+        return json.dumps({"event": event, **record}) + "\n"
+    return sse_event(record, event=event)
+
+async def stream_insights(uid: str, agents=None, area: str = None, fmt: str = "sse"):
+    """Yield one SSE/NDJSON record per agent as it completes, then a "done" record"""
+    agents = parse_agents(agents)
+    started_at = time.perf_counter()
+    needs = insight_datasets(agents, area)
+    names = list(dict.fromkeys(name for agent in agents for name in needs[agent]))
+
+    # One load for every agent (cache first, misses fetched concurrently)
+    try:
+        datasets = await load_user_datasets(uid, names)
+    except Exception as e:
+        print(f"❌ Insights data load failed: {e}")
+        datasets = {name: {"error": "Data fetch failed"} for name in names}
+    load_ms = (time.perf_counter() - started_at) * 1000
+    print(f"📦 Insights for {uid}: loaded {len(names)} datasets once for {', '.join(agents)} "
+          f"(separate calls would load {sum(len(needs[agent]) for agent in agents)})")
+    yield _format({"datasets": names, "load_ms": round(load_ms, 2)}, "datasets", fmt)
+
+    async def run(agent):
+        agent_started = time.perf_counter()
+        try:
+            result = await _run_agent(agent, uid, area, {name: datasets.get(name) for name in needs[agent]})
+            return agent, "success", result, agent_started
+        except Exception as e:
+            print(f"❌ {agent} agent error in insights: {e}")
+            return agent, "error", {"message": f"Sorry, the {agent} agent is currently unavailable. Please try again later.", "error": str(e)}, agent_started
+
+    tasks = [asyncio.ensure_future(run(agent)) for agent in agents]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            agent, status, result, agent_started = await next_done
+            yield _format({
+                "agent": agent,
+                "status": status,
+                "response": result,
+                "elapsed_ms": round((time.perf_counter() - agent_started) * 1000, 2),
+            }, "agent", fmt)
+    finally:
+        # Client went away: stop the agents still running
+        for task in tasks:
+            task.cancel()
+
+    yield _format({
+        "agents": agents,
+        "datasets_loaded": len(names),
+        "dataset_loads_saved": sum(len(needs[agent]) for agent in agents) - len(names),
+        "total_ms": round((time.perf_counter() - started_at) * 1000, 2),
+    }, "done", fmt)
@@ -2,14 +2,12 @@
 
 from fastapi import FastAPI, Depends, HTTPException, Header, Body
 import firebase_admin
-from firebase_admin import credentials, auth, firestore, messaging
+from firebase_admin import credentials, auth, messaging
 import os
 import uuid
-import httpx
 import json
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import traceback
-import asyncio
 import jwt
 from datetime import datetime
 
@@ -18,21 +16,31 @@ import vertexai
 
 # Import agent modules
 try:
-    from oracle import process_oracle_query
-    from guardian import run_guardian_analysis
+    from oracle import process_oracle_query, stream_oracle_query
+    from guardian import run_guardian_analysis, stream_guardian_analysis
     from catalyst import run_catalyst_analysis
     from strategist import run_strategist_analysis
+    from insights import stream_insights, parse_agents, INSIGHT_FORMATS
 except ImportError as e:
     print(f"Warning: Could not import agent modules: {e}")
     # Create dummy functions
     async def process_oracle_query(uid: str, question: str):
         return {"question": question, "answer": "Oracle agent not available"}
+    async def stream_oracle_query(uid: str, question: str):
+        yield "Oracle agent not available"
     async def run_guardian_analysis(uid: str):
         return {"alerts": "Guardian agent not available"}
+    async def stream_guardian_analysis(uid: str, area: str = None):
+        yield {"event": "enriched", "alerts": "Guardian agent not available"}
     async def run_catalyst_analysis(uid: str):
         return {"opportunities": "Catalyst agent not available"}
     async def run_strategist_analysis(uid: str):
         return {"strategy": "Strategist agent not available"}
+    INSIGHT_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+    def parse_agents(value):
+        return []
+    async def stream_insights(uid: str, agents=None, area: str = None, fmt: str = "sse"):
+        yield "event: done\ndata: {\"error\": \"Agents not available\"}\n\n"
 
 # Import shared utilities
 try:
@@ -40,8 +48,15 @@ try:
         get_user_financial_data,
         get_cached_mcp_data,
         force_json_safe,
+        invalidate_user_cache,
+        cache_mcp_datasets,
+        cache_late_dataset,
+        clear_cached_mcp_data,
+        mcp_payload_cache,
+        get_swr_metrics,
         MOCK_SERVER_BASE_URL
     )
+    from mcp_store import get_store_metrics
 except ImportError as e:
     print(f"Warning: Could not import shared_utils: {e}")
     MOCK_SERVER_BASE_URL = "http://localhost:8080"
@@ -54,9 +69,87 @@ except ImportError as e:
     
     def force_json_safe(data):
         return {"mock_data": True, "timestamp": "2024-01-01T00:00:00"}
+    
+    def invalidate_user_cache(uid: str):
+        return 0
+    
+    async def cache_mcp_datasets(uid: str, datasets: dict):
+        return 0
+    
+    async def clear_cached_mcp_data(uid: str):
+        return None
+    
+    def get_store_metrics():
+        return None
+    
+    def get_swr_metrics():
+        return None
+    
+    mcp_payload_cache = None
+
+# Import the shared MCP connection pool
+from mcp_client import (
+    start_mcp_client,
+    close_mcp_client,
+    mcp_get,
+    mcp_post,
+    get_mcp_pool_metrics,
+    get_single_flight_metrics
+)
+
+# Async Firestore client and named executors for the remaining blocking calls
+from firestore_db import get_db, get_document, set_document, update_document, get_firestore_metrics
+from executors import run_blocking, shutdown_executors, get_executor_metrics
+from write_behind import stop_write_behind, get_write_behind_metrics
+from llm_gateway import get_llm_metrics
+from llm_stream import sse_answer, sse_records
+from context_builder import get_context_metrics
+from dataset_planner import get_planner_metrics
+from result_cache import get_result_cache_metrics
+from precompute import precompute_scheduler, stop_precompute, get_precompute_metrics
+from agent_jobs import agent_jobs, stop_agent_jobs, get_job_metrics, job_links
+from guardian_state import get_guardian_state_metrics
+from transaction_store import get_transaction_store_metrics
+from categorizer import get_categorizer_metrics
+from deadlines import request_deadline, within_deadline, gather_within, get_deadline_metrics
+
+# In-memory mirror of hot user profile fields
+from user_profiles import (
+    get_user_profile,
+    get_profile_field,
+    write_through,
+    stop_profile_listeners,
+    get_profile_metrics
+)
 
 app = FastAPI()
 
+# Dashboard agents kept warm in the background for active users
+precompute_scheduler.register("guardian", lambda uid, area: run_guardian_analysis(uid, area))
+precompute_scheduler.register("catalyst", lambda uid, area: run_catalyst_analysis(uid))
+precompute_scheduler.register("strategist", lambda uid, area: run_strategist_analysis(uid))
+
+# Job mode: POST /jobs/{agent} returns at once, a worker pool runs the agent
+agent_jobs.register("oracle", lambda uid, payload: process_oracle_query(uid, payload.get("question", "")))
+agent_jobs.register("guardian", lambda uid, payload: run_guardian_analysis(uid, payload.get("area")))
+agent_jobs.register("catalyst", lambda uid, payload: run_catalyst_analysis(uid))
+agent_jobs.register("strategist", lambda uid, payload: run_strategist_analysis(uid))
+
+@app.on_event("startup")
+async def startup_event():
+    await start_mcp_client()
+    precompute_scheduler.start()
+    agent_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_profile_listeners()
+    await stop_agent_jobs()
+    await stop_precompute()
+    await stop_write_behind()
+    await close_mcp_client()
+    shutdown_executors()
+
 # Add CORS middleware for frontend integration
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -86,7 +179,7 @@ async def verify_firebase_token(authorization: str = Header(...)):
         
         # Try Firebase verification first
         try:
-            decoded_token = await asyncio.to_thread(auth.verify_id_token, id_token)
+            decoded_token = await run_blocking("auth", auth.verify_id_token, id_token)
             return decoded_token['uid']
         except Exception:
             # Fallback: try to decode as JWT bridge token
@@ -105,31 +198,31 @@ async def start_fi_auth(uid: str = Depends(verify_firebase_token)):
     
     # First, create session with MCP server
     try:
-        async with httpx.AsyncClient() as client:
-            # Step 1: Create session
-            response1 = await client.get(f"{MOCK_SERVER_BASE_URL}/mockWebPage?sessionId={session_id}")
-            if response1.status_code != 200:
-                print(f"❌ Failed to create MCP session: {response1.status_code}")
-                raise HTTPException(status_code=500, detail="Failed to create MCP session")
-            
-            # Step 2: Login with session
-            response2 = await client.post(
-                f"{MOCK_SERVER_BASE_URL}/login",
-                data={"sessionId": session_id, "phoneNumber": "8888888888"}
-            )
-            if response2.status_code != 200:
-                print(f"❌ Failed to login to MCP server: {response2.status_code}")
-                raise HTTPException(status_code=500, detail="Failed to login to MCP server")
-            
-            print(f"✅ Successfully created and logged into MCP session: {session_id}")
+        # Step 1: Create session
+        response1 = await mcp_get(f"{MOCK_SERVER_BASE_URL}/mockWebPage?sessionId={session_id}")
+        if response1.status_code != 200:
+            print(f"❌ Failed to create MCP session: {response1.status_code}")
+            raise HTTPException(status_code=500, detail="Failed to create MCP session")
+        
+        # Step 2: Login with session
+        response2 = await mcp_post(
+            f"{MOCK_SERVER_BASE_URL}/login",
+            data={"sessionId": session_id, "phoneNumber": "8888888888"}
+        )
+        if response2.status_code != 200:
+            print(f"❌ Failed to login to MCP server: {response2.status_code}")
+            raise HTTPException(status_code=500, detail="Failed to login to MCP server")
+        
+        print(f"✅ Successfully created and logged into MCP session: {session_id}")
     except Exception as e:
         print(f"❌ Error setting up MCP session: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to setup MCP session: {e}")
     
     # Store session ID in Firestore
-    db = firestore.client()
+    db = get_db()
     user_doc_ref = db.collection("users").document(uid)
-    await asyncio.to_thread(user_doc_ref.set, {"fi_session_id": session_id}, merge=True)
+    await set_document(user_doc_ref, {"fi_session_id": session_id}, merge=True)
+    write_through(uid, fi_session_id=session_id)
     
     auth_url = f"{MOCK_SERVER_BASE_URL}/mockWebPage?sessionId={session_id}"
     return {"auth_url": auth_url, "session_id": session_id}
@@ -138,18 +231,43 @@ async def start_fi_auth(uid: str = Depends(verify_firebase_token)):
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for the MCP pool, caches, Firestore, executors and the LLM gateway"""
+    return {
+        "mcp_pool": get_mcp_pool_metrics(),
+        "single_flight": get_single_flight_metrics(),
+        "l1_cache": mcp_payload_cache.stats() if mcp_payload_cache else None,
+        "firestore_cache": get_store_metrics(),
+        "stale_while_revalidate": get_swr_metrics(),
+        "user_profiles": get_profile_metrics(),
+        "firestore": get_firestore_metrics(),
+        "write_behind": get_write_behind_metrics(),
+        "agent_results": get_result_cache_metrics(),
+        "executors": get_executor_metrics(),
+        "llm": get_llm_metrics(),
+        "prompt_context": get_context_metrics(),
+        "dataset_planner": get_planner_metrics(),
+        "precompute": get_precompute_metrics(),
+        "agent_jobs": get_job_metrics(),
+        "guardian_state": get_guardian_state_metrics(),
+        "transaction_store": get_transaction_store_metrics(),
+        "categorizer": get_categorizer_metrics(),
+        "deadlines": get_deadline_metrics()
+    }
+
 @app.get("/test-firestore")
 async def test_firestore():
     """Test Firestore connectivity"""
     try:
-        db = firestore.client()
+        db = get_db()
         
         # Try to read from a test document
-        test_doc = await asyncio.to_thread(db.collection("test").document("connection").get)
+        test_doc = await get_document(db.collection("test").document("connection"))
         
         # Try to write a test document
-        await asyncio.to_thread(
-            db.collection("test").document("connection").set,
+        await set_document(
+            db.collection("test").document("connection"),
             {"timestamp": datetime.utcnow().isoformat(), "status": "connected"}
         )
         
@@ -173,13 +291,11 @@ async def test_data_fetch(uid: str = Depends(verify_firebase_token)):
     print(f"🔍 TEST: Starting manual data fetch test for user {uid}")
     
     # Check if user has session
-    db = firestore.client()
-    user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
-    if not user_doc.exists:
+    profile = await get_user_profile(uid)
+    if profile is None:
         return {"error": "User document not found"}
     
-    user_data = user_doc.to_dict()
-    session_id = user_data.get("fi_session_id")
+    session_id = profile.get("fi_session_id")
     
     if not session_id:
         return {"error": "No session ID found. Please authenticate first."}
@@ -195,7 +311,7 @@ async def test_data_fetch(uid: str = Depends(verify_firebase_token)):
     return {
         "session_id": session_id,
         "bank_transactions": bank_tx,
-        "user_exists": user_doc.exists,
+        "user_exists": True,
         "has_session": bool(session_id)
     }
 
@@ -203,11 +319,14 @@ async def test_data_fetch(uid: str = Depends(verify_firebase_token)):
 async def clear_cache(uid: str = Depends(verify_firebase_token)):
     """Clear the MCP data cache for a user to force fresh data fetching"""
     try:
-        db = firestore.client()
+        db = get_db()
         user_doc_ref = db.collection("users").document(uid)
         
-        # Remove the mcp_data_cache field
-        await asyncio.to_thread(user_doc_ref.update, {"mcp_data_cache": None})
+        # Drop the in-process and per-dataset Firestore copies
+        await clear_cached_mcp_data(uid)
+        
+        # Remove the legacy mcp_data_cache summary field
+        await update_document(user_doc_ref, {"mcp_data_cache": None})
         
         print(f"✅ Cleared cache for user {uid}")
         return {"status": "success", "message": "Cache cleared successfully"}
@@ -220,34 +339,34 @@ async def clear_cache(uid: str = Depends(verify_firebase_token)):
 async def setup_mcp_session(uid: str = Depends(verify_firebase_token)):
     """Setup MCP session for a user if they don't have one"""
     try:
-        db = firestore.client()
-        user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
+        db = get_db()
+        profile = await get_user_profile(uid, db)
         
-        if user_doc.exists and "fi_session_id" in user_doc.to_dict():
-            session_id = user_doc.to_dict()["fi_session_id"]
+        if profile and profile.get("fi_session_id"):
+            session_id = profile["fi_session_id"]
             return {"status": "success", "message": "Session already exists", "session_id": session_id}
         
         # Create new session
         session_id = str(uuid.uuid4())
         
         # Setup session with MCP server
-        async with httpx.AsyncClient() as client:
-            # Step 1: Create session
-            response1 = await client.get(f"{MOCK_SERVER_BASE_URL}/mockWebPage?sessionId={session_id}")
-            if response1.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to create MCP session")
-            
-            # Step 2: Login with session
-            response2 = await client.post(
-                f"{MOCK_SERVER_BASE_URL}/login",
-                data={"sessionId": session_id, "phoneNumber": "9999999999"}
-            )
-            if response2.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to login to MCP server")
+        # Step 1: Create session
+        response1 = await mcp_get(f"{MOCK_SERVER_BASE_URL}/mockWebPage?sessionId={session_id}")
+        if response1.status_code != 200:
+            raise HTTPException(status_code=500, detail="Failed to create MCP session")
+        
+        # Step 2: Login with session
+        response2 = await mcp_post(
+            f"{MOCK_SERVER_BASE_URL}/login",
+            data={"sessionId": session_id, "phoneNumber": "9999999999"}
+        )
+        if response2.status_code != 200:
+            raise HTTPException(status_code=500, detail="Failed to login to MCP server")
         
         # Store session ID in Firestore
         user_doc_ref = db.collection("users").document(uid)
-        await asyncio.to_thread(user_doc_ref.set, {"fi_session_id": session_id}, merge=True)
+        await set_document(user_doc_ref, {"fi_session_id": session_id}, merge=True)
+        write_through(uid, fi_session_id=session_id)
         
         return {"status": "success", "message": "MCP session created successfully", "session_id": session_id}
         
@@ -281,58 +400,132 @@ async def test_fcm():
 # --- Prefetch Data Endpoint ---
 @app.post("/prefetch-data")
 async def prefetch_data(uid: str = Depends(verify_firebase_token)):
-    db = firestore.client()
-    # Fetch all MCP data types in parallel
-    net_worth, bank_tx, credit, epf, mf_tx, stock_tx = await asyncio.gather(
-        get_user_financial_data(uid, tool_name="fetch_net_worth"),
-        get_user_financial_data(uid, tool_name="fetch_bank_transactions"),
-        get_user_financial_data(uid, tool_name="fetch_credit_report"),
-        get_user_financial_data(uid, tool_name="fetch_epf_details"),
-        get_user_financial_data(uid, tool_name="fetch_mf_transactions"),
-        get_user_financial_data(uid, tool_name="fetch_stock_transactions")
-    )
-    mcp_data = {
-        "net_worth": net_worth,
-        "bank_transactions": bank_tx,
-        "credit_report": credit,
-        "epf_details": epf,
-        "mf_transactions": mf_tx,
-        "stock_transactions": stock_tx,
-        "mcp_cache_timestamp": datetime.utcnow().isoformat()
-    }
+    # Fetch all MCP data types in parallel; whatever is not back within the deadline is reported
+    # as unavailable and cached once it arrives
+    names = ["net_worth", "bank_transactions", "credit_report", "epf_details", "mf_transactions", "stock_transactions"]
+    with request_deadline():
+        mcp_data = await gather_within(
+            {name: get_user_financial_data(uid, tool_name=f"fetch_{name}") for name in names},
+            stage="prefetch",
+            share=1.0,
+            on_late=lambda name, data: cache_late_dataset(uid, name, data)
+        )
+    unavailable = [name for name in names if isinstance(mcp_data[name], dict) and mcp_data[name].get("unavailable")]
+    mcp_data["mcp_cache_timestamp"] = datetime.utcnow().isoformat()
     safe_mcp_data = force_json_safe(mcp_data)
     
-    # Try to save to Firestore with error handling
+    # Try to save the full datasets to Firestore with error handling
     try:
-        await asyncio.to_thread(db.collection("users").document(uid).set, {"mcp_data_cache": safe_mcp_data}, merge=True)
-        print("✅ SUCCESS: MCP data cached in Firestore")
+        written = await cache_mcp_datasets(uid, mcp_data)
+        print(f"✅ SUCCESS: {written} MCP datasets cached in Firestore")
     except Exception as e:
         print(f"❌ WARNING: Failed to cache MCP data in Firestore: {e}")
         # Continue without caching - the app will still work
     
-    return {"status": "prefetched", "mcp_data": safe_mcp_data}
+    # Fresh data: recompute the dashboard agents in the background so the next tap is instant
+    precompute_scheduler.schedule(uid, reason="prefetch")
+    
+    return {"status": "prefetched", "mcp_data": safe_mcp_data, "unavailable": unavailable}
 
 # --- Agent Endpoints ---
 @app.post("/ask-oracle")
 async def ask_oracle(uid: str = Depends(verify_firebase_token), body: dict = Body(...)):
     """Oracle Agent - AI-powered personal finance assistant"""
     question = body.get("question", "")
-    return await process_oracle_query(uid, question)
+    with request_deadline():
+        return await process_oracle_query(uid, question)
+
+@app.post("/ask-oracle/stream")
+async def ask_oracle_stream(uid: str = Depends(verify_firebase_token), body: dict = Body(...)):
+    """Oracle Agent, streamed: the answer arrives as server-sent events while Gemini writes it"""
+    question = body.get("question", "")
+    return StreamingResponse(
+        sse_answer(within_deadline(stream_oracle_query(uid, question)), question=question),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/run-guardian")
 async def run_guardian(uid: str = Depends(verify_firebase_token), body: dict = Body(None)):
-    """Guardian Agent - AI financial safety agent"""
-    return await run_guardian_analysis(uid)
+    """Guardian Agent - AI financial safety agent (served from the background precompute when available)"""
+    with request_deadline():
+        result, freshness = await precompute_scheduler.serve(uid, "guardian", lambda: run_guardian_analysis(uid))
+    return {**result, "freshness": freshness}
+
+@app.post("/run-guardian/stream")
+async def run_guardian_stream(uid: str = Depends(verify_firebase_token), body: dict = Body(None)):
+    """Guardian, progressively: an "alerts" event with the rule-based alerts within milliseconds of the data
+    loading, then an "enriched" event once Gemini has explained them. Body: {"area": ...}"""
+    area = (body or {}).get("area")
+    return StreamingResponse(
+        sse_records(within_deadline(stream_guardian_analysis(uid, area)), agent="guardian"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/run-catalyst")
 async def run_catalyst(uid: str = Depends(verify_firebase_token), body: dict = Body(None)):
-    """Catalyst Agent - AI financial growth agent"""
-    return await run_catalyst_analysis(uid)
+    """Catalyst Agent - AI financial growth agent (served from the background precompute when available)"""
+    with request_deadline():
+        result, freshness = await precompute_scheduler.serve(uid, "catalyst", lambda: run_catalyst_analysis(uid))
+    return {**result, "freshness": freshness}
 
 @app.post("/run-strategist")
 async def run_strategist(uid: str = Depends(verify_firebase_token), body: dict = Body(None)):
-    """Strategist Agent - Investment strategy expert"""
-    return await run_strategist_analysis(uid)
+    """Strategist Agent - Investment strategy expert (served from the background precompute when available)"""
+    with request_deadline():
+        result, freshness = await precompute_scheduler.serve(uid, "strategist", lambda: run_strategist_analysis(uid))
+    return {**result, "freshness": freshness}
+
+@app.post("/insights")
+async def insights(uid: str = Depends(verify_firebase_token), body: dict = Body(None)):
+    """Guardian, Catalyst and Strategist in one call: shared data load, agents run concurrently,
+    each result streamed as soon as it is ready. Body: {"agents": [...], "area": ..., "format": "sse" | "ndjson"}"""
+    body = body or {}
+    fmt = body.get("format", "sse")
+    if fmt not in INSIGHT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(INSIGHT_FORMATS)}")
+    try:
+        agents = parse_agents(body.get("agents"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        within_deadline(stream_insights(uid, agents, body.get("area"), fmt)),
+        media_type=INSIGHT_FORMATS[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- Agent Jobs ---
+@app.post("/jobs/{agent}", status_code=202)
+async def submit_agent_job(agent: str, uid: str = Depends(verify_firebase_token), body: dict = Body(None)):
+    """Run an agent (oracle, guardian, catalyst, strategist) as a background job; returns the job id at once.
+    Body is the agent's usual input, e.g. {"question": ...} for oracle or {"area": ...} for guardian."""
+    payload = body or {}
+    if agent not in agent_jobs.agents:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent}")
+    if agent == "oracle" and not payload.get("question"):
+        raise HTTPException(status_code=400, detail="Question is required")
+    job = await agent_jobs.submit(uid, agent, payload)
+    return job_links(job)
+
+@app.get("/jobs/{job_id}")
+async def get_agent_job(job_id: str, uid: str = Depends(verify_firebase_token), wait: float = 0):
+    """Job status and, once finished, its result. ?wait=N long-polls up to N seconds (max 30) for it to finish."""
+    job = await agent_jobs.get(job_id, uid)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait > 0:
+        job = await agent_jobs.wait(job_id, timeout=min(wait, 30)) or job
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def agent_job_events(job_id: str, uid: str = Depends(verify_firebase_token)):
+    """Job progress as server-sent events: "status" on each change, then "done" with the job (result or error)"""
+    return StreamingResponse(
+        agent_jobs.events(job_id, uid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # --- Notification Endpoint ---
 @app.post("/send-notification")
@@ -358,14 +551,9 @@ async def send_notification(uid: str = Depends(verify_firebase_token), body: dic
         # 2. If not in request body, try Firestore
         if not fcm_token:
             try:
-                db = firestore.client()
-                user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
-                
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
-                    fcm_token = user_data.get('fcm_token')
-                    if fcm_token:
-                        print(f"✅ Using FCM token from Firestore: {fcm_token[:50]}...")
+                fcm_token = await get_profile_field(uid, "fcm_token")
+                if fcm_token:
+                    print(f"✅ Using FCM token from Firestore: {fcm_token[:50]}...")
             except Exception as e:
                 print(f"⚠️ Could not get FCM token from Firestore: {e}")
         
@@ -390,7 +578,7 @@ async def send_notification(uid: str = Depends(verify_firebase_token), body: dic
         
         # Send the message
         try:
-            response = await asyncio.to_thread(messaging.send, message)
+            response = await run_blocking("messaging", messaging.send, message)
             print(f"✅ Notification sent successfully: {response}")
         except Exception as fcm_error:
             print(f"❌ FCM send error: {fcm_error}")
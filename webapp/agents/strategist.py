@@ -1,21 +1,28 @@
 # Strategist Agent - Investment strategy expert
 
-import asyncio
 import json
-from firebase_admin import firestore
 from datetime import datetime
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from firestore_db import get_db
+from result_cache import data_fingerprint, get_cached_result, store_result, get_last_result
+from context_builder import build_context, report_prompt_tokens
+
+# Bump whenever the prompt below changes so cached results are not reused
+PROMPT_VERSION = "strategist-v2"
+
+STRATEGIST_DATASETS = ("stock_transactions", "mf_transactions")
+
 try:
     from shared_utils import (
         get_user_financial_data,
         get_cached_mcp_data,
-        call_gemini_text,
-        force_json_safe,
-        market_data_tool
+        load_user_datasets,
+        call_gemini,
+        force_json_safe
     )
 except ImportError as e:
     print(f"Warning: Could not import shared_utils: {e}")
@@ -26,19 +33,22 @@ except ImportError as e:
     async def get_cached_mcp_data(uid: str):
         return {"error": "No cache available"}
     
-    def call_gemini_text(prompt: str, model_name="gemini-2.5-flash", tools=None, timeout=45):
+    async def load_user_datasets(uid: str, datasets):
+        return {name: {"error": f"Mock data for {name}"} for name in datasets}
+    
+    async def call_gemini(prompt: str, uid: str = None, priority: str = "background", model_name="gemini-2.5-flash", tools=None, timeout=45):
         return f"Mock response to: {prompt[:100]}..."
     
     def force_json_safe(data):
         return {"mock_data": True, "timestamp": "2024-01-01T00:00:00"}
-    
-    # Mock market data tool
-    market_data_tool = None
 
-async def run_strategist_analysis(uid: str):
-    """Run Strategist analysis for investment recommendations"""
+async def run_strategist_analysis(uid: str, datasets: dict = None):
+    """Run Strategist analysis for investment recommendations.
+
+    datasets: already-loaded datasets to use instead of loading them (see insights.py)
+    """
     try:
-        db = firestore.client()
+        db = get_db()
     except Exception as e:
         print(f"Warning: Could not initialize Firestore: {e}")
         # Return a mock response if Firebase is not available
@@ -54,43 +64,12 @@ async def run_strategist_analysis(uid: str):
     # Initialize variables
     stock_tx = mf_tx = None
     
-    # Try cache first
+    # Cached datasets first (L1, then the full-fidelity Firestore cache); only misses hit MCP
     try:
-        mcp_cache = await get_cached_mcp_data(uid)
-        if mcp_cache and isinstance(mcp_cache, dict):
-            stock_tx = mcp_cache.get("stock_transactions")
-            mf_tx = mcp_cache.get("mf_transactions")
-        else:
-            try:
-                stock_tx, mf_tx = await asyncio.gather(
-                    get_user_financial_data(uid, tool_name="fetch_stock_transactions"),
-                    get_user_financial_data(uid, tool_name="fetch_mf_transactions")
-                )
-                # Ensure all results are dictionaries
-                if stock_tx is None:
-                    stock_tx = {"error": "Stock transactions fetch failed"}
-                if mf_tx is None:
-                    mf_tx = {"error": "Mutual fund transactions fetch failed"}
-            except Exception as e:
-                print(f"❌ Error in asyncio.gather: {e}")
-                stock_tx = {"error": "Stock transactions fetch failed"}
-                mf_tx = {"error": "Mutual fund transactions fetch failed"}
-            # Update cache
-            try:
-                mcp_data = mcp_cache if isinstance(mcp_cache, dict) else {}
-                mcp_data.update({
-                    "stock_transactions": stock_tx,
-                    "mf_transactions": mf_tx,
-                    "mcp_cache_timestamp": datetime.utcnow().isoformat()
-                })
-                safe_mcp_data = force_json_safe(mcp_data)
-                
-                # Try to save to Firestore with error handling
-                await asyncio.to_thread(db.collection("users").document(uid).set, {"mcp_data_cache": safe_mcp_data}, merge=True)
-                print("✅ SUCCESS: Strategist MCP data cached in Firestore")
-            except Exception as e:
-                print(f"❌ WARNING: Failed to cache Strategist MCP data in Firestore: {e}")
-                # Continue without caching - the app will still work
+        if datasets is None:
+            datasets = await load_user_datasets(uid, list(STRATEGIST_DATASETS))
+        stock_tx = datasets.get("stock_transactions")
+        mf_tx = datasets.get("mf_transactions")
     except Exception as e:
         print(f"❌ Error fetching data: {e}")
         stock_tx = mf_tx = {"error": "Data fetch failed"}
@@ -132,19 +111,28 @@ async def run_strategist_analysis(uid: str):
     mf_data = mf_tx if mf_tx and not mf_tx.get('error') else "unavailable"
     data = {"stock_transactions": stock_data, "mf_transactions": mf_data}
     
+    # Same inputs as a previous run -> same answer; skip Gemini entirely
+    fingerprint = data_fingerprint("strategist", PROMPT_VERSION, None, data)
+    cached = await get_cached_result(uid, "strategist", fingerprint)
+    if cached is not None:
+        print(f"⚡ Strategist result cache hit for {uid}")
+        return {"strategy": json.dumps(cached)}
+    
+    context = build_context(data, agent="strategist")
     prompt = (
         "You are an expert Investment Strategist for the Indian market. "
-        "You receive the user's stock and mutual fund transactions as JSON. "
+        "You receive precomputed JSON summaries of the user's stock and mutual fund holdings (net invested, units, activity). "
         "Analyze the portfolio and provide specific buy/sell/hold recommendations with price targets and risk assessment. "
         "If any data is 'unavailable', still provide at least two actionable, proactive recommendations for the user. "
         "If the user's portfolio is perfect, still suggest at least two ways to improve diversification, reduce risk, or optimize returns. "
         "Respond ONLY in a valid JSON object: "
         '{"summary":"...", "recommendations":[{"symbol":"...", "advice":"buy/sell/hold", "reasoning":"...", "current_price":1500, "price_analysis":{"target":1800, "stop_loss":1400, "potential_return":20}, "risk_assessment":{"level":"medium", "level_percentage":60, "description":"..."}, "action_items":["...", "..."]}]}'"\n"
-        f"User's Portfolio Data:\n{json.dumps(data)}"
+        f"User's Portfolio Data:\n{context.text}"
     )
+    report_prompt_tokens("strategist", prompt, context)
     
     try:
-        answer = await asyncio.to_thread(call_gemini_text, prompt, tools=[market_data_tool])
+        answer = await call_gemini(prompt, uid=uid, priority="background", tools=["get_market_performance"])
     except Exception as e:
         print(f"❌ Error calling Gemini: {e}")
         # Return fallback strategy if Gemini fails
@@ -166,8 +154,19 @@ async def run_strategist_analysis(uid: str):
                 {"symbol": "CASH", "advice": "Increase Equity Allocation", "reasoning": "If you have excess cash, consider allocating more to equities for long-term growth."}
             ]
         parsed['recommendations'] = recs
+        # Cache the result under its data fingerprint (write-behind, off the request path)
+        try:
+            store_result(uid, "strategist", fingerprint, parsed, PROMPT_VERSION)
+        except Exception as e:
+            print(f"❌ WARNING: Failed to cache Strategist result in Firestore: {e}")
         return {"strategy": json.dumps(parsed)}
     except Exception:
+        try:
+            cache = await get_last_result(uid, "strategist")
+            if cache:
+                return {"strategy": json.dumps(cache)}
+        except Exception as e:
+            print(f"❌ WARNING: Failed to read Strategist result cache: {e}")
         fallback = {
             "summary": "Could not analyze portfolio, but here are some general recommendations.",
             "recommendations": [
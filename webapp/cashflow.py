@@ -0,0 +1,143 @@
+# Cashflow analytics
+#
+# The health scores used stand-ins for the user's actual cashflow: a fixed
+# monthly_expenses of 50000, the number of MF transactions as a savings rate,
+# and the whole history's income times 12 as annual income. The prompt
+# context rebuilt monthly totals row by row in Python.
+#
+# build_cashflow() turns transaction arrays into monthly series in one
+# vectorized pass: income, expenses and expenses per category, one bincount
+# each over a month index. Months without transactions are kept as zeros so
+# the series are contiguous and windows mean calendar months. A latest month
+# that the data only partly covers is marked incomplete, and trailing
+# windows skip it so a half month does not read as low spending.
+
+from typing import NamedTuple
+
+import numpy as np
+
+from categorizer import categorize_many
+from transaction_store import RequestMemo
+
+ROLLING_MONTHS = 3
+# The latest month counts as complete once the data reaches this day of it
+COMPLETE_FROM_DAY = 25
+
+class Cashflow(NamedTuple):
+    months: np.ndarray             # datetime64[M], every month from the first transaction to the last
+    income: np.ndarray             # credits per month
+    expenses: np.ndarray           # debits per month
+    categories: list               # expense categories (columns of category_expenses)
+    category_expenses: np.ndarray  # debits per month and category
+    complete: np.ndarray           # bool per month: False for a latest month the data only partly covers
+
+    @property
+    def net(self) -> np.ndarray:
+        return self.income - self.expenses
+
+    @property
+    def savings_rate(self) -> np.ndarray:
+        """Net over income per month (NaN without income)"""
+        return np.divide(self.net, self.income, out=np.full(self.income.size, np.nan), where=self.income > 0)
+
+    def rolling(self, window: int = ROLLING_MONTHS) -> dict:
+        """Trailing window averages per month (shorter windows at the start of the history)"""
+        income, expenses = rolling_mean(self.income, window), rolling_mean(self.expenses, window)
+        return {
+            "income": income,
+            "expenses": expenses,
+            "savings_rate": np.divide(income - expenses, income, out=np.full(income.size, np.nan), where=income > 0),
+            "category_expenses": rolling_mean(self.category_expenses, window),
+        }
+
+class CashflowWindow(NamedTuple):
+    months: int                # months averaged (0: no data)
+    start: str                 # "YYYY-MM" or None
+    end: str
+    avg_income: float
+    avg_expenses: float
+    savings_rate: float        # None without income
+    category_expenses: dict    # average per month, largest first
+
+_memo = RequestMemo()  # columns -> cashflow, for the consumers of one request (see transaction_store)
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over up to window rows (along the first axis)"""
+    if values.shape[0] == 0:
+        return values.astype(np.float64)
+    sums = np.cumsum(values, axis=0, dtype=np.float64)
+    sums[window:] -= sums[:-window].copy()
+    counts = np.minimum(np.arange(1, values.shape[0] + 1), window)
+    return sums / counts.reshape((-1,) + (1,) * (values.ndim - 1))
+
+def build_cashflow(dates: np.ndarray, amounts: np.ndarray, is_credit: np.ndarray, is_debit: np.ndarray,
+                   category_codes: np.ndarray = None, category_names=()) -> Cashflow:
+    """Monthly series from per-row arrays; category_codes index category_names (optional)"""
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    amounts = np.asarray(amounts, dtype=np.float64)
+    valid = ~np.isnat(dates) & np.isfinite(amounts)
+    category_names = list(category_names) if category_codes is not None else []
+    if not valid.any():
+        return Cashflow(np.array([], dtype="datetime64[M]"), np.zeros(0), np.zeros(0), category_names,
+                        np.zeros((0, len(category_names))), np.zeros(0, dtype=bool))
+
+    days = dates[valid]
+    months = days.astype("datetime64[M]")
+    first, last = months.min(), months.max()
+    index = (months - first).astype(np.int64)
+    n_months = int(index.max()) + 1
+    amounts = amounts[valid]
+    debits = np.where(np.asarray(is_debit)[valid], amounts, 0.0)
+    income = np.bincount(index, weights=np.where(np.asarray(is_credit)[valid], amounts, 0.0), minlength=n_months)
+    expenses = np.bincount(index, weights=debits, minlength=n_months)
+
+    n_categories = len(category_names)
+    if n_categories:
+        cells = index * n_categories + np.asarray(category_codes)[valid]
+        by_category = np.bincount(cells, weights=debits, minlength=n_months * n_categories).reshape(n_months, n_categories)
+    else:
+        by_category = np.zeros((n_months, 0))
+
+    complete = np.ones(n_months, dtype=bool)
+    complete[-1] = int((days.max() - last.astype("datetime64[D]")).astype(np.int64)) + 1 >= COMPLETE_FROM_DAY
+    return Cashflow(first + np.arange(n_months), income, expenses, category_names, by_category, complete)
+
+def cashflow_from_columns(columns) -> Cashflow:
+    """Cashflow for shared transaction columns, with expense categories; computed once per columns object"""
+    cashflow = _memo.get(columns)
+    if cashflow is not None:
+        return cashflow
+    # Categories per distinct narration, then per row
+    names, vocabulary_codes = np.unique(categorize_many(columns.narrations).astype(str), return_inverse=True)
+    codes = vocabulary_codes.reshape(-1)[columns.narration_codes]
+    cashflow = build_cashflow(columns.dates, columns.amounts, columns.is_credit, columns.is_debit, codes, names.tolist())
+    _memo.put(columns, cashflow)
+    return cashflow
+
+def trailing_window(cashflow: Cashflow, months: int = ROLLING_MONTHS) -> CashflowWindow:
+    """Averages over the latest complete months (the partial latest month only if there is nothing else)"""
+    end = len(cashflow.months)
+    if end > 1 and not cashflow.complete[-1]:
+        end -= 1
+    start = max(0, end - months)
+    if end == 0:
+        return CashflowWindow(0, None, None, 0.0, 0.0, None, {})
+    income = float(cashflow.income[start:end].sum())
+    expenses = float(cashflow.expenses[start:end].sum())
+    count = end - start
+    per_category = cashflow.category_expenses[start:end].sum(axis=0) / count
+    return CashflowWindow(
+        months=count,
+        start=str(cashflow.months[start]),
+        end=str(cashflow.months[end - 1]),
+        avg_income=round(income / count, 2),
+        avg_expenses=round(expenses / count, 2),
+        savings_rate=round((income - expenses) / income, 4) if income > 0 else None,
+        category_expenses={
+            name: round(float(value), 2)
+            for value, name in sorted(zip(per_category, cashflow.categories), key=lambda item: -item[0]) if value > 0
+        },
+    )
+
+def clear_cashflow_memo():
+    _memo.clear()
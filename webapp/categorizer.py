@@ -0,0 +1,161 @@
+# Transaction categorizer
+#
+# Categories used to come from two hard-coded keyword chains (context_builder
+# and invested-backend/pipelines) that disagreed and ran one `any(keyword in
+# text)` per category per narration. The taxonomy now lives in
+# category_taxonomy.csv (or the file named by TRANSACTION_TAXONOMY): one row
+# per category, keywords separated by ";", earlier rows winning. Keywords
+# match whole words only, so "emi" does not fire inside "premium" nor "ola"
+# inside "chocolate".
+#
+# All keywords are compiled into one trie-shaped regex, so each position of a
+# narration is matched against the alphabet rather than against every keyword,
+# and adding categories does not slow the scan. A batch of narrations is
+# joined into one string and scanned in a single pass; the best-priority
+# keyword per narration is then picked with np.minimum.at.
+#
+# Precedence follows the old context_builder list: Income comes before Food &
+# Dining (the pipelines chain checked food first), so a salary narration that
+# also names a restaurant is income.
+#
+# Results are memoized per narration with its digits removed, so the same
+# merchant with a different reference number is only categorized once.
+
+import csv
+import os
+import re
+import time
+
+import numpy as np
+
+TAXONOMY_PATH = os.getenv("TRANSACTION_TAXONOMY", os.path.join(os.path.dirname(__file__), "category_taxonomy.csv"))
+DEFAULT_CATEGORY = "Other"
+CATEGORY_MEMO_SIZE = 100_000
+DIGITS = str.maketrans("", "", "0123456789")
+SEPARATOR = "\n"
+
+def load_taxonomy(path: str = TAXONOMY_PATH) -> dict:
+    """{category: (keywords, ...)} in priority order, from a category,keywords CSV"""
+    taxonomy = {}
+    with open(path, newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            category = (row.get("category") or "").strip()
+            keywords = tuple(word.strip() for word in (row.get("keywords") or "").split(";") if word.strip())
+            if category and keywords:
+                taxonomy[category] = taxonomy.get(category, ()) + keywords
+    return taxonomy
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+def _normalize(text) -> str:
+    return (text if isinstance(text, str) else str(text or "")).lower().translate(DIGITS).replace(SEPARATOR, " ")
+
+def _trie_pattern(words) -> str:
+    """Regex matching the longest of words at a position, shaped as a trie (one branch per next character)"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def pattern(node) -> str:
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return pattern(trie)
+
+class Categorizer:
+    """Keyword categorizer compiled from a taxonomy ({category: keywords} in priority order)"""
+
+    def __init__(self, taxonomy: dict):
+        self.categories = list(taxonomy) + [DEFAULT_CATEGORY]
+        self._default_rank = len(self.categories) - 1
+        ranks = {}
+        for rank, keywords in enumerate(taxonomy.values()):
+            for keyword in keywords:
+                ranks.setdefault(_normalize(keyword), rank)
+        ranks.pop("", None)
+        # The regex finds the longest whole-word keyword at each position; a shorter
+        # keyword that is a prefix of it ending on a word boundary matched there too,
+        # so take the best rank among them
+        self._ranks = {
+            keyword: min(
+                ranks.get(keyword[:end], rank) for end in range(1, len(keyword) + 1)
+                if end == len(keyword) or _is_word(keyword[end - 1]) != _is_word(keyword[end])
+            )
+            for keyword, rank in ranks.items()
+        }
+        self._regex = re.compile(rf"(?=\b({_trie_pattern(ranks)})\b)") if ranks else None
+        self._memo = {}
+        self._stats = {"narrations": 0, "memo_hits": 0, "scanned": 0, "scanned_chars": 0, "scan_ms": 0.0}
+
+    def _scan(self, texts: list) -> list:
+        """Category per normalized text, in one pass over all of them"""
+        started_at = time.perf_counter()
+        best = np.full(len(texts), self._default_rank, dtype=np.int64)
+        if self._regex is not None and texts:
+            blob = SEPARATOR.join(texts)
+            found = [(match.start(), self._ranks[match.group(1)]) for match in self._regex.finditer(blob)]
+            if found:
+                starts, ranks = np.array(found, dtype=np.int64).T
+                lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                np.minimum.at(best, np.searchsorted(offsets, starts, side="right") - 1, ranks)
+            self._stats["scanned_chars"] += len(blob)
+        self._stats["scanned"] += len(texts)
+        self._stats["scan_ms"] += (time.perf_counter() - started_at) * 1000
+        return [self.categories[rank] for rank in best]
+
+    def categorize_many(self, narrations) -> np.ndarray:
+        """Category per narration (object array)"""
+        keys = [_normalize(text) for text in narrations]
+        memo = self._memo
+        missing = [key for key in dict.fromkeys(keys) if key not in memo]
+        if len(memo) + len(missing) > CATEGORY_MEMO_SIZE:
+            memo.clear()
+        memo.update(zip(missing, self._scan(missing)))
+        self._stats["narrations"] += len(keys)
+        self._stats["memo_hits"] += len(keys) - len(missing)
+        return np.array([memo[key] for key in keys], dtype=object)
+
+    def categorize(self, narration) -> str:
+        category = self._memo.get(_normalize(narration))
+        if category is None:
+            return self.categorize_many([narration])[0]
+        self._stats["narrations"] += 1
+        self._stats["memo_hits"] += 1
+        return category
+
+    def get_metrics(self) -> dict:
+        return {
+            **self._stats,
+            "scan_ms": round(self._stats["scan_ms"], 2),
+            "categories": len(self.categories),
+            "keywords": len(self._ranks),
+            "memoized": len(self._memo),
+            "hit_rate": round(self._stats["memo_hits"] / self._stats["narrations"], 3) if self._stats["narrations"] else 0.0,
+        }
+
+_categorizer = None
+
+def get_categorizer() -> Categorizer:
+    """Categorizer for TAXONOMY_PATH, built on first use"""
+    global _categorizer
+    if _categorizer is None:
+        _categorizer = Categorizer(load_taxonomy())
+        print(f"🏷️ Loaded {len(_categorizer.categories) - 1} transaction categories from {TAXONOMY_PATH}")
+    return _categorizer
+
+def categorize(narration) -> str:
+    return get_categorizer().categorize(narration)
+
+def categorize_many(narrations) -> np.ndarray:
+    return get_categorizer().categorize_many(narrations)
+
+def get_categorizer_metrics() -> dict:
+    return get_categorizer().get_metrics()
@@ -0,0 +1,9 @@
+import pytest
+
+from test_support import restore_patches
+
+@pytest.fixture(autouse=True)
+def _restore_patches():
+    """Undo test_support.patch() calls after every test, so fakes do not leak into the next file"""
+    yield
+    restore_patches()
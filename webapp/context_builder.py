@@ -0,0 +1,415 @@
+# Compact, token-budgeted financial context for agent prompts
+#
+# Agents used to paste json.dumps() of the raw MCP payloads into every prompt,
+# so prompt size (and Gemini latency/cost) grew with account history. This
+# module reduces each dataset to precomputed aggregates (monthly cashflow and
+# its recent trend from the cashflow module, category totals, holdings,
+# largest unusual debits, recent transactions) and
+# trims the least important detail until the context fits a token budget.
+# The bank summary reads the shared transaction columns (transaction_store.py)
+# rather than walking the rows again.
+# Trimming drops list items, then whole sections, so the context is always
+# valid JSON.
+
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from cashflow import cashflow_from_columns, trailing_window
+from transaction_store import TYPE_CREDIT, TYPE_DEBIT, _num, transaction_columns
+
+# Default context budget per prompt; override per call with budget_tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Gemini averages roughly four characters per token on this kind of JSON
+CHARS_PER_TOKEN = 4
+RECENT_TRANSACTIONS = 15
+MONTHS_OF_CASHFLOW = 12
+TOP_ANOMALIES = 5
+TOP_ITEMS = 15
+# Long lists in the raw datasets are sized from this many evenly spaced items
+SOURCE_SAMPLE_ITEMS = 32
+# Stands in for a section dropped to fit the budget
+OMITTED = "omitted to fit the context budget"
+# Fi MCP investment transaction type codes
+BUY_TYPES = {1, "1", "BUY"}
+SELL_TYPES = {2, "2", "SELL"}
+
+class PromptContext(NamedTuple):
+    """Serialized context for a prompt plus its size accounting"""
+    text: str
+    tokens: int          # estimated tokens of text
+    source_tokens: int   # estimated tokens the raw datasets would have cost (sampled)
+    trimmed: bool        # detail was dropped to fit the budget
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+def _estimate_chars(value) -> int:
+    """About len(_dumps(value)) without serializing all of it: long lists are sized from a sample, escapes ignored"""
+    if isinstance(value, str):
+        return len(value) + 2
+    if value is None or value is True:
+        return 4
+    if value is False:
+        return 5
+    if isinstance(value, float):
+        return len(float.__repr__(value))
+    if isinstance(value, int):
+        return len(int.__repr__(value))
+    if isinstance(value, dict):
+        return 1 + sum(len(str(key)) + 4 + _estimate_chars(item) for key, item in value.items()) + (not value)
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return 2
+        sample = value[::max(1, len(value) // SOURCE_SAMPLE_ITEMS)]
+        return 1 + round(sum(_estimate_chars(item) for item in sample) * len(value) / len(sample)) + len(value)
+    return len(_dumps(value))
+
+def _units(money) -> float:
+    """Fi money objects look like {"currencyCode": "INR", "units": "84642", "nanos": ...}"""
+    if isinstance(money, dict):
+        return _num(money.get("units")) + _num(money.get("nanos")) / 1e9
+    return _num(money)
+
+# --- Per-dataset summaries ---
+def summarize_bank_transactions(payload: dict) -> dict:
+    columns = transaction_columns(payload)
+    order = columns.date_order
+    accounts = []
+    for index, bank in enumerate(columns.bank_names):
+        rows = order[columns.banks[order] == index]
+        balance = columns.balances[rows[-1]] if rows.size else np.nan
+        accounts.append({"bank": bank, "transactions": int(rows.size), "balance": None if np.isnan(balance) else float(balance)})
+
+    def row(i, **fields) -> dict:
+        return {"date": str(columns.dates[i]), "amount": float(columns.amounts[i]), **fields,
+                "narration": columns.narrations[columns.narration_codes[i]][:60], "bank": columns.bank_names[columns.banks[i]]}
+
+    # Monthly series and category totals
+    series = cashflow_from_columns(columns)
+    savings_rates = series.savings_rate
+    cashflow = [
+        {"month": str(month), "income": round(float(income), 2), "expenses": round(float(expenses), 2),
+         "net": round(float(income - expenses), 2), "savings_rate": None if np.isnan(rate) else round(float(rate), 3)}
+        for month, income, expenses, rate in zip(series.months, series.income, series.expenses, savings_rates)
+    ][-MONTHS_OF_CASHFLOW:]
+    categories = dict(zip(series.categories, series.category_expenses.sum(axis=0).tolist()))
+    window = trailing_window(series)
+
+    # Unusually large debits: well above the typical debit for this user
+    debits = np.flatnonzero(columns.is_debit)
+    anomalies = []
+    if debits.size >= 3:
+        amounts = columns.amounts[debits]
+        typical = float(np.median(amounts))
+        hits = debits[amounts > max(3 * typical, float(amounts.mean()))]
+        hits = hits[np.argsort(-columns.amounts[hits], kind="stable")][:TOP_ANOMALIES]
+        anomalies = [row(i, times_typical=round(float(columns.amounts[i]) / typical, 1) if typical else None) for i in hits]
+
+    # Debits to the same payee in several different months (subscriptions, EMIs, rent)
+    recurring = []
+    merchants, merchant_of = columns.merchant_codes()
+    debits = debits[~np.isnat(columns.dates[debits])]
+    debits = debits[merchants[merchant_of[debits]] != ""]
+    if debits.size:
+        keys = merchant_of[debits]
+        days = columns.dates[debits].astype(np.int64)
+        months = columns.dates[debits].astype("datetime64[M]").astype(np.int64)
+        months -= months.min()
+        span = int(months.max()) + 1
+        month_counts = np.bincount(np.unique(keys * span + months) // span, minlength=len(merchants))
+        average = np.bincount(keys, weights=columns.amounts[debits], minlength=len(merchants)) / np.maximum(np.bincount(keys, minlength=len(merchants)), 1)
+        last_day = np.full(len(merchants), np.iinfo(np.int64).min)
+        np.maximum.at(last_day, keys, days)
+        found = np.flatnonzero(month_counts >= 2)
+        found = found[np.lexsort((-average[found], -month_counts[found]))][:TOP_ITEMS]
+        recurring = [
+            {"payee": str(merchants[key])[:40], "avg_amount": round(float(average[key]), 2), "months": int(month_counts[key]),
+             "last_date": str(np.datetime64(int(last_day[key]), "D"))}
+            for key in found
+        ]
+
+    # Latest first (rows without a date last)
+    latest = np.where(np.isnat(columns.dates), np.iinfo(np.int64).max, -columns.dates.astype(np.int64))
+    recent = np.argsort(latest, kind="stable")[:RECENT_TRANSACTIONS]
+    type_names = {TYPE_CREDIT: "credit", TYPE_DEBIT: "debit"}
+    return {
+        "accounts": accounts,
+        "transaction_count": columns.size,
+        "monthly_cashflow": cashflow,
+        "category_totals": {name: round(total, 2) for name, total in sorted(categories.items(), key=lambda item: -item[1]) if total > 0},
+        "cashflow_trend": {
+            "months": window.months, "from": window.start, "to": window.end,
+            "avg_monthly_income": window.avg_income, "avg_monthly_expenses": window.avg_expenses,
+            "savings_rate": window.savings_rate,
+        },
+        "top_anomalies": anomalies,
+        "recurring_debits": recurring,
+        "recent_transactions": [row(i, type=type_names.get(int(columns.types[i]), "other")) for i in recent],
+    }
+
+def summarize_credit_report(payload: dict) -> dict:
+    reports = payload.get("creditReports") or []
+    report = reports[0].get("creditReportData", {}) if reports and isinstance(reports[0], dict) else {}
+    credit_account = report.get("creditAccount") or {}
+    summary = credit_account.get("creditAccountSummary") or {}
+    accounts = []
+    for account in credit_account.get("creditAccountDetails") or []:
+        if not isinstance(account, dict):
+            continue
+        limit = _num(account.get("creditLimitAmount")) or _num(account.get("highestCreditOrOriginalLoanAmount"))
+        balance = _num(account.get("currentBalance"))
+        accounts.append({
+            "lender": account.get("subscriberName", "Unknown"),
+            "type": account.get("accountType"),
+            "status": account.get("accountStatus"),
+            "balance": balance,
+            "limit_or_sanctioned": limit,
+            "utilization_pct": round(100 * balance / limit, 1) if limit else None,
+            "past_due": _num(account.get("amountPastDue")),
+            "payment_rating": account.get("paymentRating"),
+        })
+    accounts.sort(key=lambda account: -account["balance"])
+    return {
+        "score": (report.get("score") or {}).get("bureauScore"),
+        "total_accounts": (summary.get("account") or {}).get("creditAccountTotal"),
+        "active_accounts": (summary.get("account") or {}).get("creditAccountActive"),
+        "total_outstanding": _num((summary.get("totalOutstandingBalance") or {}).get("outstandingBalanceAll")),
+        "total_past_due": round(sum(account["past_due"] for account in accounts), 2),
+        "accounts": accounts[:TOP_ITEMS],
+    }
+
+def summarize_net_worth(payload: dict) -> dict:
+    response = payload.get("netWorthResponse") or {}
+    assets = {item.get("netWorthAttribute", "UNKNOWN").replace("ASSET_TYPE_", ""): _units(item.get("value"))
+              for item in response.get("assetValues") or [] if isinstance(item, dict)}
+    liabilities = {item.get("netWorthAttribute", "UNKNOWN").replace("LIABILITY_TYPE_", ""): _units(item.get("value"))
+                   for item in response.get("liabilityValues") or [] if isinstance(item, dict)}
+    return {
+        "total_net_worth": _units(response.get("totalNetWorthValue")),
+        "assets": assets,
+        "liabilities": liabilities,
+    }
+
+def summarize_mf_transactions(payload: dict) -> dict:
+    holdings = []
+    for fund in payload.get("mfTransactions") or []:
+        if not isinstance(fund, dict):
+            continue
+        invested = units = 0.0
+        dates = []
+        for row in fund.get("txns") or []:
+            if not isinstance(row, list) or len(row) < 5:
+                continue
+            sign = -1 if row[0] in SELL_TYPES else 1
+            invested += sign * _num(row[4])
+            units += sign * _num(row[3])
+            dates.append(str(row[1]))
+        holdings.append({
+            "scheme": str(fund.get("schemeName", fund.get("isin", "Unknown")))[:60],
+            "net_invested": round(invested, 2),
+            "units": round(units, 3),
+            "transactions": len(dates),
+            "last_transaction": max(dates) if dates else None,
+        })
+    holdings.sort(key=lambda holding: -holding["net_invested"])
+    return {
+        "funds": len(holdings),
+        "total_net_invested": round(sum(holding["net_invested"] for holding in holdings), 2),
+        "holdings": holdings[:TOP_ITEMS],
+    }
+
+def summarize_stock_transactions(payload: dict) -> dict:
+    holdings = []
+    for stock in payload.get("stockTransactions") or []:
+        if not isinstance(stock, dict):
+            continue
+        quantity = invested = 0.0
+        dates = []
+        for row in stock.get("txns") or []:
+            if not isinstance(row, list) or len(row) < 3:
+                continue
+            qty = _num(row[2])
+            price = _num(row[3]) if len(row) > 3 else 0.0
+            if row[0] in SELL_TYPES:
+                quantity -= qty
+                invested -= qty * price
+            elif row[0] in BUY_TYPES:
+                quantity += qty
+                invested += qty * price
+            else:
+                quantity += qty  # bonus / split units
+            dates.append(str(row[1]))
+        holdings.append({
+            "isin": stock.get("isin", "Unknown"),
+            "quantity": round(quantity, 3),
+            "net_invested": round(invested, 2),
+            "transactions": len(dates),
+            "last_transaction": max(dates) if dates else None,
+        })
+    holdings.sort(key=lambda holding: -holding["net_invested"])
+    return {
+        "stocks": len(holdings),
+        "total_net_invested": round(sum(holding["net_invested"] for holding in holdings), 2),
+        "holdings": holdings[:TOP_ITEMS],
+    }
+
+def summarize_epf_details(payload: dict) -> dict:
+    accounts = []
+    for account in payload.get("uanAccounts") or []:
+        details = (account or {}).get("rawDetails") or {}
+        balance = details.get("overall_pf_balance") or {}
+        accounts.append({
+            "establishments": len(details.get("est_details") or []),
+            "pf_balance": _num(balance.get("current_pf_balance")),
+            "pension_balance": _num(balance.get("pension_balance")),
+        })
+    return {
+        "accounts": accounts,
+        "total_pf_balance": round(sum(account["pf_balance"] for account in accounts), 2),
+    }
+
+SUMMARIZERS = {
+    "bank_transactions": summarize_bank_transactions,
+    "credit_report": summarize_credit_report,
+    "net_worth": summarize_net_worth,
+    "net_worth_summary": summarize_net_worth,
+    "mf_transactions": summarize_mf_transactions,
+    "stock_transactions": summarize_stock_transactions,
+    "epf_details": summarize_epf_details,
+}
+
+def summarize_datasets(data: dict) -> dict:
+    """Aggregate each dataset; anything unavailable or unrecognised is passed through as-is"""
+    summary = {}
+    for name, payload in data.items():
+        summarizer = SUMMARIZERS.get(name)
+        if summarizer is None or not isinstance(payload, dict) or payload.get("error"):
+            summary[name] = payload if payload is not None else "unavailable"
+            continue
+        try:
+            summary[name] = summarizer(payload)
+        except Exception as e:
+            print(f"⚠️ Could not summarize {name}: {e}")
+            summary[name] = "unavailable"
+    return summary
+
+# --- Budget enforcement ---
+# Lists shortened (from the end) when the context is over budget, least important first
+TRIM_ORDER = [
+    ("bank_transactions", "recent_transactions"),
+    ("bank_transactions", "recurring_debits"),
+    ("mf_transactions", "holdings"),
+    ("stock_transactions", "holdings"),
+    ("credit_report", "accounts"),
+    ("bank_transactions", "top_anomalies"),
+    ("bank_transactions", "monthly_cashflow"),
+    ("goals", None),
+]
+
+def _shorten(summary: dict, dataset: str, field) -> bool:
+    """Halve one list in place; monthly cashflow keeps its most recent months. Returns False if nothing was left to cut."""
+    container = summary.get(dataset)
+    if field is not None:
+        container = container.get(field) if isinstance(container, dict) else None
+    if not isinstance(container, list) or len(container) <= 1:
+        return False
+    keep = len(container) // 2
+    if field == "monthly_cashflow":
+        del container[:len(container) - keep]
+    else:
+        del container[keep:]
+    return True
+
+def _omit_largest(summary: dict, whole_datasets: bool) -> bool:
+    """Replace the largest section with OMITTED: a field of a dataset or a dataset without fields
+    (any whole dataset with whole_datasets=True). Returns False once nothing is bigger than the marker.
+    """
+    sections = [(summary, name) for name, value in summary.items() if whole_datasets or not isinstance(value, dict)]
+    if not whole_datasets:
+        sections += [(value, key) for value in summary.values() if isinstance(value, dict) for key in value]
+    size, container, key = max(
+        ((len(_dumps(container[key])), container, key) for container, key in sections),
+        key=lambda item: item[0], default=(0, None, None),
+    )
+    if size <= len(_dumps(OMITTED)):
+        return False
+    container[key] = OMITTED
+    return True
+
+def build_context(data: dict, budget_tokens: int = None, agent: str = None, fields: dict = None) -> PromptContext:
+    """Summarize datasets and fit them into budget_tokens (CONTEXT_TOKEN_BUDGET by default).
+
+    fields optionally limits a dataset's summary to some of its keys, e.g.
+    {"bank_transactions": ("monthly_cashflow", "category_totals")}.
+    """
+    budget_tokens = budget_tokens or CONTEXT_TOKEN_BUDGET
+    # Trimming edits the summary in place: copy datasets passed through as-is, so the caller's data is untouched
+    summary = {name: value.copy() if isinstance(value, (dict, list)) else value for name, value in summarize_datasets(data).items()}
+    for name, keys in (fields or {}).items():
+        if isinstance(summary.get(name), dict):
+            summary[name] = {key: summary[name][key] for key in keys if key in summary[name]}
+    text = _dumps(summary)
+    trimmed = False
+    while estimate_tokens(text) > budget_tokens:
+        if not any(_shorten(summary, dataset, field) for dataset, field in TRIM_ORDER):
+            break
+        trimmed = True
+        text = _dumps(summary)
+    # Lists are as short as they go: drop the largest sections, fields before whole datasets
+    for whole_datasets in (False, True):
+        while estimate_tokens(text) > budget_tokens and _omit_largest(summary, whole_datasets):
+            trimmed = True
+            text = _dumps(summary)
+
+    # The raw datasets are only sized (from a sample), never serialized
+    source_tokens = (_estimate_chars(data) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    context = PromptContext(text, estimate_tokens(text), source_tokens, trimmed)
+    if agent:
+        _record(agent, context)
+    return context
+
+# --- Metrics ---
+_stats = {}  # agent -> counters
+
+def _agent_stats(agent: str) -> dict:
+    return _stats.setdefault(agent, {"prompts": 0, "context_tokens": 0, "source_tokens": 0, "prompt_tokens": 0, "trimmed": 0, "last_prompt_tokens": 0})
+
+def _record(agent: str, context: PromptContext):
+    stats = _agent_stats(agent)
+    stats["prompts"] += 1
+    stats["context_tokens"] += context.tokens
+    stats["source_tokens"] += context.source_tokens
+    stats["trimmed"] += context.trimmed
+
+def report_prompt_tokens(agent: str, prompt: str, context: PromptContext = None) -> int:
+    """Log and record the estimated token count of a finished prompt"""
+    tokens = estimate_tokens(prompt)
+    stats = _agent_stats(agent)
+    stats["prompt_tokens"] += tokens
+    stats["last_prompt_tokens"] = tokens
+    if context is not None:
+        print(f"🧮 {agent} prompt: ~{tokens} tokens (context ~{context.tokens}, raw data would be ~{context.source_tokens}{', trimmed' if context.trimmed else ''})")
+    else:
+        print(f"🧮 {agent} prompt: ~{tokens} tokens")
+    return tokens
+
+def get_context_metrics() -> dict:
+    metrics = {}
+    for agent, stats in _stats.items():
+        prompts = stats["prompts"] or 1
+        metrics[agent] = {
+            "prompts": stats["prompts"],
+            "avg_context_tokens": round(stats["context_tokens"] / prompts, 1),
+            "avg_source_tokens": round(stats["source_tokens"] / prompts, 1),
+            "tokens_saved": stats["source_tokens"] - stats["context_tokens"],
+            "avg_prompt_tokens": round(stats["prompt_tokens"] / prompts, 1),
+            "last_prompt_tokens": stats["last_prompt_tokens"],
+            "trimmed": stats["trimmed"],
+        }
+    return {"budget_tokens": CONTEXT_TOKEN_BUDGET, "agents": metrics}
@@ -0,0 +1,109 @@
+# Question/area-aware dataset planning for agent prompts
+#
+# Oracle used to load all seven datasets for every question and Guardian all
+# three for every focus area. The planner maps a question (keyword rules) or a
+# Guardian area to the datasets, and the summary fields within them, that can
+# actually answer it; only those are fetched and serialized. Anything the
+# rules don't recognise falls back to the agent's full dataset list.
+
+import json
+import re
+from typing import NamedTuple
+
+ORACLE_DATASETS = ("net_worth", "bank_transactions", "credit_report", "epf_details", "mf_transactions", "stock_transactions", "goals")
+GUARDIAN_DATASETS = ("bank_transactions", "credit_report", "mf_transactions")
+
+# Bank summary sections (see context_builder.summarize_bank_transactions)
+SPENDING_FIELDS = ("accounts", "transaction_count", "monthly_cashflow", "cashflow_trend", "category_totals", "recurring_debits", "recent_transactions")
+CASHFLOW_FIELDS = ("accounts", "monthly_cashflow", "cashflow_trend", "category_totals")
+SAFETY_FIELDS = ("accounts", "top_anomalies", "recurring_debits", "recent_transactions")
+
+class DatasetPlan(NamedTuple):
+    """Datasets to load for one request, and (optionally) which summary fields of each to keep"""
+    datasets: tuple
+    fields: dict      # dataset -> tuple of summary keys; datasets not listed keep everything
+    reason: str
+
+# Oracle: (topic, pattern, datasets, fields) — every matching rule contributes
+QUESTION_RULES = [
+    ("tax", r"\btax|80c|elss|capital gain|ltcg|stcg|deduction", ("stock_transactions", "mf_transactions", "epf_details"), {}),
+    ("spending", r"subscription|recurring|netflix|spotify|spend|spent|expense|budget|\bbills?\b|shopping|food|dining",
+     ("bank_transactions",), {"bank_transactions": SPENDING_FIELDS}),
+    ("cashflow", r"sav(e|ing)|income|salary|cash ?flow|emergency fund", ("bank_transactions", "net_worth"), {"bank_transactions": CASHFLOW_FIELDS}),
+    ("credit", r"credit|cibil|score|loan|\bemi\b|debt|card|borrow", ("credit_report",), {}),
+    ("net_worth", r"net ?worth|wealth|assets?|liabilit", ("net_worth",), {}),
+    ("goals", r"goal|retire|house|\bcar\b|wedding|education|afford", ("goals", "net_worth", "bank_transactions"), {"bank_transactions": CASHFLOW_FIELDS}),
+    ("mutual_funds", r"mutual fund|\bmf\b|\bsip|fund|\bnav\b", ("mf_transactions",), {}),
+    ("investments", r"stock|share|equity|portfolio|invest", ("stock_transactions", "mf_transactions"), {}),
+    ("epf", r"\bepf|\bpf\b|provident|pension", ("epf_details",), {}),
+    ("safety", r"fraud|suspicious|unusual|anomal", ("bank_transactions",), {"bank_transactions": SAFETY_FIELDS}),
+]
+_COMPILED_RULES = [(topic, re.compile(pattern, re.IGNORECASE), datasets, fields) for topic, pattern, datasets, fields in QUESTION_RULES]
+
+# Guardian focus areas
+AREA_PLANS = {
+    "credit_monitoring": (("credit_report",), {}),
+    "credit": (("credit_report",), {}),
+    "debt_management": (("credit_report", "bank_transactions"), {"bank_transactions": CASHFLOW_FIELDS}),
+    "spending": (("bank_transactions",), {"bank_transactions": SPENDING_FIELDS}),
+    "spending_alerts": (("bank_transactions",), {"bank_transactions": SPENDING_FIELDS}),
+    "fraud_detection": (("bank_transactions",), {"bank_transactions": SAFETY_FIELDS}),
+    "subscriptions": (("bank_transactions",), {"bank_transactions": ("recurring_debits", "recent_transactions")}),
+    "investments": (("mf_transactions",), {}),
+    "investment_risk": (("mf_transactions",), {}),
+}
+
+def plan_for_question(question: str) -> DatasetPlan:
+    """Datasets Oracle needs for a question; every dataset when nothing matches"""
+    matches = [(topic, datasets, fields) for topic, pattern, datasets, fields in _COMPILED_RULES if pattern.search(question or "")]
+    if not matches:
+        return DatasetPlan(ORACLE_DATASETS, {}, "no rule matched")
+    datasets = tuple(name for name in ORACLE_DATASETS if any(name in rule_datasets for _, rule_datasets, _ in matches))
+    fields = {}
+    for name in datasets:
+        limits = [rule_fields.get(name) for _, rule_datasets, rule_fields in matches if name in rule_datasets]
+        # A rule that wants the whole dataset wins over rules that only need some of its fields
+        if all(limits):
+            fields[name] = tuple(dict.fromkeys(key for keys in limits for key in keys))
+    return DatasetPlan(datasets, fields, "matched " + ", ".join(topic for topic, _, _ in matches))
+
+def area_key(area: str = None) -> str:
+    """Normalized focus area, e.g. "Credit Monitoring" -> "credit_monitoring" (may not be in AREA_PLANS)"""
+    return (area or "").strip().lower().replace(" ", "_")
+
+def plan_for_area(area: str = None) -> DatasetPlan:
+    """Datasets Guardian needs for a focus area; every dataset for no/unknown area"""
+    key = area_key(area)
+    if key in AREA_PLANS:
+        datasets, fields = AREA_PLANS[key]
+        return DatasetPlan(datasets, fields, f"area {key}")
+    return DatasetPlan(GUARDIAN_DATASETS, {}, f"unknown area {key}" if key else "no area")
+
+# --- Metrics ---
+# Payload sizes are measured for the first few loads of each dataset only; serializing is not free
+SIZE_SAMPLES = 32
+_avg_bytes = {}  # dataset -> (samples, mean serialized size), learned from datasets that were loaded
+_stats = {}      # agent -> counters
+
+def record_plan(agent: str, plan: DatasetPlan, all_datasets, loaded: dict = None):
+    """Count the fetches skipped by a plan and estimate their bytes from the sizes seen for those datasets"""
+    for name, payload in (loaded or {}).items():
+        samples, mean = _avg_bytes.get(name, (0, 0.0))
+        if samples < SIZE_SAMPLES and isinstance(payload, (dict, list)) and not (isinstance(payload, dict) and payload.get("error")):
+            size = len(json.dumps(payload, default=str))
+            _avg_bytes[name] = (samples + 1, mean + (size - mean) / (samples + 1))
+    skipped = [name for name in all_datasets if name not in plan.datasets]
+    stats = _stats.setdefault(agent, {"requests": 0, "planned_requests": 0, "fetches": 0, "fetches_avoided": 0, "bytes_avoided_estimate": 0})
+    stats["requests"] += 1
+    stats["planned_requests"] += bool(skipped)
+    stats["fetches"] += len(plan.datasets)
+    stats["fetches_avoided"] += len(skipped)
+    stats["bytes_avoided_estimate"] += int(sum(_avg_bytes.get(name, (0, 0.0))[1] for name in skipped))
+    if skipped:
+        print(f"🧭 {agent} plan ({plan.reason}): loading {', '.join(plan.datasets)}; skipped {', '.join(skipped)}")
+
+def get_planner_metrics() -> dict:
+    return {
+        "agents": {agent: dict(stats) for agent, stats in _stats.items()},
+        "avg_dataset_bytes": {name: int(mean) for name, (_, mean) in _avg_bytes.items()},
+    }
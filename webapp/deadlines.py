@@ -0,0 +1,206 @@
+# Request deadlines
+#
+# An endpoint used to wait for the slowest of up to six MCP calls (30s each)
+# and then give Gemini its own 45s, so one slow dataset could hold a request
+# for over a minute. A Deadline is now created at the endpoint and carried in a
+# context variable, so every MCP fetch, Firestore read and LLM call below it
+# (including tasks it spawns) sizes its timeout from what is left. Fan-outs
+# return the datasets that arrived within their share of the budget and mark
+# the rest unavailable; the late fetches finish in the background.
+#
+# Code running without a deadline (scripts, background refreshes) keeps its
+# own fixed timeouts.
+
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from contextlib import aclosing, contextmanager
+from typing import NamedTuple
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "40"))
+# Share of the remaining budget data loading may use; the rest is kept for the LLM
+FETCH_BUDGET_SHARE = float(os.getenv("DEADLINE_FETCH_SHARE", "0.4"))
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+_stage_stats = {}  # stage -> {"calls", "timeouts", "deadline_misses", "unavailable"}
+
+class Deadline:
+    """A point in time a request must finish by"""
+
+    def __init__(self, seconds: float = REQUEST_DEADLINE_SECONDS, name: str = "request"):
+        self.name = name
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def share(self, fraction: float) -> float:
+        """Seconds a stage may use if it gets this fraction of what is left"""
+        return self.remaining() * fraction
+
+    def __repr__(self):
+        return f"Deadline({self.name}, {self.remaining():.2f}s left of {self.budget:.0f}s)"
+
+class StageBudget(NamedTuple):
+    timeout: float      # seconds this call may take
+    by_deadline: bool   # True when the request deadline, not the stage's own timeout, is the limit
+
+def current_deadline():
+    return _current.get()
+
+@contextmanager
+def request_deadline(seconds: float = None, name: str = "request"):
+    """with request_deadline(): ... -- everything awaited inside shares one Deadline"""
+    token = _current.set(Deadline(REQUEST_DEADLINE_SECONDS if seconds is None else seconds, name))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+def deadline_endpoint(endpoint):
+    """Decorator: run an async endpoint under a fresh request deadline (signature kept for FastAPI)"""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with request_deadline(name=endpoint.__name__):
+            return await endpoint(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def no_deadline():
+    """Detach work (e.g. a background refresh started by a request) from the request's deadline"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+async def within_deadline(chunks, seconds: float = None, name: str = "stream", deadline: Deadline = None):
+    """Run an async generator (a streamed response) under one Deadline (a new one, or the given one).
+
+    The body of a StreamingResponse runs after the endpoint has returned, so
+    the deadline is set around each step of the generator instead. Closing
+    this generator (client disconnect) closes chunks at once, so LLM gateway
+    slots held further down are released without waiting for garbage collection.
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS if seconds is None else seconds, name)
+    async with aclosing(chunks):
+        iterator = chunks.__aiter__()
+        while True:
+            token = _current.set(deadline)
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield item
+
+# --- Stage budgets ---
+def _stats(stage: str) -> dict:
+    return _stage_stats.setdefault(stage, {"calls": 0, "timeouts": 0, "deadline_misses": 0, "unavailable": 0})
+
+def stage_budget(stage: str, default: float = None) -> StageBudget:
+    """Timeout for one call of a stage: its own default (None = unbounded), cut to what is left of the request deadline"""
+    _stats(stage)["calls"] += 1
+    deadline = _current.get()
+    if deadline is None:
+        return StageBudget(default, False)
+    remaining = deadline.remaining()
+    if default is None or remaining < default:
+        return StageBudget(remaining, True)
+    return StageBudget(default, False)
+
+def record_timeout(stage: str, budget: StageBudget):
+    stats = _stats(stage)
+    stats["timeouts"] += 1
+    if budget.by_deadline:
+        stats["deadline_misses"] += 1
+
+def record_unavailable(stage: str, count: int = 1):
+    """Results a fan-out gave up on because the deadline share ran out"""
+    stats = _stats(stage)
+    stats["unavailable"] += count
+    stats["deadline_misses"] += count
+
+async def run_stage(stage: str, awaitable, default: float = None):
+    """await awaitable under the stage's budget; asyncio.TimeoutError when it runs out"""
+    budget = stage_budget(stage, default)
+    if budget.timeout is None:
+        return await awaitable
+    if budget.timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        record_timeout(stage, budget)
+        raise asyncio.TimeoutError(f"{stage}: request deadline already passed")
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget.timeout)
+    except asyncio.TimeoutError:
+        record_timeout(stage, budget)
+        raise
+
+# --- Fan-out ---
+def unavailable(name: str) -> dict:
+    """Stand-in for a dataset that did not arrive in time; agents already treat error dicts as 'unavailable'"""
+    return {"error": f"{name} unavailable: not fetched within the request deadline", "unavailable": True}
+
+async def gather_within(calls: dict, stage: str, share: float = FETCH_BUDGET_SHARE, on_late=None) -> dict:
+    """Run {name: coroutine} concurrently and return {name: result} for those done within the deadline share.
+
+    Without a deadline this is a plain gather. Late calls are not cancelled:
+    they keep running (so e.g. caches still fill) and on_late(name, result) is
+    called when each finishes. Calls that raised come back as {"error": ...}.
+    """
+    names = list(calls)
+    tasks = {name: asyncio.ensure_future(coro) for name, coro in calls.items()}
+    deadline = _current.get()
+    timeout = None if deadline is None else deadline.share(share)
+    _stats(stage)["calls"] += 1
+    if tasks:
+        await asyncio.wait(list(tasks.values()), timeout=timeout)
+
+    results = {}
+    late = []
+    for name in names:
+        task = tasks[name]
+        if not task.done():
+            late.append(name)
+            results[name] = unavailable(name)
+            if on_late is not None:
+                task.add_done_callback(lambda done, name=name: _late_result(done, name, on_late))
+            else:
+                task.add_done_callback(_ignore_result)
+        elif task.exception() is not None:
+            results[name] = {"error": f"{name} fetch failed: {task.exception()}"}
+        else:
+            results[name] = task.result()
+    if late:
+        record_unavailable(stage, len(late))
+        print(f"⏱️ {stage}: {', '.join(late)} not ready within {timeout:.1f}s, marked unavailable")
+    return results
+
+def _ignore_result(task):
+    if not task.cancelled():
+        task.exception()
+
+def _late_result(task, name, on_late):
+    if task.cancelled() or task.exception() is not None:
+        return
+    try:
+        on_late(name, task.result())
+    except Exception as e:
+        print(f"⚠️ Late result handler for {name} failed: {e}")
+
+def get_deadline_metrics() -> dict:
+    return {
+        "request_deadline_seconds": REQUEST_DEADLINE_SECONDS,
+        "fetch_budget_share": FETCH_BUDGET_SHARE,
+        "stages": {stage: dict(stats) for stage, stats in _stage_stats.items()},
+    }
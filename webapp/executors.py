@@ -0,0 +1,123 @@
+# Bounded, named thread pools for the blocking work that is left (token verification, FCM, LLM tool handlers)
+#
+# Each kind of work gets its own pool so a slowdown in one (e.g. FCM latency)
+# queues up in that pool instead of starving everything else that used to share
+# asyncio's default executor.
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+EXECUTOR_SIZES = {
+    "auth": int(os.getenv("AUTH_EXECUTOR_WORKERS", "8")),
+    "messaging": int(os.getenv("MESSAGING_EXECUTOR_WORKERS", "4")),
+    "tools": int(os.getenv("TOOLS_EXECUTOR_WORKERS", "8")),
+    "blocking": int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "8")),
+}
+LATENCY_WINDOW = 512
+
+class NamedExecutor:
+    """ThreadPoolExecutor wrapper that tracks queue depth, wait time and run time"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._stats = {"submitted": 0, "completed": 0, "errors": 0, "cancelled": 0, "max_queue_depth": 0}
+        self._wait_ms = deque(maxlen=LATENCY_WINDOW)
+        self._run_ms = deque(maxlen=LATENCY_WINDOW)
+
+    async def run(self, fn, *args, **kwargs):
+        submitted_at = time.perf_counter()
+        ctx = contextvars.copy_context()
+
+        def job():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._wait_ms.append((started_at - submitted_at) * 1000)
+            failed = False
+            try:
+                return ctx.run(fn, *args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._stats["completed"] += 1
+                    self._stats["errors"] += failed
+                    self._run_ms.append((time.perf_counter() - started_at) * 1000)
+
+        with self._lock:
+            self._queued += 1
+            self._stats["submitted"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+        future = self._pool.submit(job)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # A job cancelled while still queued never ran, so job() never dequeued it
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self._stats["cancelled"] += 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            wait_ms = sorted(self._wait_ms)
+            run_ms = sorted(self._run_ms)
+            return {
+                **self._stats,
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "wait_ms": _summary(wait_ms),
+                "run_ms": _summary(run_ms),
+            }
+
+def _summary(samples: list) -> dict:
+    if not samples:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "avg": round(sum(samples) / len(samples), 2),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "max": round(samples[-1], 2),
+    }
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(name: str) -> NamedExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = NamedExecutor(name, EXECUTOR_SIZES.get(name, EXECUTOR_SIZES["blocking"]))
+                _executors[name] = executor
+    return executor
+
+async def run_blocking(name: str, fn, *args, **kwargs):
+    """Run a blocking callable on the named executor (replacement for asyncio.to_thread)"""
+    return await get_executor(name).run(fn, *args, **kwargs)
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+
+def get_executor_metrics() -> dict:
+    return {name: executor.stats() for name, executor in list(_executors.items())}
@@ -0,0 +1,85 @@
+# Process-wide async Firestore access
+#
+# All request-path Firestore reads and writes go through the native async client,
+# so they never occupy a worker thread. Each operation is timed so a Firestore
+# slowdown shows up in /metrics instead of as mysterious thread-pool starvation.
+
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from firebase_admin import firestore_async
+
+from deadlines import run_stage
+
+LATENCY_WINDOW = 512
+
+_db = None
+_in_flight = 0
+_ops = {}  # op name -> {"count", "errors", "latencies_ms"}
+
+def get_db():
+    """Return the shared firestore.AsyncClient (created on first use, after firebase_admin.initialize_app)"""
+    global _db
+    if _db is None:
+        _db = firestore_async.client()
+    return _db
+
+def user_ref(uid: str):
+    return get_db().collection("users").document(uid)
+
+@asynccontextmanager
+async def _timed(op: str):
+    global _in_flight
+    stats = _ops.setdefault(op, {"count": 0, "errors": 0, "latencies_ms": deque(maxlen=LATENCY_WINDOW)})
+    started_at = time.perf_counter()
+    _in_flight += 1
+    try:
+        yield
+    except Exception:
+        stats["errors"] += 1
+        raise
+    finally:
+        _in_flight -= 1
+        stats["count"] += 1
+        stats["latencies_ms"].append((time.perf_counter() - started_at) * 1000)
+
+# --- Timed operations ---
+async def get_document(ref):
+    # Reads are bounded by the request deadline, if there is one
+    async with _timed("get"):
+        return await run_stage("firestore_read", ref.get())
+
+async def set_document(ref, data: dict, merge: bool = False):
+    async with _timed("set"):
+        return await ref.set(data, merge=merge)
+
+async def update_document(ref, data: dict):
+    async with _timed("update"):
+        return await ref.update(data)
+
+async def get_documents(refs, db=None) -> list:
+    """Fetch several documents in one round trip"""
+    db = db or get_db()
+    async with _timed("get_all"):
+        return await run_stage("firestore_read", _collect(db.get_all(refs)))
+
+async def _collect(snapshots) -> list:
+    return [snapshot async for snapshot in snapshots]
+
+async def commit_batch(batch):
+    async with _timed("batch_commit"):
+        return await batch.commit()
+
+def get_firestore_metrics() -> dict:
+    ops = {}
+    for op, stats in list(_ops.items()):
+        samples = sorted(stats["latencies_ms"])
+        ops[op] = {
+            "count": stats["count"],
+            "errors": stats["errors"],
+            "avg_ms": round(sum(samples) / len(samples), 2) if samples else 0.0,
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2) if samples else 0.0,
+            "max_ms": round(samples[-1], 2) if samples else 0.0,
+        }
+    return {"in_flight": _in_flight, "operations": ops}
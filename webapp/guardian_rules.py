@@ -0,0 +1,251 @@
+# Deterministic Guardian alerts
+#
+# Guardian used to show nothing until Gemini answered, and fell back to two
+# generic tips when it failed. These rules run over the raw bank transactions
+# and credit report in a few milliseconds (NumPy over the shared transaction
+# columns, see transaction_store.py), so alerts can be shown at once; Gemini's
+# explanations are merged in afterwards (see agents/guardian.py).
+#
+# Rules: large debits, first payments to new merchants, balance drops, high
+# credit utilization and missed payments. Windows are relative to the latest
+# transaction, not today, so old snapshots still produce meaningful alerts.
+
+import os
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from transaction_store import _num, merchant_key, transaction_columns
+
+RULES_VERSION = "guardian-rules-v1"
+LOOKBACK_DAYS = int(os.getenv("GUARDIAN_LOOKBACK_DAYS", "30"))
+# A debit is large at this multiple of the user's median debit (and at least the minimum amount)
+LARGE_DEBIT_MULTIPLE = 5.0
+LARGE_DEBIT_MIN_AMOUNT = 10000.0
+# First payments to a merchant below this are not worth an alert
+NEW_MERCHANT_MIN_AMOUNT = 2000.0
+# "New" only means something once there is this much earlier history
+NEW_MERCHANT_HISTORY_DAYS = 60
+BALANCE_DROP_FRACTION = 0.5
+BALANCE_DROP_MIN_AMOUNT = 10000.0
+UTILIZATION_WARN_PCT = 30.0
+UTILIZATION_HIGH_PCT = 75.0
+MAX_ALERTS_PER_RULE = 5
+# Bureau account type code for credit cards
+CREDIT_CARD_TYPES = {"10", 10}
+# Payment history characters meaning "paid late" (days-past-due buckets)
+LATE_PAYMENT_MARKS = set("123456789")
+PAYMENT_HISTORY_MONTHS = 12
+
+SEVERITY_RANK = {"high": 0, "medium": 1, "low": 2, "info": 3}
+
+class TransactionArrays(NamedTuple):
+    amounts: np.ndarray      # float64
+    dates: np.ndarray        # datetime64[D]
+    is_debit: np.ndarray     # bool
+    is_credit: np.ndarray    # bool
+    balances: np.ndarray     # float64, NaN where the row has no balance
+    banks: np.ndarray        # int index into bank_names
+    bank_names: list
+    merchants: np.ndarray    # normalized merchant key per row ("" if none)
+    narrations: np.ndarray   # object
+
+def transaction_arrays(payload: dict) -> TransactionArrays:
+    """Bank transaction rows ([amount, narration, date, type, mode, balance]) as date-sorted columns"""
+    columns = transaction_columns(payload)
+    order = columns.date_order
+    return TransactionArrays(
+        amounts=columns.amounts[order],
+        dates=columns.dates[order],
+        is_debit=columns.is_debit[order],
+        is_credit=columns.is_credit[order],
+        balances=columns.balances[order],
+        banks=columns.banks[order].astype(np.int32),
+        bank_names=columns.bank_names,
+        # Merchant keys are extracted once per distinct narration
+        merchants=columns.map_narrations(merchant_key)[order],
+        narrations=columns.narration_array()[order],
+    )
+
+def _alert(rule: str, key: str, alert_type: str, description: str, severity: str, **evidence) -> dict:
+    return {
+        "id": f"{rule}:{key}",
+        "rule": rule,
+        "type": alert_type,
+        "description": description,
+        "severity": severity,
+        "source": "rules",
+        "evidence": evidence,
+    }
+
+def _inr(amount: float) -> str:
+    return f"₹{amount:,.0f}"
+
+# --- Bank transaction rules ---
+def large_debit_alert(tx: TransactionArrays, i: int, typical: float) -> dict:
+    amount = float(tx.amounts[i])
+    multiple = amount / typical if typical else None
+    return _alert(
+        "large_debit", f"{tx.dates[i]}:{int(amount)}:{tx.merchants[i]}", "Large Debit",
+        f"{_inr(amount)} debited on {tx.dates[i]} ({tx.narrations[i][:40]}), "
+        f"{multiple:.0f}x your typical debit of {_inr(typical)}." if multiple else f"{_inr(amount)} debited on {tx.dates[i]}.",
+        "high" if multiple and multiple >= 2 * LARGE_DEBIT_MULTIPLE else "medium",
+        amount=amount, date=str(tx.dates[i]), narration=tx.narrations[i][:60], bank=tx.bank_names[tx.banks[i]],
+        typical_debit=round(typical, 2),
+    )
+
+def large_debit_alerts(tx: TransactionArrays, window_start) -> list:
+    debits = tx.amounts[tx.is_debit]
+    if debits.size < 3:
+        return []
+    typical = float(np.median(debits))
+    threshold = max(LARGE_DEBIT_MULTIPLE * typical, LARGE_DEBIT_MIN_AMOUNT)
+    hits = np.flatnonzero(tx.is_debit & (tx.dates >= window_start) & (tx.amounts >= threshold))
+    hits = hits[np.argsort(-tx.amounts[hits], kind="stable")][:MAX_ALERTS_PER_RULE]
+    return [large_debit_alert(tx, i, typical) for i in hits]
+
+def new_merchant_alert(tx: TransactionArrays, i: int) -> dict:
+    return _alert(
+        "new_merchant", str(tx.merchants[i]), "New Merchant",
+        f"First payment to {tx.merchants[i][:30]}: {_inr(float(tx.amounts[i]))} on {tx.dates[i]}. Check you recognise it.",
+        "medium" if tx.amounts[i] >= LARGE_DEBIT_MIN_AMOUNT else "low",
+        amount=float(tx.amounts[i]), date=str(tx.dates[i]), merchant=str(tx.merchants[i]), bank=tx.bank_names[tx.banks[i]],
+    )
+
+def new_merchant_alerts(tx: TransactionArrays, window_start) -> list:
+    debit_rows = np.flatnonzero(tx.is_debit & (tx.merchants != ""))
+    if debit_rows.size == 0 or tx.dates[0] > window_start - np.timedelta64(NEW_MERCHANT_HISTORY_DAYS, "D"):
+        return []
+    # Rows are date-sorted, so each merchant's first index is its first payment
+    merchants, first = np.unique(tx.merchants[debit_rows], return_index=True)
+    first_rows = debit_rows[first]
+    hits = first_rows[(tx.dates[first_rows] >= window_start) & (tx.amounts[first_rows] >= NEW_MERCHANT_MIN_AMOUNT)]
+    hits = hits[np.argsort(-tx.amounts[hits], kind="stable")][:MAX_ALERTS_PER_RULE]
+    return [new_merchant_alert(tx, i) for i in hits]
+
+def balance_drop_alert(bank: str, balances: np.ndarray, dates: np.ndarray):
+    """Alert if the last balance is far below the peak of the (date-sorted) balances, else None"""
+    peak_at = int(np.argmax(balances))
+    peak, latest = float(balances[peak_at]), float(balances[-1])
+    drop = peak - latest
+    if peak <= 0 or drop < BALANCE_DROP_MIN_AMOUNT or drop / peak < BALANCE_DROP_FRACTION:
+        return None
+    return _alert(
+        "balance_drop", bank, "Balance Drop",
+        f"{bank} balance fell {drop / peak:.0%} from {_inr(peak)} on {dates[peak_at]} to {_inr(latest)}.",
+        "high" if latest < 0.1 * peak else "medium",
+        bank=bank, peak=peak, peak_date=str(dates[peak_at]), latest=latest, latest_date=str(dates[-1]),
+    )
+
+def balance_drop_alerts(tx: TransactionArrays, window_start) -> list:
+    alerts = []
+    has_balance = ~np.isnan(tx.balances)
+    for bank_index, bank in enumerate(tx.bank_names):
+        rows = np.flatnonzero(has_balance & (tx.banks == bank_index) & (tx.dates >= window_start))
+        if rows.size < 2:
+            continue
+        alert = balance_drop_alert(bank, tx.balances[rows], tx.dates[rows])
+        if alert is not None:
+            alerts.append(alert)
+    return alerts[:MAX_ALERTS_PER_RULE]
+
+# --- Credit report rules ---
+def _credit_accounts(payload: dict) -> list:
+    reports = (payload or {}).get("creditReports") or []
+    report = reports[0].get("creditReportData", {}) if reports and isinstance(reports[0], dict) else {}
+    details = (report.get("creditAccount") or {}).get("creditAccountDetails") or []
+    return [account for account in details if isinstance(account, dict)]
+
+def utilization_alerts(payload: dict) -> list:
+    cards = [account for account in _credit_accounts(payload)
+             if account.get("accountType") in CREDIT_CARD_TYPES and _num(account.get("creditLimitAmount")) > 0]
+    if not cards:
+        return []
+    limits = np.array([_num(card.get("creditLimitAmount")) for card in cards])
+    balances = np.array([_num(card.get("currentBalance")) for card in cards])
+    utilization = 100 * balances / limits
+    alerts = []
+    for i in np.flatnonzero(utilization >= UTILIZATION_WARN_PCT)[:MAX_ALERTS_PER_RULE]:
+        lender = cards[i].get("subscriberName", "Unknown")
+        alerts.append(_alert(
+            "high_utilization", f"{lender}:{i}", "High Credit Utilization",
+            f"{lender} card is at {utilization[i]:.0f}% of its {_inr(limits[i])} limit; keeping it under {UTILIZATION_WARN_PCT:.0f}% helps your score.",
+            "high" if utilization[i] >= UTILIZATION_HIGH_PCT else "medium",
+            lender=lender, balance=float(balances[i]), limit=float(limits[i]), utilization_pct=round(float(utilization[i]), 1),
+        ))
+    overall = 100 * balances.sum() / limits.sum()
+    if len(cards) > 1 and overall >= UTILIZATION_WARN_PCT:
+        alerts.append(_alert(
+            "high_utilization", "overall", "High Credit Utilization",
+            f"Overall card utilization is {overall:.0f}% ({_inr(balances.sum())} of {_inr(limits.sum())}).",
+            "high" if overall >= UTILIZATION_HIGH_PCT else "medium",
+            balance=float(balances.sum()), limit=float(limits.sum()), utilization_pct=round(float(overall), 1),
+        ))
+    return alerts
+
+def missed_payment_alerts(payload: dict) -> list:
+    alerts = []
+    for i, account in enumerate(_credit_accounts(payload)):
+        lender = account.get("subscriberName", "Unknown")
+        past_due = _num(account.get("amountPastDue"))
+        history = str(account.get("paymentHistoryProfile") or "")[:PAYMENT_HISTORY_MONTHS]
+        late_months = sum(mark in LATE_PAYMENT_MARKS for mark in history)
+        if past_due <= 0 and not late_months:
+            continue
+        if past_due > 0:
+            description = f"{_inr(past_due)} is past due on your {lender} account. Pay it to avoid further damage to your score."
+        else:
+            description = f"{late_months} late payment(s) on your {lender} account in the last {len(history)} months."
+        alerts.append(_alert(
+            "missed_payment", f"{lender}:{i}", "Missed Payment", description,
+            "high" if past_due > 0 else "medium",
+            lender=lender, amount_past_due=past_due, late_months=late_months,
+        ))
+    alerts.sort(key=lambda alert: -alert["evidence"]["amount_past_due"])
+    return alerts[:MAX_ALERTS_PER_RULE]
+
+# --- Engine ---
+def _payload(datasets: dict, name: str):
+    payload = (datasets or {}).get(name)
+    return payload if isinstance(payload, dict) and not payload.get("error") else None
+
+def evaluate_guardian_rules(datasets: dict) -> dict:
+    """Run every rule whose dataset is present; returns {"alerts": [...], "elapsed_ms", "as_of", "rules_version"}"""
+    started_at = time.perf_counter()
+    alerts = []
+    as_of = None
+    bank = _payload(datasets, "bank_transactions")
+    if bank is not None:
+        tx = transaction_arrays(bank)
+        if tx.dates.size:
+            as_of = tx.dates[-1]
+            window_start = as_of - np.timedelta64(LOOKBACK_DAYS, "D")
+            alerts += large_debit_alerts(tx, window_start)
+            alerts += new_merchant_alerts(tx, window_start)
+            alerts += balance_drop_alerts(tx, window_start)
+    credit = _payload(datasets, "credit_report")
+    if credit is not None:
+        alerts += missed_payment_alerts(credit)
+        alerts += utilization_alerts(credit)
+    alerts.sort(key=lambda alert: SEVERITY_RANK.get(alert["severity"], len(SEVERITY_RANK)))
+    return {
+        "alerts": alerts,
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 3),
+        "as_of": str(as_of) if as_of is not None else None,
+        "rules_version": RULES_VERSION,
+    }
+
+def merge_enrichment(rule_alerts: list, enrichment: dict) -> list:
+    """Rule alerts with Gemini's explanations attached (by id), followed by any extra alerts Gemini raised"""
+    explanations = enrichment.get("explanations") if isinstance(enrichment, dict) else None
+    explanations = explanations if isinstance(explanations, dict) else {}
+    merged = [
+        {**alert, "explanation": explanations[alert["id"]]} if explanations.get(alert["id"]) else dict(alert)
+        for alert in rule_alerts
+    ]
+    extra = enrichment.get("alerts") if isinstance(enrichment, dict) else None
+    for alert in extra if isinstance(extra, list) else []:
+        if isinstance(alert, dict) and alert.get("description"):
+            merged.append({**alert, "source": "llm"})
+    return merged
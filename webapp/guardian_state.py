@@ -0,0 +1,382 @@
+# Incremental Guardian state
+#
+# Guardian used to re-read and re-send the whole bank history on every run,
+# although usually only a handful of transactions were new. Each user (and
+# focus area) now keeps a watermark -- the latest transaction date seen and
+# hashes of the rows on that date -- plus running statistics: per merchant
+# (count, mean, variance, first/last seen), per category (count, total), a
+# bounded sample of recent debits and recent daily closing balances per bank.
+#
+# A run only parses and scores the rows past the watermark against those
+# statistics, and Gemini gets those rows with a compact baseline summary
+# instead of the history, so per-run cost stays flat as the account ages.
+# The first run bootstraps the statistics from everything older than the
+# lookback window and scores the window itself, which matches the full rules
+# in guardian_rules.py.
+#
+# State lives in the guardian_state field of the user document
+# ({"<area>": state}), mirrored in an in-process L1. Areas are the dataset
+# planner's keys; any other area string shares the default state (it loads the
+# same datasets). Rows that show up later with a date before the watermark are
+# not scored.
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import weakref
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+from categorizer import categorize_many
+from dataset_planner import AREA_PLANS, area_key
+from firestore_db import user_ref
+from guardian_rules import (
+    LARGE_DEBIT_MIN_AMOUNT,
+    LARGE_DEBIT_MULTIPLE,
+    LOOKBACK_DAYS,
+    MAX_ALERTS_PER_RULE,
+    NEW_MERCHANT_HISTORY_DAYS,
+    NEW_MERCHANT_MIN_AMOUNT,
+    RULES_VERSION,
+    SEVERITY_RANK,
+    TransactionArrays,
+    balance_drop_alert,
+    large_debit_alert,
+    missed_payment_alerts,
+    new_merchant_alert,
+    transaction_arrays,
+    utilization_alerts,
+)
+from mcp_cache import MCPPayloadCache
+from write_behind import queue_write, read_field
+
+STATE_FIELD = "guardian_state"
+STATE_VERSION = 1
+DEFAULT_AREA = "default"
+GUARDIAN_STATE_TTL_SECONDS = float(os.getenv("GUARDIAN_STATE_TTL_SECONDS", str(24 * 3600)))
+# Bounds that keep the state (and so each run) the same size however long the history is
+DEBIT_SAMPLE_SIZE = 256
+MAX_MERCHANTS = int(os.getenv("GUARDIAN_MAX_MERCHANTS", "2000"))
+MAX_OPEN_ALERTS = 20
+PROMPT_TRANSACTIONS = 40
+BASELINE_TOP = 8
+
+# Updated in place under the (uid, area) lock and put back after each run
+guardian_state_cache = MCPPayloadCache(ttl_seconds=GUARDIAN_STATE_TTL_SECONDS, copy_values=False)
+# (uid, area) -> asyncio.Lock; an entry goes away once no run holds or waits on its lock
+_locks = weakref.WeakValueDictionary()
+_stats = {"runs": 0, "bootstraps": 0, "transactions_scored": 0, "unchanged_runs": 0}
+
+def empty_state() -> dict:
+    return {
+        "version": STATE_VERSION,
+        "rules_version": RULES_VERSION,
+        "watermark": None,          # {"date": "YYYY-MM-DD", "hashes": [...]}
+        "first_date": None,
+        "transactions": 0,
+        "merchants": {},            # key -> [count, mean, m2, first_date, last_date]
+        "categories": {},           # category -> [count, total] (debits)
+        "debit_sample": [],
+        "balances": {},             # bank -> [[date, closing balance], ...] within the lookback window
+        "open_alerts": [],
+        "activity": None,           # what Gemini was last shown for the bank transactions
+    }
+
+# --- Watermark ---
+def _row_hash(bank: str, row: list, seen: Counter) -> str:
+    """Hash of one row; identical rows on the same day are told apart by their occurrence number"""
+    digest = hashlib.sha1(json.dumps([bank, row], default=str).encode("utf-8")).hexdigest()[:16]
+    seen[digest] += 1
+    return f"{digest}:{seen[digest]}"
+
+def new_rows(payload: dict, watermark) -> tuple:
+    """(payload holding only the rows past the watermark, the watermark after them)
+
+    Rows are compared by date string first, so only rows on or after the
+    watermark date are hashed or parsed.
+    """
+    since = watermark["date"] if watermark else ""
+    candidates = []  # (bank, date, row)
+    for account in (payload or {}).get("bankTransactions") or []:
+        if not isinstance(account, dict):
+            continue
+        bank = account.get("bank", "Unknown")
+        for row in account.get("txns") or []:
+            if isinstance(row, list) and len(row) >= 4 and str(row[2])[:10] >= since:
+                candidates.append((bank, str(row[2])[:10], row))
+    if not candidates:
+        return {"bankTransactions": []}, watermark
+
+    latest = max(day for _, day, _ in candidates)
+    seen_hashes = set(watermark["hashes"]) if watermark else set()
+    boundary_seen, latest_seen = Counter(), Counter()
+    latest_hashes = []
+    accounts = {}
+    for bank, day, row in candidates:
+        row_hash = _row_hash(bank, row, boundary_seen) if day == since else None
+        if row_hash is not None and row_hash in seen_hashes:
+            continue
+        accounts.setdefault(bank, []).append(row)
+    for bank, day, row in candidates:
+        if day == latest:
+            latest_hashes.append(_row_hash(bank, row, latest_seen))
+    fresh = {"bankTransactions": [{"bank": bank, "txns": rows} for bank, rows in accounts.items()]}
+    return fresh, {"date": latest, "hashes": latest_hashes}
+
+# --- Running statistics ---
+def _take(tx: TransactionArrays, mask: np.ndarray) -> TransactionArrays:
+    return tx._replace(**{
+        field: getattr(tx, field)[mask] for field in TransactionArrays._fields if field != "bank_names"
+    })
+
+def absorb(state: dict, tx: TransactionArrays):
+    """Fold date-sorted transactions into the running statistics"""
+    if not tx.dates.size:
+        return
+    first, last = str(tx.dates[0]), str(tx.dates[-1])
+    state["first_date"] = min(state["first_date"] or first, first)
+    state["transactions"] += int(tx.dates.size)
+
+    # Per merchant: count/mean/M2 combined with the stored ones (parallel variance)
+    merchants = state["merchants"]
+    debit_rows = np.flatnonzero(tx.is_debit & (tx.merchants != ""))
+    if debit_rows.size:
+        keys, inverse = np.unique(tx.merchants[debit_rows], return_inverse=True)
+        amounts = tx.amounts[debit_rows]
+        counts = np.bincount(inverse)
+        means = np.bincount(inverse, weights=amounts) / counts
+        m2s = np.bincount(inverse, weights=(amounts - means[inverse]) ** 2)
+        first_rows = np.full(keys.size, debit_rows.size)
+        np.minimum.at(first_rows, inverse, np.arange(debit_rows.size))
+        last_rows = np.zeros(keys.size, dtype=np.int64)
+        np.maximum.at(last_rows, inverse, np.arange(debit_rows.size))
+        for j, key in enumerate(keys):
+            count, mean, m2 = int(counts[j]), float(means[j]), float(m2s[j])
+            first_seen = str(tx.dates[debit_rows[first_rows[j]]])
+            last_seen = str(tx.dates[debit_rows[last_rows[j]]])
+            known = merchants.get(key)
+            if known:
+                total = known[0] + count
+                delta = mean - known[1]
+                mean, m2 = known[1] + delta * count / total, known[2] + m2 + delta * delta * known[0] * count / total
+                count, first_seen = total, known[3]
+            merchants[key] = [count, mean, m2, first_seen, last_seen]
+        if len(merchants) > MAX_MERCHANTS:
+            # Forget the merchants not paid for the longest
+            for key in sorted(merchants, key=lambda key: merchants[key][4])[:len(merchants) - MAX_MERCHANTS]:
+                del merchants[key]
+
+    # Per category (debits)
+    categories = state["categories"]
+    debit_rows = np.flatnonzero(tx.is_debit)
+    for i, category in zip(debit_rows, categorize_many([tx.narrations[i] for i in debit_rows])):
+        entry = categories.setdefault(category, [0, 0.0])
+        entry[0] += 1
+        entry[1] += float(tx.amounts[i])
+
+    debits = tx.amounts[tx.is_debit]
+    state["debit_sample"] = (state["debit_sample"] + [float(amount) for amount in debits])[-DEBIT_SAMPLE_SIZE:]
+
+    # Daily closing balances per bank, kept for the lookback window
+    window_start = str(tx.dates[-1] - np.timedelta64(LOOKBACK_DAYS, "D"))
+    has_balance = ~np.isnan(tx.balances)
+    for bank_index, bank in enumerate(tx.bank_names):
+        rows = np.flatnonzero(has_balance & (tx.banks == bank_index))
+        points = state["balances"].setdefault(bank, [])
+        for i in rows:
+            day = str(tx.dates[i])
+            if points and points[-1][0] == day:
+                points[-1][1] = float(tx.balances[i])
+            elif not points or day > points[-1][0]:
+                points.append([day, float(tx.balances[i])])
+        state["balances"][bank] = [point for point in points if point[0] >= window_start]
+
+# --- Scoring ---
+def score(state: dict, tx: TransactionArrays, window_start) -> list:
+    """Rule alerts for new transactions, judged against the statistics from before them"""
+    alerts = []
+    debits = tx.amounts[tx.is_debit]
+    sample = np.array(state["debit_sample"], dtype=np.float64)
+    if sample.size < 3:
+        sample = np.concatenate([sample, debits])
+    if sample.size >= 3:
+        typical = float(np.median(sample))
+        threshold = max(LARGE_DEBIT_MULTIPLE * typical, LARGE_DEBIT_MIN_AMOUNT)
+        hits = np.flatnonzero(tx.is_debit & (tx.dates >= window_start) & (tx.amounts >= threshold))
+        hits = hits[np.argsort(-tx.amounts[hits], kind="stable")][:MAX_ALERTS_PER_RULE]
+        alerts += [large_debit_alert(tx, i, typical) for i in hits]
+
+    history_needed = window_start - np.timedelta64(NEW_MERCHANT_HISTORY_DAYS, "D")
+    if state["first_date"] and np.datetime64(state["first_date"]) <= history_needed:
+        debit_rows = np.flatnonzero(tx.is_debit & (tx.merchants != ""))
+        _, first = np.unique(tx.merchants[debit_rows], return_index=True)
+        first_rows = [i for i in debit_rows[first] if tx.merchants[i] not in state["merchants"]]
+        hits = [i for i in first_rows if tx.dates[i] >= window_start and tx.amounts[i] >= NEW_MERCHANT_MIN_AMOUNT]
+        hits.sort(key=lambda i: -tx.amounts[i])
+        alerts += [new_merchant_alert(tx, i) for i in hits[:MAX_ALERTS_PER_RULE]]
+
+    has_balance = ~np.isnan(tx.balances)
+    for bank_index, bank in enumerate(tx.bank_names):
+        rows = np.flatnonzero(has_balance & (tx.banks == bank_index) & (tx.dates >= window_start))
+        if not rows.size:
+            continue
+        earlier = [point for point in state["balances"].get(bank, []) if point[0] >= str(window_start)]
+        balances = np.concatenate([np.array([point[1] for point in earlier], dtype=np.float64), tx.balances[rows]])
+        dates = np.concatenate([np.array([point[0] for point in earlier], dtype="datetime64[D]"), tx.dates[rows]])
+        if balances.size >= 2:
+            alert = balance_drop_alert(bank, balances, dates)
+            if alert is not None:
+                alerts.append(alert)
+    return alerts
+
+def _alert_date(alert: dict) -> str:
+    evidence = alert.get("evidence") or {}
+    return evidence.get("latest_date") or evidence.get("date") or ""
+
+def _update_open_alerts(state: dict, alerts: list, window_start):
+    """New alerts replace open ones with the same id; alerts older than the window are closed"""
+    by_id = {alert["id"]: alert for alert in state["open_alerts"]}
+    by_id.update((alert["id"], alert) for alert in alerts)
+    still_open = [alert for alert in by_id.values() if _alert_date(alert) >= str(window_start)]
+    still_open.sort(key=lambda alert: (SEVERITY_RANK.get(alert["severity"], len(SEVERITY_RANK)), _alert_date(alert)))
+    state["open_alerts"] = still_open[:MAX_OPEN_ALERTS]
+
+# --- Prompt view ---
+def baseline_summary(state: dict) -> dict:
+    """Compact view of the running statistics (fixed size whatever the history length)"""
+    merchants = sorted(state["merchants"].items(), key=lambda item: -item[1][0])[:BASELINE_TOP]
+    categories = sorted(state["categories"].items(), key=lambda item: -item[1][1])[:BASELINE_TOP]
+    return {
+        "since": state["first_date"],
+        "through": state["watermark"]["date"] if state["watermark"] else None,
+        "transactions": state["transactions"],
+        "typical_debit": round(float(np.median(state["debit_sample"])), 2) if state["debit_sample"] else None,
+        "top_merchants": [
+            {"merchant": key[:30], "payments": stats[0], "avg_amount": round(stats[1], 2),
+             "std_amount": round((stats[2] / stats[0]) ** 0.5, 2) if stats[0] else 0.0, "last_paid": stats[4]}
+            for key, stats in merchants
+        ],
+        "category_spend": {category: {"count": count, "total": round(total, 2)} for category, (count, total) in categories},
+        "latest_balances": {bank: points[-1][1] for bank, points in state["balances"].items() if points},
+    }
+
+def _compact_transactions(tx: TransactionArrays) -> list:
+    rows = range(max(0, tx.dates.size - PROMPT_TRANSACTIONS), tx.dates.size)
+    return [
+        {"date": str(tx.dates[i]), "amount": float(tx.amounts[i]), "type": "debit" if tx.is_debit[i] else "credit",
+         "narration": tx.narrations[i][:40], "bank": tx.bank_names[tx.banks[i]]}
+        for i in reversed(rows)
+    ]
+
+# --- Engine ---
+def _payload(datasets: dict, name: str):
+    payload = (datasets or {}).get(name)
+    return payload if isinstance(payload, dict) and not payload.get("error") else None
+
+def evaluate_incremental(state: dict, datasets: dict) -> dict:
+    """evaluate_guardian_rules, but scoring only the bank transactions past the state's watermark.
+
+    Updates state in place. Besides the rules result, returns "bank_activity"
+    (new transactions + baseline summary, for the prompt) and "new_transactions".
+    """
+    started_at = time.perf_counter()
+    alerts = []
+    fresh_count = 0
+    bank = _payload(datasets, "bank_transactions")
+    if bank is not None:
+        bootstrap = state["watermark"] is None
+        fresh_payload, watermark = new_rows(bank, state["watermark"])
+        tx = transaction_arrays(fresh_payload)
+        if tx.dates.size:
+            as_of = max(tx.dates[-1], np.datetime64(state["watermark"]["date"])) if state["watermark"] else tx.dates[-1]
+            window_start = as_of - np.timedelta64(LOOKBACK_DAYS, "D")
+            if bootstrap:
+                # First run: everything before the window only feeds the statistics
+                absorb(state, _take(tx, tx.dates < window_start))
+                tx = _take(tx, tx.dates >= window_start)
+                _stats["bootstraps"] += 1
+            fresh_count = int(tx.dates.size)
+            baseline = baseline_summary(state)
+            _update_open_alerts(state, score(state, tx, window_start), window_start)
+            absorb(state, tx)
+            state["activity"] = {"new_transactions": _compact_transactions(tx), "new_count": fresh_count, "baseline": baseline}
+        state["watermark"] = watermark
+        alerts += state["open_alerts"]
+    credit = _payload(datasets, "credit_report")
+    if credit is not None:
+        alerts += missed_payment_alerts(credit)
+        alerts += utilization_alerts(credit)
+    alerts.sort(key=lambda alert: SEVERITY_RANK.get(alert["severity"], len(SEVERITY_RANK)))
+
+    _stats["runs"] += 1
+    _stats["transactions_scored"] += fresh_count
+    if bank is not None and not fresh_count:
+        _stats["unchanged_runs"] += 1
+    return {
+        "alerts": alerts,
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 3),
+        "as_of": state["watermark"]["date"] if state["watermark"] else None,
+        "rules_version": RULES_VERSION,
+        "new_transactions": fresh_count,
+        "bank_activity": state["activity"] if bank is not None else None,
+    }
+
+def state_area(area=None) -> str:
+    """The planner's key for a known focus area, DEFAULT_AREA for anything else"""
+    key = area_key(area)
+    return key if key in AREA_PLANS else DEFAULT_AREA
+
+# --- Persistence ---
+def _to_document(state: dict) -> dict:
+    """Firestore form: merchants as rows (lists replace wholesale on merge, so dropped merchants stay dropped)"""
+    document = {**state, "merchants": [[key, *stats] for key, stats in state["merchants"].items()]}
+    document["updated_at"] = datetime.utcnow().isoformat()
+    return json.loads(json.dumps(document, default=float))
+
+def _from_document(document) -> dict:
+    if not isinstance(document, dict) or document.get("version") != STATE_VERSION or document.get("rules_version") != RULES_VERSION:
+        return empty_state()
+    state = {**empty_state(), **document}
+    state["merchants"] = {row[0]: list(row[1:]) for row in document.get("merchants") or []}
+    state.pop("updated_at", None)
+    return state
+
+async def load_state(uid: str, area=None) -> dict:
+    area = state_area(area)
+    state = guardian_state_cache.get(uid, area)
+    if state is not None:
+        return state
+    try:
+        stored = await read_field(user_ref(uid), STATE_FIELD)
+    except Exception as e:
+        print(f"⚠️ Could not read Guardian state for {uid}: {e}")
+        stored = None
+    return _from_document(stored.get(area) if isinstance(stored, dict) else None)
+
+def save_state(uid: str, state: dict, area=None):
+    area = state_area(area)
+    guardian_state_cache.put(uid, area, state)
+    queue_write(user_ref(uid), {STATE_FIELD: {area: _to_document(state)}})
+
+async def run_incremental_rules(uid: str, datasets: dict, area=None) -> dict:
+    """Load the user's state, score what is new, store the state (write-behind)"""
+    area = state_area(area)
+    lock = _locks.get((uid, area))
+    if lock is None:
+        lock = _locks[(uid, area)] = asyncio.Lock()
+    async with lock:
+        state = await load_state(uid, area)
+        watermark = state["watermark"]
+        result = evaluate_incremental(state, datasets)
+        if result["new_transactions"] or state["watermark"] != watermark:
+            save_state(uid, state, area)
+        else:
+            guardian_state_cache.put(uid, area, state)
+    return result
+
+def get_guardian_state_metrics() -> dict:
+    return {**_stats, "locks": len(_locks), "l1": guardian_state_cache.stats()}
@@ -5,6 +5,16 @@ from typing import List
 from uuid import UUID
 import datetime
 import services
+from mcp_client import (
+    start_mcp_client,
+    close_mcp_client,
+    mcp_get,
+    mcp_post,
+    make_flight_key,
+    single_flight,
+    get_mcp_pool_metrics,
+    get_single_flight_metrics
+)
 from schemas import SubscriptionInfo, FinancialGoal, FinancialGoalUpdate
 from utils.pdf_generator import generate_summary_pdf
 import pipelines # Added for financial health, but note to use tool-based approach later
@@ -15,6 +25,9 @@ import time
 
 # Import agents router
 from routers.agents import router as agents_router
+from precompute import precompute_scheduler, stop_precompute
+from agent_jobs import agent_jobs, stop_agent_jobs
+from write_behind import stop_write_behind
 # --- Gemini & MCP Agent Integration ---
 import os
 import httpx
@@ -83,15 +96,18 @@ GLOBAL_MCP_SESSION_ID = None
 async def call_mcp_tool_agent(tool_name: str) -> dict:
     if not GLOBAL_MCP_SESSION_ID:
         raise HTTPException(status_code=500, detail="MCP session not established during startup.")
+    flight_key = make_flight_key(GLOBAL_MCP_SESSION_ID, tool_name)
+    return await single_flight(flight_key, lambda: _call_mcp_tool_agent(tool_name))
+
+async def _call_mcp_tool_agent(tool_name: str) -> dict:
     headers = {"Content-Type": "application/json", "X-Session-ID": GLOBAL_MCP_SESSION_ID}
     payload = {"tool_name": tool_name, "params": {}}
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{FI_MCP_SERVER_URL}/mcp/stream", json=payload, headers=headers, timeout=30.0
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await mcp_post(
+            f"{FI_MCP_SERVER_URL}/mcp/stream", json=payload, headers=headers, timeout=30.0
+        )
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPStatusError as e:
         detail = f"MCP Server returned an error: {e.response.status_code}. Body: {e.response.text}"
         print(f"ERROR: {detail}")
@@ -175,6 +191,19 @@ app.add_middleware(
 # Include agents router
 app.include_router(agents_router)
 
+@app.on_event("startup")
+async def startup_event_mcp_pool():
+    await start_mcp_client()
+    precompute_scheduler.start()
+    agent_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event_mcp_pool():
+    await stop_agent_jobs()
+    await stop_precompute()
+    await stop_write_behind()
+    await close_mcp_client()
+
 @app.on_event("startup")
 async def startup_event_agent():
     global GLOBAL_MCP_SESSION_ID
@@ -194,16 +223,15 @@ async def startup_event_agent():
     for attempt in range(max_retries):
         try:
             print(f"🔍 DEBUG: Attempting to connect to {FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
-            async with httpx.AsyncClient() as client:
-                response1 = await client.get(f"{FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
-                print(f"🔍 DEBUG: MockWebPage response status: {response1.status_code}")
-                
-                print(f"🔍 DEBUG: Attempting to login with sessionId={BACKEND_MCP_SESSION_ID}, phoneNumber={MCP_AUTH_PHONE_NUMBER}")
-                response2 = await client.post(
-                    f"{FI_MCP_SERVER_URL}/login",
-                    data={"sessionId": BACKEND_MCP_SESSION_ID, "phoneNumber": MCP_AUTH_PHONE_NUMBER}
-                )
-                print(f"🔍 DEBUG: Login response status: {response2.status_code}")
+            response1 = await mcp_get(f"{FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
+            print(f"🔍 DEBUG: MockWebPage response status: {response1.status_code}")
+            
+            print(f"🔍 DEBUG: Attempting to login with sessionId={BACKEND_MCP_SESSION_ID}, phoneNumber={MCP_AUTH_PHONE_NUMBER}")
+            response2 = await mcp_post(
+                f"{FI_MCP_SERVER_URL}/login",
+                data={"sessionId": BACKEND_MCP_SESSION_ID, "phoneNumber": MCP_AUTH_PHONE_NUMBER}
+            )
+            print(f"🔍 DEBUG: Login response status: {response2.status_code}")
                 
             GLOBAL_MCP_SESSION_ID = BACKEND_MCP_SESSION_ID
             print(f"✅ Successfully obtained global MCP session: {GLOBAL_MCP_SESSION_ID}")
@@ -376,20 +404,7 @@ async def get_detailed_analysis(current_phone_number: str = Depends(get_current_
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Net worth data not found for financial health analysis")
 
 
-    all_txns_flat = []
-    if 'bankTransactions' in transactions_data:
-        for bank_account in transactions_data['bankTransactions']:
-            for txn_raw in bank_account['txns']:
-                all_txns_flat.append({
-                    'amount': float(txn_raw[0]),
-                    'narration': txn_raw[1],
-                    'date': txn_raw[2],
-                    'type': 'CREDIT' if txn_raw[3] == 1 else 'DEBIT',
-                    'mode': txn_raw[4],
-                    'balance': float(txn_raw[5])
-                })
-
-    transactions_df = pipelines.process_transactions(all_txns_flat)
+    transactions_df = pipelines.process_transactions(transactions_data)
 
     total_investment_value = 0
     if investments_data_mf and 'mfTransactions' in investments_data_mf:
@@ -507,13 +522,16 @@ async def retry_mcp_connection():
         raise HTTPException(status_code=500, detail="MCP server URL or phone number not configured")
     
     try:
-        async with httpx.AsyncClient() as client:
-            await client.get(f"{FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
-            await client.post(
-                f"{FI_MCP_SERVER_URL}/login",
-                data={"sessionId": BACKEND_MCP_SESSION_ID, "phoneNumber": MCP_AUTH_PHONE_NUMBER}
-            )
+        await mcp_get(f"{FI_MCP_SERVER_URL}/mockWebPage?sessionId={BACKEND_MCP_SESSION_ID}")
+        await mcp_post(
+            f"{FI_MCP_SERVER_URL}/login",
+            data={"sessionId": BACKEND_MCP_SESSION_ID, "phoneNumber": MCP_AUTH_PHONE_NUMBER}
+        )
         GLOBAL_MCP_SESSION_ID = BACKEND_MCP_SESSION_ID
         return {"status": "success", "message": f"Successfully connected to MCP server. Session ID: {GLOBAL_MCP_SESSION_ID}"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to MCP server: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to connect to MCP server: {e}")
+@app.get("/metrics/mcp-pool")
+async def mcp_pool_metrics():
+    """Connection pool, request and coalescing metrics for the shared MCP client."""
+    return {**get_mcp_pool_metrics(), "single_flight": get_single_flight_metrics()}
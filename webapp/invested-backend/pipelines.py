@@ -1,36 +1,43 @@
 # pipelines.py
+import numpy as np
 import pandas as pd
 from typing import List, Dict
+import sys
+import os
 
-def categorize_transaction(description: str) -> str:
-    """A simple function to categorize transactions based on keywords."""
-    desc = description.lower()
-    if any(keyword in desc for keyword in ['zomato', 'swiggy']):
-        return 'Food & Dining'
-    if 'salary' in desc:
-        return 'Income'
-    if 'uber' in desc:
-        return 'Transport'
-    if 'netflix' in desc:
-        return 'Entertainment'
-    if 'sip' in desc or 'mutual fund' in desc:
-        return 'Investments'
-    if 'rent' in desc:
-        return 'Rent & Utilities'
-    if 'groceries' in desc:
-        return 'Groceries'
-    return 'Other'
+# Make the shared webapp modules (transaction_store, categorizer) importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from transaction_store import transaction_columns
+# Categories come from the shared taxonomy (webapp/category_taxonomy.csv)
+from categorizer import categorize as categorize_transaction, categorize_many
+from cashflow import build_cashflow, trailing_window
 
-def process_transactions(transactions_data: List[Dict]) -> pd.DataFrame:
+def process_transactions(transactions_data) -> pd.DataFrame:
     """
     Takes raw transaction data, cleans it, categorizes it, and returns a DataFrame.
+
+    transactions_data is a bank transactions payload (bankTransactions[].txns), read
+    through the shared transaction columns, or a list of transaction dicts.
     """
     if not transactions_data:
         return pd.DataFrame()
 
+    if isinstance(transactions_data, dict):
+        columns = transaction_columns(transactions_data)
+        return pd.DataFrame({
+            'amount': columns.amounts,
+            'narration': columns.narration_array(),
+            'date': pd.to_datetime(columns.dates),
+            'type': np.where(columns.is_credit, 'CREDIT', 'DEBIT'),
+            'mode': columns.modes,
+            'balance': columns.balances,
+            # Categorized once per distinct narration
+            'category': categorize_many(columns.narrations)[columns.narration_codes],
+        })
+
     df = pd.DataFrame(transactions_data)
     df['date'] = pd.to_datetime(df['date'])
-    df['category'] = df['narration'].apply(categorize_transaction) # Changed 'description' to 'narration' based on fetch_bank_transactions.json
+    df['category'] = categorize_many(df['narration'].tolist()) # Changed 'description' to 'narration' based on fetch_bank_transactions.json
     return df
 
 def calculate_financial_health_score(transactions_df: pd.DataFrame, investments_data: Dict, emergency_fund_progress: float = 0.0) -> Dict:
@@ -40,14 +47,17 @@ def calculate_financial_health_score(transactions_df: pd.DataFrame, investments_
     score = 0
     breakdown = {}
 
-    # --- 1. Savings Rate (Max 40 points) ---
+    # Monthly income and spending over the latest complete months
     # Ensure 'type' is correctly mapped to 'CREDIT'/'DEBIT' in process_transactions
-    income = transactions_df[transactions_df['type'] == 'CREDIT']['amount'].sum()
-    spending = transactions_df[transactions_df['type'] == 'DEBIT']['amount'].sum()
-    
-    savings_rate = 0
-    if income > 0:
-        savings_rate = (income - spending) / income
+    cashflow = trailing_window(build_cashflow(
+        transactions_df['date'].to_numpy().astype('datetime64[D]'),
+        transactions_df['amount'].to_numpy(dtype=float),
+        (transactions_df['type'] == 'CREDIT').to_numpy(),
+        (transactions_df['type'] == 'DEBIT').to_numpy(),
+    ))
+
+    # --- 1. Savings Rate (Max 40 points) ---
+    savings_rate = cashflow.savings_rate or 0
 
     score_savings = 0
     if savings_rate > 0.20:
@@ -73,7 +83,7 @@ def calculate_financial_health_score(transactions_df: pd.DataFrame, investments_
 
     # --- 3. Investment Level (Max 30 points) ---
     total_investments = investments_data.get('total_value', 0)
-    annual_income = income * 12
+    annual_income = cashflow.avg_income * 12
     
     investment_ratio = 0
     if annual_income > 0:
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any, Optional
 import sys
 import os
@@ -11,28 +12,56 @@ sys.path.append(agents_path)
 
 # Import agent functions
 try:
-    from oracle import process_oracle_query
-    from guardian import run_guardian_analysis
+    from oracle import process_oracle_query, stream_oracle_query
+    from guardian import run_guardian_analysis, stream_guardian_analysis
     from catalyst import run_catalyst_analysis
     from strategist import run_strategist_analysis
+    from insights import stream_insights, parse_agents, INSIGHT_FORMATS
 except ImportError as e:
     print(f"Warning: Could not import agent modules: {e}")
     print(f"Agents path: {agents_path}")
     # Create dummy functions for testing
     async def process_oracle_query(uid: str, question: str):
         return {"response": "Oracle agent not available"}
+    async def stream_oracle_query(uid: str, question: str):
+        yield "Oracle agent not available"
     async def run_guardian_analysis(uid: str):
         return {"alerts": "Guardian agent not available"}
+    async def stream_guardian_analysis(uid: str, area: str = None):
+        yield {"event": "enriched", "alerts": "Guardian agent not available"}
     async def run_catalyst_analysis(uid: str):
         return {"tips": "Catalyst agent not available"}
     async def run_strategist_analysis(uid: str):
         return {"portfolio_analysis": "Strategist agent not available"}
+    INSIGHT_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+    def parse_agents(value):
+        return []
+    async def stream_insights(uid: str, agents=None, area: str = None, fmt: str = "sse"):
+        yield "event: done\ndata: {\"error\": \"Agents not available\"}\n\n"
 
 # Import authentication - use absolute import to avoid relative import issues
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
+# Shared webapp modules (llm_stream) live next to the agents directory
+sys.path.append(os.path.dirname(agents_path))
+from llm_stream import sse_answer, sse_records
+from precompute import precompute_scheduler
+from agent_jobs import agent_jobs, job_links
+from deadlines import request_deadline, within_deadline
+
+# Dashboard agents kept warm in the background for active users (started by main.py)
+precompute_scheduler.register("guardian", lambda uid, area: run_guardian_analysis(uid, area))
+precompute_scheduler.register("catalyst", lambda uid, area: run_catalyst_analysis(uid))
+precompute_scheduler.register("strategist", lambda uid, area: run_strategist_analysis(uid))
+
+# Job mode for all four agents (worker pool started by main.py)
+agent_jobs.register("oracle", lambda uid, payload: process_oracle_query(uid, payload.get("question", "")))
+agent_jobs.register("guardian", lambda uid, payload: run_guardian_analysis(uid, payload.get("area")))
+agent_jobs.register("catalyst", lambda uid, payload: run_catalyst_analysis(uid))
+agent_jobs.register("strategist", lambda uid, payload: run_strategist_analysis(uid))
+
 # We'll define a simple authentication function here to avoid circular imports
 async def get_current_phone_number(token: str = None):
     # For now, return a default phone number for testing
@@ -73,7 +102,8 @@ async def oracle_chat(
         # Convert phone number to UID format for agent compatibility
         uid = current_phone_number
         
-        result = await process_oracle_query(uid, question)
+        with request_deadline():
+            result = await process_oracle_query(uid, question)
         return {
             "status": "success",
             "agent": "oracle",
@@ -83,6 +113,26 @@ async def oracle_chat(
     except Exception as e:
         return handle_agent_error("oracle", e)
 
+@router.post("/oracle/chat/stream")
+async def oracle_chat_stream(
+    body: Dict[str, Any] = Body(...),
+    current_phone_number: str = Depends(get_current_phone_number)
+):
+    """
+    Oracle Agent, streamed as server-sent events
+    Sends {"token": ...} events as the answer is generated, then a "done" event with the full answer and timings
+    """
+    question = body.get("question", "")
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+    
+    uid = current_phone_number
+    return StreamingResponse(
+        sse_answer(within_deadline(stream_oracle_query(uid, question)), agent="oracle", question=question),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/guardian/alerts")
 async def guardian_alerts(
     area: str = None,
@@ -94,16 +144,34 @@ async def guardian_alerts(
     """
     try:
         uid = current_phone_number
-        result = await run_guardian_analysis(uid, area)
+        with request_deadline():
+            result, freshness = await precompute_scheduler.serve(uid, "guardian", lambda: run_guardian_analysis(uid, area), area=area)
         return {
             "status": "success",
             "agent": "guardian",
             "alerts": result,
+            "freshness": freshness,
             "timestamp": asyncio.get_event_loop().time()
         }
     except Exception as e:
         return handle_agent_error("guardian", e)
 
+@router.get("/guardian/alerts/stream")
+async def guardian_alerts_stream(
+    area: str = None,
+    current_phone_number: str = Depends(get_current_phone_number)
+):
+    """
+    Guardian Agent, progressively, as server-sent events
+    An "alerts" event carries the rule-based alerts as soon as the data is loaded; an "enriched" event follows with Gemini's explanations merged in
+    """
+    uid = current_phone_number
+    return StreamingResponse(
+        sse_records(within_deadline(stream_guardian_analysis(uid, area)), agent="guardian"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/catalyst/tips")
 async def catalyst_tips(
     current_phone_number: str = Depends(get_current_phone_number)
@@ -114,11 +182,13 @@ async def catalyst_tips(
     """
     try:
         uid = current_phone_number
-        result = await run_catalyst_analysis(uid)
+        with request_deadline():
+            result, freshness = await precompute_scheduler.serve(uid, "catalyst", lambda: run_catalyst_analysis(uid))
         return {
             "status": "success",
             "agent": "catalyst",
             "tips": result,
+            "freshness": freshness,
             "timestamp": asyncio.get_event_loop().time()
         }
     except Exception as e:
@@ -134,16 +204,95 @@ async def strategist_portfolio(
     """
     try:
         uid = current_phone_number
-        result = await run_strategist_analysis(uid)
+        with request_deadline():
+            result, freshness = await precompute_scheduler.serve(uid, "strategist", lambda: run_strategist_analysis(uid))
         return {
             "status": "success",
             "agent": "strategist",
             "portfolio_analysis": result,
+            "freshness": freshness,
             "timestamp": asyncio.get_event_loop().time()
         }
     except Exception as e:
         return handle_agent_error("strategist", e)
 
+@router.get("/insights")
+async def agents_insights(
+    agents: str = None,
+    area: str = None,
+    format: str = "sse",
+    current_phone_number: str = Depends(get_current_phone_number)
+):
+    """
+    Guardian, Catalyst and Strategist in one call
+    Loads the datasets they share once, runs the agents concurrently and streams each result (SSE or NDJSON) as soon as it is ready
+    """
+    if format not in INSIGHT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(INSIGHT_FORMATS)}")
+    try:
+        selected = parse_agents(agents)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    uid = current_phone_number
+    return StreamingResponse(
+        within_deadline(stream_insights(uid, selected, area, format)),
+        media_type=INSIGHT_FORMATS[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/jobs/{agent}", status_code=202)
+async def submit_agent_job(
+    agent: str,
+    body: Dict[str, Any] = Body(None),
+    current_phone_number: str = Depends(get_current_phone_number)
+):
+    """
+    Run an agent as a background job and return its id right away
+    Poll /agents/jobs/{job_id} or follow /agents/jobs/{job_id}/events for the result; identical running jobs are shared
+    """
+    payload = body or {}
+    if agent not in agent_jobs.agents:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent}")
+    if agent == "oracle" and not payload.get("question"):
+        raise HTTPException(status_code=400, detail="Question is required")
+    
+    uid = current_phone_number
+    job = await agent_jobs.submit(uid, agent, payload)
+    return {"status": "accepted", **job_links(job, prefix="/agents")}
+
+@router.get("/jobs/{job_id}")
+async def get_agent_job(
+    job_id: str,
+    wait: float = 0,
+    current_phone_number: str = Depends(get_current_phone_number)
+):
+    """
+    Job status and, once finished, its result (?wait=N long-polls up to N seconds, max 30)
+    """
+    uid = current_phone_number
+    job = await agent_jobs.get(job_id, uid)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait > 0:
+        job = await agent_jobs.wait(job_id, timeout=min(wait, 30)) or job
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def agent_job_events(
+    job_id: str,
+    current_phone_number: str = Depends(get_current_phone_number)
+):
+    """
+    Job progress as server-sent events: "status" on each change, then "done" with the result or error
+    """
+    uid = current_phone_number
+    return StreamingResponse(
+        agent_jobs.events(job_id, uid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/status")
 async def agents_status():
     """
@@ -25,6 +25,9 @@ class Subscription(BaseModel):
     estimated_monthly_cost: float
     transaction_count: int
     status: Literal["active", "potentially_unused"]
+    cadence: Optional[Literal["monthly", "quarterly", "annual"]] = None
+    amount: Optional[float] = None
+    next_payment_date: Optional[date] = None
 
 
 class SubscriptionInfo(BaseModel):
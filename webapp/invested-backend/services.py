@@ -1,12 +1,22 @@
 
+import asyncio
+import time
 import httpx
-import pandas as pd
 from datetime import datetime
 from uuid import UUID, uuid4
-from typing import Dict, List, Any
+from typing import Dict, List, Any, NamedTuple
 from schemas import Subscription, SubscriptionInfo, FinancialGoal, FinancialGoalUpdate
 from pathlib import Path
 import json
+import sys
+import os
+
+# Make the shared webapp modules (mcp_client, shared_utils) importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_client import mcp_get, mcp_post, make_flight_key, single_flight
+from transaction_store import transaction_columns
+from cashflow import cashflow_from_columns, trailing_window
+from subscription_engine import detect_subscriptions as find_subscriptions
 
 # Import configuration
 from config import FI_MCP_SERVER_URL, MCP_FILE_PATH
@@ -17,7 +27,12 @@ MCP_MOCK_SERVER_URL = FI_MCP_SERVER_URL
 # --- MODIFIED: Core MCP Data Fetching using Tool Calls ---
 async def call_mcp_tool(tool_name: str, phone: str, inputs: Dict = None) -> Any:
     """Calls a specific MCP tool to fetch data."""
+    if not inputs:
+        # Read-only tool call: concurrent identical requests share one round trip
+        return await single_flight(make_flight_key(phone, tool_name), lambda: _call_mcp_tool(tool_name, phone))
+    return await _call_mcp_tool(tool_name, phone, inputs)
 
+async def _call_mcp_tool(tool_name: str, phone: str, inputs: Dict = None) -> Any:
 
     if inputs is None:
         inputs = {}
@@ -40,71 +55,30 @@ async def call_mcp_tool(tool_name: str, phone: str, inputs: Dict = None) -> Any:
         }
         print(f"DEBUG: Trying payload with key '{key}': {payload}")
         url = f"{FI_MCP_SERVER_URL}/mcp/"
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload, timeout=10.0)
-                if response.status_code == 400:
-                    print(f"DEBUG: 400 Bad Request for key '{key}'. Response content: {response.text}. Trying next key if available.")
-                    continue
-                response.raise_for_status()
-
-                result = response.json()
-                print(f"DEBUG: Successfully called tool {tool_name} with key '{key}'. Result type: {result.get('type')}")
-
-                # PATCH: Handle Go MCP server's result format
-                if 'result' in result and 'content' in result['result']:
-                    for content_item in result['result']['content']:
-                        if content_item.get('type') == 'text' and 'text' in content_item:
-                            try:
-                                parsed_json = json.loads(content_item['text'])
-                                print(f"DEBUG: Tool {tool_name} returned JSON embedded in 'text' field (Go MCP style).")
-                                return parsed_json
-                            except json.JSONDecodeError:
-                                print(f"INFO: Tool {tool_name} returned plain text: {content_item['text']}")
-                                return None
-                    print(f"WARNING: No valid text content found in tool result for {tool_name}.")
-                    return None
-                # --- End PATCH ---
-
-                if result.get('type') == 'json' and 'json' in result:
-                    try:
-                        return json.loads(result['json'])
-                    except json.JSONDecodeError:
-                        print(f"ERROR: Tool {tool_name} returned invalid JSON in 'json' field: {result['json']}")
-                        return None
-                elif result.get('type') == 'text' and 'text' in result:
-                    try:
-                        parsed_json = json.loads(result['text'])
-                        print(f"DEBUG: Tool {tool_name} returned JSON embedded in 'text' field.")
-                        return parsed_json
-                    except json.JSONDecodeError:
-                        print(f"INFO: Tool {tool_name} returned plain text: {result['text']}")
-                        return None
-                else:
-                    print(f"WARNING: Unexpected tool result format for {tool_name}: {result}")
-                    return None
-
-            except httpx.RequestError as e:
-                print(f"ERROR: Error connecting to MCP server for tool {tool_name}: {e}")
-                return None
-            except httpx.HTTPStatusError as e:
-                print(f"ERROR: MCP server returned an error for tool {tool_name} with key '{key}': {e}")
-                if e.response.status_code == 404:
-                    return None
-                if e.response.status_code == 400:
-                    print(f"DEBUG: HTTP 400 for key '{key}', will try next key if available.")
-                    continue
-                raise
-    print("ERROR: All tried keys for phone parameter resulted in 400 Bad Request.")
-    return None
-
-    async with httpx.AsyncClient() as client:
         try:
-            response = await client.post(url, json=payload, timeout=10.0)
+            response = await mcp_post(url, json=payload, timeout=10.0)
+            if response.status_code == 400:
+                print(f"DEBUG: 400 Bad Request for key '{key}'. Response content: {response.text}. Trying next key if available.")
+                continue
             response.raise_for_status()
 
             result = response.json()
-            print(f"DEBUG: Successfully called tool {tool_name}. Result type: {result.get('type')}")
+            print(f"DEBUG: Successfully called tool {tool_name} with key '{key}'. Result type: {result.get('type')}")
+
+            # PATCH: Handle Go MCP server's result format
+            if 'result' in result and 'content' in result['result']:
+                for content_item in result['result']['content']:
+                    if content_item.get('type') == 'text' and 'text' in content_item:
+                        try:
+                            parsed_json = json.loads(content_item['text'])
+                            print(f"DEBUG: Tool {tool_name} returned JSON embedded in 'text' field (Go MCP style).")
+                            return parsed_json
+                        except json.JSONDecodeError:
+                            print(f"INFO: Tool {tool_name} returned plain text: {content_item['text']}")
+                            return None
+                print(f"WARNING: No valid text content found in tool result for {tool_name}.")
+                return None
+            # --- End PATCH ---
 
             if result.get('type') == 'json' and 'json' in result:
                 try:
@@ -128,10 +102,15 @@ async def call_mcp_tool(tool_name: str, phone: str, inputs: Dict = None) -> Any:
             print(f"ERROR: Error connecting to MCP server for tool {tool_name}: {e}")
             return None
         except httpx.HTTPStatusError as e:
-            print(f"ERROR: MCP server returned an error for tool {tool_name}: {e}")
+            print(f"ERROR: MCP server returned an error for tool {tool_name} with key '{key}': {e}")
             if e.response.status_code == 404:
                 return None
+            if e.response.status_code == 400:
+                print(f"DEBUG: HTTP 400 for key '{key}', will try next key if available.")
+                continue
             raise
+    print("ERROR: All tried keys for phone parameter resulted in 400 Bad Request.")
+    return None
 
 async def call_mcp_net_worth(phone: str) -> Any:
     """Calls the GetNetWorth tool for a given user."""
@@ -174,21 +153,20 @@ async def fetch_from_mcp(phone: str, file: str) -> Any:
     """Fetches data for a given user from the mock server (direct file access)."""
     url = f"{FI_MCP_SERVER_URL}/user/{phone}/{file}"
     print(f"DEBUG: Direct fetching from mock server: {url}")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, timeout=10.0)
-            response.raise_for_status()
-            print(f"DEBUG: Successfully direct fetched {file} for {phone}.")
-            return response.json()
-        except httpx.RequestError as e:
-            print(f"ERROR: Error connecting to mock server for direct fetch {url}: {e}")
-            return None
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404 and file == "goals.json":
-                print(f"DEBUG: {file} not found for {phone}, returning empty list.")
-                return []
-            print(f"ERROR: Mock server returned an error for direct fetch {url}: {e}")
-            return None
+    try:
+        response = await mcp_get(url, timeout=10.0)
+        response.raise_for_status()
+        print(f"DEBUG: Successfully direct fetched {file} for {phone}.")
+        return response.json()
+    except httpx.RequestError as e:
+        print(f"ERROR: Error connecting to mock server for direct fetch {url}: {e}")
+        return None
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404 and file == "goals.json":
+            print(f"DEBUG: {file} not found for {phone}, returning empty list.")
+            return []
+        print(f"ERROR: Mock server returned an error for direct fetch {url}: {e}")
+        return None
 
 async def write_to_mcp(phone: str, file: str, data: Any):
     # ... (This function remains unchanged, as it writes to local disk) ...
@@ -211,52 +189,28 @@ async def write_to_mcp(phone: str, file: str, data: Any):
 
 # --- Feature 3: Subscription Detection (Modify to use new call_mcp_tool) ---
 def detect_subscriptions(transactions_data: Dict) -> SubscriptionInfo:
-    # This logic remains mostly the same, but the transactions_data input will now come from a tool call.
+    """Monthly, quarterly and annual payments found by the shared subscription engine"""
     if not transactions_data or 'bankTransactions' not in transactions_data:
         return SubscriptionInfo(total_monthly_cost=0, potential_savings=0, subscriptions=[])
     
-    all_txns = []
-    for bank_account in transactions_data['bankTransactions']:
-        all_txns.extend(bank_account['txns'])
-
-    df = pd.DataFrame(all_txns, columns=['amount', 'narration', 'date', 'type', 'mode', 'balance'])
-    df['date'] = pd.to_datetime(df['date'])
-    df = df[df['type'] == 2].copy() # Filter for debits only
-    df['amount'] = pd.to_numeric(df['amount'])
-
-    # Normalize narration to find similar transactions
-    df['narration_key'] = df['narration'].str.extract(r'([a-zA-Z\s]+)')[0].str.strip().str.upper()
-
-    subscriptions = []
-    total_monthly_cost = 0
-    potential_savings = 0
-    
-    today = datetime.strptime("2025-07-22", "%Y-%m-%d").date() # Using fixed date for consistent results
-
-    for key, group in df.groupby('narration_key'):
-        if len(group) > 1: # It's recurring if it happened more than once
-            avg_cost = group['amount'].mean()
-            last_paid_date = group['date'].max().date()
-            days_since_last_paid = (today - last_paid_date).days
-            
-            status = "active"
-            if days_since_last_paid > 45: # If not paid in ~1.5 months, flag it
-                status = "potentially_unused"
-                potential_savings += avg_cost
-
-            subscriptions.append(Subscription(
-                name=key.title(),
-                last_paid_date=last_paid_date,
-                estimated_monthly_cost=round(avg_cost, 2),
-                transaction_count=len(group),
-                status=status
-            ))
-            total_monthly_cost += avg_cost
-
+    detected = find_subscriptions(transaction_columns(transactions_data))
+    subscriptions = [
+        Subscription(
+            name=subscription.name,
+            last_paid_date=subscription.last_paid,
+            estimated_monthly_cost=subscription.monthly_cost,
+            transaction_count=subscription.payments,
+            status=subscription.status,
+            cadence=subscription.cadence,
+            amount=subscription.amount,
+            next_payment_date=subscription.next_expected,
+        )
+        for subscription in detected
+    ]
     return SubscriptionInfo(
-        total_monthly_cost=round(total_monthly_cost, 2),
-        potential_savings=round(potential_savings, 2),
-        subscriptions=sorted(subscriptions, key=lambda s: s.last_paid_date, reverse=True)
+        total_monthly_cost=round(sum(subscription.monthly_cost for subscription in detected), 2),
+        potential_savings=round(sum(subscription.monthly_cost for subscription in detected if subscription.status == "potentially_unused"), 2),
+        subscriptions=subscriptions
     )
 
 # --- Feature 4: Goal Planning (Uses direct file fetch/write, not tools yet) ---
@@ -305,17 +259,49 @@ async def delete_goal(phone: str, goal_id: UUID) -> List[FinancialGoal]:
     await write_to_mcp(phone, "goals.json", [g.dict() for g in updated_goals])
     return updated_goals
 
-async def calculate_financial_health_score(phone_number: str) -> dict:
+# --- Analysis context: the datasets behind the health score and detailed analysis ---
+# Both endpoints used to await their MCP calls one after another, and the
+# detailed analysis then called the health score, which fetched five of them
+# again (eleven serial round trips). The context fetches each dataset once,
+# concurrently, and both scorers read the same snapshot.
+ANALYSIS_TOOLS = {
+    "net_worth": "GetNetWorth",
+    "bank_transactions": "GetBankTransactions",
+    "credit_report": "GetCreditReport",
+    "mf_transactions": "GetMFTransactions",
+    "stock_transactions": "GetStockTransactions",
+}
+
+class AnalysisContext(NamedTuple):
+    phone_number: str
+    net_worth: Any
+    bank_transactions: Any
+    credit_report: Any
+    mf_transactions: Any
+    stock_transactions: Any
+    fetch_ms: float
+
+async def load_analysis_context(phone_number: str) -> AnalysisContext:
+    """Fetch every dataset the analysis endpoints need, concurrently and once"""
+    started_at = time.perf_counter()
+    fetched = await asyncio.gather(*(call_mcp_tool(tool, phone_number) for tool in ANALYSIS_TOOLS.values()))
+    fetch_ms = (time.perf_counter() - started_at) * 1000
+    print(f"📊 Loaded {len(fetched)} analysis datasets for {phone_number} in {fetch_ms:.0f} ms")
+    return AnalysisContext(phone_number, *fetched, fetch_ms=fetch_ms)
+
+async def calculate_financial_health_score(phone_number: str, context: AnalysisContext = None) -> dict:
     """
     Calculate a comprehensive financial health score based on multiple factors
     """
     try:
-        # Fetch user's financial data
-        net_worth_data = await call_mcp_net_worth(phone_number)
-        bank_transactions = await call_mcp_tool("GetBankTransactions", phone_number)
-        credit_report = await call_mcp_credit_report(phone_number)
-        mf_transactions = await call_mcp_mf_transactions(phone_number)
-        stock_transactions = await call_mcp_stock_transactions(phone_number)
+        # Fetch user's financial data (unless the caller already has it)
+        if context is None:
+            context = await load_analysis_context(phone_number)
+        net_worth_data = context.net_worth
+        bank_transactions = context.bank_transactions
+        credit_report = context.credit_report
+        mf_transactions = context.mf_transactions
+        stock_transactions = context.stock_transactions
         
         # Initialize score components
         score_components = {
@@ -326,13 +312,16 @@ async def calculate_financial_health_score(phone_number: str) -> dict:
             "credit_health": 0
         }
         
+        # Average monthly income and expenses over the latest complete months
+        cashflow = trailing_window(cashflow_from_columns(transaction_columns(bank_transactions)))
+        
         # 1. Emergency Fund Score (0-20 points)
         if net_worth_data and "netWorthResponse" in net_worth_data:
             net_worth_str = net_worth_data["netWorthResponse"].get("totalNetWorthValue", {}).get("units", "0")
             net_worth = float(net_worth_str) if isinstance(net_worth_str, str) else float(net_worth_str or 0)
             if bank_transactions:
-                # Estimate monthly expenses from transactions
-                monthly_expenses = 50000  # Default estimate
+                # Monthly expenses from the user's own transactions
+                monthly_expenses = cashflow.avg_expenses
                 emergency_fund_ratio = net_worth / (monthly_expenses * 6) if monthly_expenses > 0 else 0
                 if emergency_fund_ratio >= 1:
                     score_components["emergency_fund"] = 20
@@ -357,14 +346,13 @@ async def calculate_financial_health_score(phone_number: str) -> dict:
                 score_components["debt_management"] = 5
         
         # 3. Savings Rate Score (0-20 points)
-        if bank_transactions and mf_transactions:
-            # Calculate savings rate (simplified)
-            total_investments = len(mf_transactions.get("mfTransactionsResponse", {}).get("transactions", []))
-            if total_investments > 10:
+        if cashflow.savings_rate is not None:
+            # Share of income not spent over the latest complete months
+            if cashflow.savings_rate >= 0.3:
                 score_components["savings_rate"] = 20
-            elif total_investments > 5:
+            elif cashflow.savings_rate >= 0.2:
                 score_components["savings_rate"] = 15
-            elif total_investments > 2:
+            elif cashflow.savings_rate >= 0.1:
                 score_components["savings_rate"] = 10
             else:
                 score_components["savings_rate"] = 5
@@ -440,16 +428,17 @@ async def get_detailed_financial_analysis(phone_number: str) -> dict:
     Get detailed financial analysis with breakdowns and recommendations
     """
     try:
-        # Fetch all financial data
-        net_worth_data = await call_mcp_net_worth(phone_number)
-        bank_transactions = await call_mcp_tool("GetBankTransactions", phone_number)
-        credit_report = await call_mcp_credit_report(phone_number)
-        mf_transactions = await call_mcp_mf_transactions(phone_number)
-        stock_transactions = await call_mcp_stock_transactions(phone_number)
-        epf_details = await call_mcp_epf_details(phone_number)
+        # Fetch all financial data once; the score reads the same snapshot
+        context = await load_analysis_context(phone_number)
+        net_worth_data = context.net_worth
+        bank_transactions = context.bank_transactions
+        credit_report = context.credit_report
+        mf_transactions = context.mf_transactions
+        stock_transactions = context.stock_transactions
         
         # Calculate score components
-        score_data = await calculate_financial_health_score(phone_number)
+        score_data = await calculate_financial_health_score(phone_number, context)
+        cashflow = trailing_window(cashflow_from_columns(transaction_columns(bank_transactions)))
         
         # Prepare detailed analysis
         analysis = {
@@ -498,7 +487,10 @@ async def get_detailed_financial_analysis(phone_number: str) -> dict:
                 "Consider consulting a financial advisor for personalized advice"
             ],
             "data_summary": {
-                "total_transactions": len(bank_transactions.get("bankTransactionsResponse", {}).get("transactions", [])),
+                "total_transactions": transaction_columns(bank_transactions).size,
+                "monthly_income": cashflow.avg_income,
+                "monthly_expenses": cashflow.avg_expenses,
+                "savings_rate": cashflow.savings_rate,
                 "investment_count": len(mf_transactions.get("mfTransactionsResponse", {}).get("transactions", [])),
                 "stock_count": len(stock_transactions.get("stockTransactionsResponse", {}).get("transactions", [])),
                 "active_loans": len(credit_report.get("creditReportResponse", {}).get("activeLoans", []))
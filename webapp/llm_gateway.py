@@ -0,0 +1,305 @@
+# Async gateway for Gemini calls
+#
+# Every LLM call goes through one scheduler with a global concurrency cap and a
+# per-user cap. Waiting calls are granted in priority order, and background
+# work (Guardian/Catalyst/Strategist refreshes) cannot use the slots reserved
+# for interactive Oracle chat, so a chat never queues behind a dashboard refresh.
+
+import asyncio
+import bisect
+import itertools
+import os
+import time
+from collections import deque
+
+from vertexai.generative_models import GenerativeModel, Part
+
+from llm_tools import tool_registry
+from deadlines import stage_budget, record_timeout
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITY_RANK = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 1}
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_PER_USER = int(os.getenv("LLM_MAX_PER_USER", "2"))
+# Slots only interactive calls may use
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED", "2"))
+# Model round trips allowed for one call before giving up on further tool use
+LLM_MAX_TOOL_STEPS = int(os.getenv("LLM_MAX_TOOL_STEPS", "4"))
+LATENCY_WINDOW = 512
+
+# --- Model factory ---
+_models = {}  # (model_name, tool names, registry version) -> GenerativeModel
+
+def get_model(model_name: str = DEFAULT_MODEL, tool_names=()) -> GenerativeModel:
+    """Shared GenerativeModel per (model, tool set); models hold no conversation state, so reuse is safe"""
+    key = (model_name, tuple(sorted(tool_names)), tool_registry.version)
+    model = _models.get(key)
+    if model is None:
+        tools = [tool_registry.tool(key[1])] if key[1] else None
+        model = GenerativeModel(model_name, tools=tools)
+        _models[key] = model
+    return model
+
+def _response_text(response) -> str:
+    try:
+        return response.text
+    except ValueError:
+        # No text part (e.g. the model only returned function calls)
+        return ""
+
+class LLMGateway:
+    """Priority scheduler around generate_content_async"""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_per_user: int = LLM_MAX_PER_USER,
+                 interactive_reserved: int = LLM_INTERACTIVE_RESERVED):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.interactive_reserved = min(interactive_reserved, max_concurrency - 1)
+        self._active = 0
+        self._active_by_user = {}
+        self._waiters = []  # sorted [(rank, seq, priority, uid, future)]
+        self._seq = itertools.count()
+        self._tool_stats = {"tool_steps": 0, "function_calls": 0, "parallel_batches": 0, "step_limit_hits": 0}
+        self._stats = {
+            priority: {"completed": 0, "errors": 0, "timeouts": 0, "cancelled": 0,
+                       "wait_ms": deque(maxlen=LATENCY_WINDOW), "service_ms": deque(maxlen=LATENCY_WINDOW)}
+            for priority in PRIORITY_RANK
+        }
+        # Streamed calls: time to first chunk is tracked apart from the full answer (both include queue wait)
+        self._stream_stats = {"completed": 0, "errors": 0, "timeouts": 0, "cancelled": 0,
+                              "first_token_ms": deque(maxlen=LATENCY_WINDOW), "total_ms": deque(maxlen=LATENCY_WINDOW)}
+
+    # --- Scheduling ---
+    def _can_start(self, uid, priority: str) -> bool:
+        limit = self.max_concurrency
+        if priority != PRIORITY_INTERACTIVE:
+            limit -= self.interactive_reserved
+        if self._active >= limit:
+            return False
+        return uid is None or self._active_by_user.get(uid, 0) < self.max_per_user
+
+    def _start(self, uid):
+        self._active += 1
+        if uid is not None:
+            self._active_by_user[uid] = self._active_by_user.get(uid, 0) + 1
+
+    def _release(self, uid):
+        self._active -= 1
+        if uid is not None:
+            remaining = self._active_by_user.get(uid, 1) - 1
+            if remaining:
+                self._active_by_user[uid] = remaining
+            else:
+                self._active_by_user.pop(uid, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant waiting calls in priority order; a waiter held back by its user's cap does not block others"""
+        for waiter in list(self._waiters):
+            _, _, priority, uid, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+            elif self._can_start(uid, priority):
+                self._waiters.remove(waiter)
+                self._start(uid)
+                future.set_result(None)
+
+    async def _acquire(self, uid, priority: str):
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiters, (PRIORITY_RANK[priority], next(self._seq), priority, uid, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the caller went away
+                self._release(uid)
+            else:
+                self._waiters = [waiter for waiter in self._waiters if waiter[4] is not future]
+            raise
+
+    async def _acquire_within(self, uid, priority: str, timeout: float):
+        """Acquire a slot; returns (budget, seconds left for the call itself).
+
+        Under a request deadline the queue wait counts against it as well.
+        """
+        budget = stage_budget("llm", timeout)
+        queued_at = time.perf_counter()
+        try:
+            if budget.timeout <= 0:
+                raise asyncio.TimeoutError("LLM call skipped: request deadline already passed")
+            if budget.by_deadline:
+                await asyncio.wait_for(self._acquire(uid, priority), timeout=budget.timeout)
+            else:
+                await self._acquire(uid, priority)
+        except asyncio.TimeoutError:
+            # wait_for cancelled the wait on its own deadline: a timeout, not a cancellation
+            self._stats[priority]["timeouts"] += 1
+            record_timeout("llm", budget)
+            raise
+        except asyncio.CancelledError:
+            self._stats[priority]["cancelled"] += 1
+            raise
+        if not budget.by_deadline:
+            return budget, timeout
+        return budget, max(0.0, budget.timeout - (time.perf_counter() - queued_at))
+
+    # --- Calls ---
+    async def generate(self, prompt, uid: str = None, priority: str = PRIORITY_BACKGROUND, model_name: str = DEFAULT_MODEL,
+                       tools=None, timeout: float = 45) -> str:
+        """Run one Gemini request and return its text.
+
+        tools names registered tools the model may call; calls are executed and
+        fed back until the model answers or LLM_MAX_TOOL_STEPS is reached.
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+        stats = self._stats[priority]
+        queued_at = time.perf_counter()
+        budget, call_timeout = await self._acquire_within(uid, priority, timeout)
+        started_at = time.perf_counter()
+        stats["wait_ms"].append((started_at - queued_at) * 1000)
+        try:
+            text = await asyncio.wait_for(self._generate(prompt, model_name, tools or ()), timeout=call_timeout)
+            stats["completed"] += 1
+            return text
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            record_timeout("llm", budget)
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["service_ms"].append((time.perf_counter() - started_at) * 1000)
+            self._release(uid)
+
+    async def stream(self, prompt, uid: str = None, priority: str = PRIORITY_INTERACTIVE, model_name: str = DEFAULT_MODEL,
+                     timeout: float = 45):
+        """Run one Gemini request with streaming generation, yielding text chunks as they arrive.
+
+        The slot is held until the stream ends or the consumer stops iterating;
+        timeout bounds the whole answer, not each chunk.
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+        stats = self._stats[priority]
+        queued_at = time.perf_counter()
+        budget, call_timeout = await self._acquire_within(uid, priority, timeout)
+        started_at = time.perf_counter()
+        stats["wait_ms"].append((started_at - queued_at) * 1000)
+        deadline = started_at + call_timeout
+        first_chunk = True
+        try:
+            responses = await asyncio.wait_for(
+                get_model(model_name).generate_content_async(prompt, stream=True), timeout=call_timeout
+            )
+            chunks = responses.__aiter__()
+            while True:
+                try:
+                    response = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - time.perf_counter()))
+                except StopAsyncIteration:
+                    break
+                text = _response_text(response)
+                if not text:
+                    continue
+                if first_chunk:
+                    first_chunk = False
+                    self._stream_stats["first_token_ms"].append((time.perf_counter() - queued_at) * 1000)
+                yield text
+            stats["completed"] += 1
+            self._stream_stats["completed"] += 1
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            self._stream_stats["timeouts"] += 1
+            record_timeout("llm", budget)
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away mid-answer
+            self._stream_stats["cancelled"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            self._stream_stats["errors"] += 1
+            raise
+        finally:
+            finished_at = time.perf_counter()
+            stats["service_ms"].append((finished_at - started_at) * 1000)
+            self._stream_stats["total_ms"].append((finished_at - queued_at) * 1000)
+            self._release(uid)
+
+    async def _generate(self, prompt, model_name: str, tool_names):
+        model = get_model(model_name, tool_names)
+        if not tool_names:
+            response = await model.generate_content_async(prompt)
+            return _response_text(response)
+
+        # A chat session carries the function calls and their results between steps
+        chat = model.start_chat()
+        response = await chat.send_message_async(prompt)
+        for _ in range(LLM_MAX_TOOL_STEPS):
+            function_calls = response.candidates[0].function_calls
+            if not function_calls:
+                return _response_text(response)
+            self._tool_stats["tool_steps"] += 1
+            self._tool_stats["function_calls"] += len(function_calls)
+            if len(function_calls) > 1:
+                self._tool_stats["parallel_batches"] += 1
+            results = await tool_registry.call_all(function_calls)
+            response = await chat.send_message_async([
+                Part.from_function_response(name=function_call.name, response={"content": result})
+                for function_call, result in zip(function_calls, results)
+            ])
+        self._tool_stats["step_limit_hits"] += 1
+        print(f"⚠️ Gemini still requesting tools after {LLM_MAX_TOOL_STEPS} steps, returning partial answer")
+        return _response_text(response)
+
+    def stats(self) -> dict:
+        by_priority = {}
+        for priority, stats in self._stats.items():
+            by_priority[priority] = {
+                "completed": stats["completed"],
+                "errors": stats["errors"],
+                "timeouts": stats["timeouts"],
+                "cancelled": stats["cancelled"],
+                "queued": sum(1 for waiter in self._waiters if waiter[2] == priority),
+                "queue_wait_ms": _summary(stats["wait_ms"]),
+                "service_ms": _summary(stats["service_ms"]),
+            }
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.max_per_user,
+            "interactive_reserved": self.interactive_reserved,
+            "active_users": len(self._active_by_user),
+            "priorities": by_priority,
+            "cached_models": len(_models),
+            "tool_use": {**self._tool_stats, "tools": tool_registry.stats()},
+            "streaming": {
+                "completed": self._stream_stats["completed"],
+                "errors": self._stream_stats["errors"],
+                "timeouts": self._stream_stats["timeouts"],
+                "cancelled": self._stream_stats["cancelled"],
+                "first_token_ms": _summary(self._stream_stats["first_token_ms"]),
+                "total_ms": _summary(self._stream_stats["total_ms"]),
+            },
+        }
+
+def _summary(samples) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "avg": round(sum(samples) / len(samples), 2),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "max": round(samples[-1], 2),
+    }
+
+# Process-wide gateway
+llm_gateway = LLMGateway()
+
+def get_llm_metrics() -> dict:
+    return llm_gateway.stats()
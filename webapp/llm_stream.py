@@ -0,0 +1,108 @@
+# Streaming helpers for Gemini answers sent as server-sent events
+#
+# The Gemini response cleanup (collapse blank lines, 'nn' -> newline, double
+# spaces, strip) only ever rewrites runs of one repeated character, so it can
+# be applied chunk by chunk: text is released up to the start of the last run
+# (which the next chunk may extend) and trailing whitespace is held back until
+# more text follows it. The streamed result is identical to cleaning the whole
+# answer at once.
+#
+# Each wrapper closes the stream it wraps when it is closed itself (client
+# disconnect), so the LLM gateway slot at the bottom is released right away.
+
+import json
+import time
+from contextlib import aclosing
+
+def normalize_spacing(text: str) -> str:
+    """The spacing fixes applied to every Gemini answer (without the final strip)"""
+    cleaned = text.replace('\n\n\n', '\n\n')  # Remove triple newlines
+    cleaned = cleaned.replace('\n\n\n\n', '\n\n')  # Remove quadruple newlines
+    cleaned = cleaned.replace('nn', '\n')  # Fix common formatting issue
+    cleaned = cleaned.replace('  ', ' ')  # Remove double spaces
+    return cleaned
+
+class StreamCleaner:
+    """Incremental clean_gemini_response: feed() chunks as they arrive, then flush()"""
+
+    def __init__(self):
+        self._raw = ""        # tail that a later chunk could still change
+        self._held = ""       # cleaned whitespace waiting for more text (dropped if the answer ends)
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        self._raw += chunk or ""
+        cut = len(self._raw)
+        while cut > 0 and self._raw[cut - 1] == self._raw[-1]:
+            cut -= 1
+        ready, self._raw = self._raw[:cut], self._raw[cut:]
+        return self._emit(normalize_spacing(ready))
+
+    def flush(self) -> str:
+        text = self._emit(normalize_spacing(self._raw))
+        self._raw = self._held = ""
+        return text
+
+    def _emit(self, cleaned: str) -> str:
+        if not self._started:
+            cleaned = cleaned.lstrip()
+            if not cleaned:
+                return ""
+            self._started = True
+        text = self._held + cleaned
+        released = text.rstrip()
+        self._held = text[len(released):]
+        return released
+
+async def clean_stream(chunks):
+    """Apply StreamCleaner to an async iterator of raw text chunks"""
+    cleaner = StreamCleaner()
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            text = cleaner.feed(chunk)
+            if text:
+                yield text
+    text = cleaner.flush()
+    if text:
+        yield text
+
+def sse_event(data: dict, event: str = None) -> str:
+    """One server-sent event"""
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+async def sse_answer(chunks, **done_fields):
+    """Stream text chunks as `data: {"token": ...}` events and finish with a `done` event
+    carrying the full answer, time to first token and total time (ms)"""
+    started_at = time.perf_counter()
+    first_token_ms = None
+    parts = []
+    try:
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started_at) * 1000
+                parts.append(chunk)
+                yield sse_event({"token": chunk})
+    except Exception as e:
+        print(f"❌ Streaming answer failed: {e}")
+        yield sse_event({"error": str(e)}, event="error")
+    yield sse_event({
+        **done_fields,
+        "answer": "".join(parts),
+        "first_token_ms": round(first_token_ms, 2) if first_token_ms is not None else None,
+        "total_ms": round((time.perf_counter() - started_at) * 1000, 2),
+    }, event="done")
+
+async def sse_records(records, **fields):
+    """Stream {"event": name, ...} dicts (e.g. progressive agent results) as named server-sent events"""
+    try:
+        async with aclosing(records):
+            async for record in records:
+                record = dict(record)
+                event = record.pop("event", None)
+                yield sse_event({**fields, **record}, event=event)
+    except Exception as e:
+        print(f"❌ Streaming records failed: {e}")
+        yield sse_event({**fields, "error": str(e)}, event="error")
@@ -0,0 +1,91 @@
+# Pluggable tool registry for Gemini function calling
+#
+# Tools register a FunctionDeclaration and a handler once; callers then ask for
+# tools by name. The registry builds (and caches) the vertexai Tool for a set of
+# names and executes the function calls Gemini returns, concurrently when one
+# response asks for several.
+
+import asyncio
+import inspect
+import time
+
+from vertexai.generative_models import Tool, FunctionDeclaration
+
+from executors import run_blocking
+
+class ToolRegistry:
+    def __init__(self):
+        self._handlers = {}       # name -> callable (sync or async)
+        self._declarations = {}   # name -> FunctionDeclaration
+        self._tools = {}          # tuple of names -> Tool
+        self._stats = {}          # name -> {"calls", "errors", "total_ms"}
+        self.version = 0          # bumped on every change so cached models are rebuilt
+
+    def register(self, name: str, description: str, parameters: dict, handler):
+        """Register (or replace) a tool. handler receives the model's arguments as keyword arguments."""
+        self._handlers[name] = handler
+        self._declarations[name] = FunctionDeclaration(name=name, description=description, parameters=parameters)
+        self._tools = {names: tool for names, tool in self._tools.items() if name not in names}
+        self.version += 1
+
+    def tool(self, names) -> Tool:
+        """One Tool holding the declarations for the given names"""
+        key = tuple(sorted(names))
+        tool = self._tools.get(key)
+        if tool is None:
+            missing = [name for name in key if name not in self._declarations]
+            if missing:
+                raise KeyError(f"Unknown tools: {missing}")
+            tool = Tool(function_declarations=[self._declarations[name] for name in key])
+            self._tools[key] = tool
+        return tool
+
+    def names(self) -> list:
+        return sorted(self._handlers)
+
+    async def call(self, name: str, args: dict):
+        """Run one function call. Failures are returned to the model as {"error": ...} rather than raised."""
+        stats = self._stats.setdefault(name, {"calls": 0, "errors": 0, "total_ms": 0.0})
+        stats["calls"] += 1
+        started_at = time.perf_counter()
+        handler = self._handlers.get(name)
+        try:
+            if handler is None:
+                raise KeyError(f"Unknown tool '{name}'")
+            if inspect.iscoroutinefunction(handler):
+                return await handler(**args)
+            # Tool handlers may do blocking I/O; keep them off the event loop
+            return await run_blocking("tools", handler, **args)
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"⚠️ Tool '{name}' failed: {e}")
+            return {"error": f"{name} failed: {e}"}
+        finally:
+            stats["total_ms"] += (time.perf_counter() - started_at) * 1000
+
+    async def call_all(self, function_calls) -> list:
+        """Run every function call from one model response concurrently, preserving order"""
+        return await asyncio.gather(*[
+            self.call(function_call.name, {key: value for key, value in function_call.args.items()})
+            for function_call in function_calls
+        ])
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+            }
+            for name, stats in self._stats.items()
+        }
+
+# Process-wide registry
+tool_registry = ToolRegistry()
+
+def register_tool(name: str, description: str, parameters: dict):
+    """Decorator form of tool_registry.register"""
+    def decorator(handler):
+        tool_registry.register(name, description, parameters, handler)
+        return handler
+    return decorator
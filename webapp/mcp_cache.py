@@ -0,0 +1,134 @@
+# In-process L1 cache for MCP payloads (per user, per tool)
+
+import json
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+MCP_L1_CACHE_MAX_BYTES = int(os.getenv("MCP_L1_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+class CachePolicy(NamedTuple):
+    """Freshness window for one dataset.
+
+    Younger than fresh_seconds: served as-is. Between fresh_seconds and
+    stale_seconds: served immediately while one background refresh runs.
+    Older than stale_seconds: treated as a miss.
+    """
+    fresh_seconds: float
+    stale_seconds: float
+    beta: float = 1.0
+
+def should_refresh_early(age_seconds: float, policy: CachePolicy, recompute_seconds: float) -> bool:
+    """Probabilistic early expiry (XFetch): refresh a little before fresh_seconds, sooner the slower the fetch.
+
+    Spreads refreshes of a hot key over time so it never expires for every
+    caller at once.
+    """
+    if age_seconds >= policy.fresh_seconds:
+        return True
+    if recompute_seconds <= 0:
+        return False
+    # 1 - random() is in (0, 1], so log() is defined and <= 0
+    jitter = -recompute_seconds * policy.beta * math.log(1.0 - random.random())
+    return age_seconds + jitter >= policy.fresh_seconds
+
+class MCPPayloadCache:
+    """Bounded TTL + LRU cache keyed by (uid, tool_name).
+
+    Entry size is the length of the payload's JSON encoding; when the byte
+    budget is exceeded the least recently used entries are evicted.
+
+    Entries are kept as that JSON text and every hit decodes a fresh copy, so
+    a caller that changes what it got back cannot change what later hits see.
+    With copy_values=False the stored object itself is returned; only for an
+    owner that mutates it under its own lock and puts it back.
+    """
+
+    def __init__(self, max_bytes: int = MCP_L1_CACHE_MAX_BYTES, ttl_seconds: float = 300, copy_values: bool = True):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.copy_values = copy_values
+        self._entries = OrderedDict()  # (uid, tool_name) -> (expires_at, stored_at, size, value or JSON text)
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0, "invalidations": 0, "rejected": 0}
+
+    def get(self, uid: str, tool_name: str):
+        found = self.get_with_age(uid, tool_name)
+        return found[0] if found is not None else None
+
+    def get_with_age(self, uid: str, tool_name: str):
+        """Return (value, age_seconds) for a live entry, or None"""
+        key = (uid, tool_name)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        expires_at, stored_at, _, value = entry
+        now = time.monotonic()
+        if now >= expires_at:
+            self._remove(key)
+            self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return (json.loads(value) if self.copy_values else value), now - stored_at
+
+    def put(self, uid: str, tool_name: str, value, ttl_seconds: float = None, age_seconds: float = 0):
+        """Store a payload; age_seconds backdates entries that were already cached elsewhere (e.g. Firestore)"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        try:
+            encoded = json.dumps(value, default=str)
+        except (TypeError, ValueError):
+            self._stats["rejected"] += 1
+            return
+        size = len(encoded)
+        if size > self.max_bytes:
+            self._stats["rejected"] += 1
+            return
+
+        key = (uid, tool_name)
+        if key in self._entries:
+            self._remove(key)
+        now = time.monotonic()
+        self._entries[key] = (now + ttl, now - age_seconds, size, encoded if self.copy_values else value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, uid: str, tool_name: str = None) -> int:
+        """Drop one tool's entry for a user, or every entry for the user when tool_name is None."""
+        if tool_name is not None:
+            keys = [(uid, tool_name)] if (uid, tool_name) in self._entries else []
+        else:
+            keys = [key for key in self._entries if key[0] == uid]
+        for key in keys:
+            self._remove(key)
+        self._stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
@@ -0,0 +1,197 @@
+# Shared pooled HTTP client for all MCP server calls
+
+import asyncio
+import copy
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+# Pool configuration
+MCP_MAX_CONNECTIONS = int(os.getenv("MCP_MAX_CONNECTIONS", "50"))
+MCP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("MCP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+MCP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("MCP_MAX_CONNECTIONS_PER_HOST", "20"))
+MCP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("MCP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+MCP_DEFAULT_TIMEOUT_SECONDS = float(os.getenv("MCP_DEFAULT_TIMEOUT_SECONDS", "30"))
+MCP_HTTP2 = os.getenv("MCP_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_client = None
+_host_semaphores = {}
+_in_flight = {}  # (namespace, key) -> task
+_single_flight_metrics = {}  # namespace -> {"calls", "executions", "coalesced"}
+_metrics = {
+    "clients_created": 0,
+    "requests": 0,
+    "errors": 0,
+    "timeouts": 0,
+    "in_flight": 0,
+    "peak_in_flight": 0,
+    "total_latency_ms": 0.0,
+    "per_host": {},
+}
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = MCP_HTTP2 and _http2_available()
+    if MCP_HTTP2 and not http2:
+        print("⚠️ MCP_HTTP2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+    limits = httpx.Limits(
+        max_connections=MCP_MAX_CONNECTIONS,
+        max_keepalive_connections=MCP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=MCP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    _metrics["clients_created"] += 1
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=MCP_DEFAULT_TIMEOUT_SECONDS)
+
+# --- Lifecycle ---
+async def start_mcp_client():
+    """Create the shared client. Call once from the app's startup hook."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        print(f"✅ MCP client pool started (max_connections={MCP_MAX_CONNECTIONS}, per_host={MCP_MAX_CONNECTIONS_PER_HOST})")
+    return _client
+
+async def close_mcp_client():
+    """Close the shared client and release pooled connections. Call from the shutdown hook."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        print("✅ MCP client pool closed")
+    _client = None
+    _host_semaphores.clear()
+
+def get_mcp_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily for scripts that never ran the startup hook."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+def _host_semaphore(host: str) -> asyncio.Semaphore:
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MCP_MAX_CONNECTIONS_PER_HOST)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+# --- Requests ---
+async def mcp_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request through the shared pool, enforcing the per-host limit and recording metrics.
+
+    httpx exceptions propagate unchanged so callers keep their existing error handling.
+    """
+    client = get_mcp_client()
+    host = urlsplit(url).netloc
+    host_stats = _metrics["per_host"].setdefault(host, {"requests": 0, "errors": 0, "waiting": 0})
+
+    host_stats["waiting"] += 1
+    async with _host_semaphore(host):
+        host_stats["waiting"] -= 1
+        _metrics["requests"] += 1
+        host_stats["requests"] += 1
+        _metrics["in_flight"] += 1
+        _metrics["peak_in_flight"] = max(_metrics["peak_in_flight"], _metrics["in_flight"])
+        start = time.perf_counter()
+        try:
+            return await client.request(method, url, **kwargs)
+        except httpx.TimeoutException:
+            _metrics["timeouts"] += 1
+            _metrics["errors"] += 1
+            host_stats["errors"] += 1
+            raise
+        except httpx.HTTPError:
+            _metrics["errors"] += 1
+            host_stats["errors"] += 1
+            raise
+        finally:
+            _metrics["in_flight"] -= 1
+            _metrics["total_latency_ms"] += (time.perf_counter() - start) * 1000
+
+async def mcp_get(url: str, **kwargs) -> httpx.Response:
+    return await mcp_request("GET", url, **kwargs)
+
+async def mcp_post(url: str, **kwargs) -> httpx.Response:
+    return await mcp_request("POST", url, **kwargs)
+
+# --- Single-flight coalescing ---
+def make_flight_key(session_id: str, tool_name: str, args=None) -> tuple:
+    """Key identifying one logical MCP fetch: (session, tool, canonical args)"""
+    return (session_id, tool_name, json.dumps(args or {}, sort_keys=True, default=str))
+
+def _forget_flight(key, task):
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+    # Mark the exception as retrieved even if every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+async def single_flight(key, fetch, namespace: str = "mcp"):
+    """Run fetch() once per key; concurrent callers with the same key await the same in-flight result.
+
+    Only use this for reads. The caller that started the fetch gets its result;
+    every coalesced caller gets its own deep copy. Metrics are kept per
+    namespace, so only MCP round trips count towards the "mcp" savings.
+    """
+    stats = _single_flight_metrics.setdefault(namespace, {"calls": 0, "executions": 0, "coalesced": 0})
+    stats["calls"] += 1
+    flight = (namespace, key)
+    task = _in_flight.get(flight)
+    if task is None:
+        stats["executions"] += 1
+        task = asyncio.ensure_future(fetch())
+        _in_flight[flight] = task
+        task.add_done_callback(lambda t: _forget_flight(flight, t))
+        # Shield so one cancelled caller does not cancel the fetch for the others
+        return await asyncio.shield(task)
+    stats["coalesced"] += 1
+    return copy.deepcopy(await asyncio.shield(task))
+
+def get_single_flight_metrics(namespace: str = "mcp") -> dict:
+    """How many fetches were requested, executed, and saved by coalescing in one namespace"""
+    stats = _single_flight_metrics.get(namespace, {"calls": 0, "executions": 0, "coalesced": 0})
+    return {
+        "calls": stats["calls"],
+        "executions": stats["executions"],
+        "calls_saved": stats["coalesced"],
+        "in_flight": sum(1 for flight in _in_flight if flight[0] == namespace),
+    }
+
+# --- Metrics ---
+def get_mcp_pool_metrics() -> dict:
+    """Snapshot of request counters and the state of pooled connections"""
+    connections = []
+    if _client is not None and not _client.is_closed:
+        pool = getattr(_client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+
+    requests = _metrics["requests"]
+    return {
+        "started": _client is not None and not _client.is_closed,
+        "clients_created": _metrics["clients_created"],
+        "requests": requests,
+        "errors": _metrics["errors"],
+        "timeouts": _metrics["timeouts"],
+        "in_flight": _metrics["in_flight"],
+        "peak_in_flight": _metrics["peak_in_flight"],
+        "avg_latency_ms": round(_metrics["total_latency_ms"] / requests, 2) if requests else 0.0,
+        "pool": {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "max_connections": MCP_MAX_CONNECTIONS,
+            "max_keepalive_connections": MCP_MAX_KEEPALIVE_CONNECTIONS,
+            "max_connections_per_host": MCP_MAX_CONNECTIONS_PER_HOST,
+            "keepalive_expiry_seconds": MCP_KEEPALIVE_EXPIRY_SECONDS,
+            "http2": MCP_HTTP2 and _http2_available(),
+        },
+        "per_host": {host: dict(stats) for host, stats in _metrics["per_host"].items()},
+    }
@@ -0,0 +1,148 @@
+# Full-fidelity Firestore cache for MCP datasets
+#
+# Each dataset is stored as its own document under users/{uid}/mcp_cache/{dataset}
+# holding the compressed JSON payload, so cached reads return exactly what the
+# MCP server returned instead of a lossy summary.
+
+import json
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, zlib is always available
+    zstandard = None
+
+from firestore_db import get_documents, commit_batch
+
+CACHE_FORMAT_VERSION = 1
+CACHE_SUBCOLLECTION = "mcp_cache"
+# Firestore documents are capped at 1 MiB; leave headroom for the other fields
+MAX_BLOB_BYTES = 900 * 1024
+
+_stats = {"hits": 0, "misses": 0, "stale": 0, "version_mismatch": 0, "writes": 0, "skipped_oversize": 0, "decode_errors": 0}
+
+def _default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+def _compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    return zlib.compress(raw, 6)
+
+def _decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd-compressed cache entry but 'zstandard' is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    raise ValueError(f"Unknown cache codec: {codec}")
+
+def encode_dataset(payload, codec: str = None) -> dict:
+    """Build the Firestore document for one dataset payload"""
+    codec = codec or _default_codec()
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return {
+        "format_version": CACHE_FORMAT_VERSION,
+        "codec": codec,
+        "raw_size": len(raw),
+        "data": _compress(raw, codec),
+        "cached_at": datetime.utcnow().isoformat(),
+    }
+
+def decode_dataset(doc: dict, max_age_seconds: float = None):
+    """Return the payload stored in a cache document, or None if it is stale, foreign or unreadable"""
+    if not doc:
+        return None
+    if doc.get("format_version") != CACHE_FORMAT_VERSION:
+        _stats["version_mismatch"] += 1
+        return None
+    if max_age_seconds is not None:
+        try:
+            cached_at = datetime.fromisoformat(doc["cached_at"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if datetime.utcnow() - cached_at >= timedelta(seconds=max_age_seconds):
+            _stats["stale"] += 1
+            return None
+    try:
+        return json.loads(_decompress(bytes(doc["data"]), doc.get("codec", "zlib")))
+    except Exception as e:
+        _stats["decode_errors"] += 1
+        print(f"⚠️ Could not decode cached dataset: {e}")
+        return None
+
+def dataset_age_seconds(doc: dict):
+    try:
+        return (datetime.utcnow() - datetime.fromisoformat(doc["cached_at"])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _dataset_ref(db, uid: str, name: str):
+    return db.collection("users").document(uid).collection(CACHE_SUBCOLLECTION).document(name)
+
+async def load_datasets(db, uid: str, names, max_age_seconds: float = None) -> dict:
+    """Read the requested datasets in one batched Firestore call.
+
+    Returns {name: (payload, age_seconds)} for every fresh hit; misses are simply absent.
+    """
+    names = list(names)
+    if not names:
+        return {}
+    refs = [_dataset_ref(db, uid, name) for name in names]
+    snapshots = await get_documents(refs, db)
+
+    found = {}
+    for snapshot in snapshots:
+        if not snapshot.exists:
+            continue
+        doc = snapshot.to_dict()
+        payload = decode_dataset(doc, max_age_seconds)
+        if payload is not None:
+            found[snapshot.id] = (payload, dataset_age_seconds(doc))
+    _stats["hits"] += len(found)
+    _stats["misses"] += len(names) - len(found)
+    return found
+
+async def save_datasets(db, uid: str, datasets: dict, queue=None) -> int:
+    """Write each dataset as its own compressed document in a single batch. Returns documents written.
+
+    With a write-behind queue the documents are queued instead and committed by its flusher.
+    """
+    batch = db.batch()
+    written = 0
+    for name, payload in datasets.items():
+        doc = encode_dataset(payload)
+        if len(doc["data"]) > MAX_BLOB_BYTES:
+            _stats["skipped_oversize"] += 1
+            print(f"⚠️ Not caching '{name}': compressed size {len(doc['data'])} exceeds the Firestore document limit")
+            continue
+        if queue is not None:
+            queue.enqueue(_dataset_ref(db, uid, name), doc, merge=False)
+        else:
+            batch.set(_dataset_ref(db, uid, name), doc)
+        written += 1
+    if written and queue is None:
+        await commit_batch(batch)
+    _stats["writes"] += written
+    return written
+
+async def clear_datasets(db, uid: str, names, queue=None) -> None:
+    batch = db.batch()
+    for name in names:
+        ref = _dataset_ref(db, uid, name)
+        if queue is not None:
+            # A queued write must not resurrect the dataset after the delete
+            queue.discard(ref.path)
+        batch.delete(ref)
+    await commit_batch(batch)
+
+def get_store_metrics() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+        "codec": _default_codec(),
+        "format_version": CACHE_FORMAT_VERSION,
+    }
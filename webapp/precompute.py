@@ -0,0 +1,257 @@
+# Background precomputation of dashboard agent results
+#
+# Guardian, Catalyst and Strategist used to run only when a user tapped a
+# button, so every tap paid the full MCP + Gemini latency. The scheduler keeps
+# a result per (user, agent, area) fresh for recently active users: on a
+# cadence, after /prefetch-data, and whenever a stale result is served. The
+# endpoints answer from the store immediately (with a freshness block) and
+# only compute on demand when nothing has been stored yet.
+#
+# Refreshes are plain asyncio tasks: the work is waiting on MCP and Gemini
+# (through the LLM gateway at background priority), not CPU.
+#
+# Memory holds only active users: each tick forgets users not seen within the
+# active window along with their results, which stay persisted on the user
+# document and are read back if the user returns. Areas are normalized the way
+# the dataset planner does it, and only its known areas are stored: any other
+# area string from a client is computed on demand every time.
+
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from firestore_db import user_ref
+from write_behind import queue_write, read_field
+from deadlines import no_deadline
+from dataset_planner import AREA_PLANS, area_key
+
+PRECOMPUTE_INTERVAL_SECONDS = float(os.getenv("PRECOMPUTE_INTERVAL_SECONDS", "900"))
+# Users seen within this window are kept warm
+PRECOMPUTE_ACTIVE_SECONDS = float(os.getenv("PRECOMPUTE_ACTIVE_SECONDS", str(24 * 3600)))
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "2"))
+PRECOMPUTE_FIELD = "precomputed_results"
+DEFAULT_AREA = "default"
+
+class PrecomputeScheduler:
+    """Result store plus a refresh queue worked by a few background tasks"""
+
+    def __init__(self, interval: float = PRECOMPUTE_INTERVAL_SECONDS, active_window: float = PRECOMPUTE_ACTIVE_SECONDS,
+                 workers: int = PRECOMPUTE_WORKERS):
+        self.interval = interval
+        self.active_window = active_window
+        self.workers = workers
+        self._runners = {}      # agent -> async fn(uid, area) returning the endpoint's response
+        self._results = {}      # (uid, agent, area) -> {"result", "computed_at", "duration_ms"}
+        self._active_users = {}  # uid -> last seen (monotonic)
+        self._queued = set()     # (uid, agent, area) waiting or running
+        self._queue = None
+        self._tasks = []
+        self._ticker = None
+        self._stats = {"scheduled": 0, "deduplicated": 0, "refreshed": 0, "failed": 0, "served_precomputed": 0,
+                       "served_stale": 0, "computed_on_demand": 0, "ticks": 0, "evicted_results": 0,
+                       "unknown_areas": 0}
+
+    def register(self, agent: str, runner):
+        """runner(uid, area) -> result; called for scheduled refreshes"""
+        self._runners[agent] = runner
+
+    # --- Store ---
+    def _key(self, uid, agent, area):
+        """(uid, agent, normalized area), or None for an area the planner does not know"""
+        area = area_key(area)
+        if not area:
+            return (uid, agent, DEFAULT_AREA)
+        return (uid, agent, area) if area in AREA_PLANS else None
+
+    def _put(self, key, result, duration_ms: float):
+        entry = {"result": result, "computed_at": time.time(), "duration_ms": round(duration_ms, 2)}
+        self._results[key] = entry
+        uid, agent, area = key
+        # Persisted so another instance (or a restart) can serve it too
+        queue_write(user_ref(uid), {PRECOMPUTE_FIELD: {agent: {area: entry}}})
+
+    async def _get(self, key):
+        entry = self._results.get(key)
+        if entry is not None:
+            return entry
+        uid, agent, area = key
+        try:
+            stored = await read_field(user_ref(uid), PRECOMPUTE_FIELD)
+        except Exception as e:
+            print(f"⚠️ Could not read precomputed {agent} result: {e}")
+            return None
+        entry = ((stored or {}).get(agent) or {}).get(area) if isinstance(stored, dict) else None
+        if isinstance(entry, dict) and "result" in entry:
+            self._results[key] = entry
+            return entry
+        return None
+
+    def freshness(self, entry: dict, precomputed: bool) -> dict:
+        age = max(0.0, time.time() - entry["computed_at"])
+        return {
+            "precomputed": precomputed,
+            "computed_at": datetime.utcfromtimestamp(entry["computed_at"]).isoformat() + "Z",
+            "age_seconds": round(age, 1),
+            "stale": age > self.interval,
+        }
+
+    # --- Serving ---
+    async def serve(self, uid: str, agent: str, compute, area: str = None):
+        """Return (result, freshness): the stored result at once if there is one (refreshing it in the
+        background when stale), otherwise compute() now and store it"""
+        self.touch(uid)
+        key = self._key(uid, agent, area)
+        if key is None:
+            self._stats["unknown_areas"] += 1
+            result = await compute()
+            return result, self.freshness({"computed_at": time.time()}, precomputed=False)
+        entry = await self._get(key)
+        if entry is not None:
+            freshness = self.freshness(entry, precomputed=True)
+            self._stats["served_precomputed"] += 1
+            if freshness["stale"]:
+                self._stats["served_stale"] += 1
+                self.schedule(uid, [agent], area=area, reason="stale")
+            return entry["result"], freshness
+
+        self._stats["computed_on_demand"] += 1
+        started_at = time.perf_counter()
+        result = await compute()
+        self._put(key, result, (time.perf_counter() - started_at) * 1000)
+        return result, self.freshness(self._results[key], precomputed=False)
+
+    def touch(self, uid: str):
+        self._active_users[uid] = time.monotonic()
+
+    # --- Scheduling ---
+    def schedule(self, uid: str, agents=None, area: str = None, reason: str = "manual") -> int:
+        """Queue refreshes (deduplicated against ones already waiting). Must be called from the event loop."""
+        self.touch(uid)
+        self._ensure_workers()
+        queued = 0
+        for agent in agents or list(self._runners):
+            key = self._key(uid, agent, area)
+            if key is None or agent not in self._runners:
+                continue
+            if key in self._queued:
+                self._stats["deduplicated"] += 1
+                continue
+            self._queued.add(key)
+            self._queue.put_nowait((key, reason))
+            self._stats["scheduled"] += 1
+            queued += 1
+        return queued
+
+    def _evict_inactive(self):
+        """Forget users not seen within the active window, and their in-memory results"""
+        now = time.monotonic()
+        for uid in [uid for uid, seen in self._active_users.items() if now - seen > self.active_window]:
+            del self._active_users[uid]
+        evicted = [key for key in self._results if key[0] not in self._active_users]
+        for key in evicted:
+            del self._results[key]
+        self._stats["evicted_results"] += len(evicted)
+
+    def _due(self) -> list:
+        """(uid, agent, area) results of active users that are missing or older than the interval"""
+        self._evict_inactive()
+        now = time.time()
+        areas_by_user = {uid: {DEFAULT_AREA} for uid in self._active_users}
+        for uid, _, area in self._results:
+            areas_by_user[uid].add(area)
+        due = []
+        for uid, areas in areas_by_user.items():
+            for agent in self._runners:
+                for area in areas:
+                    entry = self._results.get((uid, agent, area))
+                    if entry is None and area != DEFAULT_AREA:
+                        continue
+                    if entry is None or now - entry["computed_at"] >= self.interval:
+                        due.append((uid, agent, area))
+        return due
+
+    def tick(self) -> int:
+        """Schedule every refresh that is due now"""
+        self._stats["ticks"] += 1
+        scheduled = 0
+        for uid, agent, area in self._due():
+            scheduled += self.schedule(uid, [agent], area=None if area == DEFAULT_AREA else area, reason="interval")
+        return scheduled
+
+    async def _run_ticker(self):
+        while True:
+            await asyncio.sleep(min(self.interval, 60))
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"⚠️ Precompute tick failed: {e}")
+
+    async def _run_worker(self):
+        while True:
+            key, reason = await self._queue.get()
+            uid, agent, area = key
+            started_at = time.perf_counter()
+            try:
+                # Workers may be started inside a request; refreshes are not bound by its deadline
+                with no_deadline():
+                    result = await self._runners[agent](uid, None if area == DEFAULT_AREA else area)
+                self._put(key, result, (time.perf_counter() - started_at) * 1000)
+                self._stats["refreshed"] += 1
+                print(f"♻️ Precomputed {agent} for {uid} ({reason}) in {(time.perf_counter() - started_at):.1f}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"⚠️ Precompute of {agent} for {uid} failed: {e}")
+            finally:
+                self._queued.discard(key)
+                self._queue.task_done()
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.ensure_future(self._run_worker()))
+
+    def start(self):
+        """Start the workers and the periodic refresh (call from the app's startup hook)"""
+        self._ensure_workers()
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.ensure_future(self._run_ticker())
+
+    async def drain(self):
+        """Wait until every queued refresh has run"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks + ([self._ticker] if self._ticker else []):
+            task.cancel()
+        for task in self._tasks + ([self._ticker] if self._ticker else []):
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks, self._ticker, self._queue = [], None, None
+        self._queued.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "stored_results": len(self._results),
+            "active_users": len(self._active_users),
+            "queued": len(self._queued),
+            "workers": len([task for task in self._tasks if not task.done()]),
+            "interval_seconds": self.interval,
+        }
+
+# Process-wide scheduler
+precompute_scheduler = PrecomputeScheduler()
+
+async def stop_precompute():
+    await precompute_scheduler.stop()
+
+def get_precompute_metrics() -> dict:
+    return precompute_scheduler.stats()
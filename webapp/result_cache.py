@@ -0,0 +1,92 @@
+# Fingerprint-validated cache of agent (LLM) results
+#
+# A Guardian/Catalyst/Strategist result is reused only while the exact inputs
+# that produced it are unchanged: the key is a hash of (agent, prompt template
+# version, area, normalized input data). New data means a new fingerprint, so
+# there is nothing to invalidate by hand.
+#
+# Entries live in the in-process L1 and in the agent's field on the user
+# document, e.g. guardian_alerts_cache = {"<area>": {"fingerprint", "result", ...}}.
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from firestore_db import user_ref
+from mcp_cache import MCPPayloadCache
+from write_behind import queue_write, read_field
+
+RESULT_CACHE_FIELDS = {
+    "guardian": "guardian_alerts_cache",
+    "catalyst": "catalyst_opportunities_cache",
+    "strategist": "strategist_strategy_cache",
+}
+DEFAULT_AREA = "default"
+# Results stay valid as long as their fingerprint matches; the TTL only bounds memory
+AGENT_RESULT_TTL_SECONDS = float(os.getenv("AGENT_RESULT_TTL_SECONDS", str(24 * 3600)))
+
+agent_result_cache = MCPPayloadCache(ttl_seconds=AGENT_RESULT_TTL_SECONDS)
+_stats = {"l1_hits": 0, "store_hits": 0, "misses": 0, "fingerprint_changes": 0, "stores": 0}
+
+def data_fingerprint(agent: str, template_version: str, area, data) -> str:
+    """Stable hash of everything that determines an agent's answer"""
+    canonical = json.dumps(
+        {"agent": agent, "template_version": template_version, "area": area or DEFAULT_AREA, "data": data},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _l1_key(agent: str, area) -> str:
+    return f"{agent}:{area or DEFAULT_AREA}"
+
+async def get_cached_result(uid: str, agent: str, fingerprint: str, area=None):
+    """The stored result for this exact fingerprint, or None"""
+    entry = agent_result_cache.get(uid, _l1_key(agent, area))
+    if entry is not None and entry["fingerprint"] == fingerprint:
+        _stats["l1_hits"] += 1
+        return entry["result"]
+
+    try:
+        stored = await read_field(user_ref(uid), RESULT_CACHE_FIELDS[agent])
+    except Exception as e:
+        print(f"⚠️ Could not read {agent} result cache: {e}")
+        stored = None
+    entry = stored.get(area or DEFAULT_AREA) if isinstance(stored, dict) else None
+    if isinstance(entry, dict) and entry.get("fingerprint") == fingerprint:
+        _stats["store_hits"] += 1
+        agent_result_cache.put(uid, _l1_key(agent, area), entry)
+        return entry["result"]
+
+    if entry is not None:
+        _stats["fingerprint_changes"] += 1
+    _stats["misses"] += 1
+    return None
+
+def store_result(uid: str, agent: str, fingerprint: str, result, template_version: str, area=None):
+    """Remember a fresh result in L1 and (write-behind) on the user document"""
+    entry = {
+        "fingerprint": fingerprint,
+        "template_version": template_version,
+        "result": result,
+        "cached_at": datetime.utcnow().isoformat(),
+    }
+    agent_result_cache.put(uid, _l1_key(agent, area), entry)
+    queue_write(user_ref(uid), {RESULT_CACHE_FIELDS[agent]: {area or DEFAULT_AREA: entry}})
+    _stats["stores"] += 1
+
+async def get_last_result(uid: str, agent: str, area=None):
+    """Most recent stored result whatever its fingerprint (used when a fresh run fails), or None"""
+    entry = agent_result_cache.get(uid, _l1_key(agent, area))
+    if entry is not None:
+        return entry["result"]
+    stored = await read_field(user_ref(uid), RESULT_CACHE_FIELDS[agent])
+    if not isinstance(stored, dict):
+        return None
+    entry = stored.get(area or DEFAULT_AREA)
+    return entry.get("result") if isinstance(entry, dict) else None
+
+def get_result_cache_metrics() -> dict:
+    lookups = _stats["l1_hits"] + _stats["store_hits"] + _stats["misses"]
+    hits = _stats["l1_hits"] + _stats["store_hits"]
+    return {**_stats, "hit_rate": round(hits / lookups, 3) if lookups else 0.0, "l1": agent_result_cache.stats()}
@@ -1,30 +1,138 @@
 # Shared utilities for Invested AI agents
 
 import firebase_admin
-from firebase_admin import firestore
 import httpx
 import asyncio
 import json
+import os
+import time
 import traceback
+from contextlib import aclosing
 from datetime import datetime, timedelta
 import vertexai
-from vertexai.generative_models import GenerativeModel, Tool, Part, FunctionDeclaration
 import pprint
 
+import numpy as np
+
+from mcp_client import mcp_post, make_flight_key, single_flight
+from mcp_cache import MCPPayloadCache, CachePolicy, should_refresh_early
+import mcp_store
+from firestore_db import get_db
+from write_behind import write_behind
+from llm_gateway import llm_gateway, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from llm_tools import tool_registry, register_tool
+from llm_stream import normalize_spacing, clean_stream
+from user_profiles import get_user_profile, write_through
+from transaction_store import transaction_columns
+from deadlines import stage_budget, record_timeout, gather_within, unavailable, no_deadline
+
 # Constants
 MOCK_SERVER_BASE_URL = "http://localhost:8080"
 CACHE_EXPIRY_SECONDS = 300  # 5 minutes
 
+# Dataset name (as used in prompts and caches) -> MCP tool that returns it
+DATASET_TOOLS = {
+    "net_worth": "fetch_net_worth",
+    "bank_transactions": "fetch_bank_transactions",
+    "credit_report": "fetch_credit_report",
+    "epf_details": "fetch_epf_details",
+    "mf_transactions": "fetch_mf_transactions",
+    "stock_transactions": "fetch_stock_transactions",
+}
+TOOL_DATASETS = {tool: name for name, tool in DATASET_TOOLS.items()}
+
+# Per-dataset freshness (fresh, stale seconds). Credit reports and EPF move far
+# slower than bank transactions. Override with e.g. MCP_CACHE_POLICY_CREDIT_REPORT="86400,604800"
+DEFAULT_CACHE_POLICY = CachePolicy(CACHE_EXPIRY_SECONDS, 3 * CACHE_EXPIRY_SECONDS)
+DATASET_CACHE_POLICIES = {
+    "bank_transactions": CachePolicy(300, 900),
+    "mf_transactions": CachePolicy(900, 3600),
+    "stock_transactions": CachePolicy(900, 3600),
+    "net_worth": CachePolicy(900, 3600),
+    "epf_details": CachePolicy(6 * 3600, 24 * 3600),
+    "credit_report": CachePolicy(24 * 3600, 7 * 24 * 3600),
+}
+
+def _policy_from_env(name: str, default: CachePolicy) -> CachePolicy:
+    raw = os.getenv(f"MCP_CACHE_POLICY_{name.upper()}")
+    if not raw:
+        return default
+    try:
+        fresh, stale = (float(part) for part in raw.split(","))
+        return CachePolicy(fresh, max(fresh, stale), default.beta)
+    except ValueError:
+        print(f"⚠️ Ignoring invalid MCP_CACHE_POLICY_{name.upper()}={raw!r}, expected 'fresh,stale'")
+        return default
+
+DATASET_CACHE_POLICIES = {name: _policy_from_env(name, policy) for name, policy in DATASET_CACHE_POLICIES.items()}
+MAX_STALE_SECONDS = max(policy.stale_seconds for policy in DATASET_CACHE_POLICIES.values())
+
+def get_cache_policy(dataset: str) -> CachePolicy:
+    return DATASET_CACHE_POLICIES.get(dataset, DEFAULT_CACHE_POLICY)
+
+# Process-local L1 cache in front of both the MCP server and the Firestore cache
+mcp_payload_cache = MCPPayloadCache(ttl_seconds=CACHE_EXPIRY_SECONDS)
+
+def invalidate_user_cache(uid: str) -> int:
+    """Drop every L1 entry for a user (used by /clear-cache)"""
+    return mcp_payload_cache.invalidate(uid)
+
 # --- Dynamic Data Fetching ---
-async def get_user_financial_data(uid: str, tool_name: str, timeout=30):
+async def _fetch_tool_from_mcp(session_id: str, uid: str, tool_name: str, timeout=30):
+    headers = {"X-Session-ID": session_id}
+    request_body = {"tool_name": tool_name, "phone_number": uid}
+    
+    try:
+        print(f"🔍 Making request to MCP server for tool: {tool_name}")
+        response = await mcp_post(
+            f"{MOCK_SERVER_BASE_URL}/mcp/stream",
+            headers=headers,
+            json=request_body,
+            timeout=timeout
+        )
+        print(f"🔍 MCP response status: {response.status_code}")
+        
+        if response.status_code == 200:
+            data = response.json()
+            print(f"✅ SUCCESS: Fetched '{tool_name}' data from MCP server")
+            return data
+        else:
+            print(f"⚠️ Error from MCP server for tool '{tool_name}': {response.status_code} - {response.text}")
+            return {"error": f"MCP server returned {response.status_code}: {response.text}"}
+                
+    except httpx.TimeoutException:
+        print(f"❌ TIMEOUT: MCP server timed out for '{tool_name}'")
+        return {"error": f"Timeout fetching {tool_name} from MCP server."}
+    except httpx.ConnectError:
+        print(f"❌ CONNECTION ERROR: Could not connect to MCP server for '{tool_name}'")
+        return {"error": f"Could not connect to MCP server for {tool_name}."}
+    except Exception as e:
+        print(f"❌ ERROR: MCP server error for '{tool_name}': {e}")
+        return {"error": f"Error fetching {tool_name} from MCP server: {e}"}
+
+async def get_user_financial_data(uid: str, tool_name: str, timeout=30, use_cache=True):
+    dataset = TOOL_DATASETS.get(tool_name)
+    if use_cache:
+        cached = mcp_payload_cache.get_with_age(uid, tool_name)
+        if cached is not None:
+            print(f"⚡ L1 cache hit for '{tool_name}'")
+            if dataset:
+                _revalidate_if_needed(uid, dataset, cached[1])
+            return cached[0]
+    
+    # Never wait past the request deadline (if any) for MCP
+    budget = stage_budget("mcp_fetch", timeout)
+    if budget.timeout <= 0:
+        record_timeout("mcp_fetch", budget)
+        return unavailable(dataset or tool_name)
+    
     try:
-        db = firestore.client()
-        user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
-        if not user_doc.exists:
+        # Hot user fields come from the in-memory profile mirror, not a Firestore read per fetch
+        user_data = await get_user_profile(uid)
+        if user_data is None:
             print(f"❌ User document not found for uid: {uid}")
             return {"error": f"User not found"}
         
-        user_data = user_doc.to_dict()
         if "fi_session_id" not in user_data:
             print(f"❌ No fi_session_id found for user: {uid}")
             return {"error": f"No session ID found. Please authenticate first."}
@@ -32,37 +140,20 @@ async def get_user_financial_data(uid: str, tool_name: str, timeout=30):
         session_id = user_data["fi_session_id"]
         print(f"🔍 Using session ID: {session_id} for tool: {tool_name}")
         
-        headers = {"X-Session-ID": session_id}
-        request_body = {"tool_name": tool_name, "phone_number": uid}
-        
+        # Concurrent callers asking for the same (session, tool, args) share one round trip
+        flight_key = make_flight_key(session_id, tool_name, {"phone_number": uid})
+        fetch = single_flight(flight_key, lambda: _timed_fetch(session_id, uid, tool_name, budget.timeout))
         try:
-            async with httpx.AsyncClient() as client:
-                print(f"🔍 Making request to MCP server for tool: {tool_name}")
-                response = await client.post(
-                    "http://localhost:8080/mcp/stream",
-                    headers=headers,
-                    json=request_body,
-                    timeout=timeout
-                )
-                print(f"🔍 MCP response status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    print(f"✅ SUCCESS: Fetched '{tool_name}' data from MCP server")
-                    return data
-                else:
-                    print(f"⚠️ Error from MCP server for tool '{tool_name}': {response.status_code} - {response.text}")
-                    return {"error": f"MCP server returned {response.status_code}: {response.text}"}
-                    
-        except httpx.TimeoutException:
-            print(f"❌ TIMEOUT: MCP server timed out for '{tool_name}'")
-            return {"error": f"Timeout fetching {tool_name} from MCP server."}
-        except httpx.ConnectError:
-            print(f"❌ CONNECTION ERROR: Could not connect to MCP server for '{tool_name}'")
-            return {"error": f"Could not connect to MCP server for {tool_name}."}
-        except Exception as e:
-            print(f"❌ ERROR: MCP server error for '{tool_name}': {e}")
-            return {"error": f"Error fetching {tool_name} from MCP server: {e}"}
+            # httpx timeouts are per phase; the deadline caps the whole fetch
+            data = await (asyncio.wait_for(fetch, timeout=budget.timeout) if budget.by_deadline else fetch)
+        except asyncio.TimeoutError:
+            data = {"error": f"Timeout fetching {tool_name} from MCP server."}
+        if isinstance(data, dict) and str(data.get("error", "")).startswith("Timeout"):
+            record_timeout("mcp_fetch", budget)
+        if isinstance(data, dict) and not data.get("error"):
+            ttl = get_cache_policy(dataset).stale_seconds if dataset else None
+            mcp_payload_cache.put(uid, tool_name, data, ttl_seconds=ttl)
+        return data
             
     except Exception as e:
         print(f"❌ Failed to fetch live data for tool '{tool_name}'. Error: {e}")
@@ -71,65 +162,221 @@ async def get_user_financial_data(uid: str, tool_name: str, timeout=30):
     print(f"ℹ️ INFO: Fallback for '{tool_name}'.")
     return {"error": f"Could not fetch {tool_name}."}
 
+# --- Stale-While-Revalidate ---
+_fetch_seconds = {}  # tool_name -> smoothed MCP fetch time, the XFetch recompute cost
+_refresh_tasks = {}  # (uid, dataset) -> background refresh task
+_swr_stats = {"fresh_hits": 0, "stale_served": 0, "early_refreshes": 0, "background_refreshes": 0, "refresh_failures": 0}
+
+async def _timed_fetch(session_id: str, uid: str, tool_name: str, timeout=30):
+    started_at = time.perf_counter()
+    try:
+        return await _fetch_tool_from_mcp(session_id, uid, tool_name, timeout)
+    finally:
+        elapsed = time.perf_counter() - started_at
+        previous = _fetch_seconds.get(tool_name)
+        _fetch_seconds[tool_name] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+
+def _revalidate_if_needed(uid: str, dataset: str, age_seconds):
+    """Called on every cache hit: schedule one background refresh once an entry is (probabilistically) expiring"""
+    policy = get_cache_policy(dataset)
+    if age_seconds is None or age_seconds >= policy.fresh_seconds:
+        _swr_stats["stale_served"] += 1
+    elif should_refresh_early(age_seconds, policy, _fetch_seconds.get(DATASET_TOOLS[dataset], 0.0)):
+        _swr_stats["early_refreshes"] += 1
+    else:
+        _swr_stats["fresh_hits"] += 1
+        return
+    _schedule_refresh(uid, dataset)
+
+def _schedule_refresh(uid: str, dataset: str):
+    key = (uid, dataset)
+    if key in _refresh_tasks:
+        return
+    _swr_stats["background_refreshes"] += 1
+    task = asyncio.ensure_future(_refresh_dataset(uid, dataset))
+    _refresh_tasks[key] = task
+    task.add_done_callback(lambda _: _refresh_tasks.pop(key, None))
+
+async def _refresh_dataset(uid: str, dataset: str):
+    try:
+        # Started from a request, but not bound by its deadline
+        with no_deadline():
+            data = await get_user_financial_data(uid, tool_name=DATASET_TOOLS[dataset], use_cache=False)
+        if isinstance(data, dict) and not data.get("error"):
+            await cache_mcp_datasets(uid, {dataset: data})
+            print(f"🔄 Refreshed '{dataset}' for {uid} in the background")
+        else:
+            _swr_stats["refresh_failures"] += 1
+    except Exception as e:
+        _swr_stats["refresh_failures"] += 1
+        print(f"⚠️ Background refresh of '{dataset}' for {uid} failed: {e}")
+
+def get_swr_metrics() -> dict:
+    return {
+        **_swr_stats,
+        "refreshing": len(_refresh_tasks),
+        "late_writes": len(_late_writes),
+        "fetch_seconds": {tool: round(seconds, 3) for tool, seconds in _fetch_seconds.items()},
+        "policies": {name: policy._asdict() for name, policy in DATASET_CACHE_POLICIES.items()},
+    }
+
 # --- Helper: Get Cached MCP Data ---
-async def get_cached_mcp_data(uid: str):
-    db = firestore.client()
-    user_doc = await asyncio.to_thread(db.collection("users").document(uid).get)
-    if user_doc.exists:
-        user_data = user_doc.to_dict()
-        mcp_cache = user_data.get("mcp_data_cache")
-        if mcp_cache:
-            ts = mcp_cache.get("mcp_cache_timestamp")
-            if ts:
-                try:
-                    cache_time = datetime.fromisoformat(ts)
-                    if datetime.utcnow() - cache_time < timedelta(seconds=CACHE_EXPIRY_SECONDS):
-                        return mcp_cache
-                except Exception:
-                    pass
-    return None
+async def get_cached_mcp_data(uid: str, datasets=None):
+    """Return cached datasets as {name: payload, "mcp_cache_timestamp": ...}, or None if nothing is cached.
+
+    Checks the in-process L1 first and reads only the missing datasets from the
+    full-fidelity Firestore cache (users/{uid}/mcp_cache/{dataset}). Entries past
+    their dataset's fresh window are still returned (up to its stale window)
+    and refreshed once in the background.
+    """
+    names = list(datasets or DATASET_TOOLS)
+    found = {}
+    for name in names:
+        cached = mcp_payload_cache.get_with_age(uid, DATASET_TOOLS[name])
+        if cached is not None:
+            found[name] = cached[0]
+            _revalidate_if_needed(uid, name, cached[1])
+    
+    missing = [name for name in names if name not in found]
+    if missing:
+        db = get_db()
+        stored = await mcp_store.load_datasets(db, uid, missing, max_age_seconds=MAX_STALE_SECONDS)
+        for name, (payload, age) in stored.items():
+            policy = get_cache_policy(name)
+            age = age or 0
+            if age >= policy.stale_seconds:
+                continue
+            found[name] = payload
+            # Keep it in L1 only for the rest of its stale window, with its real age
+            mcp_payload_cache.put(uid, DATASET_TOOLS[name], payload, ttl_seconds=policy.stale_seconds - age, age_seconds=age)
+            _revalidate_if_needed(uid, name, age)
+    
+    if not found:
+        return None
+    found["mcp_cache_timestamp"] = datetime.utcnow().isoformat()
+    return found
+
+async def cache_mcp_datasets(uid: str, datasets: dict) -> int:
+    """Store successfully fetched datasets in the full-fidelity Firestore cache"""
+    good = {name: payload for name, payload in datasets.items()
+            if name in DATASET_TOOLS and isinstance(payload, dict) and not payload.get("error")}
+    if not good:
+        return 0
+    db = get_db()
+    # Queued: the caller already has the data, the Firestore copy is for other processes and later requests
+    written = await mcp_store.save_datasets(db, uid, good, queue=write_behind)
+    if written:
+        write_through(uid, mcp_cache_updated_at=datetime.utcnow().isoformat())
+    return written
+
+_late_writes = set()  # cache writes for fetches that landed after their request answered
+
+def cache_late_dataset(uid: str, name: str, data):
+    """on_late handler for gather_within: cache a dataset that missed the request deadline.
+
+    The write task is held until it finishes, so it is not garbage-collected mid-write.
+    """
+    task = asyncio.ensure_future(cache_mcp_datasets(uid, {name: data}))
+    _late_writes.add(task)
+    task.add_done_callback(_late_write_done)
+
+def _late_write_done(task):
+    _late_writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Caching a late dataset failed: {task.exception()}")
+
+async def clear_cached_mcp_data(uid: str):
+    """Drop a user's cached datasets from L1 and Firestore"""
+    invalidate_user_cache(uid)
+    db = get_db()
+    await mcp_store.clear_datasets(db, uid, DATASET_TOOLS, queue=write_behind)
+
+async def load_user_datasets(uid: str, datasets) -> dict:
+    """Cache-first load of the named datasets; anything missing is fetched concurrently and cached.
+
+    Failed fetches are returned as {"error": ...} dicts, like get_user_financial_data.
+    Under a request deadline, fetches not done within its fetch share are
+    returned as unavailable and cached when they arrive.
+    """
+    names = list(datasets)
+    result = {}
+    try:
+        cached = await get_cached_mcp_data(uid, names)
+        if cached:
+            result.update({name: cached[name] for name in names if name in cached})
+    except Exception as e:
+        print(f"⚠️ Could not read MCP cache for {uid}: {e}")
+    
+    missing = [name for name in names if name not in result]
+    if missing:
+        print(f"🔍 Cache miss for {missing}, fetching from MCP")
+        fetched = await gather_within(
+            {name: get_user_financial_data(uid, tool_name=DATASET_TOOLS[name]) for name in missing},
+            stage="load_datasets",
+            on_late=lambda name, data: cache_late_dataset(uid, name, data)
+        )
+        fetched = {name: data if data is not None else {"error": f"{name} fetch failed"} for name, data in fetched.items()}
+        result.update(fetched)
+        try:
+            written = await cache_mcp_datasets(uid, fetched)
+            if written:
+                print(f"✅ SUCCESS: Queued {written} MCP datasets for the Firestore cache")
+        except Exception as e:
+            print(f"❌ WARNING: Failed to cache MCP datasets in Firestore: {e}")
+            # Continue without caching - the app will still work
+    return result
 
 # --- Gemini Model Call Function ---
-def call_gemini_text(prompt: str, model_name="gemini-2.5-flash", tools=None, timeout=45):
+async def call_gemini(prompt: str, uid: str = None, priority: str = PRIORITY_BACKGROUND, model_name="gemini-2.5-flash", tools=None, timeout=45):
+    """Call Gemini through the shared LLM gateway (async, capped per user, interactive calls first).
+
+    tools is a list of registered tool names, e.g. ["get_market_performance"].
+    """
     try:
-        model = GenerativeModel(model_name, tools=tools)
-        response = model.generate_content(prompt)
-        if response.candidates[0].function_calls:
-            function_call = response.candidates[0].function_calls[0]
-            if function_call.name == "get_market_performance":
-                args = {key: value for key, value in function_call.args.items()}
-                tool_result = get_market_performance(**args)
-                final_response = model.generate_content(
-                    Part.from_function_response(
-                        name="get_market_performance",
-                        response={"content": tool_result}
-                    )
-                )
-                return clean_gemini_response(final_response.text)
-        return clean_gemini_response(response.text)
+        text = await llm_gateway.generate(
+            prompt,
+            uid=uid,
+            priority=priority,
+            model_name=model_name,
+            tools=tools,
+            timeout=timeout
+        )
+        return clean_gemini_response(text)
+    except asyncio.TimeoutError:
+        print(f"❌ Gemini API timeout after {timeout}s")
+        return f"Error: Gemini API call timed out after {timeout}s"
     except Exception as e:
         print(f"❌ Gemini API error: {e}")
         traceback.print_exc()
         return f"Error: Gemini API call failed: {e}"
 
+async def call_gemini_stream(prompt: str, uid: str = None, priority: str = PRIORITY_INTERACTIVE, model_name="gemini-2.5-flash", timeout=45):
+    """Streaming call_gemini: yields cleaned text as Gemini produces it.
+
+    Failures are yielded as an "Error: ..." chunk, like call_gemini's return value.
+    """
+    try:
+        async with aclosing(clean_stream(llm_gateway.stream(prompt, uid=uid, priority=priority, model_name=model_name, timeout=timeout))) as chunks:
+            async for text in chunks:
+                yield text
+    except asyncio.TimeoutError:
+        print(f"❌ Gemini API stream timeout after {timeout}s")
+        yield f"Error: Gemini API call timed out after {timeout}s"
+    except Exception as e:
+        print(f"❌ Gemini API stream error: {e}")
+        traceback.print_exc()
+        yield f"Error: Gemini API call failed: {e}"
+
 def clean_gemini_response(text: str) -> str:
     """Clean and format Gemini API response text"""
     if not text:
         return ""
     
-    # Remove extra newlines and normalize spacing
-    cleaned = text.replace('\n\n\n', '\n\n')  # Remove triple newlines
-    cleaned = cleaned.replace('\n\n\n\n', '\n\n')  # Remove quadruple newlines
-    cleaned = cleaned.replace('nn', '\n')  # Fix common formatting issue
-    cleaned = cleaned.replace('  ', ' ')  # Remove double spaces
+    # Remove extra newlines, fix 'nn' and double spaces (shared with the streaming cleaner)
+    cleaned = normalize_spacing(text)
     
     # Remove leading/trailing whitespace
-    cleaned = cleaned.strip()
-    
-    # Ensure proper paragraph breaks
-    cleaned = cleaned.replace('\n\n', '\n\n')  # Normalize paragraph breaks
-    
-    return cleaned
+    return cleaned.strip()
 
 # --- Helper: Make Data Firestore Safe ---
 def create_safe_summary(data):
@@ -138,33 +385,26 @@ def create_safe_summary(data):
         "mcp_cache_timestamp": datetime.utcnow().isoformat()
     }
     
-    # Handle bank transactions - create a simple summary
+    # Handle bank transactions - create a simple summary from the shared transaction columns
     if 'bank_transactions' in data and isinstance(data['bank_transactions'], dict):
         bank_data = data['bank_transactions']
         if 'bankTransactions' in bank_data and isinstance(bank_data['bankTransactions'], list):
-            banks = bank_data['bankTransactions']
+            columns = transaction_columns(bank_data)
             safe_data['bank_summary'] = {
-                'total_banks': len(banks),
-                'total_transactions': 0,
+                'total_banks': len(bank_data['bankTransactions']),
+                'total_transactions': int(np.count_nonzero(columns.banks < 2)),  # Only first 2 banks
                 'recent_transactions': []
             }
             
-            # Count total transactions and get recent ones
-            for bank in banks[:2]:  # Only first 2 banks
-                if isinstance(bank, dict) and 'txns' in bank:
-                    txns = bank.get('txns', [])
-                    if isinstance(txns, list):
-                        safe_data['bank_summary']['total_transactions'] += len(txns)
-                        
-                        # Get first 5 transactions as summary
-                        for txn in txns[:5]:
-                            if isinstance(txn, list) and len(txn) >= 4:
-                                safe_data['bank_summary']['recent_transactions'].append({
-                                    'amount': str(txn[0]) if len(txn) > 0 else '0',
-                                    'description': str(txn[1])[:100] if len(txn) > 1 else 'Unknown',
-                                    'date': str(txn[2]) if len(txn) > 2 else 'Unknown',
-                                    'type': str(txn[3]) if len(txn) > 3 else 'Unknown'
-                                })
+            # First 5 transactions of each of the first 2 banks as summary
+            for bank_index in range(min(2, len(columns.bank_names))):
+                for row in np.flatnonzero(columns.banks == bank_index)[:5]:
+                    safe_data['bank_summary']['recent_transactions'].append({
+                        'amount': f"{columns.amounts[row]:.2f}".rstrip('0').rstrip('.'),
+                        'description': columns.narrations[columns.narration_codes[row]][:100],
+                        'date': str(columns.dates[row]),
+                        'type': str(columns.types[row])
+                    })
     
     # Handle credit report - create a simple summary
     if 'credit_report' in data and isinstance(data['credit_report'], dict):
@@ -319,6 +559,21 @@ def force_json_safe(data):
         return {"error": "Data could not be serialized", "timestamp": datetime.utcnow().isoformat()}
 
 # --- Market Performance Tool (for Strategist) ---
+@register_tool(
+    "get_market_performance",
+    description="Gets the real-time 1-year market performance for a list of stock symbols and the NIFTY 50 index.",
+    parameters={
+        "type": "object",
+        "properties": {
+            "stock_symbols": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "A list of stock symbols to fetch performance for, e.g., ['RELIANCE', 'TCS']"
+            }
+        },
+        "required": ["stock_symbols"]
+    },
+)
 def get_market_performance(stock_symbols: list):
     print(f"TOOL CALLED: get_market_performance for symbols: {stock_symbols}")
     performance_data = {}
@@ -332,23 +587,5 @@ def get_market_performance(stock_symbols: list):
             performance_data[symbol] = {"1y_return": 13.0}
     return json.dumps(performance_data)
 
-# Market data tool definition
-market_data_tool = Tool(
-    function_declarations=[
-        FunctionDeclaration(
-            name="get_market_performance",
-            description="Gets the real-time 1-year market performance for a list of stock symbols and the NIFTY 50 index.",
-            parameters={
-                "type": "object",
-                "properties": {
-                    "stock_symbols": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "A list of stock symbols to fetch performance for, e.g., ['RELIANCE', 'TCS']"
-                    }
-                },
-                "required": ["stock_symbols"]
-            },
-        )
-    ]
-) 
\ No newline at end of file
+# Market data tool definition (built from the registry)
+market_data_tool = tool_registry.tool(["get_market_performance"])
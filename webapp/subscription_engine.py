@@ -0,0 +1,243 @@
+# Subscription detection
+#
+# There used to be two detectors that disagreed: services.detect_subscriptions
+# called any narration seen twice "recurring", and /get-subscriptions matched
+# auto-debit narrations against a list of services one row and pattern at a
+# time. This engine replaces both.
+#
+# Over the shared transaction columns, payments are sorted by (merchant, date)
+# with one np.lexsort; the gaps between consecutive payments and the amount
+# changes are then reduced per merchant with bincounts. A merchant is a
+# subscription when its median gap is near a monthly, quarterly or annual
+# period, most gaps are within that cadence's tolerance and most payments are
+# close to the one before (so a single price rise does not break the
+# series). Three payments are needed, or two on a mandate rail (ACH, NACH,
+# ...). Auto-debit mandates to well-known services count even before a
+# cadence can be seen, with the cadence read from the narration.
+#
+# Narration work (merchant key, rail, known service) runs once per distinct
+# narration with its digits removed, so reference numbers do not multiply it.
+#
+# Subscriptions are keyed by merchant, not display name: two merchants that map
+# to the same known service (Google Play and Google Workspace are both "Google
+# Services") are two subscriptions.
+#
+# Everything is relative to as_of (the latest transaction by default), so old
+# snapshots give the same answer every time.
+
+import re
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+
+from categorizer import categorize
+from transaction_store import TransactionColumns
+
+class Cadence(NamedTuple):
+    name: str
+    period_days: float
+    tolerance_days: float   # a gap this close to the period counts as on schedule
+
+CADENCES = (
+    Cadence("monthly", 30.44, 5),
+    Cadence("quarterly", 91.31, 10),
+    Cadence("annual", 365.25, 20),
+)
+MIN_PAYMENTS = 3
+MIN_MANDATE_PAYMENTS = 2
+# Share of gaps that must be on schedule, and of payments within AMOUNT_TOLERANCE of the previous one
+REGULAR_SHARE = 0.75
+AMOUNT_TOLERANCE = 0.2
+# No payment for this many periods (plus the tolerance) -> potentially unused
+LAPSE_PERIODS = 1.5
+
+# Well-known services: narration pattern -> (display name, category)
+KNOWN_SERVICES = {
+    "NETFLIX": ("Netflix", "Entertainment"),
+    "SPOTIFY": ("Spotify Premium", "Music"),
+    "AMAZON PRIME": ("Amazon Prime", "Shopping"),
+    "YOUTUBE": ("YouTube Premium", "Entertainment"),
+    "GOOGLE CLOUD": ("Google Cloud Storage", "Technology"),
+    "MICROSOFT": ("Microsoft 365", "Productivity"),
+    "ADOBE": ("Adobe Creative Cloud", "Creative"),
+    "GOOGLE": ("Google Services", "Technology"),
+}
+# Payment rails used for standing instructions / auto-debits
+MANDATE_RAILS = {"ACH", "NACH", "ECS", "SI", "AUTO", "AUTODEBIT", "AUTOPAY", "MANDATE", "STANDING"}
+
+# Words that say how a payment was made, not who it went to
+NOISE_WORDS = {
+    "UPI", "NEFT", "IMPS", "RTGS", "ACH", "NACH", "ECS", "SI", "AUTO", "DEBIT", "AUTODEBIT", "MANDATE", "PAYMENT",
+    "PAY", "TXN", "REF", "POS", "EXP", "BILL", "TO", "FROM", "BY", "DR", "CR", "THE", "MONTHLY", "ANNUAL", "YEARLY",
+    "QUARTERLY", "PLAN", "JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC",
+}
+WORD = re.compile(r"[A-Z]{2,}")
+DIGITS = str.maketrans("", "", "0123456789")
+
+class DetectedSubscription(NamedTuple):
+    key: str
+    name: str
+    category: str
+    cadence: str             # "monthly", "quarterly" or "annual"
+    period_days: float
+    amount: float            # latest payment
+    monthly_cost: float
+    payments: int
+    first_paid: date
+    last_paid: date
+    next_expected: date
+    status: str              # "active" or "potentially_unused"
+    confidence: float        # share of gaps on schedule (1.0 for a mandate with one payment)
+    source: str              # "periodic" or "mandate"
+
+def subscription_key(narration: str) -> str:
+    """Merchant part of a narration: the first few words that are not payment rails, references or dates"""
+    words = [word for word in WORD.findall(str(narration).upper()) if word not in NOISE_WORDS]
+    return " ".join(words[:3])
+
+def known_service(text: str):
+    """(pattern, display name, category) of the first known service named in text, or None"""
+    text = text.upper()
+    for pattern, (name, category) in KNOWN_SERVICES.items():
+        if pattern in text:
+            return pattern, name, category
+    return None
+
+def _narration_facts(narrations: list) -> tuple:
+    """Per distinct narration: merchant key id, whether it is on a mandate rail, and the known service it mandates (or None)"""
+    key_ids, keys = {"": 0}, [""]
+    facts = {}  # narration without digits -> (key id, rail, mandated service)
+    key_codes = np.zeros(len(narrations), dtype=np.int64)
+    rails = np.zeros(len(narrations), dtype=bool)
+    mandated = {}
+    for code, text in enumerate(narrations):
+        skeleton = str(text).upper().translate(DIGITS)
+        fact = facts.get(skeleton)
+        if fact is None:
+            words = set(WORD.findall(skeleton))
+            key = subscription_key(skeleton)
+            rail = bool(words & MANDATE_RAILS)
+            fact = facts[skeleton] = (key_ids.setdefault(key, len(key_ids)), rail, known_service(skeleton) if rail else None)
+            if len(key_ids) > len(keys):
+                keys.append(key)
+        key_codes[code], rails[code] = fact[0], fact[1]
+        if fact[2] is not None:
+            mandated[code] = fact[2]
+    return keys, key_codes, rails, mandated
+
+def _mandate_cadence(narration: str) -> Cadence:
+    text = narration.upper()
+    if "ANNUAL" in text or "YEARLY" in text:
+        return CADENCES[2]
+    if "QUARTER" in text:
+        return CADENCES[1]
+    return CADENCES[0]
+
+def _group_median(values: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """Median of values per group id (NaN for empty groups)"""
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (ordered[low] + ordered[high]) / 2
+    return medians
+
+def _to_date(day: np.int64) -> date:
+    return np.datetime64(int(day), "D").astype(object)
+
+def _status(last_paid: int, period: float, tolerance: float, as_of: int) -> str:
+    return "active" if as_of - last_paid <= LAPSE_PERIODS * period + tolerance else "potentially_unused"
+
+def detect_subscriptions(columns: TransactionColumns, as_of=None) -> list:
+    """Recurring payments in the columns, most recently paid first"""
+    valid = ~columns.is_credit & np.isfinite(columns.amounts) & (columns.amounts > 0) & ~np.isnat(columns.dates)
+    if not valid.any():
+        return []
+    as_of = int(np.datetime64(as_of, "D").astype(np.int64)) if as_of is not None else int(columns.dates[valid].astype(np.int64).max())
+
+    # Merchant per row (key id 0: none)
+    key_names, key_codes, rail_codes, mandated = _narration_facts(columns.narrations)
+    row_keys = key_codes[columns.narration_codes]
+    rows = np.flatnonzero(valid & (row_keys != 0))
+
+    found = {}  # merchant key (mandates: the known service's pattern) -> DetectedSubscription
+    if rows.size:
+        keys, days, amounts, rows = row_keys[rows], columns.dates[rows].astype(np.int64), columns.amounts[rows], rows
+        order = np.lexsort((days, keys))
+        keys, days, amounts, rows = keys[order], days[order], amounts[order], rows[order]
+        new_group = np.concatenate(([True], keys[1:] != keys[:-1]))
+        groups = np.cumsum(new_group) - 1
+        n_groups = int(groups[-1]) + 1
+        counts = np.bincount(groups, minlength=n_groups)
+        first_rows = np.flatnonzero(new_group)
+        last_rows = np.concatenate((first_rows[1:], [keys.size])) - 1
+        on_rail = np.bincount(groups, weights=rail_codes[columns.narration_codes[rows]], minlength=n_groups) > 0
+
+        # Gaps and amount changes between consecutive payments to the same merchant
+        same = ~new_group[1:]
+        gaps = np.diff(days)[same].astype(np.float64)
+        gap_groups = groups[1:][same]
+        previous, current = amounts[:-1][same], amounts[1:][same]
+        median_gap = _group_median(gaps, gap_groups, n_groups)
+
+        # Nearest cadence to each merchant's median gap (-1: none)
+        periods = np.array([cadence.period_days for cadence in CADENCES])
+        tolerances = np.array([cadence.tolerance_days for cadence in CADENCES])
+        distance = np.abs(median_gap[:, None] - periods[None, :])
+        nearest = np.argmin(np.where(np.isnan(distance), np.inf, distance), axis=1)
+        cadence = np.where(distance[np.arange(n_groups), nearest] <= tolerances[nearest], nearest, -1)
+
+        # Share of gaps on schedule and of payments close to the previous one
+        intervals = np.maximum(counts - 1, 1)
+        on_schedule = np.abs(gaps - periods[nearest[gap_groups]]) <= tolerances[nearest[gap_groups]]
+        regular_share = np.bincount(gap_groups, weights=on_schedule, minlength=n_groups) / intervals
+        steady = np.abs(current - previous) <= AMOUNT_TOLERANCE * previous
+        steady_share = np.bincount(gap_groups, weights=steady, minlength=n_groups) / intervals
+
+        enough = counts >= np.where(on_rail, MIN_MANDATE_PAYMENTS, MIN_PAYMENTS)
+        recurring = np.flatnonzero((cadence >= 0) & enough & (regular_share >= REGULAR_SHARE) & (steady_share >= REGULAR_SHARE))
+        for g in recurring:
+            chosen = CADENCES[cadence[g]]
+            last = last_rows[g]
+            key = key_names[keys[last]]
+            narration = columns.narrations[columns.narration_codes[rows[last]]]
+            service = known_service(key) or known_service(narration)
+            name, category = (service[1], service[2]) if service else (key.title(), categorize(narration))
+            amount = float(amounts[last])
+            found[key] = DetectedSubscription(
+                key=key, name=name, category=category, cadence=chosen.name, period_days=chosen.period_days,
+                amount=amount, monthly_cost=round(amount * CADENCES[0].period_days / chosen.period_days, 2),
+                payments=int(counts[g]), first_paid=_to_date(days[first_rows[g]]), last_paid=_to_date(days[last]),
+                next_expected=_to_date(days[last] + round(chosen.period_days)),
+                status=_status(int(days[last]), chosen.period_days, chosen.tolerance_days, as_of),
+                confidence=round(float(regular_share[g]), 2), source="periodic",
+            )
+
+    # Auto-debit mandates to known services, even with a single payment so far (unless already found above)
+    mandates = {code: service for code, service in mandated.items()
+                if key_names[key_codes[code]] not in found and service[0] not in found}
+    if mandates:
+        mandate_rows = np.flatnonzero(valid & np.isin(columns.narration_codes, list(mandates)))
+        for row in mandate_rows[np.argsort(columns.dates[mandate_rows], kind="stable")]:
+            pattern, name, category = mandates[columns.narration_codes[row]]
+            narration = columns.narrations[columns.narration_codes[row]]
+            chosen = _mandate_cadence(narration)
+            day = int(columns.dates[row].astype(np.int64))
+            earlier = found.get(pattern)
+            amount = float(columns.amounts[row])
+            found[pattern] = DetectedSubscription(
+                key=pattern, name=name, category=category, cadence=chosen.name, period_days=chosen.period_days,
+                amount=amount, monthly_cost=round(amount * CADENCES[0].period_days / chosen.period_days, 2),
+                payments=earlier.payments + 1 if earlier else 1,
+                first_paid=earlier.first_paid if earlier else _to_date(day), last_paid=_to_date(day),
+                next_expected=_to_date(day + round(chosen.period_days)),
+                status=_status(day, chosen.period_days, chosen.tolerance_days, as_of),
+                confidence=1.0, source="mandate",
+            )
+
+    return sorted(found.values(), key=lambda subscription: subscription.last_paid, reverse=True)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test script for the async agent job API (submit, worker pool, polling, SSE, dedupe)
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+from agent_jobs import AgentJobManager, MemoryJobBackend, SUCCEEDED, FAILED, job_links
+from test_support import run_tests
+
+UID = "2222222222"
+
+def _manager(calls, seconds=0.1, workers=2, timeout=5):
+    jobs = AgentJobManager(backend=MemoryJobBackend(), workers=workers, timeout=timeout)
+
+    async def oracle(uid, payload):
+        calls.append(("oracle", payload.get("question")))
+        await asyncio.sleep(seconds)
+        if payload.get("question") == "boom":
+            raise RuntimeError("Gemini unavailable")
+        return {"question": payload["question"], "answer": "42"}
+
+    async def guardian(uid, payload):
+        calls.append(("guardian", payload.get("area")))
+        await asyncio.sleep(seconds)
+        return {"alerts": "[]"}
+
+    jobs.register("oracle", oracle)
+    jobs.register("guardian", guardian)
+    return jobs
+
+def test_submit_returns_at_once_and_poll_gets_result():
+    calls = []
+    jobs = _manager(calls, seconds=0.3)
+
+    async def scenario():
+        started = time.perf_counter()
+        job = await jobs.submit(UID, "oracle", {"question": "What is my net worth?"})
+        submit_ms = (time.perf_counter() - started) * 1000
+        links = job_links(job)
+        assert links["poll_url"] == f"/jobs/{job['job_id']}"
+        # Someone else's job is invisible
+        assert await jobs.get(job["job_id"], uid="someone-else") is None
+        finished = await jobs.wait(job["job_id"], timeout=5)
+        await jobs.stop()
+        return submit_ms, finished
+
+    submit_ms, finished = asyncio.run(scenario())
+    print(f"📊 submit returned in {submit_ms:.1f} ms for a 300 ms agent")
+    assert submit_ms < 50
+    assert finished["status"] == SUCCEEDED
+    assert finished["result"]["answer"] == "42"
+    assert finished["started_at"] >= finished["created_at"]
+
+def test_identical_concurrent_jobs_are_deduplicated():
+    calls = []
+    jobs = _manager(calls)
+
+    async def scenario():
+        first = await jobs.submit(UID, "guardian", {"area": "spending"})
+        second = await jobs.submit(UID, "guardian", {"area": "spending"})
+        other_area = await jobs.submit(UID, "guardian", {"area": "credit"})
+        await jobs.drain()
+        # Finished: the same request starts a new job
+        again = await jobs.submit(UID, "guardian", {"area": "spending"})
+        await jobs.drain()
+        await jobs.stop()
+        return first, second, other_area, again
+
+    first, second, other_area, again = asyncio.run(scenario())
+    assert second["job_id"] == first["job_id"] and second["deduplicated"]
+    assert other_area["job_id"] != first["job_id"]
+    assert again["job_id"] != first["job_id"] and not again["deduplicated"]
+    assert calls == [("guardian", "spending"), ("guardian", "credit"), ("guardian", "spending")]
+    assert jobs.stats()["deduplicated"] == 1
+
+def test_sse_events_and_failures():
+    calls = []
+    jobs = _manager(calls, seconds=0.05, timeout=0.2)
+
+    async def slow(uid, payload):
+        await asyncio.sleep(1)
+    jobs.register("strategist", slow)
+
+    async def follow(job_id):
+        return [event async for event in jobs.events(job_id, UID)]
+
+    async def scenario():
+        ok = await jobs.submit(UID, "oracle", {"question": "Am I saving enough?"})
+        failing = await jobs.submit(UID, "oracle", {"question": "boom"})
+        timing_out = await jobs.submit(UID, "strategist")
+        results = await asyncio.gather(follow(ok["job_id"]), follow(failing["job_id"]), follow(timing_out["job_id"]))
+        missing = await follow("does-not-exist")
+        await jobs.stop()
+        return results, missing
+
+    (ok_events, failing_events, timeout_events), missing = asyncio.run(scenario())
+    assert ok_events[0].startswith("event: status\n")
+    assert ok_events[-1].startswith("event: done\n")
+    done = json.loads(ok_events[-1].split("data: ", 1)[1])
+    assert done["status"] == SUCCEEDED and done["result"]["answer"] == "42"
+
+    failed = json.loads(failing_events[-1].split("data: ", 1)[1])
+    assert failed["status"] == FAILED and "Gemini unavailable" in failed["error"]
+    timed_out = json.loads(timeout_events[-1].split("data: ", 1)[1])
+    assert timed_out["status"] == FAILED and "Timed out" in timed_out["error"]
+    assert missing[0].startswith("event: error\n")
+    assert jobs.stats()["timed_out"] == 1
+
+    try:
+        asyncio.run(jobs.submit(UID, "unknown"))
+        assert False, "unknown agent accepted"
+    except ValueError:
+        pass
+
+def test_followers_leave_no_events_behind():
+    calls = []
+    jobs = _manager(calls, seconds=0.2)
+
+    async def scenario():
+        job = await jobs.submit(UID, "oracle", {"question": "Can I retire early?"})
+        job_id = job["job_id"]
+        # One follower gives up early, another keeps waiting and must still be woken
+        patient = asyncio.ensure_future(jobs.wait(job_id))
+        impatient = await jobs.wait(job_id, timeout=0.01)
+        assert impatient["status"] != SUCCEEDED and jobs.stats()["followed"] == 1
+        # A client that disconnects mid-stream
+        stream = jobs.events(job_id, UID)
+        await stream.__anext__()
+        await stream.aclose()
+        assert await jobs.wait("does-not-exist") is None
+        finished = await asyncio.wait_for(patient, timeout=1)
+        await jobs.stop()
+        return finished
+
+    assert asyncio.run(scenario())["status"] == SUCCEEDED
+    assert jobs._changed == {} and jobs._followers == {}
+    assert jobs.stats()["followed"] == 0
+
+def test_job_expired_in_the_queue_releases_its_claim():
+    calls = []
+    jobs = _manager(calls)
+
+    async def scenario():
+        job = await jobs.submit(UID, "guardian", {"area": "spending"})
+        # The record expires before a worker picks the job up
+        await jobs.backend.delete(jobs._job_key(job["job_id"]))
+        await jobs.drain()
+        again = await jobs.submit(UID, "guardian", {"area": "spending"})
+        await jobs.drain()
+        await jobs.stop()
+        return again
+
+    again = asyncio.run(scenario())
+    assert not again["deduplicated"]
+    assert calls == [("guardian", "spending")]
+    assert len(jobs.backend) == 1  # only the finished job's record
+
+def main():
+    tests = [
+        test_submit_returns_at_once_and_poll_gets_result,
+        test_identical_concurrent_jobs_are_deduplicated,
+        test_sse_events_and_failures,
+        test_followers_leave_no_events_behind,
+        test_job_expired_in_the_queue_releases_its_claim,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared analysis context: one concurrent fetch per request for the health score and detailed analysis
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "invested-backend"))
+
+from test_support import bank_transactions, patch, run_tests
+
+import services
+
+PHONE = "1111111111"
+# Simulated MCP round trip
+FETCH_DELAY = 0.03
+
+DATASETS = {
+    "GetNetWorth": {"netWorthResponse": {"totalNetWorthValue": {"currencyCode": "INR", "units": "650000"}}},
+    "GetBankTransactions": bank_transactions(days=90),
+    "GetCreditReport": {"creditReportResponse": {"creditScore": 768, "activeLoans": [{"type": "Home"}]}},
+    "GetMFTransactions": {"mfTransactionsResponse": {"transactions": [{"amount": 5000}] * 7}},
+    "GetStockTransactions": {"stockTransactionsResponse": {"transactions": [{"isin": "INE000000001"}]}},
+    "GetEPFDetails": {"uanAccounts": []},
+}
+
+def _install_fake_mcp(fail: str = None) -> tuple:
+    """Replace the MCP round trip with a FETCH_DELAY sleep; returns (tools called, {"now", "peak"} calls in flight)"""
+    calls = []
+    in_flight = {"now": 0, "peak": 0}
+
+    async def fake_call(tool_name, phone, inputs=None):
+        calls.append(tool_name)
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            await asyncio.sleep(FETCH_DELAY)
+        finally:
+            in_flight["now"] -= 1
+        if tool_name == fail:
+            raise RuntimeError(f"{tool_name} unavailable")
+        return DATASETS[tool_name]
+
+    patch(services, "_call_mcp_tool", fake_call)
+    return calls, in_flight
+
+async def _serial_fetch(tools) -> list:
+    """How the endpoints fetched before: one awaited call after another"""
+    return [await services.call_mcp_tool(tool, PHONE) for tool in tools]
+
+async def _serial_health_score() -> dict:
+    net_worth, bank, credit, mf, stock = await _serial_fetch(services.ANALYSIS_TOOLS.values())
+    context = services.AnalysisContext(PHONE, net_worth, bank, credit, mf, stock, fetch_ms=0.0)
+    return await services.calculate_financial_health_score(PHONE, context)
+
+async def _serial_detailed_analysis() -> dict:
+    await _serial_fetch(list(services.ANALYSIS_TOOLS.values()) + ["GetEPFDetails"])
+    return await _serial_health_score()
+
+async def _timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
+
+def test_detailed_analysis_fetches_each_dataset_once():
+    calls, in_flight = _install_fake_mcp()
+    analysis = asyncio.run(services.get_detailed_financial_analysis(PHONE))
+    assert sorted(calls) == sorted(services.ANALYSIS_TOOLS.values())
+    # All five fetches were in flight together
+    assert in_flight["peak"] == len(services.ANALYSIS_TOOLS)
+    assert analysis["overview"]["total_net_worth"] == "650000"
+    assert analysis["data_summary"]["total_transactions"] == len(DATASETS["GetBankTransactions"]["bankTransactions"][0]["txns"])
+    assert analysis["data_summary"]["investment_count"] == 7 and analysis["data_summary"]["active_loans"] == 1
+
+def test_scores_match_the_serial_path():
+    _install_fake_mcp()
+    concurrent = asyncio.run(services.calculate_financial_health_score(PHONE))
+    serial = asyncio.run(_serial_health_score())
+    assert concurrent == serial
+    assert concurrent["score"] != 50 and concurrent["components"]["credit_health"] == 20
+    detailed = asyncio.run(services.get_detailed_financial_analysis(PHONE))
+    assert detailed["overview"]["financial_health_score"] == concurrent["score"]
+
+def test_a_failed_fetch_still_falls_back():
+    _install_fake_mcp(fail="GetCreditReport")
+    score = asyncio.run(services.calculate_financial_health_score(PHONE))
+    assert score["health_level"] == "Unknown" and score["score"] == 50
+    assert "error" in asyncio.run(services.get_detailed_financial_analysis(PHONE))
+
+def benchmark() -> dict:
+    """Calls, peak concurrency and latency of both paths per endpoint (latency is printed, not asserted)"""
+    results = {}
+    for endpoint, before, after in (
+        ("financial-health", _serial_health_score, lambda: services.calculate_financial_health_score(PHONE)),
+        ("detailed", _serial_detailed_analysis, lambda: services.get_detailed_financial_analysis(PHONE)),
+    ):
+        calls, in_flight = _install_fake_mcp()
+        _, before_ms = asyncio.run(_timed(before()))
+        before_calls, before_peak = len(calls), in_flight["peak"]
+        calls.clear()
+        in_flight["peak"] = 0
+        _, after_ms = asyncio.run(_timed(after()))
+        results[endpoint] = (before_calls, before_peak, len(calls), in_flight["peak"])
+        print(f"📊 {endpoint}: before {before_calls} calls / {before_ms:.0f} ms, after {len(calls)} calls / {after_ms:.0f} ms "
+              f"({FETCH_DELAY * 1000:.0f} ms per MCP call)")
+    return results
+
+def test_fetches_before_and_after():
+    results = benchmark()
+    assert results["financial-health"][:2] == (5, 1) and results["detailed"][:2] == (11, 1)
+    for _, _, after_calls, after_peak in results.values():
+        assert after_calls == after_peak == 5
+
+def main():
+    tests = [
+        test_detailed_analysis_fetches_each_dataset_once,
+        test_scores_match_the_serial_path,
+        test_a_failed_fetch_still_falls_back,
+        test_fetches_before_and_after,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
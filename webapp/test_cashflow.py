@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Test script for the cashflow analytics: monthly series, rolling windows, and the scores and prompt context built on them
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "invested-backend"))
+
+from cashflow import build_cashflow, cashflow_from_columns, rolling_mean, trailing_window
+from categorizer import categorize_many
+from context_builder import summarize_bank_transactions
+from transaction_store import build_columns
+
+import pipelines
+import services
+from test_support import run_tests
+
+def _months_of(month_rows) -> dict:
+    """{"YYYY-MM": [(amount, narration, day, type)]} -> bank transactions payload"""
+    txns = [[str(amount), narration, f"{month}-{day:02d}", txn_type, "UPI", "0"]
+            for month, rows in month_rows.items() for amount, narration, day, txn_type in rows]
+    return {"bankTransactions": [{"bank": "HDFC", "txns": txns}]}
+
+def _salary_and_spending(months=("2024-01", "2024-02", "2024-03", "2024-04"), income=100000, rent=30000, food=10000, last_day=28):
+    return _months_of({
+        month: [(income, "SALARY ACME CORP", 1, 1), (rent, "NEFT-RENT-LANDLORD", 3, 2), (food, "UPI-SWIGGY-ORDER", last_day, 2)]
+        for month in months
+    })
+
+def _random_payload(rows: int, seed: int = 4) -> dict:
+    rng = np.random.default_rng(seed)
+    days = np.datetime64("2023-01-01") + rng.integers(0, 700, size=rows)
+    narrations = np.array(["SALARY ACME", "UPI-SWIGGY", "UBER TRIP", "AMAZON PAY", "NEFT-RENT", "MISC"])[rng.integers(0, 6, size=rows)]
+    types = rng.choice([1, 2, 2, 2, 0], size=rows)
+    amounts = rng.integers(50, 20000, size=rows)
+    txns = [[str(amount), narration, str(day), int(kind), "UPI", ""]
+            for amount, narration, day, kind in zip(amounts.tolist(), narrations.tolist(), days, types.tolist())]
+    return {"bankTransactions": [{"bank": "HDFC", "txns": txns}]}
+
+def test_series_match_a_groupby():
+    payload = _random_payload(5000)
+    # Leave a gap: no transactions at all in 2023-06
+    payload["bankTransactions"][0]["txns"] = [row for row in payload["bankTransactions"][0]["txns"] if not row[2].startswith("2023-06")]
+    series = cashflow_from_columns(build_columns(payload))
+
+    frame = pd.DataFrame(payload["bankTransactions"][0]["txns"], columns=["amount", "narration", "date", "type", "mode", "balance"])
+    frame["amount"] = frame["amount"].astype(float)
+    frame["month"] = frame["date"].str[:7]
+    frame["category"] = categorize_many(frame["narration"].tolist())
+    income = frame[frame["type"] == 1].groupby("month")["amount"].sum()
+    debits = frame[frame["type"] == 2]
+    expenses = debits.groupby("month")["amount"].sum()
+
+    months = [str(month) for month in series.months]
+    assert months[0] == "2023-01" and "2023-06" in months and len(months) == len(set(frame["month"])) + 1
+    gap = months.index("2023-06")
+    assert series.income[gap] == 0 and series.expenses[gap] == 0
+    assert np.allclose(series.income, [income.get(month, 0.0) for month in months])
+    assert np.allclose(series.expenses, [expenses.get(month, 0.0) for month in months])
+    by_category = debits.groupby(["month", "category"])["amount"].sum()
+    for (month, category), total in by_category.items():
+        assert np.isclose(series.category_expenses[months.index(month), series.categories.index(category)], total)
+    assert np.allclose(series.category_expenses.sum(axis=1), series.expenses)
+
+def test_rolling_windows_and_partial_months():
+    values = np.array([10.0, 20.0, 30.0, 40.0, 50.0])
+    assert np.allclose(rolling_mean(values, 3), pd.Series(values).rolling(3, min_periods=1).mean())
+    assert rolling_mean(np.zeros((0, 2)), 3).shape == (0, 2)
+
+    # Data ends on the 5th of May: May is partial, the window is Feb-Apr
+    payload = _salary_and_spending(months=("2024-01", "2024-02", "2024-03", "2024-04"))
+    payload["bankTransactions"][0]["txns"].append(["500", "UPI-SWIGGY-ORDER", "2024-05-05", 2, "UPI", "0"])
+    series = cashflow_from_columns(build_columns(payload))
+    assert list(series.complete) == [True, True, True, True, False]
+    window = trailing_window(series)
+    assert (window.months, window.start, window.end) == (3, "2024-02", "2024-04")
+    assert window.avg_income == 100000 and window.avg_expenses == 40000 and window.savings_rate == 0.6
+    assert list(window.category_expenses) == ["Rent & Utilities", "Food & Dining"]
+    assert np.isclose(series.rolling(2)["savings_rate"][3], 0.6)
+    # One partial month on its own is still used
+    single = build_cashflow(np.array(["2024-05-05"], dtype="datetime64[D]"), np.array([100.0]), np.array([False]), np.array([True]))
+    assert trailing_window(single).avg_expenses == 100.0
+    assert trailing_window(build_cashflow(np.array([], dtype="datetime64[D]"), np.array([]), np.array([], bool), np.array([], bool))).months == 0
+
+def test_health_scores_use_actual_cashflow():
+    async def score(bank):
+        context = services.AnalysisContext(
+            "1111111111", {"netWorthResponse": {"totalNetWorthValue": {"units": "300000"}}}, bank,
+            None, None, None, fetch_ms=0.0,
+        )
+        return (await services.calculate_financial_health_score("1111111111", context))["components"]
+
+    # 40k/month of expenses: 300k covers 1.25 x 6 months; saves 60%
+    frugal = asyncio.run(score(_salary_and_spending()))
+    assert frugal["emergency_fund"] == 20 and frugal["savings_rate"] == 20
+    # 95k/month: 300k is ~0.5 x 6 months; saves 5%
+    stretched = asyncio.run(score(_salary_and_spending(rent=80000, food=15000)))
+    assert stretched["emergency_fund"] == 15 and stretched["savings_rate"] == 5
+
+    # pipelines: annual income is twelve average months, not twelve times the whole history
+    frame = pipelines.process_transactions(_salary_and_spending(months=tuple(f"2024-{month:02d}" for month in range(1, 13))))
+    breakdown = pipelines.calculate_financial_health_score(frame, {"total_value": 700000})
+    assert breakdown["investment_score"] == 20 and breakdown["savings_score"] == 40
+
+def test_prompt_context_carries_the_trend():
+    summary = summarize_bank_transactions(_salary_and_spending())
+    assert [month["month"] for month in summary["monthly_cashflow"]] == ["2024-01", "2024-02", "2024-03", "2024-04"]
+    assert summary["monthly_cashflow"][0]["savings_rate"] == 0.6
+    assert summary["cashflow_trend"] == {
+        "months": 3, "from": "2024-02", "to": "2024-04",
+        "avg_monthly_income": 100000.0, "avg_monthly_expenses": 40000.0, "savings_rate": 0.6,
+    }
+    assert summary["category_totals"] == {"Rent & Utilities": 120000.0, "Food & Dining": 40000.0}
+
+def _row_loop(payload) -> dict:
+    """How monthly totals were built before: a dict per month, filled row by row"""
+    months = {}
+    for account in payload["bankTransactions"]:
+        for row in account["txns"]:
+            month = months.setdefault(str(row[2])[:7], {"income": 0.0, "expenses": 0.0})
+            if row[3] == 1:
+                month["income"] += float(row[0])
+            elif row[3] == 2:
+                month["expenses"] += float(row[0])
+    return months
+
+def test_one_pass_is_faster_than_the_row_loop():
+    payload = _random_payload(300_000, seed=8)
+    columns = build_columns(payload)
+    cashflow_from_columns(build_columns({}))   # categorizer loaded
+    started = time.perf_counter()
+    loop = _row_loop(payload)
+    loop_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    series = build_cashflow(columns.dates, columns.amounts, columns.is_credit, columns.is_debit)
+    vector_ms = (time.perf_counter() - started) * 1000
+    print(f"📊 300k transactions: row loop {loop_ms:.1f} ms, vectorized {vector_ms:.1f} ms over {len(series.months)} months")
+    assert np.allclose(series.expenses, [loop[str(month)]["expenses"] for month in series.months])
+    assert vector_ms < loop_ms / 5
+
+def main():
+    tests = [
+        test_series_match_a_groupby,
+        test_rolling_windows_and_partial_months,
+        test_health_scores_use_actual_cashflow,
+        test_prompt_context_carries_the_trend,
+        test_one_pass_is_faster_than_the_row_loop,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
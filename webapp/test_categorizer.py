@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test script for the compiled transaction categorizer: parity with the keyword chain, priorities, memo and scaling
+"""
+
+import re
+import sys
+import os
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "invested-backend"))
+
+import categorizer
+from categorizer import Categorizer, load_taxonomy
+
+import pipelines
+from test_support import patch, run_tests
+
+WORDS = ["UPI", "NEFT", "ACH", "SWIGGY", "ZOMATO", "SALARY", "ACME", "NETFLIX", "RENT", "OLA", "CURRENT", "GOSSIP",
+         "CC PAYMENT", "LIC", "PREMIUM", "AMAZON", "PRIME", "SIPPER", "HDFC", "KUMAR", "INTEREST", "METRO", "WATERWAYS"]
+
+def _keyword_chain(taxonomy: dict, narration: str) -> str:
+    """Reference: first category with any keyword in the text as a whole word"""
+    text = categorizer._normalize(narration)
+    for category, keywords in taxonomy.items():
+        if any(re.search(rf"\b{re.escape(keyword)}\b", text) for keyword in keywords):
+            return category
+    return "Other"
+
+def _compiled_chain(taxonomy: dict):
+    """_keyword_chain with each category's keywords compiled once (for big taxonomies)"""
+    patterns = [(category, re.compile("|".join(rf"\b{re.escape(keyword)}\b" for keyword in keywords)))
+                for category, keywords in taxonomy.items()]
+    return lambda narration: next((category for category, pattern in patterns
+                                   if pattern.search(categorizer._normalize(narration))), "Other")
+
+def _substring_chain(taxonomy: dict, narration: str) -> str:
+    """How categories were assigned before: one `any(keyword in text)` per category"""
+    text = str(narration or "").lower()
+    for category, keywords in taxonomy.items():
+        if any(keyword in text for keyword in keywords):
+            return category
+    return "Other"
+
+def _narrations(count: int, seed: int = 5) -> list:
+    rng = np.random.default_rng(seed)
+    return [
+        "-".join(rng.choice(WORDS, size=int(rng.integers(1, 4))).tolist()) + f"/{int(rng.integers(1e6))}"
+        for _ in range(count)
+    ]
+
+def _synthetic_taxonomy(categories: int, keywords_per_category: int = 5, seed: int = 11) -> dict:
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    return {
+        f"Category {index}": tuple("".join(word) for word in letters[rng.integers(0, 26, size=(keywords_per_category, 8))])
+        for index in range(categories)
+    }
+
+def test_matches_the_keyword_chain():
+    taxonomy = load_taxonomy()
+    compiled = Categorizer(taxonomy)
+    narrations = _narrations(3000) + ["", None, "Salary credit", "gossip column", "cc payment\nrent"]
+    expected = [_keyword_chain(taxonomy, text) for text in narrations]
+    assert list(compiled.categorize_many(narrations)) == expected
+    assert [compiled.categorize(text) for text in narrations[:200]] == expected[:200]
+
+def test_earlier_rows_win_even_for_nested_keywords():
+    compiled = Categorizer({"Investments": ("mutual", "sip"), "Funds": ("mutual fund",), "Drinks": ("sipper",), "Rent": ("rent",)})
+    assert compiled.categorize("MUTUAL FUND PURCHASE") == "Investments"  # "mutual" is a whole-word prefix of the longer match
+    assert compiled.categorize("UPI SIPPER STORE") == "Drinks"           # "sip" is not a word here
+    assert compiled.categorize("SIP-HDFC-MF") == "Investments"
+    assert compiled.categorize("CURRENT ACCOUNT") == "Other"
+    assert compiled.categorize("NOTHING HERE") == "Other"
+    assert Categorizer({}).categorize("SALARY") == "Other"
+
+def test_short_keywords_match_whole_words_only():
+    compiled = Categorizer(load_taxonomy())
+    expected = {
+        "AUTO-DEBIT - YOUTUBE PREMIUM": "Entertainment",
+        "UPI-DELICIOUS BAKES": "Transfers",
+        "POS COCA COLA": "Other",
+        "CHOCOLATE ROOM": "Other",
+        "HDFC PREMIUM CARD FEE": "Credit Card",
+        "UPI-OLA-RIDE": "Transport",
+        "NACH-LIC POLICY 8812": "Insurance",
+        "HOME LOAN EMI": "Loans & EMI",
+        "ACH-NETFLIX1234": "Entertainment",
+        "SALARY ACME CAFE": "Income",
+    }
+    assert {text: compiled.categorize(text) for text in expected} == expected
+
+def test_taxonomy_file_drives_every_consumer(tmp_path=None):
+    path = os.path.join(tmp_path or os.path.dirname(__file__), "taxonomy_test.csv")
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write("category,keywords\nPets,petshop; vet \nFood & Dining,swiggy\nPets,kennel\n")
+    try:
+        taxonomy = load_taxonomy(path)
+    finally:
+        os.remove(path)
+    assert taxonomy == {"Pets": ("petshop", "vet", "kennel"), "Food & Dining": ("swiggy",)}
+
+    patch(categorizer, "_categorizer", Categorizer(taxonomy))
+    frame = pipelines.process_transactions([
+        {"amount": 900, "narration": "UPI-KENNEL CLUB", "date": "2024-01-02"},
+        {"amount": 300, "narration": "UPI-SWIGGY", "date": "2024-01-03"},
+    ])
+    assert list(frame["category"]) == ["Pets", "Food & Dining"]
+
+def test_reference_numbers_share_one_memo_entry():
+    compiled = Categorizer(load_taxonomy())
+    narrations = [f"UPI/{ref}/SWIGGY" for ref in range(5000)]
+    categories = compiled.categorize_many(narrations)
+    assert set(categories) == {"Food & Dining"}
+    metrics = compiled.get_metrics()
+    assert metrics["scanned"] == 1 and metrics["memoized"] == 1
+    compiled.categorize_many(narrations)
+    assert compiled.get_metrics()["scanned"] == 1 and compiled.get_metrics()["hit_rate"] > 0.99
+
+def benchmark(category_counts=(12, 120, 1200), narrations=20_000) -> dict:
+    """Compiled scan vs the keyword chain as the taxonomy grows (printed; run from main(), not asserted)"""
+    texts = _narrations(narrations, seed=9)
+    results = {}
+    for count in category_counts:
+        taxonomy = _synthetic_taxonomy(count)
+        started = time.perf_counter()
+        compiled = Categorizer(taxonomy)
+        compile_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        compiled.categorize_many(texts)
+        compiled_ms = (time.perf_counter() - started) * 1000
+        sample = texts[:2000]
+        started = time.perf_counter()
+        for text in sample:
+            _substring_chain(taxonomy, text)
+        chain_ms = (time.perf_counter() - started) * 1000 * len(texts) / len(sample)
+        results[count] = (compile_ms, compiled_ms, chain_ms)
+        print(f"📊 {count:>5} categories: compile {compile_ms:7.1f} ms, {narrations:,} narrations {compiled_ms:7.1f} ms "
+              f"(keyword chain ~{chain_ms:8.1f} ms)")
+    return results
+
+def test_scan_work_does_not_grow_with_the_taxonomy():
+    big = _synthetic_taxonomy(1200)
+    planted = [f"UPI-{keywords[0].upper()}-{n}" for n, keywords in enumerate(list(big.values())[::100])]
+    texts = planted + _narrations(300, seed=9)
+    scans = {}
+    for count in (12, 1200):
+        taxonomy = _synthetic_taxonomy(count)
+        compiled = Categorizer(taxonomy)
+        reference = _compiled_chain(taxonomy)
+        assert list(compiled.categorize_many(texts)) == [reference(text) for text in texts]
+        metrics = compiled.get_metrics()
+        scans[count] = (metrics["scanned"], metrics["scanned_chars"])
+    # 100x the categories: still one pass over each distinct narration
+    assert scans[12] == scans[1200]
+    assert scans[1200][0] == len({categorizer._normalize(text) for text in texts})
+
+def main():
+    tests = [
+        test_matches_the_keyword_chain,
+        test_earlier_rows_win_even_for_nested_keywords,
+        test_short_keywords_match_whole_words_only,
+        test_taxonomy_file_drives_every_consumer,
+        test_reference_numbers_share_one_memo_entry,
+        test_scan_work_does_not_grow_with_the_taxonomy,
+    ]
+    passed = run_tests(tests)
+    benchmark()
+    return passed
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the token-budgeted prompt context builder
+"""
+
+import json
+import random
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import context_builder
+from context_builder import build_context, estimate_tokens, summarize_datasets, OMITTED
+from transaction_store import get_transaction_store_metrics, transaction_columns
+from test_support import run_tests
+
+def _bank_history(months=12, per_month=40, seed=7):
+    rng = random.Random(seed)
+    txns = []
+    for month in range(1, months + 1):
+        txns.append(["150000", "SALARY CREDIT ACME CORP", f"2024-{month:02d}-01", 1, "NEFT", "200000"])
+        txns.append(["649", "UPI-NETFLIX-8812", f"2024-{month:02d}-05", 2, "UPI", "199351"])
+        for day in range(per_month):
+            narration = rng.choice(["UPI-ZOMATO-1", "UPI-SWIGGY-2", "AMAZON PAY", "UBER TRIP"])
+            txns.append([str(rng.randint(100, 3000)), narration, f"2024-{month:02d}-{day % 28 + 1:02d}", 2, "UPI", "150000"])
+    txns.append(["250000", "IMPS-UNKNOWN PAYEE", "2024-12-20", 2, "IMPS", "1000"])
+    return {"bankTransactions": [{"bank": "HDFC Bank", "txns": txns}]}
+
+def _portfolio(funds=40):
+    return {"mfTransactions": [
+        {"isin": f"INF{index:06d}", "schemeName": f"Fund {index} Direct Growth", "folioId": str(index),
+         "txns": [[1, f"2024-{month:02d}-10", 50.0, 100.0, 5000.0] for month in range(1, 13)]}
+        for index in range(funds)
+    ]}
+
+def test_bank_summary_aggregates():
+    summary = summarize_datasets({"bank_transactions": _bank_history()})["bank_transactions"]
+    assert summary["transaction_count"] == 12 * 42 + 1
+    assert len(summary["monthly_cashflow"]) == 12
+    january = summary["monthly_cashflow"][0]
+    assert january["month"] == "2024-01" and january["income"] == 150000.0
+    assert january["net"] == round(january["income"] - january["expenses"], 2)
+    assert summary["top_anomalies"][0]["narration"] == "IMPS-UNKNOWN PAYEE"
+    assert "Food & Dining" in summary["category_totals"]
+    netflix = [item for item in summary["recurring_debits"] if "NETFLIX" in item["payee"]]
+    assert netflix and netflix[0]["months"] == 12 and netflix[0]["avg_amount"] == 649.0
+    assert len(summary["recent_transactions"]) == context_builder.RECENT_TRANSACTIONS
+
+def test_bank_summary_reads_the_shared_columns():
+    payload = _bank_history(months=2)
+    payload["bankTransactions"].append({"bank": "SBI", "txns": [["300", "ATM CASH", "2025-01-02", "OTHER", "ATM", ""]]})
+    transaction_columns(payload)
+    builds = get_transaction_store_metrics()["builds"]
+    summary = context_builder.summarize_bank_transactions(payload)
+    assert get_transaction_store_metrics()["builds"] == builds
+    assert summary["accounts"] == [
+        {"bank": "HDFC Bank", "transactions": 2 * 42 + 1, "balance": 1000.0},
+        {"bank": "SBI", "transactions": 1, "balance": None},
+    ]
+    assert summary["recent_transactions"][0] == {"date": "2025-01-02", "amount": 300.0, "type": "other", "narration": "ATM CASH", "bank": "SBI"}
+
+def test_context_fits_budget_and_is_much_smaller_than_raw_data():
+    data = {"bank_transactions": _bank_history(), "mf_transactions": _portfolio(), "credit_report": "unavailable"}
+    context = build_context(data, agent="test")
+    assert context.tokens <= context_builder.CONTEXT_TOKEN_BUDGET
+    assert context.tokens * 5 < context.source_tokens, (context.tokens, context.source_tokens)
+    # Still valid JSON the model can read, and unavailable datasets pass through
+    assert json.loads(context.text)["credit_report"] == "unavailable"
+
+    tight = build_context(data, budget_tokens=400)
+    assert tight.trimmed and tight.tokens <= 400
+    parsed = json.loads(tight.text)
+    # The most recent cashflow months survive trimming
+    assert parsed["bank_transactions"]["monthly_cashflow"][-1]["month"] == "2024-12"
+
+    metrics = context_builder.get_context_metrics()["agents"]["test"]
+    assert metrics["prompts"] == 1 and metrics["tokens_saved"] > 0
+
+def test_sections_are_dropped_whole_when_lists_are_not_enough():
+    goals = {"notes": "save for a house " * 400, "targets": [{"name": "House", "amount": 5000000}]}
+    data = {"bank_transactions": _bank_history(), "goals": goals, "raw_export": ["row"] * 3000}
+    context = build_context(data, budget_tokens=500)
+    assert context.trimmed and context.tokens <= 500
+    parsed = json.loads(context.text)
+    # The biggest fields go first, then whole datasets that are not summaries
+    assert parsed["goals"]["notes"] == OMITTED and parsed["goals"]["targets"][0]["name"] == "House"
+    assert parsed["raw_export"] == OMITTED
+    assert parsed["bank_transactions"]["cashflow_trend"]["months"] == 3
+    # The caller's datasets are not edited
+    assert goals["notes"].startswith("save") and len(data["raw_export"]) == 3000
+
+def test_source_tokens_are_sampled_not_serialized():
+    data = {"bank_transactions": _bank_history(months=12, per_month=4000), "mf_transactions": _portfolio()}
+    exact = estimate_tokens(context_builder._dumps(data))
+    started = time.perf_counter()
+    sampled = (context_builder._estimate_chars(data) + 3) // 4
+    sample_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    context_builder._dumps(data)
+    dump_ms = (time.perf_counter() - started) * 1000
+    print(f"📊 raw size of {exact:,} tokens: sampled in {sample_ms:.2f} ms, serializing takes {dump_ms:.1f} ms")
+    assert abs(sampled - exact) < 0.05 * exact
+    assert sample_ms < dump_ms / 5
+    small = {"mf_transactions": _portfolio(3)}
+    assert build_context(small).source_tokens == estimate_tokens(context_builder._dumps(small))
+
+def test_prompt_tokens_reported():
+    context = build_context({"mf_transactions": _portfolio(3)}, agent="reporting")
+    prompt = "You are Catalyst.\nData:\n" + context.text
+    assert context_builder.report_prompt_tokens("reporting", prompt, context) == estimate_tokens(prompt)
+    assert context_builder.get_context_metrics()["agents"]["reporting"]["last_prompt_tokens"] == estimate_tokens(prompt)
+
+def main():
+    tests = [
+        test_bank_summary_aggregates,
+        test_bank_summary_reads_the_shared_columns,
+        test_context_fits_budget_and_is_much_smaller_than_raw_data,
+        test_sections_are_dropped_whole_when_lists_are_not_enough,
+        test_source_tokens_are_sampled_not_serialized,
+        test_prompt_tokens_reported,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script for question/area-aware dataset planning (Oracle and Guardian)
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "agents"))
+
+import dataset_planner
+from dataset_planner import plan_for_question, plan_for_area, ORACLE_DATASETS
+from test_result_cache import _install_fakes, UID
+from test_support import patch, run_tests
+
+import guardian
+
+def test_questions_map_to_the_datasets_they_need():
+    tax = plan_for_question("Which of my investments qualify for tax deductions?")
+    assert {"stock_transactions", "mf_transactions", "epf_details"} <= set(tax.datasets)
+    assert "credit_report" not in tax.datasets
+
+    subscriptions = plan_for_question("What subscriptions am I paying for?")
+    assert subscriptions.datasets == ("bank_transactions",)
+    assert "recurring_debits" in subscriptions.fields["bank_transactions"]
+
+    assert plan_for_question("Is my CIBIL score healthy?").datasets == ("credit_report",)
+    # Nothing recognisable: everything, as before
+    assert plan_for_question("Hi Oracle!").datasets == ORACLE_DATASETS
+
+def test_unlimited_rule_keeps_all_fields():
+    # "fraud" limits the bank summary; "investments" doesn't touch it, so the limit stays
+    plan = plan_for_question("Any unusual payments from my investment account?")
+    assert plan.fields["bank_transactions"] == dataset_planner.SAFETY_FIELDS
+    # "spending" and "cashflow" both limit it: the union is kept
+    plan = plan_for_question("How much of my salary do I spend on food?")
+    assert set(plan.fields["bank_transactions"]) == set(dataset_planner.SPENDING_FIELDS) | set(dataset_planner.CASHFLOW_FIELDS)
+
+def test_guardian_area_fetches_only_needed_datasets():
+    _, datasets, gemini_calls = _install_fakes()
+    requested = []
+
+    async def recording_load(uid, names):
+        requested.append(list(names))
+        return {name: datasets[name] for name in names}
+
+    patch(guardian, "load_user_datasets", recording_load)
+    assert plan_for_area("credit_monitoring").datasets == ("credit_report",)
+
+    asyncio.run(guardian.run_guardian_analysis(UID))
+    asyncio.run(guardian.run_guardian_analysis(UID, area="credit_monitoring"))
+    assert requested == [["bank_transactions", "credit_report", "mf_transactions"], ["credit_report"]]
+    # Only the credit report is serialized into the focused prompt
+    assert "bankTransactions" not in gemini_calls[-1] and "monthly_cashflow" not in gemini_calls[-1]
+
+    metrics = dataset_planner.get_planner_metrics()
+    assert metrics["agents"]["guardian"]["fetches_avoided"] >= 2
+    assert metrics["agents"]["guardian"]["bytes_avoided_estimate"] > 0
+
+def main():
+    tests = [
+        test_questions_map_to_the_datasets_they_need,
+        test_unlimited_rule_keeps_all_fields,
+        test_guardian_area_fetches_only_needed_datasets,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
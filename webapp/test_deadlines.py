@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test script for request deadlines: budgeted MCP fetches, partial fan-outs and deadline-bound LLM calls
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import deadlines
+import shared_utils
+import write_behind
+from deadlines import request_deadline, gather_within, run_stage, get_deadline_metrics
+from test_mcp_cache import _install_fakes
+from test_llm_gateway import _stub_gateway
+from llm_gateway import PRIORITY_INTERACTIVE
+from test_support import SAMPLE_DATA, patch, run_tests
+
+UID = "2222222222"
+
+def _stage(name):
+    return dict(get_deadline_metrics()["stages"].get(name, {"calls": 0, "timeouts": 0, "deadline_misses": 0, "unavailable": 0}))
+
+def _slow_mcp(delays):
+    async def fetch(session_id, uid, tool_name, timeout=30):
+        await asyncio.sleep(delays.get(tool_name, 0))
+        return SAMPLE_DATA[tool_name]
+    patch(shared_utils, "_fetch_tool_from_mcp", fetch)
+
+def test_fan_out_returns_what_arrived_and_caches_the_rest_later():
+    db, _ = _install_fakes()
+    # credit report is slow: past the fetch share (0.4 of 1s) but inside the deadline
+    _slow_mcp({"fetch_bank_transactions": 0.05, "fetch_mf_transactions": 0.05, "fetch_credit_report": 0.6})
+    before = _stage("load_datasets")
+
+    async def scenario():
+        started = time.perf_counter()
+        with request_deadline(1.0):
+            datasets = await shared_utils.load_user_datasets(UID, ["bank_transactions", "credit_report", "mf_transactions"])
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.5)  # the late fetch lands after the response
+        # The late cache write is tracked until it finishes
+        assert shared_utils.get_swr_metrics()["late_writes"] == 0
+        await write_behind.write_behind.flush()
+        return datasets, elapsed
+
+    datasets, elapsed = asyncio.run(scenario())
+    print(f"📊 partial load returned in {elapsed * 1000:.0f} ms (slowest fetch 600 ms)")
+    assert elapsed < 0.55
+    assert datasets["bank_transactions"] == SAMPLE_DATA["fetch_bank_transactions"]
+    assert datasets["credit_report"]["unavailable"] and "error" in datasets["credit_report"]
+    # The late fetch still filled the cache for the next request
+    assert shared_utils.mcp_payload_cache.get(UID, "fetch_credit_report") == SAMPLE_DATA["fetch_credit_report"]
+    assert any("credit_report" in path for path in db.docs)
+    after = _stage("load_datasets")
+    assert after["unavailable"] - before["unavailable"] == 1
+
+def test_without_a_deadline_fan_out_waits_for_everything():
+    _install_fakes()
+    _slow_mcp({"fetch_credit_report": 0.3})
+    datasets = asyncio.run(shared_utils.load_user_datasets(UID, ["bank_transactions", "credit_report"]))
+    assert datasets["credit_report"] == SAMPLE_DATA["fetch_credit_report"]
+
+def test_mcp_fetch_is_cut_at_the_deadline():
+    _install_fakes()
+    _slow_mcp({"fetch_net_worth": 2.0})
+    before = _stage("mcp_fetch")
+
+    async def scenario():
+        started = time.perf_counter()
+        with request_deadline(0.2):
+            data = await shared_utils.get_user_financial_data(UID, "fetch_net_worth")
+            # Nothing left: later fetches are not even started
+            await asyncio.sleep(0.05)
+            skipped = await shared_utils.get_user_financial_data(UID, "fetch_epf_details")
+        return data, skipped, time.perf_counter() - started
+
+    data, skipped, elapsed = asyncio.run(scenario())
+    assert "Timeout" in data["error"]
+    assert skipped["unavailable"]
+    assert elapsed < 0.4
+    after = _stage("mcp_fetch")
+    assert after["deadline_misses"] - before["deadline_misses"] == 2
+
+def test_llm_call_and_queue_wait_share_the_deadline():
+    gateway, _ = _stub_gateway(max_concurrency=1, max_per_user=5, interactive_reserved=0, service_seconds=0.5)
+    before = _stage("llm")
+
+    async def scenario():
+        # Holds the only slot (no deadline)
+        blocker = asyncio.ensure_future(gateway.generate("refresh", uid="u1", priority=PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.01)
+        outcomes = []
+        with request_deadline(0.1):
+            try:
+                await gateway.generate("chat", uid="u2", priority=PRIORITY_INTERACTIVE, timeout=45)
+                outcomes.append("answered")
+            except asyncio.TimeoutError:
+                outcomes.append("timed out in queue")
+        waiters_left = len(gateway._waiters)
+        await blocker
+        with request_deadline(0.2):
+            try:
+                await gateway.generate("chat", uid="u2", priority=PRIORITY_INTERACTIVE, timeout=45)
+            except asyncio.TimeoutError:
+                outcomes.append("timed out in call")
+        return outcomes, waiters_left
+
+    started = time.perf_counter()
+    outcomes, waiters_left = asyncio.run(scenario())
+    assert outcomes == ["timed out in queue", "timed out in call"]
+    assert waiters_left == 0 and gateway.stats()["active"] == 0
+    assert time.perf_counter() - started < 1.0
+    after = _stage("llm")
+    assert after["deadline_misses"] - before["deadline_misses"] == 2
+    # The queue timeout is a timeout only, not also a cancellation
+    interactive = gateway.stats()["priorities"]["interactive"]
+    assert interactive["timeouts"] == 2 and interactive["cancelled"] == 0
+
+def test_stage_helpers():
+    async def scenario():
+        with request_deadline(0.05):
+            await asyncio.sleep(0.06)
+            try:
+                await run_stage("firestore_read", asyncio.sleep(1))
+                return "ran"
+            except asyncio.TimeoutError:
+                return "skipped"
+
+    assert asyncio.run(scenario()) == "skipped"
+    # No deadline: unbounded, behaves like a plain await / gather
+    assert asyncio.run(run_stage("firestore_read", asyncio.sleep(0, result="ok"))) == "ok"
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def fan_out():
+        return await gather_within({"ok": asyncio.sleep(0, result=1), "bad": failing()}, stage="test")
+
+    results = asyncio.run(fan_out())
+    assert results["ok"] == 1 and "boom" in results["bad"]["error"]
+    assert deadlines.current_deadline() is None
+
+def main():
+    tests = [
+        test_fan_out_returns_what_arrived_and_caches_the_rest_later,
+        test_without_a_deadline_fan_out_waits_for_everything,
+        test_mcp_fetch_is_cut_at_the_deadline,
+        test_llm_call_and_queue_wait_share_the_deadline,
+        test_stage_helpers,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the named executors used for blocking work
+"""
+
+import asyncio
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+from executors import NamedExecutor
+from test_support import run_tests
+
+def test_pools_are_isolated_and_measured():
+    """A saturated pool queues its own work without delaying another pool"""
+    slow = NamedExecutor("test-slow", 1)
+    auth = NamedExecutor("test-auth", 1)
+    release = threading.Event()
+
+    async def scenario():
+        slow_calls = [asyncio.create_task(slow.run(release.wait, 5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert slow.stats()["queue_depth"] == 2
+
+        started = time.perf_counter()
+        assert await auth.run(lambda: "uid-123") == "uid-123"
+        assert time.perf_counter() - started < 0.5
+
+        release.set()
+        await asyncio.gather(*slow_calls)
+
+    asyncio.run(scenario())
+    stats = slow.stats()
+    print(f"📊 slow pool: {stats}")
+    assert stats["completed"] == 3
+    assert stats["queue_depth"] == 0 and stats["active"] == 0
+    assert stats["max_queue_depth"] >= 2
+    assert stats["wait_ms"]["max"] > 0
+    slow.shutdown()
+    auth.shutdown()
+
+def test_errors_propagate_and_are_counted():
+    executor = NamedExecutor("test-errors", 2)
+
+    def boom():
+        raise ValueError("boom")
+
+    async def scenario():
+        try:
+            await executor.run(boom)
+        except ValueError:
+            return True
+        return False
+
+    assert asyncio.run(scenario())
+    assert executor.stats()["errors"] == 1
+    executor.shutdown()
+
+def main():
+    tests = [
+        test_pools_are_isolated_and_measured,
+        test_errors_propagate_and_are_counted,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental Guardian runs: per-user watermark, running statistics and flat per-run cost
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "agents"))
+
+import guardian_state
+import write_behind
+from guardian_rules import evaluate_guardian_rules
+from guardian_state import empty_state, evaluate_incremental, _from_document, _to_document
+from test_result_cache import _install_fakes, UID
+from test_support import BANK_START, CREDIT_REPORT, bank_transactions, run_tests
+
+import guardian
+
+def _append_day(payload, day, rows):
+    """Add rows dated BANK_START + day to the first account"""
+    today = (BANK_START + timedelta(days=day)).isoformat()
+    payload["bankTransactions"][0]["txns"].extend([[amount, narration, today, 2, "UPI", balance] for amount, narration, balance in rows])
+
+def _ids(alerts):
+    return sorted(alert["id"] for alert in alerts)
+
+def test_first_run_matches_the_full_rules():
+    datasets = {"bank_transactions": bank_transactions(), "credit_report": CREDIT_REPORT}
+    full = evaluate_guardian_rules(datasets)
+    state = empty_state()
+    first = evaluate_incremental(state, datasets)
+    assert _ids(first["alerts"]) == _ids(full["alerts"])
+    assert first["as_of"] == full["as_of"] == "2024-05-29"
+    # Only the lookback window is scored and shown to Gemini; the rest went into the baseline
+    assert first["new_transactions"] == len([row for row in datasets["bank_transactions"]["bankTransactions"][0]["txns"] if row[2] >= "2024-04-29"])
+    assert first["bank_activity"]["baseline"]["through"] is None
+    assert state["transactions"] == len(datasets["bank_transactions"]["bankTransactions"][0]["txns"])
+
+def test_later_runs_score_only_what_is_new():
+    bank = bank_transactions(incidents=False)
+    datasets = {"bank_transactions": bank}
+    state = empty_state()
+    evaluate_incremental(state, datasets)
+    seen = state["transactions"]
+
+    again = evaluate_incremental(state, datasets)
+    assert again["new_transactions"] == 0 and again["alerts"] == []
+    assert state["transactions"] == seen
+
+    # A late row on the watermark date and a big debit the next day
+    _append_day(bank, 149, [("450", "UPI-SWIGGY-PAYMENT", "1")])
+    _append_day(bank, 150, [("95000", "NEFT-UNKNOWN BENEFICIARY", "1")])
+    result = evaluate_incremental(state, datasets)
+    assert result["new_transactions"] == 2 and state["transactions"] == seen + 2
+    assert sorted(alert["rule"] for alert in result["alerts"]) == ["balance_drop", "large_debit", "new_merchant"]
+    assert result["as_of"] == "2024-05-30"
+    assert [txn["amount"] for txn in result["bank_activity"]["new_transactions"]] == [95000.0, 450.0]
+    assert result["bank_activity"]["baseline"]["through"] == "2024-05-29"
+
+    # Open alerts survive runs with nothing new, and the state round-trips through Firestore form
+    restored = _from_document(_to_document(state))
+    assert evaluate_incremental(restored, datasets)["alerts"] == result["alerts"]
+    assert restored["merchants"] == state["merchants"]
+
+def test_per_run_cost_stays_flat_as_history_grows():
+    measurements = {}
+    for days in (500, 2000):
+        bank = bank_transactions(days=days, per_day=20, incidents=False)
+        datasets = {"bank_transactions": bank, "credit_report": CREDIT_REPORT}
+        state = empty_state()
+        evaluate_incremental(state, datasets)
+        _append_day(bank, days, [("640", "UPI-ZOMATO-PAYMENT", "5000"), ("15000", "UPI-NEWSHOP-PAYMENT", "1000")])
+
+        started = time.perf_counter()
+        result = evaluate_incremental(state, datasets)
+        incremental_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        evaluate_guardian_rules(datasets)
+        full_ms = (time.perf_counter() - started) * 1000
+        rows = len(bank["bankTransactions"][0]["txns"])
+        measurements[days] = (rows, incremental_ms, full_ms, len(json.dumps(result["bank_activity"])), len(json.dumps(_to_document(state))))
+        assert result["new_transactions"] == 2
+
+    for days, (rows, incremental_ms, full_ms, prompt_chars, state_chars) in measurements.items():
+        print(f"📊 {rows} transactions: incremental {incremental_ms:.1f} ms vs full {full_ms:.1f} ms, "
+              f"bank prompt {prompt_chars} chars, state {state_chars} chars")
+    (_, small_ms, _, small_prompt, small_state), (_, big_ms, big_full_ms, big_prompt, big_state) = measurements[500], measurements[2000]
+    # Prompt and state do not grow with the history; work is a fraction of a full pass
+    assert abs(big_prompt - small_prompt) < 0.1 * small_prompt
+    assert abs(big_state - small_state) < 0.1 * small_state
+    assert big_ms < big_full_ms / 3
+
+def test_guardian_sends_only_new_transactions_and_persists_its_state():
+    db, datasets, gemini_calls = _install_fakes()
+    bank = bank_transactions(incidents=False)
+    datasets["bank_transactions"] = bank
+
+    async def scenario():
+        await guardian.run_guardian_analysis(UID)
+        _append_day(bank, 150, [("777", "UPI-BOOKSHOP-PAYMENT", "1")])
+        result = json.loads((await guardian.run_guardian_analysis(UID))["alerts"])
+        await write_behind.write_behind.flush()
+        return result
+
+    result = asyncio.run(scenario())
+    assert len(gemini_calls) == 2
+    assert "bank_activity" in gemini_calls[-1] and "BOOKSHOP" in gemini_calls[-1]
+    assert '"new_count":1' in gemini_calls[-1] and "SALARY ACME" not in gemini_calls[-1]
+    assert result["rules"]["new_transactions"] == 1
+    stored = db.docs[f"users/{UID}"]["guardian_state"]["default"]
+    assert stored["watermark"]["date"] == "2024-05-30"
+
+    # Another process (empty L1) resumes from the stored watermark: nothing new, cached answer
+    guardian_state.guardian_state_cache.clear()
+    asyncio.run(guardian.run_guardian_analysis(UID))
+    assert len(gemini_calls) == 2
+
+def test_areas_share_normalized_state_and_locks_are_released():
+    db, _, _ = _install_fakes()
+    datasets = {"bank_transactions": bank_transactions(), "credit_report": CREDIT_REPORT}
+
+    async def scenario():
+        areas = ["Credit Monitoring", "credit_monitoring"] + [f"client string {n}" for n in range(50)] + [None]
+        await asyncio.gather(*[guardian_state.run_incremental_rules(UID, datasets, area) for area in areas])
+        await write_behind.write_behind.flush()
+
+    asyncio.run(scenario())
+    assert sorted(db.docs[f"users/{UID}"]["guardian_state"]) == ["credit_monitoring", "default"]
+    assert guardian_state.get_guardian_state_metrics()["locks"] == 0
+
+def main():
+    tests = [
+        test_first_run_matches_the_full_rules,
+        test_later_runs_score_only_what_is_new,
+        test_per_run_cost_stays_flat_as_history_grows,
+        test_guardian_sends_only_new_transactions_and_persists_its_state,
+        test_areas_share_normalized_state_and_locks_are_released,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test script for the rule-based Guardian alerts and their progressive Gemini enrichment
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "agents"))
+
+from guardian_rules import evaluate_guardian_rules, merge_enrichment, transaction_arrays
+from test_result_cache import _install_fakes
+from test_support import CREDIT_REPORT, bank_transactions, patch, run_tests
+
+import guardian
+
+def test_rules_flag_each_risk_with_evidence():
+    result = evaluate_guardian_rules({"bank_transactions": bank_transactions(), "credit_report": CREDIT_REPORT})
+    by_rule = {}
+    for alert in result["alerts"]:
+        by_rule.setdefault(alert["rule"], []).append(alert)
+    print(f"📊 {len(result['alerts'])} rule alerts in {result['elapsed_ms']} ms: {sorted(by_rule)}")
+
+    assert [alert["evidence"]["amount"] for alert in by_rule["large_debit"]] == [150000.0, 12000.0]
+    assert [alert["evidence"]["merchant"] for alert in by_rule["new_merchant"]] == ["NEFT UNKNOWN BENEFICIARY", "UPI CRYPTOXCHANGE PAYMENT"]
+    assert by_rule["balance_drop"][0]["evidence"]["bank"] == "HDFC"
+    assert {alert["evidence"].get("lender") for alert in by_rule["high_utilization"]} >= {"HDFC BANK"}
+    assert by_rule["missed_payment"][0]["evidence"]["lender"] == "ICICI BANK"  # past due first
+    assert {alert["evidence"]["lender"] for alert in by_rule["missed_payment"]} == {"ICICI BANK", "BAJAJ FINANCE"}
+    # High severity first, every alert in the Guardian schema
+    assert result["alerts"][0]["severity"] == "high"
+    assert all({"type", "description", "severity", "id"} <= set(alert) for alert in result["alerts"])
+    assert result["as_of"] == "2024-05-29"
+
+def test_quiet_history_raises_nothing_and_missing_data_is_fine():
+    quiet = bank_transactions(incidents=False)
+    assert evaluate_guardian_rules({"bank_transactions": quiet})["alerts"] == []
+    assert evaluate_guardian_rules({"bank_transactions": {"error": "Timeout"}, "credit_report": "unavailable"})["alerts"] == []
+    assert transaction_arrays({}).amounts.size == 0
+
+def test_rules_are_fast_on_large_histories():
+    big = bank_transactions(days=1000, per_day=20)
+    started = time.perf_counter()
+    result = evaluate_guardian_rules({"bank_transactions": big, "credit_report": CREDIT_REPORT})
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    rows = len(big["bankTransactions"][0]["txns"])
+    print(f"📊 rules over {rows} transactions: {elapsed_ms:.1f} ms")
+    assert result["alerts"]
+    assert elapsed_ms < 500
+
+def test_merge_keeps_rule_alerts_and_adds_explanations():
+    rules = evaluate_guardian_rules({"credit_report": CREDIT_REPORT})["alerts"]
+    merged = merge_enrichment(rules, {
+        "explanations": {rules[0]["id"]: "Pay the overdue amount today."},
+        "alerts": [{"type": "Insurance", "description": "No term cover found.", "severity": "medium"}, "junk"],
+    })
+    assert merged[0]["explanation"] == "Pay the overdue amount today."
+    assert len(merged) == len(rules) + 1 and merged[-1]["source"] == "llm"
+    # Unusable answer: rule alerts unchanged
+    assert merge_enrichment(rules, "not json") == rules
+
+def test_stream_sends_rule_alerts_before_gemini_answers():
+    _, datasets, gemini_calls = _install_fakes()
+    datasets["bank_transactions"] = bank_transactions()
+    datasets["credit_report"] = CREDIT_REPORT
+
+    async def scenario():
+        started = time.perf_counter()
+        events = []
+        async for record in guardian.stream_guardian_analysis("2222222222"):
+            events.append((record, (time.perf_counter() - started) * 1000))
+        return events
+
+    events = asyncio.run(scenario())
+    (first, first_ms), (enriched, enriched_ms) = events
+    print(f"📊 rule alerts after {first_ms:.1f} ms, enriched after {enriched_ms:.1f} ms")
+    assert first["event"] == "alerts" and first["alerts"] and first_ms < 150  # fake Gemini takes 200 ms
+    assert enriched["event"] == "enriched"
+    # Rule alerts kept, Gemini's own alert appended
+    assert [alert["id"] for alert in enriched["alerts"] if alert.get("source") == "rules"] == [alert["id"] for alert in first["alerts"]]
+    assert enriched["alerts"][-1]["source"] == "llm"
+    assert "Rule alerts" in gemini_calls[-1] and first["alerts"][0]["id"] in gemini_calls[-1]
+
+def test_gemini_failure_returns_rule_alerts_not_generic_tips():
+    _, datasets, _ = _install_fakes()
+    datasets["credit_report"] = CREDIT_REPORT
+
+    async def failing_gemini(prompt, uid=None, priority="background", **kwargs):
+        return "Error: Gemini API call timed out after 45s"
+
+    patch(guardian, "call_gemini", failing_gemini)
+    result = json.loads(asyncio.run(guardian.run_guardian_analysis("2222222222", area="credit_monitoring"))["alerts"])
+    assert {alert["rule"] for alert in result["alerts"]} == {"missed_payment", "high_utilization"}
+    assert result["rules"]["count"] == len(result["alerts"])
+
+def main():
+    tests = [
+        test_rules_flag_each_risk_with_evidence,
+        test_quiet_history_raises_nothing_and_missing_data_is_fine,
+        test_rules_are_fast_on_large_histories,
+        test_merge_keeps_rule_alerts_and_adds_explanations,
+        test_stream_sends_rule_alerts_before_gemini_answers,
+        test_gemini_failure_returns_rule_alerts_not_generic_tips,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
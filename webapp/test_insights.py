@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the one-shot multi-agent /insights stream
+"""
+
+import asyncio
+import copy
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "agents"))
+
+import result_cache
+from test_support import SAMPLE_DATA, install_firestore, patch, run_tests
+
+import guardian
+import catalyst
+import strategist
+import insights
+
+UID = "2222222222"
+
+# Slowest agent last: results must arrive in completion order, not request order
+GEMINI_DELAYS = {"Guardian": 0.3, "Catalyst": 0.05, "Strategist": 0.15}
+ANSWERS = {
+    "Guardian": {"alerts": [{"type": "Spending", "description": "ok", "severity": "info"}]},
+    "Catalyst": {"opportunities": [{"title": "SIP", "description": "ok", "category": "Growth"}]},
+    "Strategist": {"summary": "ok", "recommendations": [{"symbol": "NIFTYBEES", "advice": "hold", "reasoning": "ok"}]},
+}
+
+def _install_fakes():
+    install_firestore(guardian, catalyst, strategist, uid=UID)
+    result_cache.agent_result_cache.clear()
+
+    loads = []
+
+    async def fake_load(uid, names):
+        loads.append(list(names))
+        return {name: copy.deepcopy(SAMPLE_DATA[f"fetch_{name}"]) for name in names}
+
+    async def fake_gemini(prompt, uid=None, priority="background", **kwargs):
+        agent = next(name for name in GEMINI_DELAYS if prompt.startswith(f"You are {name}") or name in prompt[:60])
+        await asyncio.sleep(GEMINI_DELAYS[agent])
+        return json.dumps(ANSWERS[agent])
+
+    for module in (guardian, catalyst, strategist):
+        patch(module, "load_user_datasets", fake_load)
+        patch(module, "call_gemini", fake_gemini)
+    patch(insights, "load_user_datasets", fake_load)
+    return loads
+
+def _collect(fmt):
+    async def scenario():
+        return [record async for record in insights.stream_insights(UID, fmt=fmt)]
+    return asyncio.run(scenario())
+
+def test_datasets_loaded_once_and_results_stream_in_completion_order():
+    loads = _install_fakes()
+    lines = _collect("ndjson")
+    records = [json.loads(line) for line in lines]
+
+    # One load of the union; the agents never load on their own
+    assert len(loads) == 1
+    assert set(loads[0]) == {"bank_transactions", "credit_report", "mf_transactions", "net_worth", "epf_details", "stock_transactions"}
+    assert loads[0].count("mf_transactions") == 1
+
+    agent_records = [record for record in records if record["event"] == "agent"]
+    assert [record["agent"] for record in agent_records] == ["catalyst", "strategist", "guardian"]
+    assert all(record["status"] == "success" for record in agent_records)
+    assert json.loads(agent_records[0]["response"]["opportunities"])["opportunities"][0]["title"] == "SIP"
+
+    done = records[-1]
+    assert done["event"] == "done" and done["dataset_loads_saved"] == 2
+    # Concurrent: total is about the slowest agent, not the sum
+    assert done["total_ms"] < sum(GEMINI_DELAYS.values()) * 1000
+
+def test_sse_format_and_agent_selection():
+    loads = _install_fakes()
+
+    async def scenario():
+        return [event async for event in insights.stream_insights(UID, agents="strategist,catalyst", fmt="sse")]
+
+    events = asyncio.run(scenario())
+    assert events[0].startswith("event: datasets\n")
+    assert all(event.endswith("\n\n") for event in events)
+    assert sum(event.startswith("event: agent\n") for event in events) == 2
+    assert set(loads[0]) == {"stock_transactions", "mf_transactions", "net_worth", "epf_details"}
+
+    try:
+        insights.parse_agents("guardian,oracle")
+        assert False, "unknown agent accepted"
+    except ValueError:
+        pass
+
+def main():
+    tests = [
+        test_datasets_loaded_once_and_results_stream_in_completion_order,
+        test_sse_format_and_agent_selection,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
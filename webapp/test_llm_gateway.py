@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Test script for the LLM gateway's scheduling and tool loop (Gemini itself is replaced by stubs)
+"""
+
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(__file__))
+
+import llm_gateway
+from llm_gateway import LLMGateway, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from llm_tools import ToolRegistry
+from llm_stream import StreamCleaner, normalize_spacing, clean_stream, sse_answer
+from deadlines import within_deadline
+from test_support import patch, run_tests
+
+def _stub_gateway(max_concurrency, max_per_user, interactive_reserved, service_seconds=0.05):
+    gateway = LLMGateway(max_concurrency=max_concurrency, max_per_user=max_per_user, interactive_reserved=interactive_reserved)
+    order = []
+
+    async def fake_generate(prompt, model_name, tool_names):
+        order.append(prompt)
+        await asyncio.sleep(service_seconds)
+        return f"answer to {prompt}"
+
+    gateway._generate = fake_generate
+    return gateway, order
+
+def test_interactive_skips_background_queue():
+    """An Oracle chat arriving behind a dashboard refresh burst starts before the queued refreshes"""
+    gateway, order = _stub_gateway(max_concurrency=2, max_per_user=10, interactive_reserved=1)
+
+    async def scenario():
+        background = [asyncio.create_task(gateway.generate(f"refresh-{i}", uid="u1", priority=PRIORITY_BACKGROUND)) for i in range(5)]
+        await asyncio.sleep(0.01)
+        chat = asyncio.create_task(gateway.generate("chat", uid="u2", priority=PRIORITY_INTERACTIVE))
+        await asyncio.gather(chat, *background)
+
+    asyncio.run(scenario())
+    # refresh-0 holds the only background slot; the chat uses the reserved one immediately
+    assert order.index("chat") == 1, order
+    stats = gateway.stats()
+    print(f"📊 LLM gateway: {stats}")
+    assert stats["priorities"]["interactive"]["queue_wait_ms"]["max"] < 30
+    assert stats["priorities"]["background"]["completed"] == 5
+    assert stats["active"] == 0
+
+def test_per_user_cap():
+    """One user's burst cannot take every slot"""
+    gateway, _ = _stub_gateway(max_concurrency=4, max_per_user=1, interactive_reserved=0)
+    peak = {"u1": 0}
+
+    async def scenario():
+        async def watch():
+            while True:
+                peak["u1"] = max(peak["u1"], gateway._active_by_user.get("u1", 0))
+                await asyncio.sleep(0.005)
+        watcher = asyncio.create_task(watch())
+        await asyncio.gather(*[gateway.generate(f"p{i}", uid="u1") for i in range(3)],
+                             gateway.generate("other", uid="u2"))
+        watcher.cancel()
+
+    asyncio.run(scenario())
+    assert peak["u1"] == 1
+
+def test_cancelled_waiter_frees_its_place():
+    gateway, _ = _stub_gateway(max_concurrency=1, max_per_user=10, interactive_reserved=0, service_seconds=0.05)
+
+    async def scenario():
+        first = asyncio.create_task(gateway.generate("first"))
+        queued = asyncio.create_task(gateway.generate("queued"))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        await first
+        assert await gateway.generate("after") == "answer to after"
+
+    asyncio.run(scenario())
+    assert gateway.stats()["active"] == 0
+    assert not gateway._waiters
+    background = gateway.stats()["priorities"]["background"]
+    assert background["cancelled"] == 1 and background["timeouts"] == 0
+
+# --- Scripted model for the tool loop ---
+def _response(function_calls=(), text=""):
+    calls = [SimpleNamespace(name=name, args=args) for name, args in function_calls]
+    return SimpleNamespace(candidates=[SimpleNamespace(function_calls=calls)], text=text)
+
+class ScriptedChat:
+    def __init__(self, script):
+        self.script = list(script)
+        self.sent = []
+
+    async def send_message_async(self, content):
+        self.sent.append(content)
+        return self.script.pop(0)
+
+def test_tool_loop_runs_calls_concurrently_over_several_steps():
+    """Two calls from one response run in parallel; a follow-up step is fed back before the final answer"""
+    registry = ToolRegistry()
+    executed = []
+
+    async def slow_quote(symbol):
+        executed.append(symbol)
+        await asyncio.sleep(0.1)
+        return {"symbol": symbol, "1y_return": 12.0}
+
+    parameters = {"type": "object", "properties": {"symbol": {"type": "string"}}, "required": ["symbol"]}
+    registry.register("get_quote", "Quote for one symbol", parameters, slow_quote)
+    registry.register("get_index", "Index return", {"type": "object", "properties": {}}, lambda: {"NIFTY 50": 12.0})
+
+    chat = ScriptedChat([
+        _response([("get_quote", {"symbol": "TCS"}), ("get_quote", {"symbol": "RELIANCE"})]),
+        _response([("get_index", {})]),
+        _response(text="Hold TCS, add RELIANCE"),
+    ])
+    model = SimpleNamespace(start_chat=lambda: chat)
+    patch(llm_gateway, "tool_registry", registry)
+    patch(llm_gateway, "get_model", lambda model_name, tool_names: model)
+    gateway = LLMGateway(max_concurrency=2, max_per_user=2, interactive_reserved=0)
+    started = time.perf_counter()
+    answer = asyncio.run(gateway.generate("Review my portfolio", uid="u1", tools=["get_quote", "get_index"]))
+    elapsed = time.perf_counter() - started
+
+    assert answer == "Hold TCS, add RELIANCE"
+    assert executed == ["TCS", "RELIANCE"]
+    assert len(chat.sent) == 3 and len(chat.sent[1]) == 2
+    assert elapsed < 0.19, f"tool calls ran serially ({elapsed:.2f}s)"
+    tool_use = gateway.stats()["tool_use"]
+    assert tool_use["tool_steps"] == 2 and tool_use["parallel_batches"] == 1
+
+def test_answer_without_text_is_empty_not_an_error():
+    class NoTextResponse:
+        candidates = [SimpleNamespace(function_calls=[])]
+
+        @property
+        def text(self):
+            raise ValueError("Response has no text part")
+
+    async def generate_content_async(prompt):
+        return NoTextResponse()
+
+    model = SimpleNamespace(generate_content_async=generate_content_async, start_chat=lambda: ScriptedChat([NoTextResponse()]))
+    patch(llm_gateway, "get_model", lambda model_name, tool_names=(): model)
+    gateway = LLMGateway(max_concurrency=1, max_per_user=1, interactive_reserved=0)
+    assert asyncio.run(gateway.generate("Summarize")) == ""
+    assert asyncio.run(gateway.generate("Summarize", tools=["get_quote"])) == ""
+    assert gateway.stats()["priorities"]["background"]["errors"] == 0
+
+def test_failing_tool_is_reported_to_the_model():
+    registry = ToolRegistry()
+
+    def broken(**kwargs):
+        raise RuntimeError("quote service down")
+
+    registry.register("get_quote", "Quote", {"type": "object", "properties": {}}, broken)
+    result = asyncio.run(registry.call("get_quote", {}))
+    assert "quote service down" in result["error"]
+    assert asyncio.run(registry.call("missing_tool", {}))["error"]
+    assert registry.stats()["get_quote"]["errors"] == 1
+
+def test_stream_cleaner_matches_whole_answer_cleaning():
+    """Cleaning chunk by chunk gives exactly what cleaning the full answer would, wherever the chunks split"""
+    answer = "\n  Your savings  rate is 32%.\n\n\n\nSpending on dining ran  high.\n\n\nconnect annual  goals   \n\n"
+    expected = normalize_spacing(answer).strip()
+    for size in (1, 2, 3, 5, 8, len(answer)):
+        cleaner = StreamCleaner()
+        pieces = [cleaner.feed(answer[i:i + size]) for i in range(0, len(answer), size)]
+        pieces.append(cleaner.flush())
+        assert "".join(pieces) == expected, f"chunk size {size}"
+
+def test_stream_yields_chunks_and_records_first_token_latency():
+    class StreamingModel:
+        async def generate_content_async(self, prompt, stream=False):
+            assert stream
+
+            async def chunks():
+                for text in ["Your net ", "worth grew ", "8% this year."]:
+                    await asyncio.sleep(0.05)
+                    yield SimpleNamespace(text=text)
+            return chunks()
+
+    patch(llm_gateway, "get_model", lambda model_name, tool_names=(): StreamingModel())
+    gateway = LLMGateway(max_concurrency=2, max_per_user=2, interactive_reserved=1)
+
+    async def consume():
+        arrivals = []
+        started = time.perf_counter()
+        async for text in gateway.stream("How am I doing?", uid="u1"):
+            arrivals.append((text, time.perf_counter() - started))
+        return arrivals
+
+    arrivals = asyncio.run(consume())
+
+    assert "".join(text for text, _ in arrivals) == "Your net worth grew 8% this year."
+    assert arrivals[0][1] < arrivals[-1][1] - 0.05, "chunks were not delivered as they arrived"
+    streaming = gateway.stats()["streaming"]
+    assert streaming["completed"] == 1
+    assert streaming["first_token_ms"]["max"] < streaming["total_ms"]["max"]
+    assert gateway.stats()["active"] == 0
+
+def test_disconnect_releases_the_slot_at_once():
+    class EndlessModel:
+        async def generate_content_async(self, prompt, stream=False):
+            async def chunks():
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield SimpleNamespace(text="more ")
+            return chunks()
+
+    patch(llm_gateway, "get_model", lambda model_name, tool_names=(): EndlessModel())
+    gateway = LLMGateway(max_concurrency=2, max_per_user=2, interactive_reserved=1)
+
+    async def scenario():
+        # The same chain as the /oracle/stream endpoint
+        events = sse_answer(within_deadline(clean_stream(gateway.stream("Keep talking", uid="u1"))))
+        first = await events.__anext__()
+        assert gateway.stats()["active"] == 1
+        # The server closes the response body when the client disconnects
+        await events.aclose()
+        return first, gateway.stats()
+
+    first, stats = asyncio.run(scenario())
+    assert first.startswith("data: ")
+    assert stats["active"] == 0
+    assert stats["streaming"]["cancelled"] == 1
+
+def main():
+    tests = [
+        test_interactive_skips_background_queue,
+        test_per_user_cap,
+        test_cancelled_waiter_frees_its_place,
+        test_tool_loop_runs_calls_concurrently_over_several_steps,
+        test_answer_without_text_is_empty_not_an_error,
+        test_failing_tool_is_reported_to_the_model,
+        test_stream_cleaner_matches_whole_answer_cleaning,
+        test_stream_yields_chunks_and_records_first_token_latency,
+        test_disconnect_releases_the_slot_at_once,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Test script for the full-fidelity MCP dataset cache (mcp_store + shared_utils)
+"""
+
+import asyncio
+import json
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(__file__))
+
+import mcp_cache
+import mcp_store
+import shared_utils
+import user_profiles
+import write_behind
+from test_support import SAMPLE_DATA, install_firestore, patch, run_tests
+
+def _install_fakes():
+    """Point shared_utils at the in-memory Firestore and a counting MCP fetch"""
+    db = install_firestore(shared_utils, user_profiles)
+    mcp_calls = []
+
+    async def fake_fetch(session_id, uid, tool_name, timeout=30):
+        mcp_calls.append(tool_name)
+        return SAMPLE_DATA[tool_name]
+
+    user_profiles.forget_user("2222222222")
+    patch(shared_utils, "_fetch_tool_from_mcp", fake_fetch)
+    shared_utils.mcp_payload_cache.clear()
+    return db, mcp_calls
+
+def test_roundtrip_is_lossless():
+    """Encoded datasets decode to exactly the original payload"""
+    for payload in SAMPLE_DATA.values():
+        doc = mcp_store.encode_dataset(payload)
+        assert mcp_store.decode_dataset(doc) == payload
+        assert doc["format_version"] == mcp_store.CACHE_FORMAT_VERSION
+
+def test_version_mismatch_is_a_miss():
+    doc = mcp_store.encode_dataset(SAMPLE_DATA["fetch_net_worth"])
+    doc["format_version"] = mcp_store.CACHE_FORMAT_VERSION + 1
+    assert mcp_store.decode_dataset(doc) is None
+
+def test_legacy_summary_never_hits():
+    """The old create_safe_summary cache has none of the keys the agents read"""
+    summary = shared_utils.create_safe_summary({
+        "bank_transactions": SAMPLE_DATA["fetch_bank_transactions"],
+        "stock_transactions": SAMPLE_DATA["fetch_stock_transactions"],
+    })
+    assert summary.get("bank_transactions") is None
+    assert summary.get("stock_transactions") is None
+
+def test_agents_hit_full_fidelity_cache():
+    """Guardian, Catalyst and Strategist share one cache: each dataset is fetched from MCP once"""
+    db, mcp_calls = _install_fakes()
+    uid = "2222222222"
+    agent_datasets = {
+        "guardian": ["bank_transactions", "credit_report", "mf_transactions"],
+        "catalyst": ["net_worth", "epf_details", "mf_transactions"],
+        "strategist": ["stock_transactions", "mf_transactions"],
+    }
+
+    async def run_dashboard():
+        for names in agent_datasets.values():
+            datasets = await shared_utils.load_user_datasets(uid, names)
+            for name in names:
+                assert datasets[name] == SAMPLE_DATA[shared_utils.DATASET_TOOLS[name]]
+        # Cache writes are queued; commit them as the flusher would after the request
+        await write_behind.write_behind.flush()
+
+    before = mcp_store.get_store_metrics()
+    asyncio.run(run_dashboard())            # cold: every distinct dataset fetched once
+    shared_utils.mcp_payload_cache.clear()  # simulate another worker process
+    asyncio.run(run_dashboard())            # served from Firestore
+    asyncio.run(run_dashboard())            # served from L1
+    after = mcp_store.get_store_metrics()
+
+    requested = sum(len(names) for names in agent_datasets.values()) * 3
+    assert len(mcp_calls) == 6, mcp_calls
+    hit_rate = 1 - len(mcp_calls) / requested
+    store_hits = after["hits"] - before["hits"]
+    print(f"📊 {requested} dataset reads, {len(mcp_calls)} MCP fetches, overall hit rate {hit_rate:.0%}")
+    print(f"📊 Firestore cache hits: {store_hits}, L1: {shared_utils.mcp_payload_cache.stats()}")
+    assert store_hits >= 6
+    assert hit_rate >= 0.75
+
+def test_stale_entries_are_served_and_refreshed_once():
+    """Past its fresh window an entry is still served immediately; one background refresh replaces it"""
+    db, mcp_calls = _install_fakes()
+    uid = "2222222222"
+    tool = "fetch_bank_transactions"
+    policy = shared_utils.get_cache_policy("bank_transactions")
+    stale_payload = {"bankTransactions": [], "stale": True}
+    age = (policy.fresh_seconds + policy.stale_seconds) / 2
+    shared_utils.mcp_payload_cache.put(uid, tool, stale_payload, ttl_seconds=policy.stale_seconds - age, age_seconds=age)
+
+    async def dashboard_burst():
+        results = await asyncio.gather(*[shared_utils.load_user_datasets(uid, ["bank_transactions"]) for _ in range(10)])
+        # Every caller got the stale copy without waiting on MCP
+        assert all(result["bank_transactions"] == stale_payload for result in results)
+        await asyncio.gather(*list(shared_utils._refresh_tasks.values()))
+
+    asyncio.run(dashboard_burst())
+    assert mcp_calls == [tool], mcp_calls
+    assert shared_utils.mcp_payload_cache.get(uid, tool) == SAMPLE_DATA[tool]
+    print(f"📊 SWR: {shared_utils.get_swr_metrics()}")
+
+def test_result_cache_writes_are_coalesced():
+    """Several agent cache writes for one user become a single batched commit"""
+    db, _ = _install_fakes()
+    queue = write_behind.write_behind
+    coalesced_before = queue.stats()["coalesced"]
+    user_doc = db.collection("users").document("2222222222")
+
+    async def dashboard():
+        queue.enqueue(user_doc, {"guardian_alerts_cache": [{"type": "old"}]})
+        queue.enqueue(user_doc, {"catalyst_opportunities_cache": [{"title": "Diversify"}]})
+        queue.enqueue(user_doc, {"guardian_alerts_cache": [{"type": "new"}]})
+        assert db.commits == 0
+        # Reads see queued fields before they are committed
+        assert await write_behind.read_field(user_doc, "guardian_alerts_cache") == [{"type": "new"}]
+        await queue.stop()
+
+    asyncio.run(dashboard())
+    assert db.commits == 1
+    stored = db.docs["users/2222222222"]
+    assert stored["fi_session_id"] == "test-session"
+    assert stored["guardian_alerts_cache"] == [{"type": "new"}]
+    assert stored["catalyst_opportunities_cache"] == [{"title": "Diversify"}]
+    assert queue.stats()["coalesced"] - coalesced_before == 2
+
+def _size(value) -> int:
+    return len(json.dumps(value, default=str))
+
+def test_byte_budget_evicts_least_recently_used():
+    payload = {"txns": ["x" * 100]}
+    cache = mcp_cache.MCPPayloadCache(max_bytes=3 * _size(payload), ttl_seconds=60)
+    for tool in ("a", "b", "c"):
+        cache.put("u1", tool, payload)
+    assert cache.stats()["bytes"] == 3 * _size(payload)
+    cache.get("u1", "a")                  # "b" is now the least recently used
+    cache.put("u1", "d", payload)
+    assert cache.get("u1", "b") is None
+    assert all(cache.get("u1", tool) == payload for tool in ("a", "c", "d"))
+    # Replacing an entry frees its old size first
+    cache.put("u1", "a", {"txns": []})
+    assert cache.stats()["entries"] == 3 and cache.stats()["evictions"] == 1
+    # Larger than the whole budget: not cached, nothing evicted
+    cache.put("u2", "huge", {"txns": ["x" * 1000]})
+    stats = cache.stats()
+    assert stats["rejected"] == 1 and stats["entries"] == 3 and stats["bytes"] <= stats["max_bytes"]
+
+def test_entries_expire_after_their_ttl():
+    clock = [1000.0]
+    patch(mcp_cache, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    cache = mcp_cache.MCPPayloadCache(ttl_seconds=300)
+    cache.put("u1", "fetch_net_worth", SAMPLE_DATA["fetch_net_worth"])
+    cache.put("u1", "fetch_credit_report", SAMPLE_DATA["fetch_credit_report"], ttl_seconds=30, age_seconds=20)
+    cache.put("u1", "never", {"x": 1}, ttl_seconds=0)
+    clock[0] += 29
+    assert cache.get_with_age("u1", "fetch_credit_report") == (SAMPLE_DATA["fetch_credit_report"], 49)
+    clock[0] += 1
+    assert cache.get("u1", "fetch_credit_report") is None
+    assert cache.get("u1", "fetch_net_worth") == SAMPLE_DATA["fetch_net_worth"]
+    assert cache.get("u1", "never") is None
+    clock[0] += 270
+    assert cache.get("u1", "fetch_net_worth") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 2 and stats["entries"] == 0 and stats["bytes"] == 0
+
+def test_invalidate_one_tool_or_the_whole_user():
+    cache = mcp_cache.MCPPayloadCache(ttl_seconds=60)
+    for uid in ("u1", "u2"):
+        for tool in ("fetch_net_worth", "fetch_bank_transactions"):
+            cache.put(uid, tool, SAMPLE_DATA[tool])
+    assert cache.invalidate("u1", "fetch_net_worth") == 1
+    assert cache.invalidate("u1", "fetch_net_worth") == 0
+    assert cache.get("u1", "fetch_bank_transactions") is not None
+    assert cache.invalidate("u2") == 2
+    assert cache.get("u2", "fetch_net_worth") is None and cache.get("u1", "fetch_bank_transactions") is not None
+    stats = cache.stats()
+    assert stats["invalidations"] == 3 and stats["entries"] == 1
+    assert stats["bytes"] == _size(SAMPLE_DATA["fetch_bank_transactions"])
+
+def test_hits_are_independent_copies():
+    cache = mcp_cache.MCPPayloadCache(ttl_seconds=60)
+    cache.put("u1", "fetch_bank_transactions", SAMPLE_DATA["fetch_bank_transactions"])
+    first = cache.get("u1", "fetch_bank_transactions")
+    first["bankTransactions"][0]["txns"].clear()
+    assert cache.get("u1", "fetch_bank_transactions") == SAMPLE_DATA["fetch_bank_transactions"]
+    # An owner that updates the value in place opts out of copies
+    shared = mcp_cache.MCPPayloadCache(ttl_seconds=60, copy_values=False)
+    state = {"merchants": {}}
+    shared.put("u1", "state", state)
+    assert shared.get("u1", "state") is state
+
+def test_slow_datasets_have_longer_windows():
+    bank = shared_utils.get_cache_policy("bank_transactions")
+    credit = shared_utils.get_cache_policy("credit_report")
+    assert credit.fresh_seconds > bank.fresh_seconds
+    assert credit.stale_seconds > bank.stale_seconds
+
+def test_early_expiry_is_probabilistic():
+    policy = mcp_cache.CachePolicy(300, 900)
+    assert not any(mcp_cache.should_refresh_early(0, policy, 1.0) for _ in range(1000))
+    near_expiry = sum(mcp_cache.should_refresh_early(298, policy, 1.0) for _ in range(1000))
+    # P(refresh) = exp(-2) ~ 13.5% two seconds before expiry with a 1s fetch
+    assert 50 < near_expiry < 250, near_expiry
+    assert mcp_cache.should_refresh_early(300, policy, 0.0)
+
+def main():
+    tests = [
+        test_roundtrip_is_lossless,
+        test_version_mismatch_is_a_miss,
+        test_legacy_summary_never_hits,
+        test_agents_hit_full_fidelity_cache,
+        test_stale_entries_are_served_and_refreshed_once,
+        test_result_cache_writes_are_coalesced,
+        test_byte_budget_evicts_least_recently_used,
+        test_entries_expire_after_their_ttl,
+        test_invalidate_one_tool_or_the_whole_user,
+        test_hits_are_independent_copies,
+        test_slow_datasets_have_longer_windows,
+        test_early_expiry_is_probabilistic,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
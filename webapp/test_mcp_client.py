@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared MCP client: pooled client lifecycle, per-host limit and single-flight coalescing
+"""
+
+import asyncio
+import copy
+import sys
+import os
+
+import httpx
+
+sys.path.append(os.path.dirname(__file__))
+
+import mcp_client
+from mcp_client import make_flight_key, single_flight, get_single_flight_metrics
+from test_support import SAMPLE_DATA, patch, run_tests
+
+MCP_URL = "http://mcp.test/mcp/stream"
+
+def _install_mock_pool(handler) -> list:
+    """Build pooled clients over an in-process transport; returns the clients built"""
+    built = []
+
+    def build():
+        mcp_client._metrics["clients_created"] += 1
+        built.append(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        return built[-1]
+
+    patch(mcp_client, "_build_client", build)
+    patch(mcp_client, "_client", None)
+    patch(mcp_client, "_host_semaphores", {})
+    return built
+
+def test_pool_limits_come_from_configuration():
+    async def scenario():
+        client = mcp_client._build_client()
+        pool = client._transport._pool
+        await client.aclose()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool._max_connections == mcp_client.MCP_MAX_CONNECTIONS
+    assert pool._max_keepalive_connections == mcp_client.MCP_MAX_KEEPALIVE_CONNECTIONS
+    assert pool._keepalive_expiry == mcp_client.MCP_KEEPALIVE_EXPIRY_SECONDS
+
+def test_one_client_is_shared_until_closed():
+    built = _install_mock_pool(lambda request: httpx.Response(200, json={"ok": True}))
+    before = mcp_client.get_mcp_pool_metrics()
+
+    async def scenario():
+        started = await mcp_client.start_mcp_client()
+        assert await mcp_client.start_mcp_client() is started
+        responses = await asyncio.gather(*[mcp_client.mcp_post(MCP_URL, json={"n": n}) for n in range(10)])
+        assert all(response.json() == {"ok": True} for response in responses)
+        assert mcp_client.get_mcp_client() is started
+        await mcp_client.close_mcp_client()
+        assert started.is_closed and not mcp_client.get_mcp_pool_metrics()["started"]
+        # Scripts that never ran the startup hook get a client lazily
+        await mcp_client.mcp_get(MCP_URL)
+        lazy = mcp_client.get_mcp_client()
+        await mcp_client.close_mcp_client()
+        return lazy
+
+    lazy = asyncio.run(scenario())
+    after = mcp_client.get_mcp_pool_metrics()
+    assert len(built) == 2 and lazy is built[1] and lazy.is_closed
+    assert after["clients_created"] - before["clients_created"] == 2
+    assert after["requests"] - before["requests"] == 11
+    assert after["in_flight"] == 0
+
+def test_per_host_limit_caps_concurrency():
+    active = {"now": 0, "peak": 0}
+
+    async def handler(request):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.02)
+        active["now"] -= 1
+        if request.url.path == "/down":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200)
+
+    _install_mock_pool(handler)
+    patch(mcp_client, "MCP_MAX_CONNECTIONS_PER_HOST", 2)
+    host_before = dict(mcp_client.get_mcp_pool_metrics()["per_host"].get("limited.test", {"requests": 0, "errors": 0}))
+
+    async def scenario():
+        await asyncio.gather(*[mcp_client.mcp_get("http://limited.test/ok") for _ in range(8)])
+        try:
+            await mcp_client.mcp_get("http://limited.test/down")
+            assert False, "connection error swallowed"
+        except httpx.ConnectError:
+            pass
+        await mcp_client.close_mcp_client()
+
+    asyncio.run(scenario())
+    host = mcp_client.get_mcp_pool_metrics()["per_host"]["limited.test"]
+    assert active["peak"] == 2
+    assert host["requests"] - host_before["requests"] == 9 and host["errors"] - host_before["errors"] == 1
+    assert host["waiting"] == 0
+
+def _counting_fetch(calls, payload, seconds=0.05):
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(seconds)
+        return copy.deepcopy(payload)
+    return fetch
+
+def test_concurrent_identical_fetches_run_once():
+    calls = []
+    key = make_flight_key("session-1", "fetch_bank_transactions", {"phone_number": "2222222222"})
+    before = get_single_flight_metrics()
+
+    async def burst():
+        fetch = _counting_fetch(calls, SAMPLE_DATA["fetch_bank_transactions"])
+        return await asyncio.gather(*[single_flight(key, fetch) for _ in range(20)])
+
+    results = asyncio.run(burst())
+    after = get_single_flight_metrics()
+    assert len(calls) == 1
+    assert after["calls"] - before["calls"] == 20
+    assert after["executions"] - before["executions"] == 1
+    assert after["calls_saved"] - before["calls_saved"] == 19
+    assert after["in_flight"] == 0
+    assert all(result == SAMPLE_DATA["fetch_bank_transactions"] for result in results)
+
+def test_each_waiter_gets_its_own_result():
+    calls = []
+    key = make_flight_key("session-1", "fetch_bank_transactions")
+
+    async def burst():
+        fetch = _counting_fetch(calls, SAMPLE_DATA["fetch_bank_transactions"])
+        return await asyncio.gather(*[single_flight(key, fetch) for _ in range(3)])
+
+    first, second, third = asyncio.run(burst())
+    first["bankTransactions"][0]["txns"].append(["1", "INJECTED", "2024-06-30", 2, "UPI", "0"])
+    first["note"] = "changed by one caller"
+    assert second == third == SAMPLE_DATA["fetch_bank_transactions"]
+    assert second is not third
+
+def test_namespaces_keep_their_own_metrics():
+    before_mcp = get_single_flight_metrics()
+    before_profiles = get_single_flight_metrics("user_profile")
+
+    async def load():
+        await asyncio.sleep(0.01)
+        return {"fi_session_id": "s"}
+
+    async def burst():
+        # Same key in two namespaces: two separate fetches
+        return await asyncio.gather(*[single_flight("2222222222", load, namespace="user_profile") for _ in range(5)],
+                                    single_flight("2222222222", load))
+
+    asyncio.run(burst())
+    profiles = get_single_flight_metrics("user_profile")
+    assert profiles["executions"] - before_profiles["executions"] == 1
+    assert profiles["calls_saved"] - before_profiles["calls_saved"] == 4
+    assert get_single_flight_metrics()["calls_saved"] == before_mcp["calls_saved"]
+    assert get_single_flight_metrics()["executions"] - before_mcp["executions"] == 1
+
+def test_cancelled_waiter_does_not_cancel_the_fetch():
+    calls = []
+    key = make_flight_key("session-2", "fetch_net_worth")
+
+    async def scenario():
+        fetch = _counting_fetch(calls, SAMPLE_DATA["fetch_bank_transactions"], seconds=0.1)
+        leader = asyncio.create_task(single_flight(key, fetch))
+        follower = asyncio.create_task(single_flight(key, fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == SAMPLE_DATA["fetch_bank_transactions"]
+    assert len(calls) == 1
+
+def main():
+    tests = [
+        test_pool_limits_come_from_configuration,
+        test_one_client_is_shared_until_closed,
+        test_per_host_limit_caps_concurrency,
+        test_concurrent_identical_fetches_run_once,
+        test_each_waiter_gets_its_own_result,
+        test_namespaces_keep_their_own_metrics,
+        test_cancelled_waiter_does_not_cancel_the_fetch,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
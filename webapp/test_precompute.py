@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test script for background agent precomputation (result store + refresh scheduler)
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import write_behind
+from precompute import PrecomputeScheduler, PRECOMPUTE_FIELD
+from test_support import install_firestore, run_tests
+
+UID = "2222222222"
+
+def _slow_agent(calls, seconds=0.2):
+    async def run(uid, area=None):
+        calls.append((uid, area))
+        await asyncio.sleep(seconds)
+        return {"alerts": f"run {len(calls)}"}
+    return run
+
+def test_prefetch_then_tap_is_served_from_the_store():
+    db = install_firestore(uid=UID)
+    calls = []
+    scheduler = PrecomputeScheduler(interval=900, workers=2)
+    runner = _slow_agent(calls)
+    scheduler.register("guardian", runner)
+
+    async def scenario():
+        # /prefetch-data schedules the refresh; the user taps later
+        scheduler.schedule(UID, reason="prefetch")
+        await scheduler.drain()
+        started = time.perf_counter()
+        result, freshness = await scheduler.serve(UID, "guardian", lambda: runner(UID))
+        tap_ms = (time.perf_counter() - started) * 1000
+        await write_behind.write_behind.flush()
+        await scheduler.stop()
+        return result, freshness, tap_ms
+
+    result, freshness, tap_ms = asyncio.run(scenario())
+    print(f"📊 tap after precompute served in {tap_ms:.1f} ms (agent takes 200 ms)")
+    assert result == {"alerts": "run 1"} and len(calls) == 1
+    assert freshness["precomputed"] and not freshness["stale"]
+    assert tap_ms < 50
+    assert db.docs[f"users/{UID}"][PRECOMPUTE_FIELD]["guardian"]["default"]["result"] == result
+
+def test_missing_result_computed_on_demand_and_duplicates_coalesced():
+    install_firestore(uid=UID)
+    calls = []
+    scheduler = PrecomputeScheduler(interval=900, workers=2)
+    runner = _slow_agent(calls, seconds=0.05)
+    scheduler.register("guardian", runner)
+
+    async def scenario():
+        result, freshness = await scheduler.serve(UID, "guardian", lambda: runner(UID))
+        assert not freshness["precomputed"]
+        # Three refresh requests while one is pending: one run
+        assert scheduler.schedule(UID) == 1
+        assert scheduler.schedule(UID) == 0
+        assert scheduler.schedule(UID) == 0
+        await scheduler.drain()
+        await scheduler.stop()
+        return result
+
+    result = asyncio.run(scenario())
+    assert result == {"alerts": "run 1"}
+    assert len(calls) == 2
+    assert scheduler.stats()["deduplicated"] == 2
+
+def test_stale_result_served_immediately_and_refreshed():
+    install_firestore(uid=UID)
+    calls = []
+    scheduler = PrecomputeScheduler(interval=0.1, workers=1)
+    runner = _slow_agent(calls, seconds=0.05)
+    scheduler.register("catalyst", runner)
+
+    async def scenario():
+        await scheduler.serve(UID, "catalyst", lambda: runner(UID))
+        await asyncio.sleep(0.15)
+        assert scheduler.tick() == 1  # active user, result past the interval
+        await scheduler.drain()
+        await asyncio.sleep(0.15)
+        result, freshness = await scheduler.serve(UID, "catalyst", lambda: runner(UID))
+        assert freshness["stale"] and freshness["precomputed"]
+        await scheduler.drain()
+        await scheduler.stop()
+        return result
+
+    result = asyncio.run(scenario())
+    assert result == {"alerts": "run 2"}
+    assert len(calls) == 3  # on demand, interval tick, stale-serve refresh
+
+def test_inactive_users_are_forgotten_but_their_results_persist():
+    db = install_firestore(uid=UID)
+    db.docs["users/3333333333"] = {"fi_session_id": "other-session"}
+    calls = []
+    scheduler = PrecomputeScheduler(interval=900, active_window=0.05, workers=1)
+    runner = _slow_agent(calls, seconds=0.01)
+    scheduler.register("guardian", runner)
+
+    async def scenario():
+        for uid in (UID, "3333333333"):
+            await scheduler.serve(uid, "guardian", lambda uid=uid: runner(uid))
+        await write_behind.write_behind.flush()
+        await asyncio.sleep(0.06)
+        scheduler.touch(UID)
+        assert scheduler.tick() == 0
+        stats = scheduler.stats()
+        assert stats["active_users"] == 1 and stats["stored_results"] == 1 and stats["evicted_results"] == 1
+        # Returning later, the user is served the persisted result without recomputing
+        result, freshness = await scheduler.serve("3333333333", "guardian", lambda: runner("3333333333"))
+        await scheduler.stop()
+        return result, freshness
+
+    result, freshness = asyncio.run(scenario())
+    assert freshness["precomputed"] and result == {"alerts": "run 2"}
+    assert len(calls) == 2
+
+def test_areas_are_normalized_and_unknown_ones_not_stored():
+    db = install_firestore(uid=UID)
+    calls = []
+    scheduler = PrecomputeScheduler(interval=900, workers=1)
+    runner = _slow_agent(calls, seconds=0.01)
+    scheduler.register("guardian", runner)
+
+    async def scenario():
+        served = []
+        for area in ("Credit Monitoring", "credit_monitoring", " credit monitoring ", "my secret area", "my secret area"):
+            served.append(await scheduler.serve(UID, "guardian", lambda area=area: runner(UID, area), area=area))
+        assert scheduler.schedule(UID, ["guardian"], area="my secret area") == 0
+        await write_behind.write_behind.flush()
+        await scheduler.stop()
+        return served
+
+    served = asyncio.run(scenario())
+    assert [freshness["precomputed"] for _, freshness in served] == [False, True, True, False, False]
+    assert len(calls) == 3
+    stats = scheduler.stats()
+    assert stats["stored_results"] == 1 and stats["unknown_areas"] == 2
+    assert list(db.docs[f"users/{UID}"][PRECOMPUTE_FIELD]["guardian"]) == ["credit_monitoring"]
+
+def main():
+    tests = [
+        test_prefetch_then_tap_is_served_from_the_store,
+        test_missing_result_computed_on_demand_and_duplicates_coalesced,
+        test_stale_result_served_immediately_and_refreshed,
+        test_inactive_users_are_forgotten_but_their_results_persist,
+        test_areas_are_normalized_and_unknown_ones_not_stored,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-memory user profile mirror: TTL, eviction and snapshot listeners
+"""
+
+import asyncio
+import sys
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(__file__))
+
+import user_profiles
+from test_support import install_firestore, patch, run_tests
+
+UIDS = ["1111111111", "2222222222", "3333333333"]
+
+class FakeWatchClient:
+    """Stand-in for the sync firestore client: records each on_snapshot callback"""
+
+    def __init__(self):
+        self.callbacks = {}
+        self.closed = []
+
+    def collection(self, name):
+        return SimpleNamespace(document=lambda uid: SimpleNamespace(on_snapshot=lambda callback: self._watch(uid, callback)))
+
+    def _watch(self, uid, callback):
+        self.callbacks[uid] = callback
+        return SimpleNamespace(unsubscribe=lambda: self.closed.append(uid))
+
+    def push(self, uid, data):
+        """Deliver a snapshot from another thread, as the Firestore watch thread does"""
+        snapshot = SimpleNamespace(exists=True, to_dict=lambda: data)
+        thread = threading.Thread(target=self.callbacks[uid], args=([snapshot], [], None))
+        thread.start()
+        thread.join()
+
+def _install_mirror(listeners=True):
+    """Empty mirror over an in-memory Firestore holding UIDS; returns (db, watch client)"""
+    db = install_firestore(user_profiles)
+    for uid in UIDS:
+        db.docs[f"users/{uid}"] = {"fi_session_id": f"session-{uid}", "fcm_token": "token", "holdings": [1, 2, 3]}
+    client = FakeWatchClient()
+    patch(user_profiles, "_profiles", OrderedDict())
+    patch(user_profiles, "_listeners", {})
+    patch(user_profiles, "_stats", dict.fromkeys(user_profiles._stats, 0))
+    patch(user_profiles, "PROFILE_LISTENERS_ENABLED", listeners)
+    patch(user_profiles, "firestore", SimpleNamespace(client=lambda: client))
+    return db, client
+
+def test_snapshot_from_the_watch_thread_replaces_the_profile():
+    db, client = _install_mirror()
+    uid = UIDS[0]
+
+    async def scenario():
+        assert (await user_profiles.get_user_profile(uid))["fi_session_id"] == f"session-{uid}"
+        client.push(uid, {"fi_session_id": "rotated", "fcm_token": "new-token", "holdings": []})
+        # The watch thread only queued the update; the loop has not applied it yet
+        assert user_profiles._profiles[uid]["fields"]["fi_session_id"] == f"session-{uid}"
+        await asyncio.sleep(0)
+        return await user_profiles.get_user_profile(uid)
+
+    profile = asyncio.run(scenario())
+    assert profile == {"fi_session_id": "rotated", "fcm_token": "new-token"}
+    metrics = user_profiles.get_profile_metrics()
+    assert metrics["snapshot_updates"] == 1 and metrics["firestore_reads"] == 1 and metrics["hits"] == 1
+
+def test_concurrent_snapshots_and_evictions_stay_consistent():
+    db, client = _install_mirror()
+    patch(user_profiles, "MAX_PROFILES", 2)
+    pushes = 200
+
+    async def scenario():
+        for uid in UIDS:
+            await user_profiles.get_user_profile(uid)
+        # Every listener's thread fires while the loop keeps loading and evicting users
+        threads = [
+            threading.Thread(target=lambda uid=uid: [client.push(uid, {"fi_session_id": f"{uid}-{n}"}) for n in range(pushes)])
+            for uid in UIDS
+        ]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for uid in UIDS:
+                await user_profiles.get_user_profile(uid)
+            await asyncio.sleep(0)
+        for thread in threads:
+            thread.join()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert len(user_profiles._profiles) <= 2
+    assert set(user_profiles._listeners) <= set(user_profiles._profiles)
+    # Snapshots only land for users that are still watched
+    assert all(entry["watched"] for entry in user_profiles._profiles.values())
+
+def test_unwatched_profiles_expire_after_the_ttl():
+    db, _ = _install_mirror(listeners=False)
+    patch(user_profiles, "PROFILE_TTL_SECONDS", 0.05)
+    uid = UIDS[1]
+
+    async def scenario():
+        await user_profiles.get_user_profile(uid)
+        await user_profiles.get_user_profile(uid)
+        assert db.reads == 1
+        db.docs[f"users/{uid}"]["fi_session_id"] = "changed elsewhere"
+        time.sleep(0.06)
+        return await user_profiles.get_user_profile(uid)
+
+    assert asyncio.run(scenario())["fi_session_id"] == "changed elsewhere"
+    assert db.reads == 2
+
+def test_oldest_profile_is_evicted_with_its_listener():
+    _, client = _install_mirror()
+    patch(user_profiles, "MAX_PROFILES", 2)
+
+    async def scenario():
+        for uid in UIDS:
+            await user_profiles.get_user_profile(uid)
+
+    asyncio.run(scenario())
+    assert list(user_profiles._profiles) == UIDS[1:]
+    assert client.closed == [UIDS[0]] and UIDS[0] not in user_profiles._listeners
+
+def main():
+    tests = [
+        test_snapshot_from_the_watch_thread_replaces_the_profile,
+        test_concurrent_snapshots_and_evictions_stay_consistent,
+        test_unwatched_profiles_expire_after_the_ttl,
+        test_oldest_profile_is_evicted_with_its_listener,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
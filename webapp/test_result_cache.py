@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script for the fingerprint-validated agent result cache
+"""
+
+import asyncio
+import copy
+import json
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "agents"))
+
+import guardian_state
+import result_cache
+import write_behind
+from test_support import SAMPLE_DATA, install_firestore, patch, run_tests
+
+import guardian
+
+UID = "2222222222"
+
+def _install_fakes():
+    db = install_firestore(guardian, uid=UID)
+    result_cache.agent_result_cache.clear()
+    guardian_state.guardian_state_cache.clear()
+
+    datasets = {
+        "bank_transactions": copy.deepcopy(SAMPLE_DATA["fetch_bank_transactions"]),
+        "credit_report": copy.deepcopy(SAMPLE_DATA["fetch_credit_report"]),
+        "mf_transactions": copy.deepcopy(SAMPLE_DATA["fetch_mf_transactions"]),
+    }
+    gemini_calls = []
+
+    async def fake_load(uid, names):
+        return {name: datasets[name] for name in names}
+
+    async def fake_gemini(prompt, uid=None, priority="background", **kwargs):
+        gemini_calls.append(prompt)
+        await asyncio.sleep(0.2)
+        return json.dumps({"alerts": [{"type": "Spending", "description": f"call {len(gemini_calls)}", "severity": "info"}]})
+
+    patch(guardian, "load_user_datasets", fake_load)
+    patch(guardian, "call_gemini", fake_gemini)
+    return db, datasets, gemini_calls
+
+def test_fingerprint_is_order_independent():
+    a = {"x": 1, "y": [1, 2]}
+    b = {"y": [1, 2], "x": 1}
+    assert result_cache.data_fingerprint("guardian", "v1", None, a) == result_cache.data_fingerprint("guardian", "v1", None, b)
+    assert result_cache.data_fingerprint("guardian", "v1", None, a) != result_cache.data_fingerprint("guardian", "v2", None, a)
+    assert result_cache.data_fingerprint("guardian", "v1", None, a) != result_cache.data_fingerprint("guardian", "v1", "spending", a)
+
+def test_repeat_dashboard_load_skips_gemini():
+    db, datasets, gemini_calls = _install_fakes()
+
+    async def scenario():
+        first = await guardian.run_guardian_analysis(UID)
+        started = time.perf_counter()
+        second = await guardian.run_guardian_analysis(UID)
+        repeat_ms = (time.perf_counter() - started) * 1000
+        assert second == first
+        await write_behind.write_behind.flush()
+        return repeat_ms
+
+    repeat_ms = asyncio.run(scenario())
+    print(f"📊 repeat load served in {repeat_ms:.1f} ms")
+    assert len(gemini_calls) == 1
+    assert repeat_ms < 50
+    stored = db.docs[f"users/{UID}"]["guardian_alerts_cache"]["default"]
+    assert stored["template_version"] == guardian.PROMPT_VERSION
+
+    # Another process (empty L1) validates against the Firestore copy
+    result_cache.agent_result_cache.clear()
+    asyncio.run(guardian.run_guardian_analysis(UID))
+    assert len(gemini_calls) == 1
+
+def test_new_data_invalidates_by_fingerprint():
+    _, datasets, gemini_calls = _install_fakes()
+    asyncio.run(guardian.run_guardian_analysis(UID))
+    datasets["bank_transactions"]["bankTransactions"][0]["txns"].append(["1200", "SWIGGY", "2024-06-12", 2, "UPI", "88301"])
+    result = asyncio.run(guardian.run_guardian_analysis(UID))
+    assert len(gemini_calls) == 2
+    assert "call 2" in result["alerts"]
+    # Areas are cached separately
+    asyncio.run(guardian.run_guardian_analysis(UID, area="spending"))
+    assert len(gemini_calls) == 3
+
+def main():
+    tests = [
+        test_fingerprint_is_order_independent,
+        test_repeat_dashboard_load_skips_gemini,
+        test_new_data_invalidates_by_fingerprint,
+    ]
+    return run_tests(tests)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
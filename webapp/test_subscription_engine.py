@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test script for the periodicity-based subscription engine, with a microbenchmark from 10k to 1M transactions
+"""
+
+import sys
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "invested-backend"))
+
+from subscription_engine import detect_subscriptions, subscription_key
+from transaction_store import build_columns
+
+import services
+from test_support import run_tests
+
+START = date(2023, 1, 1)
+BENCHMARK_SIZES = (10_000, 100_000, 1_000_000)
+
+def _row(day, amount, narration, txn_type=2):
+    return [str(amount), narration, (START + timedelta(days=int(day))).isoformat(), txn_type, "UPI", "50000"]
+
+def _history():
+    """Two years of payments: real subscriptions (with jitter and a price rise), a lapsed one, and everyday noise"""
+    rng = np.random.default_rng(3)
+    rows = []
+    for month in range(24):
+        jitter = int(rng.integers(-2, 3))
+        rows.append(_row(month * 30.44 + 5 + jitter, 649 if month < 15 else 799, f"ACH-NETFLIX-{1000 + month}"))
+        rows.append(_row(month * 30.44 + 1, 90000, "SALARY ACME CORP", txn_type=1))
+        if month < 18:
+            rows.append(_row(month * 30.44 + 10 + jitter, 1500, f"UPI/{778800 + month}/CULTFIT GYM"))
+    for quarter in range(8):
+        rows.append(_row(quarter * 91.3 + 20, 5400, "NACH-HDFC ERGO HEALTH INSURANCE"))
+    for year in range(2):
+        rows.append(_row(year * 365.25 + 40, 899, "SI-GODADDY DOMAIN RENEWAL"))
+    for day in range(720):
+        for _ in range(int(rng.integers(0, 3))):
+            rows.append(_row(day, int(rng.integers(80, 900)), f"UPI-SWIGGY-{int(rng.integers(1e6))}"))
+    # A payee paid now and then, at no steady interval
+    for day in (3, 50, 61, 190, 200, 420, 700):
+        rows.append(_row(day, 2500, "IMPS-RAMESH KUMAR"))
+    return {"bankTransactions": [{"bank": "HDFC", "txns": rows}]}
+
+def _synthetic_payload(n_rows: int, seed: int = 7) -> dict:
+    """n_rows over three years: ~3% subscription payments to n_rows/1000 services, the rest one-off spends with unique refs"""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    merchants = ["".join(word) for word in letters[rng.integers(0, 26, size=(2000, 7))]]
+    services_count = max(1, n_rows // 1000)
+    subscription_rows = []
+    for service in range(services_count):
+        start_day = int(rng.integers(0, 60))
+        for month in range(36):
+            subscription_rows.append((start_day + int(month * 30.44), 199.0 + service, f"ACH-{merchants[service]}-SUB"))
+    noise = n_rows - len(subscription_rows)
+    days = rng.integers(0, 3 * 365, size=noise)
+    picks = rng.integers(services_count, len(merchants), size=noise)
+    amounts = rng.integers(50, 5000, size=noise)
+    refs = rng.integers(1e9, 1e10, size=noise)
+    dates = np.datetime_as_string(np.datetime64(START.isoformat()) + np.concatenate([days, [day for day, _, _ in subscription_rows]]))
+    txns = [[str(amount), f"UPI/{ref}/{merchants[pick]}", day, 2, "UPI", ""]
+            for amount, ref, pick, day in zip(amounts.tolist(), refs.tolist(), picks.tolist(), dates[:noise].tolist())]
+    txns += [[str(amount), narration, day, 2, "NACH", ""] for (_, amount, narration), day in zip(subscription_rows, dates[noise:].tolist())]
+    return {"bankTransactions": [{"bank": "HDFC", "txns": txns}]}
+
+def test_detects_cadences_and_ignores_noise():
+    found = {subscription.key: subscription for subscription in detect_subscriptions(build_columns(_history()))}
+    assert set(found) == {"NETFLIX", "CULTFIT GYM", "HDFC ERGO HEALTH", "GODADDY DOMAIN RENEWAL"}, sorted(found)
+    netflix = found["NETFLIX"]
+    assert (netflix.name, netflix.cadence, netflix.payments, netflix.amount) == ("Netflix", "monthly", 24, 799.0)
+    assert netflix.status == "active" and netflix.source == "periodic"
+    assert found["HDFC ERGO HEALTH"].cadence == "quarterly" and found["HDFC ERGO HEALTH"].monthly_cost == round(5400 * 30.44 / 91.31, 2)
+    assert found["GODADDY DOMAIN RENEWAL"].cadence == "annual"
+    # Gym stopped six months before the latest transaction
+    assert found["CULTFIT GYM"].status == "potentially_unused"
+    assert found["NETFLIX"].next_expected - found["NETFLIX"].last_paid == timedelta(days=30)
+
+def test_mandates_to_known_services_count_from_the_first_payment():
+    rows = [
+        ["499", "AUTO-DEBIT - NETFLIX MONTHLY - EXP: 2024-07-10", "2024-06-10"],
+        ["799", "AUTO-DEBIT - AMAZON PRIME ANNUAL - EXP: 2025-06-20", "2024-06-15"],
+        ["1100", "AUTO-DEBIT - GOOGLE CLOUD STORAGE - EXP: 2024-07-15", "2024-06-17"],
+        ["350", "SWIGGY ORDER", "2024-06-18"],
+    ]
+    found = {s.name: s for s in detect_subscriptions(build_columns({"bankTransactionsResponse": {"transactions": rows}}))}
+    assert set(found) == {"Netflix", "Amazon Prime", "Google Cloud Storage"}
+    assert found["Amazon Prime"].cadence == "annual" and found["Amazon Prime"].source == "mandate"
+    assert found["Google Cloud Storage"].last_paid == date(2024, 6, 17)
+
+def test_merchants_sharing_a_known_service_stay_separate():
+    rows = []
+    for month in range(6):
+        rows.append(_row(month * 30.44 + 3, 100, f"UPI-GOOGLE PLAY-{month}"))
+        rows.append(_row(month * 30.44 + 8, 650, f"UPI-GOOGLE WORKSPACE-{month}"))
+    payload = {"bankTransactions": [{"bank": "HDFC", "txns": rows}]}
+    found = sorted(detect_subscriptions(build_columns(payload)), key=lambda subscription: subscription.amount)
+    assert [(s.key, s.name, s.amount) for s in found] == [
+        ("GOOGLE PLAY", "Google Services", 100.0), ("GOOGLE WORKSPACE", "Google Services", 650.0)]
+    info = services.detect_subscriptions(payload)
+    assert len(info.subscriptions) == 2
+    assert info.total_monthly_cost == round(sum(s.monthly_cost for s in found), 2)
+
+def test_service_summary_uses_the_engine():
+    info = services.detect_subscriptions(_history())
+    by_name = {subscription.name: subscription for subscription in info.subscriptions}
+    assert by_name["Netflix"].cadence == "monthly" and by_name["Netflix"].transaction_count == 24
+    assert info.potential_savings == by_name["Cultfit Gym"].estimated_monthly_cost
+    assert info.total_monthly_cost == round(sum(s.estimated_monthly_cost for s in info.subscriptions), 2)
+    assert [s.last_paid_date for s in info.subscriptions] == sorted((s.last_paid_date for s in info.subscriptions), reverse=True)
+
+def test_subscription_key_drops_rails_and_references():
+    assert subscription_key("UPI/889900112/SWIGGY") == "SWIGGY"
+    assert subscription_key("ACH D- NETFLIX 00123 JUL") == "NETFLIX"
+    assert subscription_key("12345") == ""
+
+def benchmark(sizes=BENCHMARK_SIZES) -> dict:
+    """Parse and detection time from 10k to 1M rows (printed; run from main(), not asserted)"""
+    results = {}
+    for size in sizes:
+        payload = _synthetic_payload(size)
+        started = time.perf_counter()
+        columns = build_columns(payload)
+        parse_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        found = detect_subscriptions(columns)
+        detect_ms = (time.perf_counter() - started) * 1000
+        results[size] = (parse_ms, detect_ms, len(found))
+        print(f"📊 {size:>9,} transactions: columns {parse_ms:7.1f} ms, detection {detect_ms:7.1f} ms, {len(found)} subscriptions")
+    return results
+
+def test_synthetic_services_are_found_among_one_off_spends():
+    columns = build_columns(_synthetic_payload(BENCHMARK_SIZES[0]))
+    found = detect_subscriptions(columns)
+    assert len(found) == BENCHMARK_SIZES[0] // 1000
+    assert all(s.cadence == "monthly" and s.payments == 36 for s in found)
+    assert detect_subscriptions(columns) == found
+
+def main():
+    tests = [
+        test_detects_cadences_and_ignores_noise,
+        test_mandates_to_known_services_count_from_the_first_payment,
+        test_merchants_sharing_a_known_service_stay_separate,
+        test_service_summary_uses_the_engine,
+        test_subscription_key_drops_rails_and_references,
+        test_synthetic_services_are_found_among_one_off_spends,
+    ]
+    passed = run_tests(tests)
+    benchmark()
+    return passed
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures for the test scripts: sample MCP payloads, a generated bank history, an in-memory
+Firestore, module patches that are undone after every test, and the script runner
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(__file__))
+
+import firestore_db
+import write_behind
+
+UID = "2222222222"
+
+SAMPLE_DATA = {
+    "fetch_bank_transactions": {"bankTransactions": [{"bank": "HDFC", "txns": [["5000", "SALARY", "2024-06-01", 1, "NEFT", "90000"], ["499", "NETFLIX", "2024-06-10", 2, "CARD", "89501"]]}]},
+    "fetch_credit_report": {"creditReports": [{"creditReportData": {"score": {"bureauScore": "781"}}}]},
+    "fetch_mf_transactions": {"mfTransactions": [{"schemeName": "Nifty 50 Index", "txns": [[1, "2024-01-05", 120.5, 10, 1205]]}]},
+    "fetch_net_worth": {"netWorthResponse": {"totalNetWorthValue": {"currencyCode": "INR", "units": "1250000"}}},
+    "fetch_epf_details": {"uanAccounts": [{"rawDetails": {"overall_pf_balance": {"current_pf_balance": "210000"}}}]},
+    "fetch_stock_transactions": {"stockTransactions": [{"isin": "INE002A01018", "txns": [[1, "2024-02-01", 10, 2450.0]]}]},
+}
+
+# --- Bank history and credit report for the analytics tests ---
+BANK_START = date(2024, 1, 1)
+
+def bank_transactions(days=150, per_day=4, bank="HDFC", incidents=True):
+    """Everyday debits plus a salary; with incidents, the last days add a big debit to an unknown payee and a new merchant"""
+    rows = []
+    balance = 20000.0
+    merchants = ["SWIGGY", "UBER", "AMAZON", "BIGBASKET", "ZOMATO"]
+    for day in range(days):
+        today = (BANK_START + timedelta(days=day)).isoformat()
+        if day % 30 == 0:
+            balance += 90000
+            rows.append(["90000", "SALARY ACME CORP", today, 1, "NEFT", str(balance)])
+        for i in range(per_day):
+            amount = 300 + 50 * ((day + i) % 7)
+            balance -= amount
+            rows.append([str(amount), f"UPI-{merchants[(day + i) % len(merchants)]}-PAYMENT", today, 2, "UPI", str(balance)])
+        if incidents and day == days - 4:
+            balance -= 150000
+            rows.append(["150000", "NEFT-UNKNOWN BENEFICIARY", today, 2, "NEFT", str(balance)])
+        if incidents and day == days - 3:
+            balance -= 12000
+            rows.append(["12000", "UPI-CRYPTOXCHANGE-PAYMENT", today, 2, "UPI", str(balance)])
+    return {"bankTransactions": [{"bank": bank, "txns": rows}]}
+
+CREDIT_REPORT = {"creditReports": [{"creditReportData": {
+    "score": {"bureauScore": "702"},
+    "creditAccount": {"creditAccountDetails": [
+        {"subscriberName": "HDFC BANK", "accountType": "10", "creditLimitAmount": "100000", "currentBalance": "82000",
+         "amountPastDue": "0", "paymentHistoryProfile": "000000000000"},
+        {"subscriberName": "ICICI BANK", "accountType": "10", "creditLimitAmount": "50000", "currentBalance": "5000",
+         "amountPastDue": "4500", "paymentHistoryProfile": "100000000000"},
+        {"subscriberName": "BAJAJ FINANCE", "accountType": "05", "highestCreditOrOriginalLoanAmount": "300000",
+         "currentBalance": "120000", "amountPastDue": "0", "paymentHistoryProfile": "000200000000"},
+    ]},
+}}]}
+
+# --- Minimal in-memory stand-in for firestore.AsyncClient ---
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    async def get(self):
+        self._db.reads += 1
+        return FakeSnapshot(self.id, self._db.docs.get(self.path))
+
+    async def set(self, data, merge=False):
+        existing = self._db.docs.get(self.path, {}) if merge else {}
+        self._db.docs[self.path] = {**existing, **data}
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeDocument(self._db, f"{self.path}/{doc_id}")
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(("set", ref, data, merge))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None, False))
+
+    async def commit(self):
+        self._db.commits += 1
+        for op, ref, data, merge in self._ops:
+            if op == "set":
+                existing = self._db.docs.get(ref.path, {}) if merge else {}
+                self._db.docs[ref.path] = {**existing, **data}
+            else:
+                self._db.docs.pop(ref.path, None)
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    async def get_all(self, refs):
+        self.reads += 1
+        for ref in refs:
+            yield FakeSnapshot(ref.id, self.docs.get(ref.path))
+
+    def batch(self):
+        return FakeBatch(self)
+
+# --- Patches ---
+_MISSING = object()
+_patches = []  # (target, name, original), undone newest first
+
+def patch(target, name: str, value):
+    """Set target.name to value until restore_patches()"""
+    _patches.append((target, name, getattr(target, name, _MISSING)))
+    setattr(target, name, value)
+    return value
+
+def restore_patches():
+    """Undo every patch() in reverse order"""
+    while _patches:
+        target, name, original = _patches.pop()
+        if original is _MISSING:
+            delattr(target, name)
+        else:
+            setattr(target, name, original)
+
+def install_firestore(*modules, uid: str = UID) -> FakeFirestore:
+    """Point get_db at a fresh in-memory Firestore holding uid's user document
+
+    modules: extra modules that imported get_db by name (firestore_db and write_behind are always patched)
+    """
+    db = FakeFirestore()
+    db.docs[f"users/{uid}"] = {"fi_session_id": "test-session"}
+    for module in (firestore_db, write_behind) + modules:
+        patch(module, "get_db", lambda: db)
+    # Writes queued (not yet flushed) by an earlier test would otherwise be read back
+    write_behind.write_behind.discard(f"users/{uid}")
+    return db
+
+def run_tests(tests) -> bool:
+    """Run test functions in order, printing ✅/❌ per test; patches are undone after each one"""
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+        finally:
+            restore_patches()
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    return failed == 0
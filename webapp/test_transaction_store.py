@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test script for the columnar transaction store and the analytics that read from it
+"""
+
+import sys
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "invested-backend"))
+
+import transaction_store
+from transaction_store import transaction_columns, build_columns, get_transaction_store_metrics, RequestMemo, TYPE_DEBIT, TYPE_CREDIT
+from shared_utils import create_safe_summary
+
+import pipelines
+import services
+from test_support import bank_transactions, patch, run_tests
+
+def _list_of_dicts_path(payload) -> pd.DataFrame:
+    """What the health-score code and process_transactions did before: flatten to dicts, then a DataFrame"""
+    flat = []
+    for account in payload["bankTransactions"]:
+        for txn in account["txns"]:
+            flat.append({
+                "amount": float(txn[0]), "narration": txn[1], "date": txn[2],
+                "type": "CREDIT" if txn[3] == 1 else "DEBIT", "mode": txn[4], "balance": float(txn[5]),
+            })
+    df = pd.DataFrame(flat)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+def _measure(function, payload):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function(payload)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed_ms, peak / 1e6
+
+def test_columns_match_the_rows():
+    payload = bank_transactions(days=40)
+    payload["bankTransactions"].append({"bank": "ICICI", "txns": [
+        ["1200", "UPI-SWIGGY-PAYMENT", "2024-03-01T10:00:00", "DEBIT", "UPI"],  # no balance, text type, timestamp
+        ["oops"],                                                              # malformed: skipped
+    ]})
+    rows = payload["bankTransactions"][0]["txns"]
+    columns = build_columns(payload)
+    assert columns.size == len(rows) + 1
+    assert columns.amounts[0] == float(rows[0][0]) and str(columns.dates[0]) == rows[0][2]
+    assert columns.bank_names == ["HDFC", "ICICI"] and columns.banks[-1] == 1
+    assert columns.types[-1] == TYPE_DEBIT and columns.amounts[-1] == 1200.0 and np.isnan(columns.balances[-1])
+    assert str(columns.dates[-1]) == "2024-03-01"
+    # Narrations interned: a handful of distinct strings for all the rows
+    assert len(columns.narrations) == 8
+    assert list(columns.narration_array()[:len(rows)]) == [row[1] for row in rows]
+    assert (np.diff(columns.dates[columns.date_order].astype(np.int64)) >= 0).all()
+    # The older response shape (and rows without a type) read the same way
+    legacy = build_columns({"bankTransactionsResponse": {"transactions": [["499", "AUTO-DEBIT NETFLIX", "2024-06-10"]]}})
+    assert legacy.size == 1 and legacy.types[0] not in (TYPE_DEBIT, TYPE_CREDIT)
+    assert build_columns({}).size == 0 and build_columns(None).size == 0
+
+def test_one_parse_per_snapshot():
+    transaction_store.clear_transaction_store()
+    payload = bank_transactions()
+    before = get_transaction_store_metrics()
+    first = transaction_columns(payload)
+    assert transaction_columns(payload) is first
+    create_safe_summary({"bank_transactions": payload})
+    services.detect_subscriptions(payload)
+    pipelines.process_transactions(payload)
+    after = get_transaction_store_metrics()
+    assert after["builds"] - before["builds"] == 1
+    assert after["memo_hits"] - before["memo_hits"] == 4
+    # An in-place append is a new snapshot
+    payload["bankTransactions"][0]["txns"].append(["100", "UPI-UBER-PAYMENT", "2024-06-01", 2, "UPI", "5"])
+    assert transaction_columns(payload).size == first.size + 1
+
+def test_memo_holds_only_the_payloads_in_use():
+    clock = {"now": 1000.0}
+    patch(transaction_store, "time", SimpleNamespace(monotonic=lambda: clock["now"], perf_counter=time.perf_counter))
+    patch(transaction_store, "_memo", RequestMemo(size=2, seconds=30))
+    first, second, third = (bank_transactions(days=10) for _ in range(3))
+    before = get_transaction_store_metrics()
+    for payload in (first, second, third):
+        transaction_columns(payload)
+    # Over the size bound: the oldest payload is no longer held
+    assert get_transaction_store_metrics()["memoized"] == 2
+    transaction_columns(third)
+    transaction_columns(first)
+    # Past a request's lifetime nothing is held
+    clock["now"] += 31
+    transaction_columns(third)
+    after = get_transaction_store_metrics()
+    assert after["builds"] - before["builds"] == 5
+    assert after["memo_hits"] - before["memo_hits"] == 1
+    assert after["memoized"] == 1
+
+def test_consumers_agree_with_the_row_based_versions():
+    payload = bank_transactions(days=120)
+    # process_transactions from the payload vs from the flattened dicts
+    from_columns = pipelines.process_transactions(payload)
+    from_dicts = pipelines.process_transactions(_list_of_dicts_path(payload).to_dict("records"))
+    for field in ("amount", "type", "category", "narration"):
+        assert list(from_columns[field]) == list(from_dicts[field]), field
+    assert pipelines.calculate_financial_health_score(from_columns, {"total_value": 500000}) == \
+        pipelines.calculate_financial_health_score(from_dicts, {"total_value": 500000})
+
+    summary = create_safe_summary({"bank_transactions": payload})["bank_summary"]
+    assert summary["total_transactions"] == len(payload["bankTransactions"][0]["txns"])
+    assert summary["recent_transactions"][0] == {"amount": "90000", "description": "SALARY ACME CORP", "date": "2024-01-01", "type": "1"}
+
+def _held_bytes(old_df: pd.DataFrame, columns) -> tuple:
+    old_bytes = int(old_df.memory_usage(deep=True).sum())
+    new_bytes = sum(getattr(columns, field).nbytes for field in ("amounts", "dates", "types", "balances", "banks", "narration_codes", "date_order"))
+    return old_bytes, new_bytes
+
+def test_columns_hold_a_fraction_of_the_list_of_dicts():
+    payload = bank_transactions(days=200, per_day=20)
+    rows = sum(len(account["txns"]) for account in payload["bankTransactions"])
+    before = get_transaction_store_metrics()
+    columns = build_columns(payload)
+    old_bytes, new_bytes = _held_bytes(_list_of_dicts_path(payload), columns)
+    assert columns.size == rows
+    assert get_transaction_store_metrics()["rows_parsed"] - before["rows_parsed"] == rows
+    assert new_bytes < old_bytes / 4
+
+def benchmark(days: int = 1000, per_day: int = 50) -> dict:
+    """Parse time, peak and held memory of both paths (printed; not asserted, timings vary by machine)"""
+    payload = bank_transactions(days=days, per_day=per_day)
+    rows = sum(len(account["txns"]) for account in payload["bankTransactions"])
+    old_df, old_ms, old_peak = _measure(_list_of_dicts_path, payload)
+    columns, new_ms, new_peak = _measure(build_columns, payload)
+    old_bytes, new_bytes = _held_bytes(old_df, columns)
+    print(f"📊 {rows} rows: list-of-dicts + DataFrame {old_ms:.0f} ms / peak {old_peak:.1f} MB / {old_bytes / 1e6:.1f} MB held; "
+          f"columns {new_ms:.0f} ms / peak {new_peak:.1f} MB / {new_bytes / 1e6:.1f} MB held")
+    return {"rows": rows, "old_ms": old_ms, "new_ms": new_ms, "old_peak_mb": old_peak, "new_peak_mb": new_peak}
+
+def main():
+    tests = [
+        test_columns_match_the_rows,
+        test_one_parse_per_snapshot,
+        test_memo_holds_only_the_payloads_in_use,
+        test_consumers_agree_with_the_row_based_versions,
+        test_columns_hold_a_fraction_of_the_list_of_dicts,
+    ]
+    passed = run_tests(tests)
+    benchmark()
+    return passed
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,242 @@
+# Columnar bank transactions
+#
+# Bank transactions arrive as nested lists ([amount, narration, date, type,
+# mode, balance] under bankTransactions[].txns) and every consumer used to walk
+# them again in Python or build its own DataFrame. transaction_columns() turns
+# a payload into NumPy columns once -- amounts, dates, type codes, balances, a
+# bank index and interned narration codes -- and memoizes the result per
+# payload snapshot, so Guardian rules, summaries, subscription detection and
+# the health score all share one parse.
+#
+# The memo only pays off within a request: the payload object a request loaded
+# is handed to each of those consumers in turn. Across requests it never hits,
+# because the L1 cache decodes a fresh copy of the payload for every reader. So
+# entries live for a request's lifetime (STORE_MEMO_SECONDS) and the memo holds
+# only the handful of payloads requests are working on right now.
+#
+# Rows stay in payload order; date_order gives the date-sorted view. Narrations
+# are stored once each (narrations[narration_codes[i]]), so per-narration work
+# such as categorizing or merchant extraction runs over the vocabulary, not
+# over every row.
+#
+# Payloads are treated as snapshots: a cached payload object is never mutated,
+# and the memo also checks each account's row count to catch in-place appends.
+#
+# The Fi type codes and merchant keys are defined here too, so the modules
+# reading the columns (context_builder, guardian_rules) share one definition.
+
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+# Fi MCP transaction type codes (bank txns may also carry the names)
+CREDIT_TYPES = {1, "1", "CREDIT"}
+DEBIT_TYPES = {2, "2", "DEBIT"}
+# Leading alphabetic part of a narration, e.g. "UPI-NETFLIX-1234" -> "UPI NETFLIX"
+MERCHANT_KEY = re.compile(r"[A-Za-z][A-Za-z\s\-/]*")
+
+TYPE_OTHER, TYPE_CREDIT, TYPE_DEBIT = 0, 1, 2
+TYPE_CODES = {**{value: TYPE_CREDIT for value in CREDIT_TYPES}, **{value: TYPE_DEBIT for value in DEBIT_TYPES}}
+# Bounds on the per-request memo: payloads in use at once, and how long one request works on one
+STORE_MEMO_SIZE = int(os.getenv("STORE_MEMO_SIZE", "16"))
+STORE_MEMO_SECONDS = float(os.getenv("STORE_MEMO_SECONDS", "30"))
+
+class TransactionColumns(NamedTuple):
+    amounts: np.ndarray          # float64
+    dates: np.ndarray            # datetime64[D]
+    types: np.ndarray            # int8: TYPE_CREDIT, TYPE_DEBIT or TYPE_OTHER
+    balances: np.ndarray         # float64, NaN where the row has no balance
+    banks: np.ndarray            # int16 index into bank_names
+    bank_names: list
+    narration_codes: np.ndarray  # int32 index into narrations
+    narrations: list             # each distinct narration once
+    modes: list                  # per row, as sent
+    date_order: np.ndarray       # row indices sorted by date (stable)
+
+    @property
+    def size(self) -> int:
+        return int(self.amounts.size)
+
+    @property
+    def is_debit(self) -> np.ndarray:
+        return self.types == TYPE_DEBIT
+
+    @property
+    def is_credit(self) -> np.ndarray:
+        return self.types == TYPE_CREDIT
+
+    def narration_array(self) -> np.ndarray:
+        """Narration text per row (object array)"""
+        return np.array(self.narrations, dtype=object)[self.narration_codes] if self.narrations else np.array([], dtype=object)
+
+    def map_narrations(self, function) -> np.ndarray:
+        """function(narration) per row, evaluated once per distinct narration"""
+        values = np.array([function(text) for text in self.narrations], dtype=object)
+        return values[self.narration_codes] if self.narrations else np.array([], dtype=object)
+
+    def merchant_codes(self):
+        """(distinct merchant keys, index into them per row); evaluated once per distinct narration.
+
+        Rows without a merchant point at the key "", which is always present.
+        """
+        keys = np.array([merchant_key(text) for text in self.narrations] + [""], dtype=str)
+        names, codes = np.unique(keys, return_inverse=True)
+        return names, codes.reshape(-1)[self.narration_codes]
+
+class RequestMemo:
+    """Values derived from an object, keyed by its id, while requests are passing that object around.
+
+    An entry keeps its object alive (so the id cannot be reused while cached)
+    and is dropped after `seconds` or when more than `size` are held.
+    """
+
+    def __init__(self, size: int = STORE_MEMO_SIZE, seconds: float = STORE_MEMO_SECONDS):
+        self.size = size
+        self.seconds = seconds
+        self._entries = OrderedDict()  # id(obj) -> (obj, value, stored at (monotonic))
+
+    def _prune(self, now: float):
+        while self._entries:
+            _, _, stored_at = next(iter(self._entries.values()))
+            if len(self._entries) <= self.size and now - stored_at <= self.seconds:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, obj):
+        self._prune(time.monotonic())
+        entry = self._entries.get(id(obj))
+        return entry[1] if entry is not None and entry[0] is obj else None
+
+    def put(self, obj, value):
+        self._entries.pop(id(obj), None)
+        self._entries[id(obj)] = (obj, value, time.monotonic())
+        self._prune(time.monotonic())
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_memo = RequestMemo()  # payload -> (signature, columns)
+_stats = {"builds": 0, "memo_hits": 0, "rows_parsed": 0, "build_ms": 0.0}
+
+def _num(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def merchant_key(narration: str) -> str:
+    match = MERCHANT_KEY.search(narration or "")
+    if not match:
+        return ""
+    return " ".join(match.group(0).replace("-", " ").replace("/", " ").split()).upper()
+
+def _dict_row(row: dict) -> list:
+    return [row.get("amount"), row.get("narration") or row.get("description") or "", row.get("date"),
+            row.get("type"), row.get("mode"), row.get("balance")]
+
+def _accounts(payload) -> list:
+    """[(bank name, rows)] from bankTransactions[], or the older bankTransactionsResponse.transactions list"""
+    if not isinstance(payload, dict):
+        return []
+    accounts = [
+        (account.get("bank", "Unknown"), account.get("txns") or [])
+        for account in payload.get("bankTransactions") or [] if isinstance(account, dict)
+    ]
+    response = payload.get("bankTransactionsResponse")
+    if isinstance(response, dict) and isinstance(response.get("transactions"), list):
+        accounts.append(("Unknown", response["transactions"]))
+    return accounts
+
+def _signature(accounts: list) -> tuple:
+    return tuple((id(rows), len(rows)) for _, rows in accounts)
+
+def _float_column(values: list) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_num(value) for value in values], dtype=np.float64)
+
+def _date_column(values: list) -> np.ndarray:
+    try:
+        return np.array(values, dtype="datetime64[D]")
+    except (TypeError, ValueError):
+        dates = []
+        for value in values:
+            try:
+                dates.append(np.datetime64(str(value)[:10], "D"))
+            except ValueError:
+                dates.append(np.datetime64("NaT"))
+        return np.array(dates, dtype="datetime64[D]")
+
+def build_columns(payload) -> TransactionColumns:
+    """Parse a bank transactions payload into columns (no memo; see transaction_columns)"""
+    started_at = time.perf_counter()
+    amounts, narrations, dates, types, modes, balances, banks = [], [], [], [], [], [], []
+    bank_names = []
+    for bank, rows in _accounts(payload):
+        bank_index = len(bank_names)
+        bank_names.append(bank)
+        if not all(type(row) is list and len(row) >= 6 for row in rows):
+            rows = [_dict_row(row) if isinstance(row, dict) else row for row in rows]
+            rows = [row for row in rows if isinstance(row, list) and len(row) >= 3]
+            rows = [row + [None] * (6 - len(row)) for row in rows]
+        # One comprehension per column (cheaper than zip(*rows), which builds huge tuples)
+        amounts += [row[0] for row in rows]
+        narrations += [row[1] for row in rows]
+        dates += [row[2] for row in rows]
+        types += [row[3] for row in rows]
+        modes += [row[4] for row in rows]
+        balances += [row[5] for row in rows]
+        banks += [bank_index] * len(rows)
+
+    balances = [value if value not in (None, "") else "nan" for value in balances]
+    vocabulary = {}
+    codes = [vocabulary.setdefault(text if isinstance(text, str) else str(text), len(vocabulary)) for text in narrations]
+    dates = _date_column(dates)
+    columns = TransactionColumns(
+        amounts=_float_column(amounts),
+        dates=dates,
+        types=np.array([TYPE_CODES.get(value, TYPE_OTHER) for value in types], dtype=np.int8),
+        balances=_float_column(balances),
+        banks=np.array(banks, dtype=np.int16),
+        bank_names=bank_names,
+        narration_codes=np.array(codes, dtype=np.int32),
+        narrations=list(vocabulary),
+        modes=modes,
+        date_order=np.argsort(dates, kind="stable"),
+    )
+    _stats["builds"] += 1
+    _stats["rows_parsed"] += columns.size
+    _stats["build_ms"] += (time.perf_counter() - started_at) * 1000
+    return columns
+
+def transaction_columns(payload) -> TransactionColumns:
+    """Columns for a bank transactions payload, parsed once per snapshot"""
+    accounts = _accounts(payload)
+    entry = _memo.get(payload)
+    if entry is not None and entry[0] == _signature(accounts):
+        _stats["memo_hits"] += 1
+        return entry[1]
+    columns = build_columns(payload)
+    if isinstance(payload, dict):
+        _memo.put(payload, (_signature(accounts), columns))
+    return columns
+
+def clear_transaction_store():
+    _memo.clear()
+
+def get_transaction_store_metrics() -> dict:
+    lookups = _stats["builds"] + _stats["memo_hits"]
+    return {
+        **_stats,
+        "build_ms": round(_stats["build_ms"], 2),
+        "memoized": len(_memo),
+        "hit_rate": round(_stats["memo_hits"] / lookups, 3) if lookups else 0.0,
+    }
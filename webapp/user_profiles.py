@@ -0,0 +1,165 @@
+# In-memory mirror of the small, hot per-user fields (session id, FCM token, cache timestamps)
+#
+# Request handlers read these on every call; the mirror turns that into a dict
+# lookup. Entries are kept fresh by Firestore on_snapshot listeners and by
+# write-through from the endpoints that change them.
+#
+# Listener callbacks run on the Firestore watch thread. They never touch the
+# mirror themselves: each snapshot is handed to the event loop that registered
+# the listener, so _profiles, _listeners and _stats are only ever changed on
+# that loop.
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from firebase_admin import firestore
+
+from firestore_db import get_db, get_document
+from mcp_client import get_single_flight_metrics, single_flight
+
+HOT_FIELDS = ("fi_session_id", "fcm_token", "mcp_cache_updated_at")
+
+PROFILE_LISTENERS_ENABLED = os.getenv("PROFILE_LISTENERS_ENABLED", "true").lower() in ("1", "true", "yes")
+MAX_WATCHED_USERS = int(os.getenv("PROFILE_MAX_WATCHED_USERS", "500"))
+MAX_PROFILES = int(os.getenv("PROFILE_MAX_ENTRIES", "10000"))
+# Without a listener an entry is only trusted for this long
+PROFILE_TTL_SECONDS = float(os.getenv("PROFILE_TTL_SECONDS", "60"))
+
+_profiles = OrderedDict()  # uid -> {"fields": {...}, "loaded_at": monotonic, "watched": bool}
+_listeners = {}  # uid -> firestore Watch (owned by the event loop that registered it)
+_stats = {"hits": 0, "misses": 0, "firestore_reads": 0, "snapshot_updates": 0, "write_throughs": 0, "listener_evictions": 0}
+
+def _hot(data: dict) -> dict:
+    return {field: data[field] for field in HOT_FIELDS if field in data}
+
+def _store(uid: str, fields: dict, watched: bool = None):
+    entry = _profiles.get(uid)
+    if watched is None:
+        watched = entry["watched"] if entry else False
+    _profiles[uid] = {"fields": fields, "loaded_at": time.monotonic(), "watched": watched}
+    _profiles.move_to_end(uid)
+    while len(_profiles) > MAX_PROFILES:
+        oldest_uid = next(iter(_profiles))
+        if oldest_uid == uid:
+            break
+        forget_user(oldest_uid)
+
+def _is_fresh(entry: dict) -> bool:
+    return entry["watched"] or time.monotonic() - entry["loaded_at"] < PROFILE_TTL_SECONDS
+
+# --- Snapshot listeners ---
+def _apply_snapshot(uid: str, fields: dict):
+    # A snapshot queued before its listener was closed must not bring the entry back
+    if uid not in _listeners:
+        return
+    _store(uid, fields, watched=True)
+    _stats["snapshot_updates"] += 1
+
+def _on_snapshot(uid: str, loop: asyncio.AbstractEventLoop):
+    def callback(doc_snapshots, changes, read_time):
+        # Runs on the Firestore watch thread: pass the fields to the loop, which applies them
+        for snapshot in doc_snapshots:
+            data = snapshot.to_dict() if snapshot.exists else {}
+            try:
+                loop.call_soon_threadsafe(_apply_snapshot, uid, _hot(data or {}))
+            except RuntimeError:
+                # The loop is closed (shutdown); nothing is left to serve from the mirror
+                return
+    return callback
+
+def _watch(uid: str):
+    if not PROFILE_LISTENERS_ENABLED or uid in _listeners:
+        return
+    try:
+        # The async client has no on_snapshot; watches run on the sync client's own thread
+        doc_ref = firestore.client().collection("users").document(uid)
+        _listeners[uid] = doc_ref.on_snapshot(_on_snapshot(uid, asyncio.get_running_loop()))
+    except Exception as e:
+        print(f"⚠️ Could not attach profile listener for {uid}: {e}")
+        return
+    # Bound the number of open listeners; the oldest users fall back to TTL reads
+    while len(_listeners) > MAX_WATCHED_USERS:
+        oldest_uid = next(iter(_listeners))
+        _unwatch(oldest_uid)
+        _stats["listener_evictions"] += 1
+
+def _unwatch(uid: str):
+    watch = _listeners.pop(uid, None)
+    if watch is not None:
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            print(f"⚠️ Error closing profile listener for {uid}: {e}")
+    entry = _profiles.get(uid)
+    if entry:
+        entry["watched"] = False
+
+# --- Public API ---
+async def get_user_profile(uid: str, db=None):
+    """Return the hot fields for a user, or None if the user document does not exist.
+
+    Served from memory when possible; a miss does one (coalesced) Firestore read
+    and starts a snapshot listener for the user.
+    """
+    entry = _profiles.get(uid)
+    if entry is not None and _is_fresh(entry):
+        _stats["hits"] += 1
+        _profiles.move_to_end(uid)
+        return entry["fields"]
+
+    _stats["misses"] += 1
+    if db is None:
+        db = get_db()
+    doc_ref = db.collection("users").document(uid)
+
+    async def load():
+        _stats["firestore_reads"] += 1
+        snapshot = await get_document(doc_ref)
+        if not snapshot.exists:
+            return None
+        fields = _hot(snapshot.to_dict() or {})
+        _store(uid, fields)
+        _watch(uid)
+        if uid in _listeners:
+            _profiles[uid]["watched"] = True
+        return fields
+
+    # Six concurrent fetches for the same user share one document read
+    return await single_flight(uid, load, namespace="user_profile")
+
+async def get_profile_field(uid: str, field: str, db=None):
+    profile = await get_user_profile(uid, db)
+    return profile.get(field) if profile else None
+
+def write_through(uid: str, **fields):
+    """Record fields the caller has just written to Firestore so later reads see them immediately"""
+    entry = _profiles.get(uid)
+    if entry is None:
+        # Nothing mirrored yet; the next read loads the full document
+        return
+    current = dict(entry["fields"])
+    current.update(_hot(fields))
+    _store(uid, current)
+    _stats["write_throughs"] += 1
+
+def forget_user(uid: str):
+    _unwatch(uid)
+    _profiles.pop(uid, None)
+
+def stop_profile_listeners():
+    """Detach every snapshot listener (call on shutdown)"""
+    for uid in list(_listeners):
+        _unwatch(uid)
+
+def get_profile_metrics() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+        "coalesced_reads": get_single_flight_metrics("user_profile")["calls_saved"],
+        "profiles": len(_profiles),
+        "listeners": len(_listeners),
+        "listeners_enabled": PROFILE_LISTENERS_ENABLED,
+    }
@@ -0,0 +1,165 @@
+# Write-behind queue for cache documents (agent results, MCP datasets)
+#
+# Cache writes are not needed to answer the request that produced them, so they
+# are queued in memory, coalesced per document (several merge-sets to the same
+# user document become one write) and committed in batches on an interval or
+# on shutdown.
+
+import asyncio
+import copy
+import os
+import time
+
+from firestore_db import get_db, get_document, commit_batch
+
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "2"))
+# Flush early once this many documents are pending (Firestore batches hold at most 500 writes)
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "400"))
+WRITE_BEHIND_MAX_ATTEMPTS = 3
+FIRESTORE_BATCH_LIMIT = 500
+
+def _deep_merge(target: dict, updates: dict):
+    """Apply updates the way a Firestore merge-set does: nested maps are merged, everything else replaced"""
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = value
+
+class WriteBehindQueue:
+    """Pending document writes keyed by document path, flushed by a background task"""
+
+    def __init__(self, flush_interval: float = WRITE_BEHIND_FLUSH_SECONDS, max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}  # path -> {"ref", "data", "merge", "attempts", "queued_at"}
+        self._flusher = None
+        self._wake = None
+        self._stats = {"enqueued": 0, "coalesced": 0, "flushes": 0, "documents_written": 0, "commit_failures": 0, "dropped": 0, "discarded": 0}
+        self._last_flush_ms = 0.0
+
+    def enqueue(self, ref, data: dict, merge: bool = True):
+        """Queue a set() of data on ref. Must be called from the event loop."""
+        self._stats["enqueued"] += 1
+        entry = self._pending.get(ref.path)
+        if entry is not None and merge:
+            # A merge on top of a pending write keeps that write's mode (a full set stays a full set)
+            _deep_merge(entry["data"], data)
+            self._stats["coalesced"] += 1
+        else:
+            if entry is not None:
+                self._stats["coalesced"] += 1
+            self._pending[ref.path] = {"ref": ref, "data": copy.deepcopy(data), "merge": merge, "attempts": 0, "queued_at": time.monotonic()}
+        self._ensure_flusher()
+        if len(self._pending) >= self.max_pending:
+            self._wake.set()
+
+    def pending(self, ref):
+        """Fields queued for ref but not yet committed, or None"""
+        entry = self._pending.get(ref.path)
+        return dict(entry["data"]) if entry else None
+
+    def discard(self, path_prefix: str) -> int:
+        """Drop pending writes for a document or anything beneath it (e.g. on cache clear)"""
+        paths = [path for path in self._pending if path == path_prefix or path.startswith(path_prefix + "/")]
+        for path in paths:
+            del self._pending[path]
+        self._stats["discarded"] += len(paths)
+        return len(paths)
+
+    async def flush(self) -> int:
+        """Commit everything pending now. Returns documents written."""
+        if not self._pending:
+            return 0
+        entries, self._pending = list(self._pending.values()), {}
+        started_at = time.perf_counter()
+        written = 0
+        db = get_db()
+        for start in range(0, len(entries), FIRESTORE_BATCH_LIMIT):
+            chunk = entries[start:start + FIRESTORE_BATCH_LIMIT]
+            batch = db.batch()
+            for entry in chunk:
+                batch.set(entry["ref"], entry["data"], merge=entry["merge"])
+            try:
+                await commit_batch(batch)
+                written += len(chunk)
+            except Exception as e:
+                self._stats["commit_failures"] += 1
+                print(f"⚠️ Write-behind commit of {len(chunk)} documents failed: {e}")
+                self._requeue(chunk)
+        self._stats["flushes"] += 1
+        self._stats["documents_written"] += written
+        self._last_flush_ms = (time.perf_counter() - started_at) * 1000
+        return written
+
+    def _requeue(self, entries):
+        for entry in entries:
+            entry["attempts"] += 1
+            if entry["attempts"] >= WRITE_BEHIND_MAX_ATTEMPTS:
+                self._stats["dropped"] += 1
+                continue
+            newer = self._pending.get(entry["ref"].path)
+            if newer is None:
+                self._pending[entry["ref"].path] = entry
+            elif newer["merge"]:
+                # Newer fields win over the failed ones
+                _deep_merge(entry["data"], newer["data"])
+                self._pending[entry["ref"].path] = entry
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Write-behind flush failed: {e}")
+
+    async def stop(self):
+        """Stop the background flusher and commit whatever is still pending"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        oldest = min((entry["queued_at"] for entry in self._pending.values()), default=None)
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "oldest_pending_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            "flush_interval_seconds": self.flush_interval,
+        }
+
+# Process-wide queue
+write_behind = WriteBehindQueue()
+
+def queue_write(ref, data: dict, merge: bool = True):
+    write_behind.enqueue(ref, data, merge=merge)
+
+async def read_field(ref, field: str):
+    """Read one field, seeing writes that are still queued"""
+    pending = write_behind.pending(ref)
+    if pending and field in pending:
+        return pending[field]
+    snapshot = await get_document(ref)
+    return (snapshot.to_dict() or {}).get(field) if snapshot.exists else None
+
+async def stop_write_behind():
+    await write_behind.stop()
+
+def get_write_behind_metrics() -> dict:
+    return write_behind.stats()